@@ -0,0 +1,143 @@
+"""
+Declarative registry of the tables and JSON outputs an aggregation script builds.
+
+Every node is either a table (`CREATE TABLE name AS sql`, e.g. the p_*
+partial aggregates, with ENUM columns stored as VARCHAR) or an output written to `<out>/<name>.json`, built from
+SQL or from a Python function of a cursor. SQL nodes take their inputs from
+the tables the query references; Python builders declare them. `run()`
+executes any subset of outputs together with the upstream tables they need,
+dispatching every node to the QueryPool as soon as its inputs exist.
+"""
+
+from __future__ import annotations
+
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Iterable
+
+import duckdb
+
+from log_store import decode_enums, referenced_columns
+from query_pool import QueryPool
+
+
+def _selects_star(sql: str) -> bool:
+    """Whether the result of `sql` has a `*` column (of either side of a set operation)."""
+    statement = json.loads(duckdb.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    stack = [statement["statements"][0]["node"]]
+    while stack:
+        node = stack.pop()
+        if node["type"] == "SET_OPERATION_NODE":
+            stack.extend((node["left"], node["right"]))
+        elif any(expr["class"] == "STAR" for expr in node.get("select_list", ())):
+            return True
+    return False
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.nodes: dict[str, dict[str, Any]] = {}
+
+    def _add(self, name: str, kind: str, build: Any, inputs: Iterable[str], files: Iterable[str] = ()) -> None:
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node: {name!r}")
+        self.nodes[name] = {"kind": kind, "build": build, "inputs": frozenset(inputs), "files": tuple(files)}
+
+    def table(self, name: str, sql: str) -> None:
+        """Register `CREATE TABLE name AS sql`."""
+        self._add(name, "table", sql, duckdb.get_table_names(sql))
+
+    def sql(self, name: str, sql: str) -> None:
+        """Register an output holding the records of `sql`."""
+        self._add(name, "sql", sql, duckdb.get_table_names(sql))
+
+    def python(self, name: str, inputs: Iterable[str], files: Iterable[str] = ()) -> Callable:
+        """
+        Decorator registering `fn(cursor)` as the builder of output `name`.
+        `files` lists side files the builder reads besides its input tables.
+        """
+        def register(fn: Callable[[duckdb.DuckDBPyConnection], Any]) -> Callable:
+            self._add(name, "python", fn, inputs, files)
+            return fn
+        return register
+
+    @property
+    def outputs(self) -> list[str]:
+        return [name for name, node in self.nodes.items() if node["kind"] != "table"]
+
+    def select(self, only: Iterable[str] | None = None) -> list[str]:
+        """
+        The `only` outputs (all outputs when empty) plus every table upstream
+        of them, in registration order.
+        """
+        targets = list(only or self.outputs)
+        unknown = [name for name in targets if name not in self.outputs]
+        if unknown:
+            raise ValueError(f"Unknown outputs: {', '.join(unknown)} (expected any of: {', '.join(self.outputs)})")
+        needed: set[str] = set()
+        stack = targets
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(i for i in self.nodes[name]["inputs"] if i in self.nodes)
+        return [name for name in self.nodes if name in needed]
+
+    def readers(self, name: str) -> list[str]:
+        """Outputs that are `name` or read it (directly or through other tables)."""
+        if name not in self.nodes:
+            raise ValueError(f"Unknown node: {name!r}")
+        return [output for output in self.outputs if name in self.select([output])]
+
+    def external_inputs(self, names: Iterable[str]) -> set[str]:
+        """Relations `names` read that the registry does not build (e.g. `logs`)."""
+        return {i for name in names for i in self.nodes[name]["inputs"] if i not in self.nodes}
+
+    def columns_read(self, names: Iterable[str], relations: Iterable[str], columns: Iterable[str]) -> set[str]:
+        """
+        Which of `columns` the nodes `names` read from `relations` (e.g. the
+        logs), by the names their SQL references. A Python builder or a query
+        selecting `*` that reads one of `relations` takes all of them.
+        """
+        relations, columns = set(relations), list(columns)
+        found: set[str] = set()
+        for name in names:
+            node = self.nodes[name]
+            if not node["inputs"] & relations:
+                continue
+            if node["kind"] == "python" or _selects_star(node["build"]):
+                return set(columns)
+            found |= referenced_columns(node["build"], columns)
+        return found
+
+    def _dispatch(self, pool: QueryPool, out: str, name: str) -> Future:
+        node = self.nodes[name]
+        if node["kind"] == "table":
+            return pool.submit(lambda cur: cur.execute(f"CREATE TABLE {name} AS {decode_enums(cur, node['build'])}"), name)
+        if node["kind"] == "sql":
+            return pool.json(f"{out}/{name}.json", node["build"])
+        return pool.write(f"{out}/{name}.json", node["build"])
+
+    def run(self, pool: QueryPool, out: str, names: Iterable[str], done: Iterable[str] = ()) -> None:
+        """
+        Build `names` (see `select`) on `pool`. Nodes in `done` already exist;
+        every other node is dispatched once all of its inputs are built.
+        """
+        done = set(done)
+        waiting = {
+            name: {i for i in self.nodes[name]["inputs"] if i in self.nodes and i not in done}
+            for name in names if name not in done
+        }
+        running: dict[Future, str] = {}
+        while waiting or running:
+            for name in [n for n, deps in waiting.items() if not deps]:
+                del waiting[name]
+                running[self._dispatch(pool, out, name)] = name
+            if not running:
+                raise ValueError(f"Unbuildable nodes (cycle or missing input): {', '.join(waiting)}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                for deps in waiting.values():
+                    deps.discard(name)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Accuracy and cost of `--approx` against the exact distinct counts.
+
+Builds the distinct-count outputs of `generate_hra_data.py` twice over the
+same parquet, exact and from HLL sketches, with `--profile` on, and
+reports for each output:
+  - the error of every count (median / p95 / max relative error, the
+    largest absolute error and the share within 2σ of the HLL bound)
+  - the seconds and memory the nodes computing it took in each mode
+The ML geo features (`ua_cardinality` per country) are compared the same
+way.
+
+Usage:
+    python data_processing/benchmark_approx.py
+    python data_processing/benchmark_approx.py --parquet data/synthetic/hra-10M-seed42 --json approx.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import duckdb
+
+import generate_hra_data
+import generate_hra_ml_insights
+from hll_sketch import compare, describe_accuracy
+from log_store import materialize_logs
+from query_profile import PROFILE_FILE
+from runtime_config import add_runtime_args, apply_runtime, runtime_config
+
+# Output → (keys the rows are matched on, counts compared)
+OUTPUTS = {
+    "monthly_unique_users": (("month_year",), ("unique_sessions",)),
+    "unique_sessions_rollup": (("period_type", "period"), ("unique_sessions",)),
+}
+
+
+def _build(parquet: str, out: str, approx: bool, workers: int, runtime: dict) -> dict:
+    """Run the HRA outputs in one mode; returns their rows, wall time and profiled nodes."""
+    t0 = time.perf_counter()
+    generate_hra_data.run(parquet, out, workers=workers, runtime=runtime, only=list(OUTPUTS),
+                          profile=os.path.join(out, PROFILE_FILE), approx=approx)
+    seconds = time.perf_counter() - t0
+    with open(os.path.join(out, PROFILE_FILE), encoding="utf-8") as f:
+        nodes = {node["name"]: node for node in json.load(f)["nodes"]}
+    rows = {}
+    for name in OUTPUTS:
+        with open(os.path.join(out, f"{name}.json"), encoding="utf-8") as f:
+            rows[name] = json.load(f)
+    return {"seconds": seconds, "nodes": nodes, "rows": rows}
+
+
+def _cost(nodes: dict, reg: generate_hra_data.Registry, name: str) -> dict:
+    """Seconds and bytes allocated by an output and the partials it reads."""
+    used = [n for n in reg.select([name]) if n in nodes]
+    return {
+        "seconds": round(sum(nodes[n]["seconds"] for n in used), 4),
+        "memory_mb": round(sum(nodes[n]["memory_allocated"] for n in used) / 2**20, 1),
+    }
+
+
+def _registry(approx: bool) -> generate_hra_data.Registry:
+    reg = generate_hra_data.Registry()
+    for name, sql in generate_hra_data.partial_queries("logs", "events", approx).items():
+        reg.table(f"p_{name}", sql)
+    generate_hra_data.register_outputs(reg, approx)
+    return reg
+
+
+def geo_accuracy(parquet: str, runtime: dict) -> dict:
+    """`ua_cardinality` per country of the ML geo features, exact vs sketched."""
+    con = duckdb.connect()
+    apply_runtime(con, runtime)
+    materialize_logs(con, parquet, generate_hra_ml_insights.LOG_COLUMNS)
+    result = {}
+    for approx in (False, True):
+        t0 = time.perf_counter()
+        geo = generate_hra_ml_insights.load_geo_features(con, approx)
+        result[approx] = (geo.to_dict(orient="records"), time.perf_counter() - t0)
+    report = compare(result[False][0], result[True][0], ("c_country",), ("ua_cardinality",))
+    report["cost"] = {"exact": {"seconds": round(result[False][1], 4)}, "approx": {"seconds": round(result[True][1], 4)}}
+    return report
+
+
+def run(parquet: str, workers: int = generate_hra_data.DEFAULT_WORKERS, runtime: dict | None = None,
+        geo: bool = True) -> dict:
+    runtime = dict(runtime or {})
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = _build(parquet, os.path.join(tmp, "exact"), False, workers, runtime)
+        approx = _build(parquet, os.path.join(tmp, "approx"), True, workers, runtime)
+
+    registries = {False: _registry(False), True: _registry(True)}
+    reports = {}
+    for name, (keys, fields) in OUTPUTS.items():
+        report = compare(exact["rows"][name], approx["rows"][name], keys, fields)
+        report["cost"] = {
+            "exact": _cost(exact["nodes"], registries[False], name),
+            "approx": _cost(approx["nodes"], registries[True], name),
+        }
+        reports[name] = report
+    if geo:
+        reports["geo_ua_cardinality"] = geo_accuracy(parquet, runtime)
+
+    print(f"\n{describe_accuracy(reports)}")
+    for name, report in reports.items():
+        cost = report["cost"]
+        memory = ""
+        if "memory_mb" in cost["exact"]:
+            memory = f"   memory {cost['exact']['memory_mb']:.1f} → {cost['approx']['memory_mb']:.1f} MiB"
+        print(f"  {name:<24} exact {cost['exact']['seconds']:7.3f}s → approx {cost['approx']['seconds']:7.3f}s{memory}")
+    print(f"Total: exact {exact['seconds']:.2f}s, approx {approx['seconds']:.2f}s")
+    return {
+        "parquet": parquet,
+        "exact_seconds": round(exact["seconds"], 3),
+        "approx_seconds": round(approx["seconds"], 3),
+        "outputs": reports,
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare the --approx (HyperLogLog) distinct counts with the exact ones")
+    p.add_argument("--parquet", default=generate_hra_data.PARQUET_DEFAULT,
+                   help="Source parquet file, glob, or directory of (hive-partitioned) files")
+    p.add_argument("--workers", type=int, default=generate_hra_data.DEFAULT_WORKERS,
+                   help="Aggregations run concurrently on this many cursors")
+    p.add_argument("--no-geo", action="store_true", help="Skip the ML geo feature comparison")
+    add_runtime_args(p)
+    p.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args.parquet, args.workers, runtime_config(args), geo=not args.no_geo)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
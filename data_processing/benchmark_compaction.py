@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Row groups each pipeline query skips before and after `compact_logs.py`.
+
+Compacts `--parquet` (by default a synthetic dataset, see
+`generate_synthetic_logs.py`) into a temporary directory, then, for every
+partial aggregate of the site's script, asks DuckDB which filters it pushes
+into the parquet scan when the logs are a view over the parquet (as with
+`--dedup-mode view`, or the load's `--sample`/incremental filters) and
+counts the row groups whose min/max rule those filters out, in the source
+and in the compacted copy (`compact_logs.skipped`), plus those of the
+load of an incremental refresh of the newest month. Also times a
+`count(*)` over the pushed filters on each.
+
+Usage:
+    python data_processing/benchmark_compaction.py --rows 3M
+    python data_processing/benchmark_compaction.py --parquet data/hra/logs --row-group-rows 100000 --json compaction.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Mapping
+
+import duckdb
+
+import generate_cns_data
+import generate_hra_data
+from compact_logs import (
+    COMPRESSIONS, DEFAULT_COMPRESSION, DEFAULT_ROW_GROUP_ROWS, compact, conjuncts, describe_compaction, row_group_index,
+    skipped, zone_conditions,
+)
+from event_store import EVENTS_FILTER
+from generate_synthetic_logs import generate, parse_rows
+from incremental_state import date_predicate
+from log_store import hive_keys, materialize_logs, parquet_source
+from runtime_config import add_runtime_args, apply_runtime, runtime_config
+
+PARTITION_TYPES = {"hra": generate_hra_data.PARTITION_TYPES, "cns": generate_cns_data.PARTITION_TYPES}
+
+
+def site_queries(con: duckdb.DuckDBPyConnection, parquet: str, site: str) -> dict[str, str]:
+    """
+    The partial aggregates of `site`'s script, reading `logs` (events
+    filtered in each query), and the load of an incremental refresh of the
+    newest month.
+    """
+    if site == "hra":
+        queries = generate_hra_data.partial_queries("logs", f"(SELECT * FROM logs WHERE {EVENTS_FILTER})")
+    else:
+        queries = generate_cns_data.partial_queries("logs")
+    queries = {f"p_{name}": sql for name, sql in queries.items()}
+    src = parquet_source(parquet, PARTITION_TYPES[site])
+    (newest,) = con.execute(f"SELECT strftime(max(date), '%Y-%m') FROM {src}").fetchone()
+    if newest:
+        queries["incremental load"] = f"SELECT * FROM {src} WHERE {date_predicate([newest], hive_keys(parquet))}"
+    return queries
+
+
+def _view(con: duckdb.DuckDBPyConnection, parquet: str, site: str) -> None:
+    if site == "hra":
+        materialize_logs(con, parquet, generate_hra_data.LOG_COLUMNS, mode="view",
+                         derived=generate_hra_data.EVENT_COLUMNS | generate_hra_data.TOOL_COLUMNS,
+                         hive_types=PARTITION_TYPES[site])
+    else:
+        materialize_logs(con, parquet, generate_cns_data.LOG_COLUMNS, mode="view", hive_types=PARTITION_TYPES[site])
+
+
+def pushed_filters(con: duckdb.DuckDBPyConnection, sql: str) -> list[str]:
+    """The filters DuckDB pushes into the parquet scans of `sql`."""
+    found: list[str] = []
+    stack = json.loads(con.execute(f"EXPLAIN (FORMAT json) {sql}").fetchall()[0][1])
+    while stack:
+        node = stack.pop()
+        if node.get("name") == "READ_PARQUET":
+            filters = node.get("extra_info", {}).get("Filters", [])
+            found.extend([filters] if isinstance(filters, str) else filters)
+        stack.extend(node.get("children", []))
+    return found
+
+
+def _scan_seconds(con: duckdb.DuckDBPyConnection, parquet: str, site: str, conditions: list[str]) -> float:
+    where = " AND ".join(conditions) or "true"
+    start = time.perf_counter()
+    con.execute(f"SELECT count(*) FROM {parquet_source(parquet, PARTITION_TYPES[site])} WHERE {where}").fetchone()
+    return round(time.perf_counter() - start, 3)
+
+
+def compare(source: str, compacted: str, site: str, runtime: Mapping[str, Any] | None = None) -> list[dict[str, Any]]:
+    """Per partial: its zone-map filters and the row groups they skip in `source` and `compacted`."""
+    indexes = {"before": row_group_index(source), "after": row_group_index(compacted)}
+    con = duckdb.connect()
+    apply_runtime(con, runtime or {})
+    _view(con, source, site)
+    results = []
+    for name, sql in site_queries(con, source, site).items():
+        filters = pushed_filters(con, sql)
+        conditions = zone_conditions(filters)
+        texts = [term for text in filters for term in conjuncts(text) if zone_conditions([term])]
+        result = {"query": name, "filters": texts}
+        for label, parquet in (("before", source), ("after", compacted)):
+            result[label] = {**skipped(indexes[label], conditions),
+                             "seconds": _scan_seconds(con, parquet, site, texts)}
+        results.append(result)
+    con.close()
+    return results
+
+
+def describe_comparison(results: list[dict[str, Any]]) -> str:
+    lines = [f"{'query':<22} {'row groups skipped':>27} {'rows':>5} {'scan (s)':>14}  filters"]
+    for result in results:
+        before, after = result["before"], result["after"]
+        lines.append(
+            f"{result['query']:<22} {before['row_groups']:>5}/{before['total_row_groups']:<5} -> "
+            f"{after['row_groups']:>5}/{after['total_row_groups']:<5} {after['rows'] / max(after['total_rows'], 1):>5.0%} "
+            f"{before['seconds']:>6.3f} -> {after['seconds']:.3f}  {' AND '.join(result['filters']) or '-'}"
+        )
+    return "\n".join(lines)
+
+
+def run(parquet: str | None = None, rows: int = 1_000_000, site: str = "hra",
+        row_group_rows: int = DEFAULT_ROW_GROUP_ROWS, compression: str = DEFAULT_COMPRESSION,
+        runtime: dict | None = None) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        if not parquet:
+            parquet = os.path.join(tmp, "synthetic")
+            generate(parquet, rows, site=site)
+        summary = compact(parquet, os.path.join(tmp, "compacted"), row_group_rows=row_group_rows,
+                          compression=compression, runtime=runtime)
+        print(describe_compaction(summary))
+        results = compare(parquet, summary["out"], site, runtime)
+        print(describe_comparison(results))
+    return {"parquet": parquet, "site": site, "row_group_rows": row_group_rows, "compression": compression,
+            "compaction": {k: v for k, v in summary.items() if k != "out"}, "queries": results}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Row groups each pipeline query skips before and after compaction")
+    p.add_argument("--parquet", default=None, help="Dataset to compact (default: a synthetic one)")
+    p.add_argument("--rows", type=parse_rows, default=parse_rows("1M"), help="Rows of the synthetic dataset (default 1M)")
+    p.add_argument("--site", choices=sorted(PARTITION_TYPES), default="hra", help="Whose partial aggregates to check")
+    p.add_argument("--row-group-rows", type=int, default=DEFAULT_ROW_GROUP_ROWS, help="Rows per compacted row group")
+    p.add_argument("--compression", choices=COMPRESSIONS, default=DEFAULT_COMPRESSION, help="Codec of the compacted copy")
+    add_runtime_args(p)
+    p.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args.parquet, args.rows, args.site, args.row_group_rows, args.compression, runtime_config(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
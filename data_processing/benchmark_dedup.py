@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the dedup keys of the log-loading stage.
+
+Loads the HRA log the way `generate_hra_data.py` does (same columns, event
+fields, tool columns and ENUMs) once per key of `log_store.DEDUP_KEYS`:
+  row         — `SELECT DISTINCT *`, every column of every row is compared
+  request_id  — one row per `x_edge_request_id`
+  hash        — one row per 64-bit hash of the whole row
+Each load runs in a fresh process, so the peak RSS reported for a key is
+that load's alone. `--verify` adds the `verify_dedup` report of where the
+keys disagree.
+
+Usage:
+    python data_processing/benchmark_dedup.py
+    python data_processing/benchmark_dedup.py --parquet data/hra/2026-04-06_hra-logs.parquet --threads 4 --memory-limit 2GB --verify --json bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+
+from generate_hra_data import ENUM_COLUMNS, EVENT_COLUMNS, LOG_COLUMNS, PARQUET_DEFAULT, PARTITION_TYPES, TOOL_COLUMNS
+from log_store import DEDUP_KEYS, describe_verification, materialize_logs, verify_dedup
+from query_profile import peak_rss_mb
+from runtime_config import add_runtime_args, apply_runtime, describe_runtime, runtime_config
+
+
+def _load(parquet: str, key: str, runtime: dict) -> dict:
+    con = duckdb.connect()
+    apply_runtime(con, runtime)
+    baseline = peak_rss_mb()
+    load = materialize_logs(con, parquet, LOG_COLUMNS, derived=EVENT_COLUMNS | TOOL_COLUMNS,
+                            enums=ENUM_COLUMNS, hive_types=PARTITION_TYPES, key=key)
+    return {**load, "peak_rss_mb": round(peak_rss_mb(), 1), "baseline_rss_mb": round(baseline, 1)}
+
+
+def run(parquet: str, keys=DEDUP_KEYS, runtime: dict | None = None, verify: bool = False) -> dict:
+    runtime = runtime or {}
+    con = duckdb.connect()
+    settings = apply_runtime(con, runtime)
+    print(describe_runtime(settings))
+    rows = []
+    for key in keys:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            load = pool.submit(_load, parquet, key, runtime).result()
+        rows.append(load)
+        print(f"  {key:<11} {load['seconds']:7.2f}s   peak RSS {load['peak_rss_mb']:8.0f} MB   "
+              f"{load['deduped_rows']:,} rows ({load['duplicates']:,} duplicates)")
+
+    summary = {"parquet": parquet, "raw_rows": rows[0]["raw_rows"] if rows else 0, "runtime": settings, "keys": rows}
+    if verify:
+        report = verify_dedup(con, parquet, hive_types=PARTITION_TYPES)
+        print(describe_verification(report))
+        summary["verification"] = report
+    return summary
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare time and memory of the log dedup keys")
+    p.add_argument("--parquet", default=PARQUET_DEFAULT, help="Source parquet file, glob, or directory")
+    p.add_argument("--keys", type=lambda v: [key.strip() for key in v.split(",") if key.strip()],
+                   default=list(DEDUP_KEYS), help=f"Comma-separated dedup keys (default: {','.join(DEDUP_KEYS)})")
+    add_runtime_args(p)
+    p.add_argument("--verify", action="store_true", help="Also report where the keys disagree")
+    p.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args.parquet, args.keys, runtime_config(args), args.verify)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
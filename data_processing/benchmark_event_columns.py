@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark `query` MAP lookups against the flattened event columns.
+
+Runs every HRA partial aggregate twice over the same deduplicated log:
+  map       — the event fields are `query[...]` lookups evaluated inside each
+              query (views over the raw MAP column, as before flattening)
+  columnar  — the fields were extracted once on load
+Both sides read a pre-filtered Events `/tr` table, so the difference is the
+MAP lookup cost alone. The one-time extraction cost is reported separately,
+so the per-query savings can be weighed against it.
+
+Usage:
+    python data_processing/benchmark_event_columns.py
+    python data_processing/benchmark_event_columns.py --parquet data/hra/2026-04-06_hra-logs.parquet --repeat 3 --json bench.json
+"""
+
+import argparse
+import json
+import time
+
+import duckdb
+
+from event_store import materialize_events
+from generate_hra_data import EVENT_COLUMNS, LOG_COLUMNS, PARQUET_DEFAULT, TOOL_COLUMNS, partial_queries
+from log_store import materialize_logs
+from runtime_config import add_runtime_args, apply_runtime, runtime_config
+
+
+def _timed(con: duckdb.DuckDBPyConnection, sql: str, repeat: int) -> float:
+    """Best-of-`repeat` seconds for running `sql` to completion."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        con.execute(f"SELECT count(*) FROM ({sql})").fetchone()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(parquet: str, repeat: int = 3, runtime: dict | None = None) -> dict:
+    con = duckdb.connect()
+    apply_runtime(con, runtime or {})
+    load = materialize_logs(con, parquet, LOG_COLUMNS + ("query",), name="raw_logs")
+    print(f"Loaded {load['deduped_rows']:,} rows in {load['seconds']:.2f}s")
+
+    lookups = ", ".join(f"{expr} AS {col}" for col, expr in (EVENT_COLUMNS | TOOL_COLUMNS).items())
+    con.execute(f"CREATE VIEW map_logs AS SELECT * EXCLUDE (query), {lookups} FROM raw_logs")
+    materialize_events(con, "raw_logs", name="raw_events")
+    con.execute(f"CREATE VIEW map_events AS SELECT * EXCLUDE (query), {lookups} FROM raw_events")
+
+    start = time.perf_counter()
+    con.execute("CREATE TABLE logs AS SELECT * FROM map_logs")
+    flatten = time.perf_counter() - start
+    n_events = materialize_events(con, "logs")
+
+    map_queries = partial_queries("map_logs", "map_events")
+    column_queries = partial_queries("logs", "events")
+    rows = []
+    for name in map_queries:
+        map_s = _timed(con, map_queries[name], repeat)
+        col_s = _timed(con, column_queries[name], repeat)
+        rows.append({"partial": name, "map_seconds": round(map_s, 4), "columnar_seconds": round(col_s, 4)})
+        print(f"  {name:<20} map {map_s:7.3f}s   columnar {col_s:7.3f}s   ({map_s / max(col_s, 1e-9):5.1f}×)")
+
+    map_total = sum(r["map_seconds"] for r in rows)
+    col_total = sum(r["columnar_seconds"] for r in rows)
+    summary = {
+        "parquet": parquet,
+        "rows": load["deduped_rows"],
+        "event_rows": n_events,
+        "repeat": repeat,
+        "flatten_seconds": round(flatten, 3),
+        "map_total_seconds": round(map_total, 3),
+        "columnar_total_seconds": round(col_total, 3),
+        "columnar_with_flatten_seconds": round(col_total + flatten, 3),
+        "partials": rows,
+    }
+    print(
+        f"\nAll partials: map {map_total:.2f}s vs columnar {col_total:.2f}s "
+        f"(+{flatten:.2f}s one-time flatten)"
+    )
+    return summary
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare query MAP lookups with flattened event columns")
+    p.add_argument("--parquet", default=PARQUET_DEFAULT, help="Path to source parquet")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per query (best time is kept)")
+    add_runtime_args(p)
+    p.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args.parquet, args.repeat, runtime_config(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Throughput of `ingest_cloudfront_logs.py` in rows per second.
+
+Turns a parquet dataset (by default a synthetic one, see
+`generate_synthetic_logs.py`) back into gzipped CloudFront W3C logs
+(`write_w3c`), then ingests them once per `--workers` count and reports the
+rows per second and the peak RSS of the parser processes. The peak stays
+at about one `--batch-rows` batch per worker whatever the number of rows
+or files, so a larger `--rows` should only change the time.
+
+Usage:
+    python data_processing/benchmark_ingest.py --rows 1M --workers 1,2,4
+    python data_processing/benchmark_ingest.py --parquet data/hra/logs --rows-per-file 20000 --json ingest.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Sequence
+
+import duckdb
+
+from generate_synthetic_logs import generate, parse_rows
+from ingest_cloudfront_logs import DEFAULT_BATCH_ROWS, describe_ingest, ingest
+from log_store import parquet_source, sql_escape
+from runtime_config import add_runtime_args, runtime_config
+
+# The fields of a CloudFront standard log, plus the optional c-country
+W3C_FIELDS = (
+    "date", "time", "x-edge-location", "sc-bytes", "c-ip", "cs-method", "cs(Host)", "cs-uri-stem", "sc-status",
+    "cs(Referer)", "cs(User-Agent)", "cs-uri-query", "cs(Cookie)", "x-edge-result-type", "x-edge-request-id",
+    "x-host-header", "cs-protocol", "cs-bytes", "time-taken", "x-forwarded-for", "ssl-protocol", "ssl-cipher",
+    "x-edge-response-result-type", "cs-protocol-version", "fle-status", "fle-encrypted-fields", "c-port",
+    "time-to-first-byte", "x-edge-detailed-result-type", "sc-content-type", "sc-content-len", "sc-range-start",
+    "sc-range-end", "c-country",
+)
+# Field → SQL over the parquet columns; the rest read the column of the same name
+W3C_VALUES = {
+    "c-ip": "'10.' || (hash(anon_id) % 256) || '.' || (hash(anon_id, 1) % 256) || '.' || (hash(anon_id, 2) % 256)",
+    "cs(Host)": "'d111111abcdef8.cloudfront.net'",
+    "cs(User-Agent)": "url_encode(cs_user_agent)",
+    # The query string of the `query` MAP when it has one, so it parses back into the same MAP
+    "cs-uri-query": """CASE WHEN cardinality(query) > 0
+        THEN array_to_string(list_transform(map_entries(query), e -> url_encode(e.key) || '=' || url_encode(e.value)), '&')
+        ELSE cs_uri_query END""",
+    "x-host-header": "CASE WHEN site = 'CDN' THEN 'cdn.humanatlas.io' ELSE x_host_header END",
+    "x-forwarded-for": "NULL",
+    "fle-status": "NULL",
+    "fle-encrypted-fields": "NULL",
+    "c-port": "443",
+}
+
+
+def _field_sql(field: str) -> str:
+    column = {"cs(Referer)": "cs_referer", "cs(Cookie)": "cs_cookie"}.get(field, field.replace("-", "_"))
+    sql = W3C_VALUES.get(field, f"\"{column}\"")
+    return f"coalesce(({sql})::VARCHAR, '-') AS \"{field}\""
+
+
+def write_w3c(parquet: str, out: str, rows_per_file: int = 50_000) -> dict[str, Any]:
+    """
+    Write the rows of `parquet` as gzipped W3C logs of `rows_per_file` rows
+    under `out`, in time order like CloudFront's deliveries.
+    """
+    con = duckdb.connect()
+    staging = tempfile.mkdtemp()
+    os.makedirs(out, exist_ok=True)
+    try:
+        con.execute(f"""
+            COPY (
+                SELECT {', '.join(_field_sql(f) for f in W3C_FIELDS)},
+                       (row_number() OVER (ORDER BY date, time) - 1) // {rows_per_file} AS part,
+                       distribution AS dist
+                FROM {parquet_source(parquet)}
+            ) TO '{sql_escape(staging)}'
+            (FORMAT CSV, DELIMITER '\t', HEADER false, QUOTE '', ESCAPE '', COMPRESSION gzip, PARTITION_BY (part, dist))
+        """)
+        header = gzip.compress(f"#Version: 1.0\n#Fields: {' '.join(W3C_FIELDS)}\n".encode())
+        files = []
+        for path in sorted(glob.glob(os.path.join(staging, "part=*", "dist=*", "*.csv.gz"))):
+            part = path.split("part=")[1].split(os.sep)[0]
+            dist = path.split("dist=")[1].split(os.sep)[0]
+            name = os.path.join(out, f"{dist}.{int(part):06d}.gz")
+            # Concatenated gzip members read as one stream
+            with open(name, "wb") as f, open(path, "rb") as body:
+                f.write(header)
+                shutil.copyfileobj(body, f)
+            files.append(name)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        con.close()
+    return {"files": len(files), "bytes": sum(os.path.getsize(p) for p in files)}
+
+
+def run(parquet: str | None = None, rows: int = 1_000_000, workers: Sequence[int] = (1,),
+        batch_rows: int = DEFAULT_BATCH_ROWS, rows_per_file: int = 50_000,
+        runtime: dict | None = None) -> dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if not parquet:
+            parquet = os.path.join(tmp, "synthetic")
+            generate(parquet, rows, site="hra")
+        raw = os.path.join(tmp, "raw")
+        t0 = time.perf_counter()
+        written = write_w3c(parquet, raw, rows_per_file)
+        print(f"Wrote {written['files']:,} W3C logs ({written['bytes'] / 2**20:.1f} MiB gzipped) "
+              f"in {time.perf_counter() - t0:.1f}s")
+        for n in workers:
+            out = os.path.join(tmp, f"ingested-{n}")
+            summary = ingest(raw, out, "hra", workers=n, batch_rows=batch_rows, runtime=runtime)
+            print(f"  {describe_ingest(summary)}")
+            results.append({k: summary[k] for k in ("workers", "rows", "seconds", "rows_per_second",
+                                                     "peak_worker_rss_mb", "tasks")})
+    return {"parquet": parquet, "batch_rows": batch_rows, "rows_per_file": rows_per_file, **written,
+            "runs": results}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Rows per second of the CloudFront .gz ingestion")
+    p.add_argument("--parquet", default=None, help="Dataset to turn into W3C logs (default: a synthetic HRA one)")
+    p.add_argument("--rows", type=parse_rows, default=parse_rows("1M"), help="Rows of the synthetic dataset (default 1M)")
+    p.add_argument("--workers", type=lambda v: [int(n) for n in v.split(",")], default=[1],
+                   help="Comma-separated parser process counts to time (default 1)")
+    p.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per worker batch")
+    p.add_argument("--rows-per-file", type=int, default=50_000, help="Rows per W3C log file")
+    add_runtime_args(p)
+    p.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args.parquet, args.rows, args.workers, args.batch_rows, args.rows_per_file, runtime_config(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Scale benchmark of the three log pipelines on synthetic data.
+
+For each scale (`--scales 1M,10M,100M`) the runner generates HRA and CNS
+logs with `generate_synthetic_logs.py` (reused from `--data-dir` when a
+dataset of that size and seed already exists), then runs
+`generate_hra_data`, `generate_cns_data` and `generate_hra_ml_insights`
+on them, each in a fresh process so its peak RSS is its own. It records:
+  - the pipeline's wall time and peak RSS
+  - every stage: for HRA/CNS each node of `pipeline_profile.json` (the
+    log load, the events table, every partial and output); for the ML
+    script each step of `run_pipeline` (`stage_seconds` in its metadata)
+  - with `--serial-baseline`, HRA and CNS run a second time with one
+    worker on all threads, and the aggregation stage's speedup is the
+    serial run's wall-clock over the concurrent one's
+
+Results are written to `--results-dir/<commit>.json` (`-dirty` when the tree
+has uncommitted changes), so two commits can be compared stage by stage
+with `--compare`.
+
+Usage:
+    python data_processing/benchmark_pipeline.py --scales 1M
+    python data_processing/benchmark_pipeline.py --scales 1M,10M --threads 4 --memory-limit 8GB
+    python data_processing/benchmark_pipeline.py --scales 1M --pipelines hra,cns --serial-baseline
+    python data_processing/benchmark_pipeline.py --scales 1M --compare 82f9f3b
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Mapping, Sequence
+
+import duckdb
+
+from generate_synthetic_logs import DEFAULT_DUPLICATES, default_out, format_rows, generate, matches, parse_rows
+from query_profile import PROFILE_FILE, peak_rss_mb
+from runtime_config import add_runtime_args, apply_runtime, describe_runtime, runtime_config
+
+PIPELINES = ("hra", "cns", "ml")
+DATA_DEFAULT = "data/synthetic"
+RESULTS_DEFAULT = "data/benchmarks"
+# Stage changes smaller than this are timing noise in the comparison
+MIN_CHANGE_SECONDS = 0.05
+
+
+def _hra(parquet: str, out: str, runtime: dict, workers: int) -> dict:
+    import generate_hra_data
+    generate_hra_data.run(parquet, out, workers=workers, runtime=runtime,
+                          profile=os.path.join(out, PROFILE_FILE))
+    return _profiled_stages(out)
+
+
+def _cns(parquet: str, out: str, runtime: dict, workers: int) -> dict:
+    import generate_cns_data
+    generate_cns_data.run(parquet, out, workers=workers, runtime=runtime,
+                          profile=os.path.join(out, PROFILE_FILE))
+    return _profiled_stages(out)
+
+
+def _ml(parquet: str, out: str, runtime: dict, workers: int) -> dict:
+    import generate_hra_ml_insights
+    meta = generate_hra_ml_insights.run_pipeline(Path(parquet), Path(out), 6, runtime=runtime)
+    return {"stages": meta["stage_seconds"]}
+
+
+RUNNERS = {"hra": _hra, "cns": _cns, "ml": _ml}
+
+
+def _profiled_stages(out: str) -> dict:
+    with open(os.path.join(out, PROFILE_FILE), encoding="utf-8") as f:
+        report = json.load(f)
+    return {
+        "stages": {node["name"]: node["seconds"] for node in report["nodes"]},
+        "scheduler": {k: report[k] for k in ("wall_seconds", "task_seconds", "concurrency", "workers", "threads_per_query")
+                      if k in report},
+    }
+
+
+def _measure(pipeline: str, parquet: str, runtime: dict, workers: int) -> dict:
+    with tempfile.TemporaryDirectory() as out:
+        t0 = time.perf_counter()
+        result = RUNNERS[pipeline](parquet, out, runtime, workers)
+        seconds = time.perf_counter() - t0
+    return {**result, "seconds": round(seconds, 3), "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def _measure_in_process(pipeline: str, parquet: str, runtime: dict, workers: int) -> dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measure, pipeline, parquet, runtime, workers).result()
+
+
+def serial_speedup(concurrent: Mapping[str, Any], serial: Mapping[str, Any]) -> dict[str, Any]:
+    """Wall-clock of the aggregation stage run serially (one worker, all threads) against concurrently."""
+    before, after = serial["scheduler"]["wall_seconds"], concurrent["scheduler"]["wall_seconds"]
+    return {
+        "serial_wall_seconds": before,
+        "concurrent_wall_seconds": after,
+        "speedup": round(before / after, 2) if after else None,
+        "serial_seconds": serial["seconds"],
+    }
+
+
+def git_commit(root: str = ".") -> tuple[str, bool]:
+    """Short hash of HEAD and whether the tree has uncommitted changes (`unknown` outside git)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(status.strip())
+
+
+def dataset(data_dir: str, site: str, rows: int, seed: int, duplicates: float, runtime: dict) -> str:
+    """Directory of the synthetic `site` logs at `rows`, generated unless already there."""
+    out = default_out(site, rows, seed, data_dir)
+    if matches(out, rows, site, seed, duplicates):
+        return out
+    con = duckdb.connect()
+    apply_runtime(con, runtime)
+    manifest = generate(out, rows, site, seed, duplicates, con=con)
+    print(f"  generated {manifest['written_rows']:,} {site} rows in {manifest['seconds']:.1f}s → {out}/")
+    return out
+
+
+def run(
+    scales: Sequence[int],
+    pipelines: Sequence[str] = PIPELINES,
+    data_dir: str = DATA_DEFAULT,
+    results_dir: str | None = RESULTS_DEFAULT,
+    runtime: Mapping[str, Any] | None = None,
+    workers: int = 4,
+    seed: int = 42,
+    duplicates: float = DEFAULT_DUPLICATES,
+    serial_baseline: bool = False,
+) -> dict[str, Any]:
+    runtime = dict(runtime or {})
+    settings = apply_runtime(duckdb.connect(), runtime)
+    print(describe_runtime(settings))
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "generated_at_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "duckdb": duckdb.__version__, "cpus": os.cpu_count()},
+        "runtime": settings,
+        "workers": workers,
+        "seed": seed,
+        "runs": [],
+    }
+    for rows in scales:
+        print(f"\nScale {format_rows(rows)}")
+        sources = {
+            "hra": dataset(data_dir, "hra", rows, seed, duplicates, runtime) if {"hra", "ml"} & set(pipelines) else None,
+            "cns": dataset(data_dir, "cns", rows, seed, duplicates, runtime) if "cns" in pipelines else None,
+        }
+        for pipeline in pipelines:
+            parquet = sources["cns" if pipeline == "cns" else "hra"]
+            measured = _measure_in_process(pipeline, parquet, runtime, workers)
+            print(f"  {pipeline:<4} {measured['seconds']:9.2f}s   peak RSS {measured['peak_rss_mb']:8.0f} MB   "
+                  f"{len(measured['stages'])} stages")
+            if serial_baseline and "scheduler" in measured:
+                measured["serial_baseline"] = serial_speedup(
+                    measured, _measure_in_process(pipeline, parquet, runtime, 1))
+                baseline = measured["serial_baseline"]
+                print(f"       aggregations: {baseline['serial_wall_seconds']:.2f}s serial (1 worker) → "
+                      f"{baseline['concurrent_wall_seconds']:.2f}s on {workers} workers "
+                      f"({baseline['speedup'] or 0:.2f}× speedup)")
+            results["runs"].append({"scale": format_rows(rows), "rows": rows, "pipeline": pipeline, **measured})
+
+    if results_dir:
+        os.makedirs(results_dir, exist_ok=True)
+        path = os.path.join(results_dir, f"{commit}{'-dirty' if dirty else ''}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {path}")
+    return results
+
+
+def compare(base: Mapping[str, Any], head: Mapping[str, Any]) -> list[dict[str, Any]]:
+    """Per pipeline and scale run in both results: total and per-stage seconds, base vs head."""
+    before = {(r["pipeline"], r["scale"]): r for r in base["runs"]}
+    rows = []
+    for run_ in head["runs"]:
+        old = before.get((run_["pipeline"], run_["scale"]))
+        if old is None:
+            continue
+        stages = [
+            {"stage": name, "base": old["stages"].get(name), "head": run_["stages"].get(name)}
+            for name in sorted(set(old["stages"]) | set(run_["stages"]))
+        ]
+        rows.append({
+            "pipeline": run_["pipeline"], "scale": run_["scale"],
+            "base": old["seconds"], "head": run_["seconds"],
+            "base_rss_mb": old["peak_rss_mb"], "head_rss_mb": run_["peak_rss_mb"],
+            "stages": stages,
+        })
+    return rows
+
+
+def describe_comparison(rows: list[Mapping[str, Any]], base: str, head: str, top: int = 5) -> str:
+    lines = [f"Comparison {base} → {head}"]
+    for row in rows:
+        change = (row["head"] - row["base"]) / row["base"] * 100 if row["base"] else 0.0
+        lines.append(f"  {row['pipeline']:<4} {row['scale']:>5}  {row['base']:9.2f}s → {row['head']:9.2f}s "
+                     f"({change:+.1f}%)   peak RSS {row['base_rss_mb']:.0f} → {row['head_rss_mb']:.0f} MB")
+        moved = [s for s in row["stages"] if abs((s["head"] or 0) - (s["base"] or 0)) >= MIN_CHANGE_SECONDS]
+        moved.sort(key=lambda s: abs((s["head"] or 0) - (s["base"] or 0)), reverse=True)
+        for stage in moved[:top]:
+            old = "—" if stage["base"] is None else f"{stage['base']:.3f}s"
+            new = "—" if stage["head"] is None else f"{stage['head']:.3f}s"
+            lines.append(f"      {stage['stage']:<34} {old:>10} → {new:>10}")
+    return "\n".join(lines)
+
+
+def load_results(ref: str, results_dir: str = RESULTS_DEFAULT) -> dict[str, Any]:
+    """Results of a commit (`results_dir/<ref>.json`) or of a results file path."""
+    path = ref if os.path.exists(ref) else os.path.join(results_dir, f"{ref}.json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Time every stage of the pipelines on synthetic logs at several scales")
+    p.add_argument("--scales", type=lambda v: [parse_rows(s) for s in v.split(",") if s.strip()],
+                   default=[parse_rows("1M")], help="Comma-separated row counts, e.g. 1M,10M,100M (default 1M)")
+    p.add_argument("--pipelines", type=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+                   default=list(PIPELINES), help=f"Comma-separated pipelines (default: {','.join(PIPELINES)})")
+    p.add_argument("--data-dir", default=DATA_DEFAULT, help="Where the synthetic datasets are generated and reused")
+    p.add_argument("--results-dir", default=RESULTS_DEFAULT, help="Where the results of each commit are stored")
+    p.add_argument("--seed", type=int, default=42, help="Seed of the synthetic data")
+    p.add_argument("--duplicates", type=float, default=DEFAULT_DUPLICATES, help="Fraction of rows delivered twice")
+    p.add_argument("--workers", type=int, default=4, help="HRA + CNS aggregation workers")
+    p.add_argument("--serial-baseline", action="store_true",
+                   help="Also run HRA + CNS with one worker on all threads and report the aggregation speedup")
+    add_runtime_args(p)
+    p.add_argument("--compare", metavar="COMMIT", default=None,
+                   help="Compare with the stored results of this commit (or a results JSON path)")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    unknown = [name for name in args.pipelines if name not in PIPELINES]
+    if unknown:
+        raise SystemExit(f"Unknown pipelines: {', '.join(unknown)} (expected {', '.join(PIPELINES)})")
+    head = run(args.scales, args.pipelines, args.data_dir, args.results_dir, runtime_config(args),
+               args.workers, args.seed, args.duplicates, args.serial_baseline)
+    if args.compare:
+        base = load_results(args.compare, args.results_dir)
+        print(describe_comparison(compare(base, head), base["commit"], head["commit"]))
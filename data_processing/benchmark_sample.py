@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of a `--sample` preview against a full run.
+
+Runs a generator over the same parquet in full and on a sample, or reuses
+the outputs of an earlier full run (`--full-dir`), and reports the error of
+every JSON output of the sample (see `sampling.compare_outputs`). Outputs
+that count users or sessions are not scaled up; they are listed apart.
+
+Usage:
+    python data_processing/benchmark_sample.py --site hra --fraction 0.05
+    python data_processing/benchmark_sample.py --site cns --full-dir public/data/cns --json sample.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import generate_cns_data
+import generate_hra_data
+from query_pool import DEFAULT_WORKERS
+from runtime_config import add_runtime_args, runtime_config
+from sampling import compare_outputs, describe_comparison, parse_fraction
+
+# Site → (generator module, metadata JSON)
+SITES = {
+    "hra": (generate_hra_data, "data_metadata"),
+    "cns": (generate_cns_data, "cns_data_metadata"),
+}
+
+
+def _timed_run(site: str, parquet: str, out: str, sample: float | None, workers: int, runtime: dict) -> float:
+    t0 = time.perf_counter()
+    SITES[site][0].run(parquet, out, workers=workers, runtime=runtime, sample=sample)
+    return time.perf_counter() - t0
+
+
+def run(site: str, parquet: str, fraction: float, full_dir: str | None = None,
+        workers: int = DEFAULT_WORKERS, runtime: dict | None = None) -> dict:
+    runtime = dict(runtime or {})
+    metadata = SITES[site][1]
+    with tempfile.TemporaryDirectory() as tmp:
+        full_seconds = None
+        if not full_dir:
+            full_dir = os.path.join(tmp, "full")
+            full_seconds = _timed_run(site, parquet, full_dir, None, workers, runtime)
+        sample_dir = os.path.join(tmp, "sample")
+        sample_seconds = _timed_run(site, parquet, sample_dir, fraction, workers, runtime)
+        with open(os.path.join(sample_dir, f"{metadata}.json"), encoding="utf-8") as f:
+            unscaled = set(json.load(f)["sample"]["unscaled_outputs"])
+        reports = compare_outputs(full_dir, sample_dir)
+    reports.pop(metadata, None)
+    scaled = {name: r for name, r in reports.items() if name not in unscaled}
+
+    print(f"\n{describe_comparison(scaled)}")
+    if unscaled:
+        print(f"Not scaled (users / sessions of the sample): {', '.join(sorted(unscaled))}")
+    full = f"full {full_seconds:.2f}s, " if full_seconds is not None else ""
+    print(f"Total: {full}{fraction:.0%} sample {sample_seconds:.2f}s")
+    return {
+        "site": site,
+        "parquet": parquet,
+        "fraction": fraction,
+        "full_seconds": round(full_seconds, 3) if full_seconds is not None else None,
+        "sample_seconds": round(sample_seconds, 3),
+        "unscaled_outputs": sorted(unscaled),
+        "outputs": reports,
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare a --sample preview with a full run of the same parquet")
+    p.add_argument("--site", choices=sorted(SITES), default="hra")
+    p.add_argument("--parquet", default=None,
+                   help="Source parquet file, glob, or directory (default: the site generator's default)")
+    p.add_argument("--fraction", type=parse_fraction, default=0.05, help="Share of the users kept by the sample")
+    p.add_argument("--full-dir", default=None,
+                   help="Outputs of an earlier full run of the same parquet, instead of running it again")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help="Aggregations run concurrently on this many cursors")
+    add_runtime_args(p)
+    p.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    parquet = args.parquet or SITES[args.site][0].PARQUET_DEFAULT
+    result = run(args.site, parquet, args.fraction, args.full_dir, args.workers, runtime_config(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Rewrite a log dataset sorted for row-group pruning.
+
+Parquet keeps the min/max of every column per row group, and DuckDB skips
+the row groups whose ranges exclude a filter pushed into the scan (e.g.
+`site='Events' AND cs_uri_stem='/tr'` or `date >= '2018-01-01'`). Logs
+written in delivery order mix every site, path and day in every row group,
+so nothing can be skipped. This script rewrites `--parquet` sorted by
+`--sort` (default site, date, cs_uri_stem), so each row group covers one
+site, a short run of days and few paths:
+
+  - a hive-partitioned source (`year=/month=` directories) keeps its
+    layout; the files of every partition are sorted into one file of their
+    own, so the sort never holds more than one partition
+  - `--row-group-rows` and `--compression` set the row groups and codec of
+    the output (see DEFAULT_ROW_GROUP_ROWS, DEFAULT_COMPRESSION)
+  - no row is added, dropped or changed; duplicates are still removed on
+    load
+
+`_row_groups.json` next to the output lists every row group with its row
+count and the min/max of INDEX_COLUMNS (`row_group_index`), so a tool can
+see which row groups a filter touches without opening the parquet footers.
+`benchmark_compaction.py` counts the row groups each pipeline query skips
+before and after.
+
+Usage:
+    python data_processing/compact_logs.py --parquet data/hra/logs --out data/hra/logs_compacted
+    python data_processing/compact_logs.py --parquet data/cns/cns.parquet --out data/cns/compacted --sort date,cs_uri_stem
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from typing import Any, Iterable, Mapping, Sequence
+
+import duckdb
+
+from log_store import dataset_files, sql_escape
+from runtime_config import add_runtime_args, apply_runtime, runtime_config
+
+INDEX_FILE = "_row_groups.json"
+SORT_COLUMNS = ("site", "date", "cs_uri_stem")
+# Columns whose row-group ranges the sidecar index keeps (those present)
+INDEX_COLUMNS = ("site", "date", "cs_uri_stem", "traffic_type", "year", "month")
+# On 3M synthetic HRA rows, 50k-row groups (DuckDB writes multiples of 2,048)
+# let a one-month date window skip 88% of the rows, against 68% at DuckDB's
+# default of 122,880; the site filters skip as much at either size. zstd
+# makes the sorted copy 226 MiB, against 329 MiB with snappy and 397 MiB for
+# the delivery-ordered source, for slightly slower scans.
+DEFAULT_ROW_GROUP_ROWS = 50_000
+DEFAULT_COMPRESSION = "zstd"
+COMPRESSIONS = ("zstd", "snappy", "gzip", "lz4", "uncompressed")
+
+# A pushed-down filter zone maps can decide: `column <op> literal`, as DuckDB prints it
+_CONDITION = re.compile(r"^\(?(\w+)\s*(=|!=|<>|>=|<=|>|<)\s*('(?:[^']|'')*'|-?\d+(?:\.\d+)?)(?:::\w+)?\)?$")
+
+
+def _stat(value: str | None, physical: str | None = None) -> Any:
+    """A min/max statistic as a comparable value (dates and timestamps stay ISO strings)."""
+    if value is None:
+        return None
+    if physical in (None, "INT32", "INT64") and re.fullmatch(r"-?\d+", value):
+        return int(value)
+    if physical in ("FLOAT", "DOUBLE"):
+        return float(value)
+    return value
+
+
+def row_group_index(parquet: str, columns: Iterable[str] = INDEX_COLUMNS) -> list[dict[str, Any]]:
+    """
+    Every row group of `parquet` with its file (relative to the dataset),
+    row count and `[min, max]` of each of `columns` it has statistics for.
+    Hive partition keys have their directory's value as both bounds.
+    """
+    files = dataset_files(parquet)
+    if not files:
+        return []
+    root = parquet if os.path.isdir(parquet) else os.path.dirname(files[0])
+    columns = set(columns)
+    con = duckdb.connect()
+    try:
+        rows = con.execute(f"""
+            SELECT file_name, row_group_id, row_group_num_rows, path_in_schema, type, stats_min_value, stats_max_value
+            FROM parquet_metadata([{', '.join(f"'{sql_escape(path)}'" for path in files)}])
+            ORDER BY file_name, row_group_id
+        """).fetchall()
+    finally:
+        con.close()
+    groups: dict[tuple[str, int], dict[str, Any]] = {}
+    for file, group, n, column, physical, low, high in rows:
+        entry = groups.setdefault((file, group), {
+            "file": os.path.relpath(file, root), "row_group": group, "rows": n,
+            "ranges": {key: [_stat(value)] * 2 for key, value in
+                       (part.split("=", 1) for part in os.path.relpath(file, root).split(os.sep)[:-1] if "=" in part)
+                       if key in columns},
+        })
+        if column in columns and low is not None and high is not None:
+            entry["ranges"][column] = [_stat(low, physical), _stat(high, physical)]
+    return list(groups.values())
+
+
+def conjuncts(text: str) -> list[str]:
+    """The top-level `AND` terms of a filter (DuckDB joins those on one column)."""
+    terms, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(text):
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and depth == 0 and text.startswith(" AND ", i):
+            terms.append(text[start:i])
+            start = i + len(" AND ")
+    return [term.strip() for term in [*terms, text[start:]] if term.strip()]
+
+
+def zone_conditions(filters: Iterable[str]) -> list[tuple[str, str, Any]]:
+    """
+    The `(column, operator, value)` conditions among `filters` (the pushed
+    filters of a parquet scan) that row-group min/max can rule out. The rest
+    (functions, IS NULL, ORs, ...) never skip a row group here.
+    """
+    conditions = []
+    for text in (term for text in filters for term in conjuncts(text)):
+        match = _CONDITION.match(text)
+        if match:
+            column, op, literal = match.groups()
+            value = literal[1:-1].replace("''", "'") if literal.startswith("'") else _stat(literal)
+            conditions.append((column, "!=" if op == "<>" else op, value))
+    return conditions
+
+
+def may_match(ranges: Mapping[str, Sequence[Any]], conditions: Iterable[tuple[str, str, Any]]) -> bool:
+    """Whether rows within `ranges` can satisfy every condition (unknown columns can)."""
+    for column, op, value in conditions:
+        if column not in ranges:
+            continue
+        low, high = ranges[column]
+        try:
+            excluded = {
+                "=": value < low or value > high,
+                "!=": low == high == value,
+                ">": high <= value,
+                ">=": high < value,
+                "<": low >= value,
+                "<=": low > value,
+            }[op]
+        except TypeError:
+            # e.g. a VARCHAR partition value against a number
+            excluded = False
+        if excluded:
+            return False
+    return True
+
+
+def skipped(index: Sequence[Mapping[str, Any]], conditions: Sequence[tuple[str, str, Any]]) -> dict[str, int]:
+    """Row groups (and their rows) of `index` that `conditions` let a scan skip."""
+    pruned = [group for group in index if not may_match(group["ranges"], conditions)]
+    return {"row_groups": len(pruned), "rows": sum(group["rows"] for group in pruned),
+            "total_row_groups": len(index), "total_rows": sum(group["rows"] for group in index)}
+
+
+def compact(
+    parquet: str,
+    out: str,
+    sort: Sequence[str] = SORT_COLUMNS,
+    row_group_rows: int = DEFAULT_ROW_GROUP_ROWS,
+    compression: str = DEFAULT_COMPRESSION,
+    runtime: Mapping[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Write the rows of `parquet` sorted by `sort` to the dataset directory
+    `out` (replaced when it exists), and its INDEX_FILE. The files of each
+    directory of the source (each hive partition) become one sorted file in
+    the same directory of `out`. Returns the row counts, sizes and timing.
+    """
+    files = dataset_files(parquet)
+    if not files:
+        raise FileNotFoundError(f"Parquet not found: {parquet}")
+    if os.path.abspath(out) in {os.path.abspath(parquet), *(os.path.dirname(os.path.abspath(f)) for f in files)}:
+        raise ValueError("--out must not hold the source files; write the compacted copy elsewhere, then swap it in")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression!r} (expected one of {COMPRESSIONS})")
+    start = time.perf_counter()
+    root = parquet if os.path.isdir(parquet) else os.path.dirname(files[0])
+    partitions: dict[str, list[str]] = {}
+    for path in files:
+        partitions.setdefault(os.path.relpath(os.path.dirname(path), root), []).append(path)
+
+    con = duckdb.connect()
+    apply_runtime(con, runtime or {})
+    staging = f"{out.rstrip(os.sep)}.compacting"
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        for directory, paths in partitions.items():
+            # Partition keys stay in the directory names, exactly as delivered
+            listed = ", ".join(f"'{sql_escape(path)}'" for path in paths)
+            src = f"read_parquet([{listed}], union_by_name = true, hive_partitioning = false)"
+            available = {row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {src}").fetchall()}
+            order = [col for col in sort if col in available]
+            if not order:
+                raise ValueError(f"None of the sort columns {', '.join(sort)} is in {parquet}")
+            os.makedirs(os.path.join(staging, directory), exist_ok=True)
+            con.execute(f"""
+                COPY (SELECT * FROM {src} ORDER BY {', '.join(order)})
+                TO '{sql_escape(os.path.join(staging, directory, 'part-0.parquet'))}'
+                (FORMAT PARQUET, COMPRESSION {compression}, ROW_GROUP_SIZE {int(row_group_rows)})
+            """)
+        index = row_group_index(staging)
+        with open(os.path.join(staging, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump({"sort": order, "row_group_rows": row_group_rows, "compression": compression,
+                       "columns": sorted({col for group in index for col in group["ranges"]}),
+                       "row_groups": index}, f, indent=1)
+        shutil.rmtree(out, ignore_errors=True)
+        os.replace(staging, out)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        con.close()
+    return {
+        "source": parquet,
+        "out": out,
+        "sort": order,
+        "rows": sum(group["rows"] for group in index),
+        "partitions": len(partitions),
+        "row_groups": len(index),
+        "source_row_groups": len(row_group_index(parquet, ())),
+        "bytes": sum(os.path.getsize(path) for path in dataset_files(out)),
+        "source_bytes": sum(os.path.getsize(path) for path in files),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def load_index(out: str) -> dict[str, Any]:
+    """The INDEX_FILE of a compacted dataset."""
+    with open(os.path.join(out, INDEX_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def describe_compaction(summary: Mapping[str, Any]) -> str:
+    return (f"Compacted {summary['rows']:,} rows sorted by {', '.join(summary['sort'])} into {summary['out']}/ in "
+            f"{summary['seconds']:.1f}s: {summary['source_row_groups']:,} -> {summary['row_groups']:,} row groups "
+            f"in {summary['partitions']:,} partitions, {summary['source_bytes'] / 2**20:.1f} -> "
+            f"{summary['bytes'] / 2**20:.1f} MiB")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Rewrite a log dataset sorted for row-group pruning")
+    p.add_argument("--parquet", required=True, help="Source parquet file, glob, or directory of (hive-partitioned) files")
+    p.add_argument("--out", required=True, help="Output dataset directory (replaced); must not hold the source")
+    p.add_argument("--sort", type=lambda v: [col.strip() for col in v.split(",") if col.strip()],
+                   default=list(SORT_COLUMNS), help=f"Comma-separated sort columns (default {','.join(SORT_COLUMNS)})")
+    p.add_argument("--row-group-rows", type=int, default=DEFAULT_ROW_GROUP_ROWS,
+                   help=f"Rows per row group, rounded up to a multiple of 2048 (default {DEFAULT_ROW_GROUP_ROWS})")
+    p.add_argument("--compression", choices=COMPRESSIONS, default=DEFAULT_COMPRESSION,
+                   help=f"Parquet codec (default {DEFAULT_COMPRESSION})")
+    add_runtime_args(p)
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(describe_compaction(compact(args.parquet, args.out, args.sort, args.row_group_rows, args.compression,
+                                      runtime_config(args))))
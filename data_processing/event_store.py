@@ -0,0 +1,57 @@
+"""
+Flattened Events `/tr` pings shared by the HRA aggregation and ML scripts.
+
+UI event pings carry their payload in the `query` MAP. Looking keys up in a
+MAP is far more expensive than reading a column, and the scripts used to
+repeat the same lookups in WHERE, SELECT and GROUP BY of every event query.
+Instead the keys a script needs are extracted into plain columns while the
+logs are loaded (`materialize_logs(derived=event_fields(...))`), and
+`materialize_events` filters the human `/tr` pings once into a compact
+`events` table without the MAP.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+import duckdb
+
+# Shared predicate of every Events/`/tr` aggregation (UI event pings from humans)
+EVENTS_FILTER = "site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'"
+
+# Column name → key of the `query` MAP it is extracted from
+EVENT_FIELDS = {
+    "event_type": "event",
+    "app": "app",
+    "path": "path",
+    "session_id": "sessionId",
+    "e_label": "e.label",
+    "e_action": "e.action",
+    "e_tab": "e.tab",
+    "e_value": "e.value",
+    "e_message": "e.message",
+    "e_path": "e.path",
+    "e_reason_message": "e.reason.message",
+    "e_reason_stack": "e.reason.stack",
+}
+
+
+def event_fields(names: Iterable[str] | None = None) -> dict[str, str]:
+    """`{column: SQL expression}` extracting `names` (all fields when None) from `query`."""
+    names = list(EVENT_FIELDS) if names is None else list(names)
+    unknown = [name for name in names if name not in EVENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown event fields: {', '.join(unknown)}")
+    return {name: f"query['{EVENT_FIELDS[name]}']" for name in names}
+
+
+def materialize_events(
+    con: duckdb.DuckDBPyConnection,
+    source: str = "logs",
+    name: str = "events",
+    columns: Iterable[str] | None = None,
+) -> int:
+    """Create `name` from the `EVENTS_FILTER` rows of `source`; returns its row count."""
+    projection = ", ".join(columns) if columns else "*"
+    con.execute(f"CREATE TABLE {name} AS SELECT {projection} FROM {source} WHERE {EVENTS_FILTER}")
+    return con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
@@ -10,6 +10,8 @@ from pathlib import Path
 
 import duckdb
 
+from shared_logs import store_status
+
 def _latest_parquet(directory: str) -> Path:
     import glob, os
     files = sorted(glob.glob(os.path.join(directory, "*.parquet")), key=os.path.getmtime, reverse=True)
@@ -242,11 +244,13 @@ def extract_row_count(con: duckdb.DuckDBPyConnection, parquet_path: Path) -> int
     return int(con.execute(f"SELECT COUNT(*)::BIGINT FROM read_parquet('{parquet_sql}')").fetchone()[0])
 
 
-def run(parquet_path: Path, out_path: Path) -> None:
+def run(parquet_path: Path, out_path: Path, log_store: Path | None = None) -> None:
+    # An up-to-date shared log store already counted the rows of this parquet
+    store = store_status(str(log_store), str(parquet_path)) if log_store else None
     con = duckdb.connect()
     try:
         fields = extract_schema(con, parquet_path)
-        row_count = extract_row_count(con, parquet_path)
+        row_count = store["raw_rows"] if store else extract_row_count(con, parquet_path)
     finally:
         con.close()
 
@@ -256,6 +260,8 @@ def run(parquet_path: Path, out_path: Path) -> None:
         "row_count": row_count,
         "fields": fields,
     }
+    if store:
+        payload["deduped_row_count"] = store["deduped_rows"]
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
     out_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
@@ -268,9 +274,11 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--parquet", default=str(DEFAULT_PARQUET), help="Input parquet path")
     parser.add_argument("--out", default=str(DEFAULT_OUT), help="Output JSON path")
+    parser.add_argument("--log-store", default=None,
+                        help="Shared log store (see generate_hra_data.py --log-store) to take the row counts from")
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    run(Path(args.parquet), Path(args.out))
+    run(Path(args.parquet), Path(args.out), Path(args.log_store) if args.log_store else None)
@@ -12,18 +12,45 @@ Usage:
 
 import json
 import os
+import time
 import argparse
+from datetime import date
 from pathlib import Path
+from typing import Any, Mapping, Sequence
 
 import duckdb
 
-def _latest_parquet(directory: str, pattern: str = "*.parquet") -> str:
-    import glob
-    files = sorted(glob.glob(os.path.join(directory, pattern)), key=os.path.getmtime, reverse=True)
-    return files[0] if files else ""
-
-PARQUET_DEFAULT = _latest_parquet("data/cns") or "data/cns/2026-04-06_cns-logs.parquet"
+from aggregation_registry import Registry
+from incremental_state import (
+    DEFAULT_LOOKBACK_DAYS, PART, build_partials, describe_plan, open_state, plan_refresh,
+)
+from log_store import (
+    DEDUP_KEYS, DEDUP_MODES, DEFAULT_DEDUP_KEY, default_source, describe_scan, describe_verification, hive_keys,
+    load_definition, materialize_logs, verify_dedup,
+)
+from output_cache import OutputCache
+from query_pool import DEFAULT_WORKERS, QueryPool, describe_stats, records
+from query_profile import PROFILE_FILE, describe_profile, write_profile
+from runtime_config import add_runtime_args, apply_runtime, describe_runtime, record_runtime, runtime_config
+from sampling import parse_fraction, sample_metadata, sample_predicate, scale_counts
+from time_window import check_window, combine, describe_window, parse_day, window_metadata, window_predicate
+
+PARQUET_DEFAULT = default_source("data/cns") or "data/cns/2026-04-06_cns-logs.parquet"
 OUT_DEFAULT = "public/data/cns"
+STATE_DEFAULT = "data/cns/cns_state.duckdb"
+CACHE_DEFAULT = "data/cns/output_cache"
+PROFILE_DEFAULT = f"data/cns/{PROFILE_FILE}"
+
+# Columns read by the aggregations below (cs_Referer resolves to cs_referer)
+LOG_COLUMNS = (
+    "date", "year", "month", "time", "traffic_type", "c_country",
+    "cs_uri_stem", "cs_uri_query", "cs_referer", "referrer", "sc_status",
+)
+# Types of the date columns when a hive-partitioned source only has them as
+# `year=/month=/day=` directories (as stored in the monolithic parquet)
+PARTITION_TYPES = {"year": "VARCHAR", "month": "VARCHAR", "day": "VARCHAR"}
+# Low-cardinality columns stored as ENUMs (members read from the parquet)
+ENUM_COLUMNS = {"traffic_type": None, "c_country": None}
 
 # Filter out static assets from page-level analysis
 ASSET_FILTER = r"""
@@ -84,433 +111,508 @@ SECURITY_CASE = """CASE
     ELSE NULL
 END"""
 
+WORKSHOP_LABEL = """CASE
+    WHEN cs_uri_stem = '/workshops.html' THEN 'Workshops (index)'
+    WHEN cs_uri_stem = '/events_calendar.html' THEN 'Events Calendar'
+    WHEN regexp_matches(cs_uri_stem, '/workshops/event/\\d{6}\\.html')
+        THEN CASE CAST(substr(split_part(cs_uri_stem, '/', 4), 3, 2) AS INTEGER)
+            WHEN 1 THEN 'Jan'  WHEN 2 THEN 'Feb'  WHEN 3 THEN 'Mar'
+            WHEN 4 THEN 'Apr'  WHEN 5 THEN 'May'  WHEN 6 THEN 'Jun'
+            WHEN 7 THEN 'Jul'  WHEN 8 THEN 'Aug'  WHEN 9 THEN 'Sep'
+            WHEN 10 THEN 'Oct' WHEN 11 THEN 'Nov' WHEN 12 THEN 'Dec'
+            ELSE 'Unk'
+        END || ' 20' || substr(split_part(cs_uri_stem, '/', 4), 1, 2) || ' Workshop'
+    WHEN cs_uri_stem LIKE '/workshops/%' THEN replace(replace(cs_uri_stem, '/workshops/', ''), '.html', '')
+    ELSE cs_uri_stem
+END"""
 
-def write_json(path: str, data: object) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=True)
+
+def partial_queries(P: str) -> dict[str, str]:
+    """
+    Per-month partial aggregates every output below is derived from.
+
+    Each query groups by `part` (month of the row), so a month can be
+    recomputed on its own and the outputs re-aggregate the partials with
+    SUM. `p_<name>` holds the result during a run.
+    """
+    return {
+        "traffic": f"""
+            SELECT {PART} AS part, year, traffic_type,
+                   MIN(date) AS first_date, MAX(date) AS last_date, count(*)::BIGINT AS n
+            FROM {P}
+            GROUP BY ALL
+        """,
+        "hourly": f"""
+            SELECT {PART} AS part, try_cast(split_part(time, ':', 1) AS INTEGER) AS hour,
+                   count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human' AND time IS NOT NULL
+            GROUP BY ALL
+        """,
+        "dow": f"""
+            SELECT {PART} AS part, dayofweek(date) AS dow_num, dayname(date) AS day_name,
+                   count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human'
+            GROUP BY ALL
+        """,
+        "country_traffic": f"""
+            SELECT {PART} AS part, c_country, traffic_type, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE c_country IS NOT NULL AND c_country NOT IN ('-', '')
+            GROUP BY ALL
+        """,
+        # Top pages (no static assets, no probes/scanners)
+        "pages": f"""
+            SELECT {PART} AS part, cs_uri_stem, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human'
+              {ASSET_FILTER}
+              AND cs_uri_stem != '/deadlink.html'
+              AND NOT cs_uri_stem LIKE '/+CSCOT+/%'
+              AND cs_uri_stem != '/wp-login.php'
+              AND NOT cs_uri_stem LIKE '/wp-admin%'
+              AND NOT cs_uri_stem LIKE '/cgi-bin/%'
+              AND NOT cs_uri_stem LIKE '/scripts/%'
+              AND NOT cs_uri_stem LIKE '%@%'
+            GROUP BY ALL
+        """,
+        "pdfs": f"""
+            SELECT {PART} AS part, cs_uri_stem, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human' AND cs_uri_stem LIKE '%.pdf'
+            GROUP BY ALL
+        """,
+        "content": f"""
+            SELECT {PART} AS part, {CONTENT_CASE} AS type, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human'
+              AND cs_uri_stem != '/' AND cs_uri_stem != '//' AND cs_uri_stem != ''
+            GROUP BY ALL
+        """,
+        # Workshop pages (no emails/php)
+        "workshops": f"""
+            SELECT {PART} AS part, cs_uri_stem, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human'
+              AND (cs_uri_stem LIKE '/workshops/%' OR cs_uri_stem = '/workshops.html'
+                   OR cs_uri_stem = '/events_calendar.html')
+              AND NOT regexp_matches(cs_uri_stem, '\\.(png|jpg|gif|css|js|php)$')
+              AND NOT cs_uri_stem LIKE '%@%'
+              AND NOT cs_uri_stem LIKE '%www.%'
+              AND NOT cs_uri_stem LIKE '%http%'
+              AND cs_uri_stem NOT IN ('/workshops/event', '/workshops/event/')
+              AND cs_uri_stem NOT LIKE '%/event/dev/%'
+            GROUP BY ALL
+        """,
+        "team": f"""
+            SELECT
+                {PART} AS part,
+                CASE
+                    WHEN cs_uri_stem = '/current_team.html' THEN 'Current Team (index)'
+                    WHEN cs_uri_stem LIKE '/images/people/%.png' OR cs_uri_stem LIKE '/images/people/%.jpg'
+                        THEN regexp_replace(split_part(cs_uri_stem, '/', 4), '\\.(png|jpg)', '')
+                    WHEN cs_uri_stem LIKE '/current_team/bio/%.html'
+                        THEN replace(split_part(cs_uri_stem, '/', 4), '.html', '')
+                    ELSE cs_uri_stem
+                END AS member,
+                count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human'
+              AND (cs_uri_stem LIKE '%team%' OR cs_uri_stem LIKE '/images/people/%'
+                   OR cs_uri_stem = '/current_team.html' OR cs_uri_stem LIKE '/current_team/bio/%')
+            GROUP BY ALL
+        """,
+        "referrers": f"""
+            SELECT {PART} AS part, {REFERRER_DOMAIN} AS domain, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type='Likely Human'
+            GROUP BY ALL
+        """,
+        "statuses": f"""
+            SELECT {PART} AS part, sc_status, count(*)::BIGINT AS n
+            FROM {P}
+            GROUP BY ALL
+        """,
+        "error_paths": f"""
+            SELECT {PART} AS part, year, month, cs_uri_stem, sc_status, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE sc_status >= 400
+            GROUP BY ALL
+        """,
+        "dead_links": f"""
+            SELECT {PART} AS part, cs_uri_query, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE cs_uri_stem = '/deadlink.html'
+              AND cs_uri_query IS NOT NULL AND cs_uri_query NOT IN ('-', '')
+            GROUP BY ALL
+        """,
+        "security": f"""
+            SELECT {PART} AS part, {SECURITY_CASE} AS signal_type, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE {SECURITY_CASE} IS NOT NULL
+            GROUP BY ALL
+        """,
+    }
+
+
+def report(path: str) -> None:
     print(f"  \u2713 {os.path.basename(path)}")
 
 
-def run(parquet: str, out: str) -> None:
-    os.makedirs(out, exist_ok=True)
-    con = duckdb.connect()
-    con.execute("PRAGMA threads=4")
-
-    # Deduplicate parquet on load
-    raw_count = con.execute(f"SELECT count(*) FROM read_parquet('{parquet}')").fetchone()[0]
-    con.execute(f"CREATE TEMP VIEW logs AS SELECT DISTINCT * FROM read_parquet('{parquet}')")
-    deduped_count = con.execute("SELECT count(*) FROM logs").fetchone()[0]
-    dupes = raw_count - deduped_count
-    if dupes > 0:
-        print(f"\u26a0 Removed {dupes:,} duplicate rows ({dupes/raw_count*100:.2f}%) \u2014 {deduped_count:,} rows remain")
-    P = "logs"
+def write_json(path: str, data: object) -> None:
+    # One-shot json.dumps runs the C encoder (see generate_hra_data.write_json)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, ensure_ascii=True, default=float))
+    report(path)
 
-    def q(sql: str):
-        return con.execute(sql).df().to_dict(orient="records")
 
+def register_outputs(reg: Registry, out: str) -> None:
+    """
+    Register every dashboard JSON output. They read only the p_* partial
+    aggregates, plus cns_publications.json in `out` (when present) to title
+    the top PDFs.
+    """
     # ─── 0. Metadata ─────────────────────────────────────────────────────────
-    date_range = con.execute(f"""
-        SELECT
-            MIN(date)::VARCHAR AS first_date,
-            MAX(date)::VARCHAR AS last_date,
-            count(*)::BIGINT AS total_rows
-        FROM {P}
-    """).fetchone()
-    write_json(f"{out}/cns_data_metadata.json", {
-        "first_date": date_range[0],
-        "last_date": date_range[1],
-        "total_rows": date_range[2],
-    })
+    @reg.python("cns_data_metadata", inputs=("p_traffic",))
+    def metadata(cur):
+        date_range = cur.execute("""
+            SELECT
+                MIN(first_date)::VARCHAR AS first_date,
+                MAX(last_date)::VARCHAR AS last_date,
+                SUM(n)::BIGINT AS total_rows
+            FROM p_traffic
+        """).fetchone()
+        return {
+            "first_date": date_range[0],
+            "last_date": date_range[1],
+            "total_rows": date_range[2],
+        }
 
     # ─── 1. Traffic types ─────────────────────────────────────────────────────
-    write_json(f"{out}/cns_traffic_types.json", q(f"""
-        SELECT traffic_type AS type, count(*)::BIGINT AS count
-        FROM {P}
+    reg.sql("cns_traffic_types", """
+        SELECT traffic_type AS type, SUM(n)::BIGINT AS count
+        FROM p_traffic
         WHERE traffic_type IS NOT NULL
         GROUP BY traffic_type ORDER BY count DESC
-    """))
+    """)
 
     # ─── 2. Monthly visits (human/bot/AI) ─────────────────────────────────────
-    write_json(f"{out}/cns_monthly_visits.json", q(f"""
+    reg.sql("cns_monthly_visits", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            SUM(CASE WHEN traffic_type='Likely Human' THEN 1 ELSE 0 END)::BIGINT AS human,
-            SUM(CASE WHEN traffic_type='Bot' THEN 1 ELSE 0 END)::BIGINT AS bot,
-            SUM(CASE WHEN traffic_type='AI-Assistant / Bot' THEN 1 ELSE 0 END)::BIGINT AS ai_bot,
-            count(*)::BIGINT AS total
-        FROM {P}
-        WHERE date >= '2015-01-01'
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(CASE WHEN traffic_type='Likely Human' THEN n ELSE 0 END)::BIGINT AS human,
+            SUM(CASE WHEN traffic_type='Bot' THEN n ELSE 0 END)::BIGINT AS bot,
+            SUM(CASE WHEN traffic_type='AI-Assistant / Bot' THEN n ELSE 0 END)::BIGINT AS ai_bot,
+            SUM(n)::BIGINT AS total
+        FROM p_traffic
+        WHERE part >= DATE '2015-01-01'
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 3. Yearly visits ─────────────────────────────────────────────────────
-    write_json(f"{out}/cns_yearly_visits.json", q(f"""
+    reg.sql("cns_yearly_visits", """
         SELECT
             year AS year,
-            SUM(CASE WHEN traffic_type='Likely Human' THEN 1 ELSE 0 END)::BIGINT AS human,
-            SUM(CASE WHEN traffic_type='Bot' THEN 1 ELSE 0 END)::BIGINT AS bot,
-            SUM(CASE WHEN traffic_type='AI-Assistant / Bot' THEN 1 ELSE 0 END)::BIGINT AS ai_bot,
-            count(*)::BIGINT AS total
-        FROM {P}
+            SUM(CASE WHEN traffic_type='Likely Human' THEN n ELSE 0 END)::BIGINT AS human,
+            SUM(CASE WHEN traffic_type='Bot' THEN n ELSE 0 END)::BIGINT AS bot,
+            SUM(CASE WHEN traffic_type='AI-Assistant / Bot' THEN n ELSE 0 END)::BIGINT AS ai_bot,
+            SUM(n)::BIGINT AS total
+        FROM p_traffic
         WHERE CAST(year AS INTEGER) >= 2015
         GROUP BY year ORDER BY year
-    """))
+    """)
 
     # ─── 4. Hourly traffic ────────────────────────────────────────────────────
-    write_json(f"{out}/cns_hourly_traffic.json", q(f"""
-        SELECT
-            try_cast(split_part(time, ':', 1) AS INTEGER) AS hour,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE traffic_type='Likely Human' AND time IS NOT NULL
+    reg.sql("cns_hourly_traffic", """
+        SELECT hour, SUM(n)::BIGINT AS count
+        FROM p_hourly
         GROUP BY hour
         HAVING hour IS NOT NULL
         ORDER BY hour
-    """))
+    """)
 
     # ─── 5. Day of week ──────────────────────────────────────────────────────
-    write_json(f"{out}/cns_traffic_by_dow.json", q(f"""
-        SELECT
-            dayofweek(date) AS dow_num,
-            dayname(date) AS day_name,
-            count(*)::BIGINT AS visits
-        FROM {P}
-        WHERE traffic_type='Likely Human'
+    reg.sql("cns_traffic_by_dow", """
+        SELECT dow_num, day_name, SUM(n)::BIGINT AS visits
+        FROM p_dow
         GROUP BY dow_num, day_name
         ORDER BY dow_num
-    """))
+    """)
 
     # ─── 6. Geographic distribution ───────────────────────────────────────────
-    write_json(f"{out}/cns_geo_distribution.json", q(f"""
-        SELECT c_country, count(*)::BIGINT AS visits
-        FROM {P}
+    reg.sql("cns_geo_distribution", """
+        SELECT c_country, SUM(n)::BIGINT AS visits
+        FROM p_country_traffic
         WHERE traffic_type='Likely Human'
-          AND c_country IS NOT NULL AND c_country NOT IN ('-', '')
         GROUP BY c_country ORDER BY visits DESC
-    """))
+    """)
 
     # ─── 7. Geo bot traffic ──────────────────────────────────────────────────
-    write_json(f"{out}/cns_geo_bot_traffic.json", q(f"""
+    reg.sql("cns_geo_bot_traffic", """
         SELECT
             c_country,
-            SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN 1 ELSE 0 END)::BIGINT AS bot_visits,
-            count(*)::BIGINT AS total_requests,
-            round(100.0 * SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN 1 ELSE 0 END)
-                  / count(*), 1) AS bot_pct
-        FROM {P}
-        WHERE c_country IS NOT NULL AND c_country NOT IN ('-', '')
+            SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN n ELSE 0 END)::BIGINT AS bot_visits,
+            SUM(n)::BIGINT AS total_requests,
+            round(100.0 * SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN n ELSE 0 END)
+                  / SUM(n), 1) AS bot_pct
+        FROM p_country_traffic
         GROUP BY c_country
         HAVING total_requests > 100
         ORDER BY bot_visits DESC
         LIMIT 30
-    """))
+    """)
 
     # ─── 8. Top pages (no static assets, no probes/scanners) ──────────────────
-    write_json(f"{out}/cns_top_pages.json", q(f"""
+    reg.sql("cns_top_pages", """
         SELECT page, sum(visits)::BIGINT AS visits FROM (
-            SELECT regexp_replace(cs_uri_stem, '^/+', '/') AS page, count(*)::BIGINT AS visits
-            FROM {P}
-            WHERE traffic_type='Likely Human'
-              {ASSET_FILTER}
-              AND cs_uri_stem != '/deadlink.html'
-              AND NOT cs_uri_stem LIKE '/+CSCOT+/%'
-              AND cs_uri_stem != '/wp-login.php'
-              AND NOT cs_uri_stem LIKE '/wp-admin%'
-              AND NOT cs_uri_stem LIKE '/cgi-bin/%'
-              AND NOT cs_uri_stem LIKE '/scripts/%'
-              AND NOT cs_uri_stem LIKE '%@%'
+            SELECT regexp_replace(cs_uri_stem, '^/+', '/') AS page, SUM(n)::BIGINT AS visits
+            FROM p_pages
             GROUP BY cs_uri_stem
         )
         GROUP BY page ORDER BY visits DESC LIMIT 30
-    """))
-
-    # ─── 9. Top PDF downloads ─────────────────────────────────────────────────
-    top_pdfs_raw = q(f"""
-        WITH normalized AS (
-            SELECT regexp_replace(cs_uri_stem, '^/+', '/') AS pdf, count(*)::BIGINT AS downloads
-            FROM {P}
-            WHERE traffic_type='Likely Human' AND cs_uri_stem LIKE '%.pdf'
-            GROUP BY pdf
-        )
-        SELECT
-            pdf,
-            CASE
-                WHEN pdf LIKE '/docs/publications/%' OR pdf LIKE '/images/pub/%' THEN 'Publications'
-                WHEN pdf LIKE '/docs/presentations/%' THEN 'Presentations'
-                WHEN pdf LIKE '/docs/news/%' THEN 'News'
-                WHEN pdf LIKE '/docs/handouts/%' OR pdf LIKE '/docs/netscitalks/%' THEN 'Handouts'
-                ELSE 'Other PDFs'
-            END AS category,
-            sum(downloads)::BIGINT AS downloads
-        FROM normalized
-        GROUP BY pdf, category ORDER BY downloads DESC LIMIT 30
     """)
 
-    # Post-process: match each PDF to a publication title from cns_publications.json (if available)
-    pubs_path = Path(out) / "cns_publications.json"
-    if pubs_path.exists():
-        from urllib.parse import unquote
-        with open(pubs_path, encoding="utf-8") as f:
-            publications = json.load(f)
-
-        def norm_filename(name: str) -> str:
-            """Normalize filename for fuzzy matching: lowercase, remove %-encoding, strip extension."""
-            name = unquote(name).lower()
-            name = name.rsplit("/", 1)[-1]
-            name = name.replace(".pdf", "").replace("%20", "").replace(" ", "").replace("_", "-")
-            return name
-
-        # Build lookup by normalized filename
-        pdf_to_pub: dict[str, dict] = {}
-        for p in publications:
-            url = p.get("url", "") or ""
-            if "cns.iu.edu" in url and ".pdf" in url:
-                path = unquote(url).split("cns.iu.edu", 1)[1]
-                key = norm_filename(path)
-                pdf_to_pub[key] = {
-                    "title": p.get("title", ""),
-                    "doi": p.get("doi", ""),
-                    "authors": p.get("authors", [])[:3],
-                    "pub_date": p.get("pub_date", ""),
-                }
-
-        # Enrich top PDFs with titles
-        matched_count = 0
-        for row in top_pdfs_raw:
-            key = norm_filename(row["pdf"])
-            match = pdf_to_pub.get(key)
-            if match:
-                row["title"] = match["title"]
-                row["doi"] = match["doi"]
-                row["authors"] = match["authors"]
-                row["pub_date"] = match["pub_date"]
-                matched_count += 1
-        print(f"  Matched {matched_count}/{len(top_pdfs_raw)} PDFs to publication titles")
-
-    write_json(f"{out}/cns_top_pdfs.json", top_pdfs_raw)
+    # ─── 9. Top PDF downloads ─────────────────────────────────────────────────
+    @reg.python("cns_top_pdfs", inputs=("p_pdfs",), files=(f"{out}/cns_publications.json",))
+    def top_pdfs(cur):
+        top_pdfs_raw = records(cur, """
+            WITH normalized AS (
+                SELECT regexp_replace(cs_uri_stem, '^/+', '/') AS pdf, SUM(n)::BIGINT AS downloads
+                FROM p_pdfs
+                GROUP BY pdf
+            )
+            SELECT
+                pdf,
+                CASE
+                    WHEN pdf LIKE '/docs/publications/%' OR pdf LIKE '/images/pub/%' THEN 'Publications'
+                    WHEN pdf LIKE '/docs/presentations/%' THEN 'Presentations'
+                    WHEN pdf LIKE '/docs/news/%' THEN 'News'
+                    WHEN pdf LIKE '/docs/handouts/%' OR pdf LIKE '/docs/netscitalks/%' THEN 'Handouts'
+                    ELSE 'Other PDFs'
+                END AS category,
+                sum(downloads)::BIGINT AS downloads
+            FROM normalized
+            GROUP BY pdf, category ORDER BY downloads DESC LIMIT 30
+        """)
+
+        # Post-process: match each PDF to a publication title from cns_publications.json (if available)
+        pubs_path = Path(out) / "cns_publications.json"
+        if pubs_path.exists():
+            from urllib.parse import unquote
+            with open(pubs_path, encoding="utf-8") as f:
+                publications = json.load(f)
+
+            def norm_filename(name: str) -> str:
+                """Normalize filename for fuzzy matching: lowercase, remove %-encoding, strip extension."""
+                name = unquote(name).lower()
+                name = name.rsplit("/", 1)[-1]
+                name = name.replace(".pdf", "").replace("%20", "").replace(" ", "").replace("_", "-")
+                return name
+
+            # Build lookup by normalized filename
+            pdf_to_pub: dict[str, dict] = {}
+            for p in publications:
+                url = p.get("url", "") or ""
+                if "cns.iu.edu" in url and ".pdf" in url:
+                    path = unquote(url).split("cns.iu.edu", 1)[1]
+                    key = norm_filename(path)
+                    pdf_to_pub[key] = {
+                        "title": p.get("title", ""),
+                        "doi": p.get("doi", ""),
+                        "authors": p.get("authors", [])[:3],
+                        "pub_date": p.get("pub_date", ""),
+                    }
+
+            # Enrich top PDFs with titles
+            matched_count = 0
+            for row in top_pdfs_raw:
+                key = norm_filename(row["pdf"])
+                match = pdf_to_pub.get(key)
+                if match:
+                    row["title"] = match["title"]
+                    row["doi"] = match["doi"]
+                    row["authors"] = match["authors"]
+                    row["pub_date"] = match["pub_date"]
+                    matched_count += 1
+            print(f"  Matched {matched_count}/{len(top_pdfs_raw)} PDFs to publication titles")
+
+        return top_pdfs_raw
 
     # ─── 10. PDF downloads monthly trend ──────────────────────────────────────
-    write_json(f"{out}/cns_pdf_monthly.json", q(f"""
+    reg.sql("cns_pdf_monthly", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            count(*)::BIGINT AS downloads
-        FROM {P}
-        WHERE traffic_type='Likely Human' AND cs_uri_stem LIKE '%.pdf'
-          AND date >= '2018-01-01'
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(n)::BIGINT AS downloads
+        FROM p_pdfs
+        WHERE part >= DATE '2018-01-01'
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 11. Content type breakdown (exclude catch-all "Other Pages") ─────────
-    write_json(f"{out}/cns_content_breakdown.json", q(f"""
+    reg.sql("cns_content_breakdown", """
         SELECT type, count
         FROM (
-            SELECT
-                {CONTENT_CASE} AS type,
-                count(*)::BIGINT AS count
-            FROM {P}
-            WHERE traffic_type='Likely Human'
-              AND cs_uri_stem != '/' AND cs_uri_stem != '//' AND cs_uri_stem != ''
+            SELECT type, SUM(n)::BIGINT AS count
+            FROM p_content
             GROUP BY type
         )
         WHERE type != 'Other Pages'
         ORDER BY count DESC
-    """))
+    """)
 
     # ─── 12. Workshop pages (readable labels, no emails/php) ──────────────────
-    write_json(f"{out}/cns_workshop_pages.json", q(f"""
+    reg.sql("cns_workshop_pages", f"""
         SELECT label AS page, SUM(visits)::BIGINT AS visits
         FROM (
-            SELECT
-                cs_uri_stem,
-                count(*)::BIGINT AS visits,
-                CASE
-                    WHEN cs_uri_stem = '/workshops.html' THEN 'Workshops (index)'
-                    WHEN cs_uri_stem = '/events_calendar.html' THEN 'Events Calendar'
-                    WHEN regexp_matches(cs_uri_stem, '/workshops/event/\\d{{6}}\\.html')
-                        THEN CASE CAST(substr(split_part(cs_uri_stem, '/', 4), 3, 2) AS INTEGER)
-                            WHEN 1 THEN 'Jan'  WHEN 2 THEN 'Feb'  WHEN 3 THEN 'Mar'
-                            WHEN 4 THEN 'Apr'  WHEN 5 THEN 'May'  WHEN 6 THEN 'Jun'
-                            WHEN 7 THEN 'Jul'  WHEN 8 THEN 'Aug'  WHEN 9 THEN 'Sep'
-                            WHEN 10 THEN 'Oct' WHEN 11 THEN 'Nov' WHEN 12 THEN 'Dec'
-                            ELSE 'Unk'
-                        END || ' 20' || substr(split_part(cs_uri_stem, '/', 4), 1, 2) || ' Workshop'
-                    WHEN cs_uri_stem LIKE '/workshops/%' THEN replace(replace(cs_uri_stem, '/workshops/', ''), '.html', '')
-                    ELSE cs_uri_stem
-                END AS label
-            FROM {P}
-            WHERE traffic_type='Likely Human'
-              AND (cs_uri_stem LIKE '/workshops/%' OR cs_uri_stem = '/workshops.html'
-                   OR cs_uri_stem = '/events_calendar.html')
-              AND NOT regexp_matches(cs_uri_stem, '\\.(png|jpg|gif|css|js|php)$')
-              AND NOT cs_uri_stem LIKE '%@%'
-              AND NOT cs_uri_stem LIKE '%www.%'
-              AND NOT cs_uri_stem LIKE '%http%'
-              AND cs_uri_stem NOT IN ('/workshops/event', '/workshops/event/')
-              AND cs_uri_stem NOT LIKE '%/event/dev/%'
+            SELECT cs_uri_stem, SUM(n)::BIGINT AS visits, {WORKSHOP_LABEL} AS label
+            FROM p_workshops
             GROUP BY cs_uri_stem
         )
         GROUP BY label ORDER BY visits DESC LIMIT 20
-    """))
-
-    # ─── 13. Team page views ──────────────────────────────────────────────────
-    import re as _re
-    raw_team = q(f"""
-        SELECT
-            CASE
-                WHEN cs_uri_stem = '/current_team.html' THEN 'Current Team (index)'
-                WHEN cs_uri_stem LIKE '/images/people/%.png' OR cs_uri_stem LIKE '/images/people/%.jpg'
-                    THEN regexp_replace(split_part(cs_uri_stem, '/', 4), '\\.(png|jpg)', '')
-                WHEN cs_uri_stem LIKE '/current_team/bio/%.html'
-                    THEN replace(split_part(cs_uri_stem, '/', 4), '.html', '')
-                ELSE cs_uri_stem
-            END AS member,
-            count(*)::BIGINT AS visits
-        FROM {P}
-        WHERE traffic_type='Likely Human'
-          AND (cs_uri_stem LIKE '%team%' OR cs_uri_stem LIKE '/images/people/%'
-               OR cs_uri_stem = '/current_team.html' OR cs_uri_stem LIKE '/current_team/bio/%')
-        GROUP BY member ORDER BY visits DESC
     """)
 
-    # Normalize team member names and merge duplicates
-    def _normalize_member(name: str) -> str:
-        # Skip non-person entries
-        if name in ("Current Team (index)", "AdvisoryBoard", "Advisory Board"):
+    # ─── 13. Team page views ──────────────────────────────────────────────────
+    @reg.python("cns_team_pages", inputs=("p_team",))
+    def team_pages(cur):
+        import re as _re
+        raw_team = records(cur, """
+            SELECT member, SUM(n)::BIGINT AS visits
+            FROM p_team
+            GROUP BY member ORDER BY visits DESC
+        """)
+
+        # Normalize team member names and merge duplicates
+        def _normalize_member(name: str) -> str:
+            # Skip non-person entries
+            if name in ("Current Team (index)", "AdvisoryBoard", "Advisory Board"):
+                return name
+            # Skip placeholders
+            if "placeholder" in name.lower():
+                return ""
+            # Remove _weblrg suffix
+            name = _re.sub(r'_weblrg$', '', name)
+            # Remove file extensions
+            name = _re.sub(r'\.(png|jpg|html)$', '', name)
+            # Extract from paths like /current_team/bio/katy_borner.html
+            if '/' in name:
+                name = name.rstrip('/').split('/')[-1]
+            # Normalize separators: CamelCase → parts, underscores → dashes
+            # Split CamelCase: KatyBorner → Katy Borner
+            name = _re.sub(r'([a-z])([A-Z])', r'\1-\2', name)
+            # Replace underscores with dashes
+            name = name.replace('_', '-').lower().strip('-')
             return name
-        # Skip placeholders
-        if "placeholder" in name.lower():
-            return ""
-        # Remove _weblrg suffix
-        name = _re.sub(r'_weblrg$', '', name)
-        # Remove file extensions
-        name = _re.sub(r'\.(png|jpg|html)$', '', name)
-        # Extract from paths like /current_team/bio/katy_borner.html
-        if '/' in name:
-            name = name.rstrip('/').split('/')[-1]
-        # Normalize separators: CamelCase → parts, underscores → dashes
-        # Split CamelCase: KatyBorner → Katy Borner
-        name = _re.sub(r'([a-z])([A-Z])', r'\1-\2', name)
-        # Replace underscores with dashes
-        name = name.replace('_', '-').lower().strip('-')
-        return name
-
-    merged: dict[str, int] = {}
-    for row in raw_team:
-        normalized = _normalize_member(row["member"])
-        if not normalized:
-            continue
-        merged[normalized] = merged.get(normalized, 0) + row["visits"]
-
-    team_result = sorted(
-        [{"member": k, "visits": v} for k, v in merged.items()],
-        key=lambda x: x["visits"], reverse=True
-    )[:25]
-    write_json(f"{out}/cns_team_pages.json", team_result)
+
+        merged: dict[str, int] = {}
+        for row in raw_team:
+            normalized = _normalize_member(row["member"])
+            if not normalized:
+                continue
+            merged[normalized] = merged.get(normalized, 0) + row["visits"]
+
+        team_result = sorted(
+            [{"member": k, "visits": v} for k, v in merged.items()],
+            key=lambda x: x["visits"], reverse=True
+        )[:25]
+        return team_result
 
     # ─── 14. Referrer domains ─────────────────────────────────────────────────
-    write_json(f"{out}/cns_referrers.json", q(f"""
-        SELECT
-            {REFERRER_DOMAIN} AS domain,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE traffic_type='Likely Human'
+    reg.sql("cns_referrers", """
+        SELECT domain, SUM(n)::BIGINT AS count
+        FROM p_referrers
         GROUP BY domain ORDER BY count DESC
-    """))
+    """)
 
     # ─── 15. Referrer trend (monthly, top sources) ────────────────────────────
-    write_json(f"{out}/cns_referrer_trend.json", q(f"""
+    reg.sql("cns_referrer_trend", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            SUM(CASE WHEN {REFERRER_DOMAIN} = 'Google' THEN 1 ELSE 0 END)::BIGINT AS google,
-            SUM(CASE WHEN {REFERRER_DOMAIN} = 'Google Scholar' THEN 1 ELSE 0 END)::BIGINT AS scholar,
-            SUM(CASE WHEN {REFERRER_DOMAIN} = 'Bing' THEN 1 ELSE 0 END)::BIGINT AS bing,
-            SUM(CASE WHEN {REFERRER_DOMAIN} = 'Direct' THEN 1 ELSE 0 END)::BIGINT AS direct,
-            SUM(CASE WHEN {REFERRER_DOMAIN} NOT IN ('Google','Google Scholar','Bing','Direct','Self (CNS)','Attack/Injection') THEN 1 ELSE 0 END)::BIGINT AS other
-        FROM {P}
-        WHERE traffic_type='Likely Human' AND date >= '2018-01-01'
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(CASE WHEN domain = 'Google' THEN n ELSE 0 END)::BIGINT AS google,
+            SUM(CASE WHEN domain = 'Google Scholar' THEN n ELSE 0 END)::BIGINT AS scholar,
+            SUM(CASE WHEN domain = 'Bing' THEN n ELSE 0 END)::BIGINT AS bing,
+            SUM(CASE WHEN domain = 'Direct' THEN n ELSE 0 END)::BIGINT AS direct,
+            SUM(CASE WHEN domain NOT IN ('Google','Google Scholar','Bing','Direct','Self (CNS)','Attack/Injection') THEN n ELSE 0 END)::BIGINT AS other
+        FROM p_referrers
+        WHERE part >= DATE '2018-01-01'
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 16. HTTP status codes ────────────────────────────────────────────────
-    write_json(f"{out}/cns_http_status.json", q(f"""
-        SELECT sc_status AS status, count(*)::BIGINT AS count
-        FROM {P}
+    reg.sql("cns_http_status", """
+        SELECT sc_status AS status, SUM(n)::BIGINT AS count
+        FROM p_statuses
         GROUP BY sc_status ORDER BY count DESC
-    """))
+    """)
 
     # ─── 17. Monthly errors ──────────────────────────────────────────────────
-    write_json(f"{out}/cns_monthly_errors.json", q(f"""
+    reg.sql("cns_monthly_errors", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            SUM(CASE WHEN sc_status = 404 THEN 1 ELSE 0 END)::BIGINT AS s404,
-            SUM(CASE WHEN sc_status = 500 THEN 1 ELSE 0 END)::BIGINT AS s500,
-            SUM(CASE WHEN sc_status = 403 THEN 1 ELSE 0 END)::BIGINT AS s403,
-            SUM(CASE WHEN sc_status >= 400 THEN 1 ELSE 0 END)::BIGINT AS total_errors
-        FROM {P}
-        WHERE date >= '2018-01-01'
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(CASE WHEN sc_status = 404 THEN n ELSE 0 END)::BIGINT AS s404,
+            SUM(CASE WHEN sc_status = 500 THEN n ELSE 0 END)::BIGINT AS s500,
+            SUM(CASE WHEN sc_status = 403 THEN n ELSE 0 END)::BIGINT AS s403,
+            SUM(CASE WHEN sc_status >= 400 THEN n ELSE 0 END)::BIGINT AS total_errors
+        FROM p_statuses
+        WHERE part >= DATE '2018-01-01'
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 18. Top 404 paths ───────────────────────────────────────────────────
-    write_json(f"{out}/cns_top_404s.json", q(f"""
+    reg.sql("cns_top_404s", """
         SELECT path, sum(count)::BIGINT AS count FROM (
-            SELECT regexp_replace(rtrim(cs_uri_stem, '/'), '^/+', '/') AS path, count(*)::BIGINT AS count
-            FROM {P}
+            SELECT regexp_replace(rtrim(cs_uri_stem, '/'), '^/+', '/') AS path, SUM(n)::BIGINT AS count
+            FROM p_error_paths
             WHERE sc_status = 404
               AND NOT regexp_matches(cs_uri_stem, '\\.(png|jpg|gif|css|js|ico|svg|woff2?|ttf)$')
             GROUP BY cs_uri_stem
         )
         WHERE path != '' GROUP BY path ORDER BY count DESC LIMIT 20
-    """))
+    """)
 
     # ─── 19. Top 500 error paths ──────────────────────────────────────────────
-    write_json(f"{out}/cns_top_500s.json", q(f"""
+    reg.sql("cns_top_500s", """
         SELECT path, sum(count)::BIGINT AS count FROM (
-            SELECT regexp_replace(rtrim(cs_uri_stem, '/'), '^/+', '/') AS path, count(*)::BIGINT AS count
-            FROM {P}
+            SELECT regexp_replace(rtrim(cs_uri_stem, '/'), '^/+', '/') AS path, SUM(n)::BIGINT AS count
+            FROM p_error_paths
             WHERE sc_status >= 500
               AND NOT regexp_matches(cs_uri_stem, '\\.(png|jpg|gif|css|js|ico|svg|woff2?|ttf)$')
             GROUP BY cs_uri_stem
         )
         WHERE path != '' GROUP BY path ORDER BY count DESC LIMIT 20
-    """))
+    """)
 
     # ─── 20. Dead link targets ────────────────────────────────────────────────
-    write_json(f"{out}/cns_dead_links.json", q(f"""
+    reg.sql("cns_dead_links", """
         SELECT
             cs_uri_query AS url,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE cs_uri_stem = '/deadlink.html'
-          AND cs_uri_query IS NOT NULL AND cs_uri_query NOT IN ('-', '')
+            SUM(n)::BIGINT AS count
+        FROM p_dead_links
         GROUP BY cs_uri_query ORDER BY count DESC LIMIT 20
-    """))
+    """)
 
     # ─── 21. Security signals ─────────────────────────────────────────────────
-    write_json(f"{out}/cns_security_signals.json", q(f"""
-        SELECT
-            {SECURITY_CASE} AS signal_type,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE {SECURITY_CASE} IS NOT NULL
+    reg.sql("cns_security_signals", """
+        SELECT signal_type, SUM(n)::BIGINT AS count
+        FROM p_security
         GROUP BY signal_type ORDER BY count DESC
-    """))
+    """)
 
     # ─── 22. Bot trend over time ──────────────────────────────────────────────
-    write_json(f"{out}/cns_bot_trend.json", q(f"""
+    reg.sql("cns_bot_trend", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            SUM(CASE WHEN traffic_type='Likely Human' THEN 1 ELSE 0 END)::BIGINT AS human,
-            SUM(CASE WHEN traffic_type='Bot' THEN 1 ELSE 0 END)::BIGINT AS bot,
-            SUM(CASE WHEN traffic_type='AI-Assistant / Bot' THEN 1 ELSE 0 END)::BIGINT AS ai_bot
-        FROM {P}
-        WHERE date >= '2018-01-01'
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(CASE WHEN traffic_type='Likely Human' THEN n ELSE 0 END)::BIGINT AS human,
+            SUM(CASE WHEN traffic_type='Bot' THEN n ELSE 0 END)::BIGINT AS bot,
+            SUM(CASE WHEN traffic_type='AI-Assistant / Bot' THEN n ELSE 0 END)::BIGINT AS ai_bot
+        FROM p_traffic
+        WHERE part >= DATE '2018-01-01'
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 23. Cache / CDN response performance ──────────────────────────────────
     # x_edge_result_type is NULL in this parquet — derive from HTTP status codes
-    write_json(f"{out}/cns_cache_performance.json", q(f"""
+    reg.sql("cns_cache_performance", """
         SELECT
             CASE
                 WHEN sc_status BETWEEN 200 AND 299 THEN 'Hit'
@@ -520,14 +622,14 @@ def run(parquet: str, out: str) -> None:
                 WHEN sc_status >= 500 THEN 'Error'
                 ELSE 'Other'
             END AS result_type,
-            count(*)::BIGINT AS count
-        FROM {P}
+            SUM(n)::BIGINT AS count
+        FROM p_statuses
         WHERE sc_status IS NOT NULL
         GROUP BY result_type ORDER BY count DESC
-    """))
+    """)
 
     # ─── 24. Error categories (actionable buckets) ─────────────────────────
-    write_json(f"{out}/cns_error_categories.json", q(f"""
+    reg.sql("cns_error_categories", """
         SELECT
             CASE
                 WHEN sc_status = 404 AND (cs_uri_stem LIKE '%wp-login%' OR cs_uri_stem LIKE '%wp-admin%'
@@ -548,86 +650,247 @@ def run(parquet: str, out: str) -> None:
                 ELSE 'Other HTTP Errors'
             END AS category,
             sc_status AS status,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE sc_status >= 400
+            SUM(n)::BIGINT AS count
+        FROM p_error_paths
         GROUP BY category, status
         ORDER BY count DESC
-    """))
+    """)
 
     # ─── 25. Monthly error rate ──────────────────────────────────────────────
-    write_json(f"{out}/cns_monthly_error_rate.json", q(f"""
+    reg.sql("cns_monthly_error_rate", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            count(*)::BIGINT AS total,
-            SUM(CASE WHEN sc_status >= 400 THEN 1 ELSE 0 END)::BIGINT AS errors,
-            round(100.0 * SUM(CASE WHEN sc_status >= 400 THEN 1 ELSE 0 END) / count(*), 2) AS error_rate
-        FROM {P}
-        WHERE date >= '2018-01-01'
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(n)::BIGINT AS total,
+            SUM(CASE WHEN sc_status >= 400 THEN n ELSE 0 END)::BIGINT AS errors,
+            round(100.0 * SUM(CASE WHEN sc_status >= 400 THEN n ELSE 0 END) / SUM(n), 2) AS error_rate
+        FROM p_statuses
+        WHERE part >= DATE '2018-01-01'
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 26. Top error paths by month (for drilldown panel) ──────────────────
-    error_rows = q(f"""
-        SELECT
-            year || '-' || lpad(month, 2, '0') AS mo,
-            cs_uri_stem AS path,
-            sc_status::INTEGER AS status,
-            CASE
-                WHEN sc_status = 404 AND (cs_uri_stem LIKE '%wp-login%' OR cs_uri_stem LIKE '%wp-admin%'
-                    OR cs_uri_stem LIKE '%xmlrpc%' OR cs_uri_stem LIKE '%.env%'
-                    OR cs_uri_stem LIKE '%/admin%' OR cs_uri_stem LIKE '%/manager%'
-                    OR cs_uri_stem LIKE '%/console%' OR cs_uri_stem LIKE '%config%'
-                    OR cs_uri_stem LIKE '%/debug%') THEN 'Scanner Probe'
-                WHEN sc_status = 404 AND cs_uri_stem LIKE '%.pdf' THEN 'Missing PDF'
-                WHEN sc_status = 404 AND (cs_uri_stem LIKE '/workshops/%' OR cs_uri_stem LIKE '/events%') THEN 'Moved Page'
-                WHEN sc_status = 404 AND cs_uri_stem LIKE '/images/%' THEN 'Missing Image'
-                WHEN sc_status = 404 AND cs_uri_stem LIKE '/docs/%' THEN 'Missing Doc'
-                WHEN sc_status = 404 THEN 'Broken Link'
-                WHEN sc_status >= 500 AND (cs_uri_stem LIKE '%wp-%' OR cs_uri_stem LIKE '%.php'
-                    OR cs_uri_stem LIKE '%/cgi-bin/%' OR cs_uri_stem LIKE '%/scripts/%') THEN 'Scanner Probe'
-                WHEN sc_status >= 500 AND cs_uri_stem = '/' THEN 'Homepage Error'
-                WHEN sc_status >= 500 THEN 'Server Error'
-                WHEN sc_status = 403 THEN 'Access Denied'
-                ELSE 'Other'
-            END AS category,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE sc_status >= 400
-        GROUP BY mo, path, status, category
-        ORDER BY mo, count DESC
-    """)
-    # Build per-month top 10 and all-time top 15 in Python
-    from collections import defaultdict
-    by_month_map = defaultdict(list)
-    all_time_map = defaultdict(lambda: {"path": "", "status": 0, "count": 0, "category": ""})
-    for r in error_rows:
-        mo = r["mo"]
-        key = (r["path"], r["status"])
-        by_month_map[mo].append({"path": r["path"], "status": r["status"], "count": r["count"], "category": r["category"]})
-        existing = all_time_map[key]
-        if existing["count"] == 0:
-            all_time_map[key] = {"path": r["path"], "status": r["status"], "count": r["count"], "category": r["category"]}
-        else:
-            existing["count"] += r["count"]
-    by_month_out = {}
-    for mo, rows in sorted(by_month_map.items()):
-        by_month_out[mo] = sorted(rows, key=lambda x: -x["count"])[:10]
-    all_time_list = sorted(all_time_map.values(), key=lambda x: -x["count"])[:15]
-    write_json(f"{out}/cns_top_errors_by_month.json", {"all_time": all_time_list, "by_month": by_month_out})
+    @reg.python("cns_top_errors_by_month", inputs=("p_error_paths",))
+    def top_errors_by_month(cur):
+        error_rows = records(cur, """
+            SELECT
+                year || '-' || lpad(month, 2, '0') AS mo,
+                cs_uri_stem AS path,
+                sc_status::INTEGER AS status,
+                CASE
+                    WHEN sc_status = 404 AND (cs_uri_stem LIKE '%wp-login%' OR cs_uri_stem LIKE '%wp-admin%'
+                        OR cs_uri_stem LIKE '%xmlrpc%' OR cs_uri_stem LIKE '%.env%'
+                        OR cs_uri_stem LIKE '%/admin%' OR cs_uri_stem LIKE '%/manager%'
+                        OR cs_uri_stem LIKE '%/console%' OR cs_uri_stem LIKE '%config%'
+                        OR cs_uri_stem LIKE '%/debug%') THEN 'Scanner Probe'
+                    WHEN sc_status = 404 AND cs_uri_stem LIKE '%.pdf' THEN 'Missing PDF'
+                    WHEN sc_status = 404 AND (cs_uri_stem LIKE '/workshops/%' OR cs_uri_stem LIKE '/events%') THEN 'Moved Page'
+                    WHEN sc_status = 404 AND cs_uri_stem LIKE '/images/%' THEN 'Missing Image'
+                    WHEN sc_status = 404 AND cs_uri_stem LIKE '/docs/%' THEN 'Missing Doc'
+                    WHEN sc_status = 404 THEN 'Broken Link'
+                    WHEN sc_status >= 500 AND (cs_uri_stem LIKE '%wp-%' OR cs_uri_stem LIKE '%.php'
+                        OR cs_uri_stem LIKE '%/cgi-bin/%' OR cs_uri_stem LIKE '%/scripts/%') THEN 'Scanner Probe'
+                    WHEN sc_status >= 500 AND cs_uri_stem = '/' THEN 'Homepage Error'
+                    WHEN sc_status >= 500 THEN 'Server Error'
+                    WHEN sc_status = 403 THEN 'Access Denied'
+                    ELSE 'Other'
+                END AS category,
+                SUM(n)::BIGINT AS count
+            FROM p_error_paths
+            GROUP BY mo, path, status, category
+            ORDER BY mo, count DESC
+        """)
+        # Build per-month top 10 and all-time top 15 in Python
+        from collections import defaultdict
+        by_month_map = defaultdict(list)
+        all_time_map = defaultdict(lambda: {"path": "", "status": 0, "count": 0, "category": ""})
+        for r in error_rows:
+            mo = r["mo"]
+            key = (r["path"], r["status"])
+            by_month_map[mo].append({"path": r["path"], "status": r["status"], "count": r["count"], "category": r["category"]})
+            existing = all_time_map[key]
+            if existing["count"] == 0:
+                all_time_map[key] = {"path": r["path"], "status": r["status"], "count": r["count"], "category": r["category"]}
+            else:
+                existing["count"] += r["count"]
+        by_month_out = {}
+        for mo, rows in sorted(by_month_map.items()):
+            by_month_out[mo] = sorted(rows, key=lambda x: -x["count"])[:10]
+        all_time_list = sorted(all_time_map.values(), key=lambda x: -x["count"])[:15]
+        return {"all_time": all_time_list, "by_month": by_month_out}
+
+
+def run(
+    parquet: str,
+    out: str,
+    dedup_mode: str = "table",
+    dedup_key: str = DEFAULT_DEDUP_KEY,
+    verify: bool = False,
+    spill_db: str | None = None,
+    incremental: bool = False,
+    state_db: str = STATE_DEFAULT,
+    lookback_days: int = DEFAULT_LOOKBACK_DAYS,
+    workers: int = DEFAULT_WORKERS,
+    runtime: Mapping[str, Any] | None = None,
+    only: Sequence[str] | None = None,
+    cache_dir: str | None = None,
+    profile: str | None = None,
+    explain: str | None = None,
+    sample: float | None = None,
+    since: date | None = None,
+    until: date | None = None,
+) -> None:
+    windowed = since is not None or until is not None
+    check_window(since, until)
+    if sample and incremental:
+        raise ValueError("--sample cannot be combined with --incremental (the state would hold sampled partials)")
+    if windowed and incremental:
+        raise ValueError("--since/--until cannot be combined with --incremental (the state holds every date)")
+    started = time.perf_counter()
+    os.makedirs(out, exist_ok=True)
+
+    P = "logs"
+    partials = partial_queries(P)
+    # What the loaded logs depend on besides the parquet (keys the state and the cache)
+    log_definition = load_definition(dedup_key, enums=ENUM_COLUMNS)
+    reg = Registry()
+    for name, sql in partials.items():
+        # A sampled run scales the request counts back up (see sampling.py)
+        reg.table(f"p_{name}", scale_counts(sql, sample) if sample else sql)
+    register_outputs(reg, out)
+    # Sampled outputs are previews: never cached, never served from the cache
+    if sample:
+        cache_dir = None
+    # `explain` runs only that node (and what it reads) with its plans kept, uncached
+    if explain:
+        only, cache_dir = reg.readers(explain)[:1], None
+    # `only` restricts the run to those outputs and the partials they read
+    targets = [name for name in reg.select(only) if name in reg.outputs]
+
+    # Outputs whose parquet fingerprint and definitions are unchanged are copied from the cache
+    cache = OutputCache(cache_dir, reg, parquet, dedup_key, window_metadata(since, until),
+                        log_definition, write_json) if cache_dir else None
+    if cache:
+        targets = cache.restore(targets, out)
+
+    con = duckdb.connect()
+    settings = apply_runtime(con, runtime or {})
+    print(f"  {describe_runtime(settings)}")
+    if targets:
+        pool = QueryPool(con, workers=workers, threads=int(settings["threads"]), writer=write_json, report=report,
+                         profile=profile is not None, explain=[explain] if explain else ())
+        selected = reg.select(targets)
+
+        # Incremental runs only load the months whose partials must be recomputed
+        plan = None
+        if incremental:
+            open_state(con, state_db)
+            plan = plan_refresh(con, parquet, partials, lookback_days, load=log_definition)
+            print(f"  {describe_plan(plan)}")
+
+        # Deduplicate parquet once on load, keeping only the columns the nodes
+        # being built use (all the partials' in an incremental refresh)
+        readers = [*selected, *(f"p_{name}" for name in partials)] if plan else selected
+        read = reg.columns_read(readers, (P,), LOG_COLUMNS)
+        # A window is pushed into the scan (and the hive partitions) of the load
+        window = window_predicate(since, until, hive_keys(parquet)) if windowed else None
+        if window:
+            print(f"  Window: {describe_window(since, until)}")
+        load = pool.stage(P, lambda con: materialize_logs(
+            con, parquet, [col for col in LOG_COLUMNS if col in read], mode=dedup_mode, spill_db=spill_db,
+            where=plan["where"] if plan else combine(sample_predicate(sample) if sample else None, window),
+            enums={col: values for col, values in ENUM_COLUMNS.items() if col in read},
+            hive_types=PARTITION_TYPES, key=dedup_key,
+        ))
+        raw_count, deduped_count, dupes = load["raw_rows"], load["deduped_rows"], load["duplicates"]
+        if dupes > 0:
+            print(f"\u26a0 Removed {dupes:,} duplicate rows ({dupes/raw_count*100:.2f}%) \u2014 {deduped_count:,} rows remain")
+        print(f"  Loaded logs ({dedup_mode}, key={dedup_key}) in {load['seconds']:.2f}s")
+        print(f"  {describe_scan(load['scan'])}")
+        if verify:
+            print(f"  {describe_verification(verify_dedup(con, parquet, plan['where'] if plan else window, PARTITION_TYPES))}")
+
+        done = []
+        if plan:
+            t0 = time.perf_counter()
+            pool.stage("partials", lambda con: build_partials(con, partials, plan))
+            done = [f"p_{name}" for name in partials]
+            print(f"  Refreshed {len(partials)} partial aggregates in {time.perf_counter() - t0:.2f}s")
+
+        reg.run(pool, out, selected, done)
+
+        stats = pool.close()
+        print(f"  {describe_stats(stats)}")
+        if profile:
+            ranked = write_profile(profile, pool.profiles, stats)
+            print(f"  {describe_profile(ranked)}")
+        for name, plans in pool.plans.items():
+            print(f"\nEXPLAIN ANALYZE {name} ({len(plans)} queries)")
+            print("\n".join(plans))
+        if cache:
+            cache.store(targets, out)
+    if cache:
+        cache.prune()
+        print(f"  {cache.describe()}")
+    # Run settings differ between runs of the same outputs, so they stay out of the cache
+    if "cns_data_metadata" in reg.select(only):
+        record_runtime(os.path.join(out, "cns_data_metadata.json"), settings, sample=sample_metadata(sample),
+                       window=window_metadata(since, until))
 
     total = len([f for f in os.listdir(out) if f.endswith(".json")])
-    print(f"\nAll done \u2014 {total} files in {out}/")
+    mode = "incremental" if incremental else f"{sample:.0%} sample" if sample else "full"
+    if windowed:
+        mode += f" of {describe_window(since, until)}"
+    print(f"\nAll done \u2014 {total} files in {out}/ ({time.perf_counter() - started:.1f}s, {mode}, dedup={dedup_mode})")
 
 
 def parse_args():
     p = argparse.ArgumentParser(description="Generate CNS dashboard JSON files from CloudFront parquet logs")
-    p.add_argument("--parquet", default=PARQUET_DEFAULT, help="Path to source parquet")
+    p.add_argument("--parquet", default=PARQUET_DEFAULT, help="Source parquet file, glob, or directory of (hive-partitioned) files")
     p.add_argument("--out", default=OUT_DEFAULT, help="Output directory")
+    p.add_argument("--dedup-mode", choices=DEDUP_MODES, default="table",
+                   help="'table' materializes the deduplicated logs once; 'view' re-runs DISTINCT per query (for timing comparisons)")
+    p.add_argument("--dedup-key", choices=DEDUP_KEYS, default=DEFAULT_DEDUP_KEY,
+                   help="What identifies a duplicate: x_edge_request_id (default; check it with --verify-dedup), the whole row, or a 64-bit row hash")
+    p.add_argument("--verify-dedup", action="store_true",
+                   help="Report where the dedup keys disagree (request ids shared by differing rows, hash collisions)")
+    p.add_argument("--spill-db", default=None,
+                   help="Materialize the deduplicated logs in this DuckDB file instead of memory")
+    p.add_argument("--incremental", action="store_true",
+                   help="Reuse per-month partial aggregates from --state-db; only changed and recent months are rescanned")
+    p.add_argument("--state-db", default=STATE_DEFAULT,
+                   help="DuckDB file holding the incremental state")
+    p.add_argument("--lookback-days", type=int, default=DEFAULT_LOOKBACK_DAYS,
+                   help="Months overlapping the last N days of data are always recomputed in incremental mode")
+    p.add_argument("--sample", type=parse_fraction, metavar="FRACTION", default=None,
+                   help="Preview on this fraction of the users (e.g. 0.05), with request counts scaled back up; uncached")
+    p.add_argument("--since", type=parse_day, metavar="DAY", default=None,
+                   help="Only read the logs dated on or after this day (YYYY-MM-DD); pushed into the parquet scan")
+    p.add_argument("--until", type=parse_day, metavar="DAY", default=None,
+                   help="Only read the logs dated on or before this day (YYYY-MM-DD); pushed into the parquet scan")
+    add_runtime_args(p)
+    p.add_argument("--profile", action="store_true",
+                   help="Profile every output and partial; writes the nodes to --profile-out, most expensive first")
+    p.add_argument("--profile-out", metavar="PATH", default=PROFILE_DEFAULT,
+                   help="Profile report of --profile (kept out of the published outputs)")
+    p.add_argument("--explain-analyze", metavar="NAME", default=None,
+                   help="Run only this output or partial table (and its inputs), uncached, and print its full query plans")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help="Aggregations run concurrently on this many cursors; 1 runs them serially")
+    p.add_argument("--only", type=lambda v: [name.strip() for name in v.split(",") if name.strip()],
+                   help="Comma-separated outputs to regenerate (JSON names without .json), plus the partials they need")
+    p.add_argument("--cache-dir", default=CACHE_DEFAULT,
+                   help="Reuse outputs whose parquet fingerprint and query definitions match a cached entry")
+    p.add_argument("--no-cache", action="store_true", help="Recompute every output")
     return p.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
     print(f"CNS data pipeline: {args.parquet} \u2192 {args.out}/")
-    run(args.parquet, args.out)
+    run(args.parquet, args.out, dedup_mode=args.dedup_mode, dedup_key=args.dedup_key,
+        verify=args.verify_dedup, spill_db=args.spill_db,
+        incremental=args.incremental, state_db=args.state_db, lookback_days=args.lookback_days,
+        workers=args.workers, runtime=runtime_config(args), only=args.only,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        profile=args.profile_out if args.profile else None, explain=args.explain_analyze, sample=args.sample,
+        since=args.since, until=args.until)
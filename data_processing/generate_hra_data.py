@@ -13,21 +13,44 @@ New outputs vs the pandas version:
 
 import json
 import os
+import time
 import argparse
+from datetime import date
+from functools import partial
 from pathlib import Path
+from typing import Any, Mapping, Sequence
 
 import duckdb
 
-def _latest_parquet(directory: str, pattern: str = "*.parquet") -> str:
-    """Find the most recently modified parquet in a directory."""
-    import glob
-    files = sorted(glob.glob(os.path.join(directory, pattern)), key=os.path.getmtime, reverse=True)
-    return files[0] if files else ""
+from aggregation_registry import Registry
+from event_store import EVENTS_FILTER, event_fields, materialize_events
+from hll_sketch import estimate, merge, sketch_query
+from incremental_state import (
+    DEFAULT_LOOKBACK_DAYS, PART, build_partials, describe_plan, open_state, plan_refresh,
+)
+from log_store import (
+    DEDUP_KEYS, DEDUP_MODES, DEFAULT_DEDUP_KEY, dataset_files, default_source, describe_scan, describe_verification,
+    hive_keys, load_definition, materialize_logs, referenced_columns, verify_dedup,
+)
+from output_cache import OutputCache
+from query_pool import DEFAULT_WORKERS, QueryPool, describe_stats, records
+from query_profile import PROFILE_FILE, describe_profile, write_profile
+from runtime_config import add_runtime_args, apply_runtime, describe_runtime, record_runtime, runtime_config
+from rollup_cube import CUBE_TABLE, attach_cube, cube_outputs, describe_cube, write_cube
+from shared_logs import describe_store, open_shared_logs
+from sampling import parse_fraction, sample_metadata, sample_predicate, scale_counts, unscaled_outputs
+from time_window import check_window, combine, describe_window, parse_day, window_metadata, window_predicate
+from user_state import describe_refresh, refresh_state, state_queries, stored_tables
 
-PARQUET_DEFAULT = _latest_parquet("data/hra") or "data/hra/2026-04-06_hra-logs.parquet"
+PARQUET_DEFAULT = default_source("data/hra") or "data/hra/2026-04-06_hra-logs.parquet"
 OUT_DEFAULT = "public/data/hra"
+STATE_DEFAULT = "data/hra/hra_state.duckdb"
+CACHE_DEFAULT = "data/hra/output_cache"
+PROFILE_DEFAULT = f"data/hra/{PROFILE_FILE}"
 
-TOOL_STEMS = "('/eui/','/rui/','/cde/','/ftu-explorer/','/kg-explorer/')"
+TOOL_STEM_VALUES = ("/eui/", "/rui/", "/cde/", "/ftu-explorer/", "/kg-explorer/")
+TOOL_STEMS = "(" + ",".join(f"'{stem}'" for stem in TOOL_STEM_VALUES) + ")"
+TOOL_NAMES = ("EUI", "RUI", "CDE", "FTU Explorer", "KG Explorer")
 TOOL_CASE = """CASE cs_uri_stem
     WHEN '/eui/'          THEN 'EUI'
     WHEN '/rui/'          THEN 'RUI'
@@ -36,7 +59,7 @@ TOOL_CASE = """CASE cs_uri_stem
     WHEN '/kg-explorer/'  THEN 'KG Explorer'
 END"""
 
-APP_TOOL_CASE = """CASE query['app']
+APP_TOOL_CASE = """CASE app
     WHEN 'ccf-eui'          THEN 'EUI'
     WHEN 'ccf-rui'          THEN 'RUI'
     WHEN 'cde-ui'           THEN 'CDE'
@@ -45,430 +68,654 @@ APP_TOOL_CASE = """CASE query['app']
     WHEN 'kg-explorer'      THEN 'KG Explorer'
 END"""
 
+# Error classification, evaluated once per distinct message in `error_dictionary`
 ERROR_BUCKET_CASE = """CASE
-    WHEN query['e.reason.message'] ILIKE '%/api/v1/technology-names%' THEN 'Net/CORS: technology list API'
-    WHEN query['e.reason.message'] ILIKE 'Error retrieving icon%' THEN 'Icon retrieval failures'
-    WHEN query['e.reason.message'] ILIKE 'Cannot read properties of null (reading ''0'')%' THEN 'Null selection read'
-    WHEN query['e.reason.message'] = '[object Object]' THEN 'Unreadable structured error object'
-    WHEN query['e.reason.message'] ILIKE '%data.yaml%'
-      OR query['e.reason.message'] ILIKE '%links.yml%'
-      OR query['e.reason.message'] ILIKE '%resources.yml%' THEN 'Content file fetch failures'
-    WHEN query['e.reason.message'] ILIKE '%127.0.0.1%'
-      OR query['e.reason.message'] ILIKE '%localhost%' THEN 'Local development request noise'
+    WHEN message ILIKE '%/api/v1/technology-names%' THEN 'Net/CORS: technology list API'
+    WHEN message ILIKE 'Error retrieving icon%' THEN 'Icon retrieval failures'
+    WHEN message ILIKE 'Cannot read properties of null (reading ''0'')%' THEN 'Null selection read'
+    WHEN message = '[object Object]' THEN 'Unreadable structured error object'
+    WHEN message ILIKE '%data.yaml%'
+      OR message ILIKE '%links.yml%'
+      OR message ILIKE '%resources.yml%' THEN 'Content file fetch failures'
+    WHEN message ILIKE '%127.0.0.1%'
+      OR message ILIKE '%localhost%' THEN 'Local development request noise'
     ELSE 'Other'
 END"""
 
+# Finer buckets of the per-tool drill-down (top_errors_by_tool)
+TOOL_ERROR_BUCKET_CASE = """CASE
+    WHEN message ILIKE '%/api/v1/technology-names%'        THEN 'CORS: technology list API'
+    WHEN message ILIKE '%Http failure%' AND message ILIKE '%/api/%' THEN 'API failure'
+    WHEN message ILIKE '%Http failure%' AND (message ILIKE '%127.0.0.1%' OR message ILIKE '%localhost%') THEN 'Dev noise'
+    WHEN message ILIKE '%Http failure%' AND (message ILIKE '%.yml%' OR message ILIKE '%.yaml%') THEN 'Content fetch failure'
+    WHEN message ILIKE '%Http failure%'                    THEN 'CDN / HTTP failure'
+    WHEN message ILIKE 'Error retrieving icon%'            THEN 'CDN icon failure'
+    WHEN message ILIKE 'Cannot read properties of null%'
+      OR message ILIKE 'Cannot read properties of undefined%'
+      OR message ILIKE '%is undefined%'
+      OR message ILIKE 'can''t access property%'           THEN 'Null-ref error'
+    WHEN message ILIKE 'NG0%'                              THEN 'Angular DI error'
+    WHEN message ILIKE '%is not a function%'               THEN 'Runtime type error'
+    ELSE 'Other'
+END"""
+
+# Display form of a message: Http failures reduced to the host/path, icon
+# errors to the icon name, Angular errors to their code, cut to 90 characters
+CLEAN_MESSAGE = r"""left(
+    regexp_replace(
+        regexp_replace(
+            regexp_replace(message,
+                'Http failure (response|during parsing) for https?://([^\s:]+)[^:]*',
+                'Http failure: \2', 'g'),
+            'Error retrieving icon ([^!]+)!.*', 'Icon failure: \1', 'g'),
+        '(NG\d+:[^.]+)\..*', '\1', 'g'),
+    90)"""
+
+EVENTS_MODES = ("fused", "scan")
+
 STATIC_FILTER = r"NOT regexp_matches(cs_uri_stem, '\.(js|css|svg|png|ico|woff2?|ttf|jpe?g|webp)$')"
 
+# Only these columns are read by the aggregations below; the deduplicated
+# log table is materialized with just these.
+LOG_COLUMNS = (
+    "date", "year", "time", "site", "cs_uri_stem", "traffic_type",
+    "c_country", "cs_referer", "anon_id",
+)
+# Types of the date columns when a hive-partitioned source only has them as
+# `year=/month=/day=` directories (as stored in the monolithic parquet)
+PARTITION_TYPES = {"year": "INTEGER", "month": "INTEGER", "day": "INTEGER"}
+# Keys of the `query` MAP the aggregations read, flattened into columns on load
+EVENT_COLUMNS = event_fields((
+    "event_type", "app", "path", "session_id", "e_label", "e_action",
+    "e_tab", "e_value", "e_path", "e_reason_message",
+))
+# Tool columns derived on load: the tool page of an Apps request and the
+# tool of an event ping (both NULL outside the five tools)
+TOOL_COLUMNS = {
+    "tool_stem": f"CASE WHEN cs_uri_stem IN {TOOL_STEMS} THEN cs_uri_stem END",
+    "app_tool": APP_TOOL_CASE,
+}
+# Low-cardinality columns stored as ENUMs (None: members read from the parquet)
+ENUM_COLUMNS = {
+    "site": None, "traffic_type": None, "c_country": None,
+    "tool_stem": TOOL_STEM_VALUES, "app_tool": TOOL_NAMES,
+}
+
 SESSION_FILTER = """
-    query['sessionId'] IS NOT NULL
-    AND query['sessionId'] NOT IN ('', '-', 'TODO', 'null', 'None', 'nan')
-    AND length(query['sessionId']) >= 4
+    session_id IS NOT NULL
+    AND session_id NOT IN ('', '-', 'TODO', 'null', 'None', 'nan')
+    AND length(session_id) >= 4
 """
 
 
+REQUEST_TYPE_CASE = """CASE
+    WHEN cs_uri_stem LIKE '%.js'
+      OR cs_uri_stem LIKE '%.js.map'       THEN 'JS Bundles'
+    WHEN cs_uri_stem LIKE '%.css'
+      OR cs_uri_stem LIKE '%.css.map'      THEN 'Stylesheets'
+    WHEN cs_uri_stem LIKE '%.woff'
+      OR cs_uri_stem LIKE '%.woff2'
+      OR cs_uri_stem LIKE '%.ttf'
+      OR cs_uri_stem LIKE '%.otf'
+      OR cs_uri_stem LIKE '%.eot'          THEN 'Fonts'
+    WHEN cs_uri_stem LIKE '/api/%'
+      OR cs_uri_stem LIKE '%.graphql'      THEN 'API Calls'
+    WHEN cs_uri_stem LIKE '%.json'
+      OR cs_uri_stem LIKE '%.geojson'      THEN 'Data Files'
+    WHEN cs_uri_stem LIKE '%.png'
+      OR cs_uri_stem LIKE '%.jpg'
+      OR cs_uri_stem LIKE '%.jpeg'
+      OR cs_uri_stem LIKE '%.svg'
+      OR cs_uri_stem LIKE '%.ico'
+      OR cs_uri_stem LIKE '%.webp'         THEN 'Images'
+    WHEN cs_uri_stem LIKE '%.html'
+      OR cs_uri_stem = '/'
+      OR cs_uri_stem LIKE '%/'             THEN 'HTML Pages'
+    ELSE                                        'Other'
+END"""
+
+REFERRER_CASE = """CASE
+    WHEN cs_referer LIKE '%gtexportal.org%'              THEN 'GTEx Portal'
+    WHEN cs_referer LIKE '%hubmapconsortium.org%'
+      OR cs_referer LIKE '%hubmapconsortium.github.io%'  THEN 'HubMAP'
+    WHEN cs_referer LIKE '%ebi.ac.uk%'                   THEN 'EBI'
+    WHEN cs_referer LIKE '%sennetconsortium.org%'        THEN 'SenNet'
+    WHEN cs_referer LIKE '%vitessce.io%'                 THEN 'Vitessce'
+    WHEN cs_referer LIKE '%google.com%'                  THEN 'Google'
+END"""
+
+
+def partial_queries(P: str, E: str, approx: bool = False) -> dict[str, str]:
+    """
+    Per-month partial aggregates every output below is derived from.
+
+    Each query groups by `part` (month of the row), so a month can be
+    recomputed on its own and the outputs re-aggregate the partials with
+    SUM / DISTINCT. `p_<name>` holds the result during a run. `approx` adds
+    the HLL sketches (`*_sketches`) the `--approx` outputs merge instead.
+    """
+    partials = {
+        "apps_dates": f"""
+            SELECT {PART} AS part, MIN(date) AS first_date, MAX(date) AS last_date
+            FROM {P}
+            WHERE site = 'Apps'
+            GROUP BY part
+        """,
+        # Requests per month × weekday × hour × site × tool × country × traffic
+        # type × event (see rollup_cube.py). `tool` is the tool page of an Apps
+        # request or the tool of a human Events `/tr` ping, whose event type fills `event`.
+        "traffic_cube": f"""
+            SELECT {PART} AS part, year, dayofweek(date) AS dow,
+                   try_cast(split_part(time, ':', 1) AS INTEGER) AS hour,
+                   site,
+                   CASE WHEN site='Apps' THEN {TOOL_CASE}
+                        WHEN {EVENTS_FILTER} THEN app_tool END AS tool,
+                   c_country, traffic_type,
+                   CASE WHEN {EVENTS_FILTER} THEN event_type END AS event,
+                   count(*)::BIGINT AS n
+            FROM {P}
+            GROUP BY ALL
+        """,
+        "app_anon_months": f"""
+            SELECT DISTINCT {PART} AS part, anon_id, tool_stem AS cs_uri_stem
+            FROM {P}
+            WHERE site='Apps' AND traffic_type='Likely Human'
+              AND tool_stem IS NOT NULL
+              AND anon_id IS NOT NULL AND length(anon_id) >= 4
+        """,
+        "request_types": f"""
+            SELECT {PART} AS part, {REQUEST_TYPE_CASE} AS request_type, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE traffic_type = 'Likely Human'
+              AND cs_uri_stem != '/tr'
+            GROUP BY ALL
+        """,
+        "referrers": f"""
+            SELECT {PART} AS part, {REFERRER_CASE} AS name, count(*)::BIGINT AS n
+            FROM {P}
+            WHERE cs_referer IS NOT NULL
+              AND cs_referer NOT IN ('', '-')
+              AND cs_referer NOT LIKE '%humanatlas.io%'
+              AND cs_referer NOT LIKE '%localhost%'
+              AND cs_referer NOT LIKE '%cloudfront.net%'
+            GROUP BY ALL
+        """,
+        # Error pings from any Events traffic (not only human `/tr` rows)
+        "site_errors": f"""
+            SELECT {PART} AS part, app AS app, e_reason_message AS message,
+                   count(*)::BIGINT AS n
+            FROM {P}
+            WHERE site='Events' AND event_type='error'
+            GROUP BY ALL
+        """,
+        "event_paths": f"""
+            SELECT {PART} AS part, path, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE path IS NOT NULL
+            GROUP BY ALL
+        """,
+        "cde_paths": f"""
+            SELECT {PART} AS part, path, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE app = 'cde-ui'
+              AND path IS NOT NULL
+            GROUP BY ALL
+        """,
+        "nav_labels": f"""
+            SELECT {PART} AS part, e_label AS label, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE e_label IS NOT NULL
+            GROUP BY ALL
+        """,
+        "cde_tabs": f"""
+            SELECT {PART} AS part, e_tab AS tab, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE e_tab IS NOT NULL
+            GROUP BY ALL
+        """,
+        "sidebar_actions": f"""
+            SELECT {PART} AS part, e_action AS action, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE e_action IS NOT NULL
+            GROUP BY ALL
+        """,
+        # Exclude coordinate strings (CenterY_global_px style) and long UUIDs
+        "organ_selections": f"""
+            SELECT {PART} AS part, e_value AS selection, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE e_value IS NOT NULL
+              AND length(e_value) < 60
+              AND NOT regexp_matches(e_value, '^[A-Z][a-zA-Z]+_')
+            GROUP BY ALL
+        """,
+        "sessions": f"""
+            SELECT {PART} AS part, session_id AS sid, count(*)::BIGINT AS n
+            FROM {E}
+            WHERE {SESSION_FILTER}
+            GROUP BY ALL
+        """,
+        # app_tool is NULL for pings outside the five tools
+        # Raw messages; outputs look their classification up in error_dictionary
+        "errors": f"""
+            SELECT {PART} AS part, app_tool, e_reason_message AS message,
+                   count(*)::BIGINT AS n
+            FROM {E}
+            WHERE event_type = 'error'
+            GROUP BY ALL
+        """,
+        "event_anon_months": f"""
+            SELECT DISTINCT {PART} AS part, anon_id
+            FROM {E}
+            WHERE anon_id IS NOT NULL
+              AND anon_id NOT IN ('', '-', 'TODO', 'null', 'None', 'nan')
+              AND length(anon_id) >= 4
+        """,
+        # click/hover/keyboard use `path` (UI element path)
+        # pageView uses `e_path` (URL path)
+        # error uses `e_reason_message` (error message)
+        "paths_by_event": f"""
+            SELECT part, event, target AS path, count(*)::BIGINT AS n
+            FROM (
+                SELECT
+                    {PART} AS part,
+                    event_type AS event,
+                    CASE event_type
+                        WHEN 'pageView' THEN e_path
+                        WHEN 'error'    THEN e_reason_message
+                        ELSE                 path
+                    END AS target
+                FROM {E}
+                WHERE event_type IN ('click','hover','error','keyboard','pageView')
+            )
+            WHERE target IS NOT NULL
+            GROUP BY ALL
+        """,
+        "tool_hours": f"""
+            SELECT
+                {PART} AS part,
+                app_tool AS tool,
+                try_cast(split_part(time, ':', 1) AS INTEGER) AS hour_utc,
+                count(*)::BIGINT AS n
+            FROM {E}
+            WHERE app IS NOT NULL
+              AND time IS NOT NULL
+            GROUP BY ALL
+            HAVING tool IS NOT NULL AND hour_utc IS NOT NULL
+        """,
+    }
+    if approx:
+        # One HLL sketch of the session ids per month, merged by the session counts
+        partials["session_sketches"] = sketch_query(E, [f"{PART} AS part"], "session_id", SESSION_FILTER)
+    return partials
+
+
+# Partials counting users or sessions rather than requests: a `--sample` run
+# keeps them as sampled and lists the outputs reading them in the metadata
+SAMPLED_ENTITIES = ("app_anon_months", "event_anon_months", "sessions", "session_sketches")
+
+# First-seen state behind cohort_retention and tool_return_rate (user_state.py):
+# one row per user (per tool), updated from the rebuilt months in incremental runs
+USER_STATE = {
+    "users": {"source": "event_anon_months", "keys": {"anon_id": "anon_id"}, "groups": []},
+    "tool_users": {"source": "app_anon_months", "keys": {"anon_id": "anon_id", "tool": TOOL_CASE}, "groups": ["tool"]},
+}
+
+
+def report(path: str) -> None:
+    print(f"✓ {os.path.basename(path)}")
+
+
 def write_json(path: str, data: object) -> None:
+    # json.dumps encodes in one C call; json.dump would take the pure-Python path.
+    # DECIMAL results come back as Decimal, which JSON writes as a number.
     with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=True)
-    print(f"✓ {os.path.basename(path)}")
+        f.write(json.dumps(data, ensure_ascii=True, default=float))
+    report(path)
 
 
-def run(parquet: str, out: str) -> None:
-    os.makedirs(out, exist_ok=True)
-    con = duckdb.connect()
-    con.execute("PRAGMA threads=4")
-
-    # Deduplicate parquet on load — CloudFront log delivery can produce exact dupes
-    raw_count = con.execute(f"SELECT count(*) FROM read_parquet('{parquet}')").fetchone()[0]
-    con.execute(f"CREATE TEMP VIEW logs AS SELECT DISTINCT * FROM read_parquet('{parquet}')")
-    deduped_count = con.execute("SELECT count(*) FROM logs").fetchone()[0]
-    dupes = raw_count - deduped_count
-    if dupes > 0:
-        print(f"⚠ Removed {dupes:,} duplicate rows ({dupes/raw_count*100:.2f}%) — {deduped_count:,} rows remain")
-    P = "logs"
+def register_outputs(reg: Registry, approx: bool = False) -> None:
+    """
+    Register every dashboard JSON output. They read only the p_* partial
+    aggregates and tables derived from them. `approx` estimates the unique
+    session counts from the HLL sketch partials.
+    """
+    # Every distinct error message with its classification, computed once per
+    # run (p_site_errors holds a superset of the messages in p_errors)
+    reg.table("error_dictionary", f"""
+        SELECT
+            row_number() OVER (ORDER BY message)::INTEGER AS message_id,
+            message,
+            {CLEAN_MESSAGE} AS cleaned,
+            {ERROR_BUCKET_CASE} AS bucket,
+            {TOOL_ERROR_BUCKET_CASE} AS tool_bucket
+        FROM (SELECT DISTINCT message FROM p_site_errors WHERE message IS NOT NULL)
+    """)
+
+    # Tool page loads on the Apps site (any traffic type): the traffic cube
+    # rolled up over hours and events, read by every tool-visit output
+    reg.table("tool_visits", """
+        SELECT part, year, dow, tool, c_country, traffic_type, SUM(n)::BIGINT AS n
+        FROM p_traffic_cube
+        WHERE site = 'Apps' AND tool IS NOT NULL
+        GROUP BY ALL
+    """)
 
-    def q(sql: str):
-        return con.execute(sql).df().to_dict(orient="records")
+    # First-seen month of every user (and user × tool) with its activity matrix
+    for name, sql in state_queries(USER_STATE).items():
+        reg.table(name, sql)
 
+    # Each output runs on a worker cursor as soon as the partials it reads
+    # exist; the pool's writer thread writes its JSON.
     # ─── 0. Data metadata (exact date range) ─────────────────────────────────
-    date_range = con.execute(f"""
-        SELECT
-            MIN(date)::VARCHAR AS first_date,
-            MAX(date)::VARCHAR AS last_date
-        FROM {P}
-        WHERE site = 'Apps'
-    """).fetchone()
-    write_json(f"{out}/data_metadata.json", {
-        "first_date": date_range[0],
-        "last_date":  date_range[1],
-    })
+    @reg.python("data_metadata", inputs=("p_apps_dates",))
+    def data_metadata(cur):
+        date_range = cur.execute("""
+            SELECT
+                MIN(first_date)::VARCHAR AS first_date,
+                MAX(last_date)::VARCHAR AS last_date
+            FROM p_apps_dates
+        """).fetchone()
+        return {
+            "first_date": date_range[0],
+            "last_date":  date_range[1],
+        }
 
     # ─── 1. Tool visits by year (wide format) ────────────────────────────────
-    write_json(f"{out}/tool_visits_by_year.json", q(f"""
+    reg.sql("tool_visits_by_year", """
         SELECT
             year,
-            SUM(CASE WHEN cs_uri_stem='/eui/'          THEN 1 ELSE 0 END)::BIGINT AS EUI,
-            SUM(CASE WHEN cs_uri_stem='/rui/'          THEN 1 ELSE 0 END)::BIGINT AS RUI,
-            SUM(CASE WHEN cs_uri_stem='/cde/'          THEN 1 ELSE 0 END)::BIGINT AS CDE,
-            SUM(CASE WHEN cs_uri_stem='/ftu-explorer/' THEN 1 ELSE 0 END)::BIGINT AS "FTU Explorer",
-            SUM(CASE WHEN cs_uri_stem='/kg-explorer/'  THEN 1 ELSE 0 END)::BIGINT AS "KG Explorer"
-        FROM {P}
+            SUM(CASE WHEN tool='EUI'          THEN n ELSE 0 END)::BIGINT AS EUI,
+            SUM(CASE WHEN tool='RUI'          THEN n ELSE 0 END)::BIGINT AS RUI,
+            SUM(CASE WHEN tool='CDE'          THEN n ELSE 0 END)::BIGINT AS CDE,
+            SUM(CASE WHEN tool='FTU Explorer' THEN n ELSE 0 END)::BIGINT AS "FTU Explorer",
+            SUM(CASE WHEN tool='KG Explorer'  THEN n ELSE 0 END)::BIGINT AS "KG Explorer"
+        FROM tool_visits
         WHERE traffic_type='Likely Human'
-          AND site='Apps'
-          AND cs_uri_stem IN {TOOL_STEMS}
         GROUP BY year ORDER BY year
-    """))
+    """)
 
     # ─── 2. Tool visits by month (wide format) ────────────────────────────────
-    write_json(f"{out}/tool_visits_by_month.json", q(f"""
+    reg.sql("tool_visits_by_month", """
         SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            SUM(CASE WHEN cs_uri_stem='/eui/'          THEN 1 ELSE 0 END)::BIGINT AS EUI,
-            SUM(CASE WHEN cs_uri_stem='/rui/'          THEN 1 ELSE 0 END)::BIGINT AS RUI,
-            SUM(CASE WHEN cs_uri_stem='/cde/'          THEN 1 ELSE 0 END)::BIGINT AS CDE,
-            SUM(CASE WHEN cs_uri_stem='/ftu-explorer/' THEN 1 ELSE 0 END)::BIGINT AS "FTU Explorer",
-            SUM(CASE WHEN cs_uri_stem='/kg-explorer/'  THEN 1 ELSE 0 END)::BIGINT AS "KG Explorer"
-        FROM {P}
+            strftime(part, '%Y-%m') AS month_year,
+            SUM(CASE WHEN tool='EUI'          THEN n ELSE 0 END)::BIGINT AS EUI,
+            SUM(CASE WHEN tool='RUI'          THEN n ELSE 0 END)::BIGINT AS RUI,
+            SUM(CASE WHEN tool='CDE'          THEN n ELSE 0 END)::BIGINT AS CDE,
+            SUM(CASE WHEN tool='FTU Explorer' THEN n ELSE 0 END)::BIGINT AS "FTU Explorer",
+            SUM(CASE WHEN tool='KG Explorer'  THEN n ELSE 0 END)::BIGINT AS "KG Explorer"
+        FROM tool_visits
         WHERE traffic_type='Likely Human'
-          AND site='Apps'
-          AND cs_uri_stem IN {TOOL_STEMS}
         GROUP BY month_year ORDER BY month_year
-    """))
+    """)
 
     # ─── 3. Total tool visits ─────────────────────────────────────────────────
-    write_json(f"{out}/total_tool_visits.json", q(f"""
-        SELECT {TOOL_CASE} AS tool, count(*)::BIGINT AS visits
-        FROM {P}
+    reg.sql("total_tool_visits", """
+        SELECT tool, SUM(n)::BIGINT AS visits
+        FROM tool_visits
         WHERE traffic_type='Likely Human'
-          AND site='Apps'
-          AND cs_uri_stem IN {TOOL_STEMS}
         GROUP BY tool ORDER BY visits DESC
-    """))
+    """)
 
     # ─── 4. Event types distribution ──────────────────────────────────────────
-    write_json(f"{out}/event_types.json", q(f"""
-        SELECT query['event'] AS event, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['event'] IS NOT NULL
+    reg.sql("event_types", """
+        SELECT event, SUM(n)::BIGINT AS count
+        FROM p_traffic_cube
+        WHERE event IS NOT NULL
         GROUP BY event ORDER BY count DESC
-    """))
+    """)
 
     # ─── 5. Top 20 UI paths ───────────────────────────────────────────────────
-    write_json(f"{out}/top_ui_paths.json", q(f"""
-        SELECT query['path'] AS path, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['path'] IS NOT NULL
+    reg.sql("top_ui_paths", """
+        SELECT path, SUM(n)::BIGINT AS count
+        FROM p_event_paths
         GROUP BY path ORDER BY count DESC LIMIT 20
-    """))
+    """)
 
     # ─── 6. Opacity interactions ──────────────────────────────────────────────
-    write_json(f"{out}/opacity_interactions.json", q(f"""
-        SELECT query['path'] AS path, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND lower(query['path']) LIKE '%opaci%'
+    reg.sql("opacity_interactions", """
+        SELECT path, SUM(n)::BIGINT AS count
+        FROM p_event_paths
+        WHERE lower(path) LIKE '%opaci%'
         GROUP BY path ORDER BY count DESC
-    """))
+    """)
 
     # ─── 7. Spatial search interactions ───────────────────────────────────────
-    write_json(f"{out}/spatial_search.json", q(f"""
-        SELECT query['path'] AS path, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND lower(query['path']) LIKE '%spatial%'
+    reg.sql("spatial_search", """
+        SELECT path, SUM(n)::BIGINT AS count
+        FROM p_event_paths
+        WHERE lower(path) LIKE '%spatial%'
         GROUP BY path ORDER BY count DESC
-    """))
+    """)
 
     # ─── 8. Geographic distribution ───────────────────────────────────────────
     # Count tool page visits per country (not CDN hops, not event pings)
-    write_json(f"{out}/geo_distribution.json", q(f"""
-        SELECT c_country, count(*)::BIGINT AS visits
-        FROM {P}
+    reg.sql("geo_distribution", """
+        SELECT c_country, SUM(n)::BIGINT AS visits
+        FROM tool_visits
         WHERE traffic_type='Likely Human'
-          AND site='Apps'
-          AND cs_uri_stem IN {TOOL_STEMS}
           AND c_country IS NOT NULL AND c_country <> '-'
         GROUP BY c_country ORDER BY visits DESC
-    """))
+    """)
 
     # ─── 9. Traffic type breakdown (all rows) ─────────────────────────────────
-    write_json(f"{out}/traffic_types.json", q(f"""
-        SELECT traffic_type AS type, count(*)::BIGINT AS count
-        FROM {P}
+    reg.sql("traffic_types", """
+        SELECT traffic_type AS type, SUM(n)::BIGINT AS count
+        FROM p_traffic_cube
         WHERE traffic_type IS NOT NULL
         GROUP BY traffic_type ORDER BY count DESC
-    """))
+    """)
 
     # ─── 10. CDE workflow funnel ──────────────────────────────────────────────
-    write_json(f"{out}/cde_workflow.json", q(f"""
-        SELECT query['path'] AS path, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['app'] = 'cde-ui'
-          AND query['path'] IS NOT NULL
+    reg.sql("cde_workflow", """
+        SELECT path, SUM(n)::BIGINT AS count
+        FROM p_cde_paths
         GROUP BY path ORDER BY count DESC LIMIT 15
-    """))
+    """)
 
     # ─── 11. External referrer ecosystem ──────────────────────────────────────
-    write_json(f"{out}/referrers.json", q(f"""
-        SELECT name, sum(n)::BIGINT AS value
-        FROM (
-            SELECT
-                CASE
-                    WHEN cs_referer LIKE '%gtexportal.org%'              THEN 'GTEx Portal'
-                    WHEN cs_referer LIKE '%hubmapconsortium.org%'
-                      OR cs_referer LIKE '%hubmapconsortium.github.io%'  THEN 'HubMAP'
-                    WHEN cs_referer LIKE '%ebi.ac.uk%'                   THEN 'EBI'
-                    WHEN cs_referer LIKE '%sennetconsortium.org%'        THEN 'SenNet'
-                    WHEN cs_referer LIKE '%vitessce.io%'                 THEN 'Vitessce'
-                    WHEN cs_referer LIKE '%google.com%'                  THEN 'Google'
-                END AS name,
-                count(*) AS n
-            FROM {P}
-            WHERE cs_referer IS NOT NULL
-              AND cs_referer NOT IN ('', '-')
-              AND cs_referer NOT LIKE '%humanatlas.io%'
-              AND cs_referer NOT LIKE '%localhost%'
-              AND cs_referer NOT LIKE '%cloudfront.net%'
-            GROUP BY name
-        )
+    reg.sql("referrers", """
+        SELECT name, SUM(n)::BIGINT AS value
+        FROM p_referrers
         WHERE name IS NOT NULL
         GROUP BY name ORDER BY value DESC
-    """))
+    """)
 
     # ─── 12. Portal navigation clicks (e.label) ───────────────────────────────
-    write_json(f"{out}/nav_clicks.json", q(f"""
-        SELECT query['e.label'] AS label, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['e.label'] IS NOT NULL
+    reg.sql("nav_clicks", """
+        SELECT label, SUM(n)::BIGINT AS count
+        FROM p_nav_labels
         GROUP BY label ORDER BY count DESC LIMIT 15
-    """))
+    """)
 
     # ─── 13. CDE tab usage (e.tab) ────────────────────────────────────────────
-    write_json(f"{out}/cde_tabs.json", q(f"""
-        SELECT query['e.tab'] AS tab, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['e.tab'] IS NOT NULL
+    reg.sql("cde_tabs", """
+        SELECT tab, SUM(n)::BIGINT AS count
+        FROM p_cde_tabs
         GROUP BY tab ORDER BY count DESC
-    """))
+    """)
 
     # ─── 14. Sidebar / panel actions (e.action) ───────────────────────────────
-    write_json(f"{out}/sidebar_actions.json", q(f"""
-        SELECT query['e.action'] AS action, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['e.action'] IS NOT NULL
+    reg.sql("sidebar_actions", """
+        SELECT action, SUM(n)::BIGINT AS count
+        FROM p_sidebar_actions
         GROUP BY action ORDER BY count DESC
-    """))
+    """)
 
     # ─── 15. Organ / view selections (e.value) ────────────────────────────────
-    # Exclude coordinate strings (CenterY_global_px style) and long UUIDs
-    write_json(f"{out}/organ_selections.json", q(f"""
-        SELECT query['e.value'] AS selection, count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['e.value'] IS NOT NULL
-          AND length(query['e.value']) < 60
-          AND NOT regexp_matches(query['e.value'], '^[A-Z][a-zA-Z]+_')
+    reg.sql("organ_selections", """
+        SELECT selection, SUM(n)::BIGINT AS count
+        FROM p_organ_selections
         GROUP BY selection ORDER BY count DESC LIMIT 20
-    """))
+    """)
 
     # ─── 16. Hourly traffic distribution (UTC) ────────────────────────────────
-    write_json(f"{out}/hourly_traffic.json", q(f"""
-        SELECT
-            try_cast(split_part(time, ':', 1) AS INTEGER) AS hour,
-            count(*)::BIGINT AS count
-        FROM {P}
+    reg.sql("hourly_traffic", """
+        SELECT hour, SUM(n)::BIGINT AS count
+        FROM p_traffic_cube
         WHERE traffic_type='Likely Human'
-          AND time IS NOT NULL
         GROUP BY hour
         HAVING hour IS NOT NULL
         ORDER BY hour
-    """))
+    """)
 
     # ─── 17. Monthly unique sessions ──────────────────────────────────────────
-    write_json(f"{out}/monthly_unique_users.json", q(f"""
-        SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            count(DISTINCT query['sessionId'])::BIGINT AS unique_sessions
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND {SESSION_FILTER}
-        GROUP BY month_year ORDER BY month_year
-    """))
+    if approx:
+        reg.sql("monthly_unique_users", f"""
+            SELECT strftime(part, '%Y-%m') AS month_year, {estimate()} AS unique_sessions
+            FROM p_session_sketches
+            GROUP BY month_year ORDER BY month_year
+        """)
+    else:
+        reg.sql("monthly_unique_users", """
+            SELECT
+                strftime(part, '%Y-%m') AS month_year,
+                count(DISTINCT sid)::BIGINT AS unique_sessions
+            FROM p_sessions
+            GROUP BY month_year ORDER BY month_year
+        """)
+
+    # ─── NEW: Unique sessions per quarter and year ───────────────────────────
+    # Rolled up from the monthly partials: sessions spanning months count once
+    periods = """
+        SELECT 'quarter' AS period_type, strftime(part, '%Y') || '-Q' || quarter(part) AS period, {cols}
+        FROM {source} WHERE part IS NOT NULL
+        UNION ALL
+        SELECT 'year', strftime(part, '%Y'), {cols}
+        FROM {source} WHERE part IS NOT NULL
+    """
+    if approx:
+        reg.sql("unique_sessions_rollup", f"""
+            SELECT period_type, period, {estimate()} AS unique_sessions
+            FROM ({merge(f"({periods.format(cols='register, rho', source='p_session_sketches')})",
+                         ["period_type", "period"])})
+            GROUP BY ALL ORDER BY period_type, period
+        """)
+    else:
+        reg.sql("unique_sessions_rollup", f"""
+            SELECT period_type, period, count(DISTINCT sid)::BIGINT AS unique_sessions
+            FROM ({periods.format(cols='sid', source='p_sessions')})
+            GROUP BY ALL ORDER BY period_type, period
+        """)
 
     # ─── 18. Session depth distribution ───────────────────────────────────────
-    depth_raw = q(f"""
-        WITH session_depths AS (
-            SELECT query['sessionId'] AS sid, count(*)::BIGINT AS n
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND {SESSION_FILTER}
-            GROUP BY sid
-        )
-        SELECT
-            CASE
-                WHEN n = 1    THEN '1'
-                WHEN n = 2    THEN '2'
-                WHEN n <= 5   THEN '3–5'
-                WHEN n <= 10  THEN '6–10'
-                WHEN n <= 20  THEN '11–20'
-                ELSE '20+'
-            END AS depth,
-            count(*)::BIGINT AS sessions
-        FROM session_depths
-        GROUP BY depth
-    """)
-    order = ['1', '2', '3–5', '6–10', '11–20', '20+']
-    depth_map = {d['depth']: d['sessions'] for d in depth_raw}
-    write_json(f"{out}/session_depth.json", [
-        {'depth': k, 'sessions': depth_map.get(k, 0)} for k in order if k in depth_map
-    ])
+    @reg.python("session_depth", inputs=("p_sessions",))
+    def session_depth(cur):
+        depth_raw = records(cur, """
+            WITH session_depths AS (
+                SELECT sid, SUM(n)::BIGINT AS n
+                FROM p_sessions
+                GROUP BY sid
+            )
+            SELECT
+                CASE
+                    WHEN n = 1    THEN '1'
+                    WHEN n = 2    THEN '2'
+                    WHEN n <= 5   THEN '3–5'
+                    WHEN n <= 10  THEN '6–10'
+                    WHEN n <= 20  THEN '11–20'
+                    ELSE '20+'
+                END AS depth,
+                count(*)::BIGINT AS sessions
+            FROM session_depths
+            GROUP BY depth
+        """)
+        order = ['1', '2', '3–5', '6–10', '11–20', '20+']
+        depth_map = {d['depth']: d['sessions'] for d in depth_raw}
+        return [
+            {'depth': k, 'sessions': depth_map.get(k, 0)} for k in order if k in depth_map
+        ]
 
     # ─── 19. Error breakdown (source + root cause) ────────────────────────────
     # Uses the same data that powers the Features page error charts.
     # Source = which app; root cause = top error message patterns.
-    write_json(f"{out}/error_breakdown.json", {
-        "by_source": q(f"""
-            SELECT COALESCE({APP_TOOL_CASE}, 'Portal/Other') AS tool, count(*)::BIGINT AS errors
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND query['event'] = 'error'
-            GROUP BY tool
-            ORDER BY errors DESC
-        """),
-        "by_message": q(f"""
-            SELECT query['e.reason.message'] AS message, count(*)::BIGINT AS errors
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND query['event'] = 'error'
-              AND query['e.reason.message'] IS NOT NULL
-            GROUP BY message ORDER BY errors DESC LIMIT 20
-        """),
-    })
+    @reg.python("error_breakdown", inputs=("p_errors",))
+    def error_breakdown(cur):
+        return {
+            "by_source": records(cur, """
+                SELECT COALESCE(app_tool, 'Portal/Other') AS tool, SUM(n)::BIGINT AS errors
+                FROM p_errors
+                GROUP BY 1
+                ORDER BY errors DESC
+            """),
+            "by_message": records(cur, """
+                SELECT message, SUM(n)::BIGINT AS errors
+                FROM p_errors
+                WHERE message IS NOT NULL
+                GROUP BY message ORDER BY errors DESC LIMIT 20
+            """),
+        }
 
     # ─── 20. Error root-cause buckets by source (tools + Portal/Other) ───────
-    write_json(f"{out}/error_root_cause_breakdown.json", {
-        "by_source_bucket": q(f"""
-            SELECT
-                COALESCE({APP_TOOL_CASE}, 'Portal/Other') AS source,
-                {ERROR_BUCKET_CASE} AS bucket,
-                count(*)::BIGINT AS errors
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND query['event'] = 'error'
-            GROUP BY source, bucket
-            ORDER BY source, errors DESC
-        """),
-        "by_source": q(f"""
-            SELECT
-                COALESCE({APP_TOOL_CASE}, 'Portal/Other') AS source,
-                count(*)::BIGINT AS errors
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND query['event'] = 'error'
-            GROUP BY source
-            ORDER BY errors DESC
-        """),
-        "by_bucket": q(f"""
-            SELECT
-                {ERROR_BUCKET_CASE} AS bucket,
-                count(*)::BIGINT AS errors
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND query['event'] = 'error'
-            GROUP BY bucket
-            ORDER BY errors DESC
-        """),
-    })
+    @reg.python("error_root_cause_breakdown", inputs=("p_errors", "error_dictionary"))
+    def error_root_cause_breakdown(cur):
+        return {
+            "by_source_bucket": records(cur, """
+                SELECT
+                    COALESCE(app_tool, 'Portal/Other') AS source,
+                    COALESCE(d.bucket, 'Other') AS bucket,
+                    SUM(n)::BIGINT AS errors
+                FROM p_errors LEFT JOIN error_dictionary d USING (message)
+                GROUP BY source, bucket
+                ORDER BY source, errors DESC
+            """),
+            "by_source": records(cur, """
+                SELECT
+                    COALESCE(app_tool, 'Portal/Other') AS source,
+                    SUM(n)::BIGINT AS errors
+                FROM p_errors
+                GROUP BY source
+                ORDER BY errors DESC
+            """),
+            "by_bucket": records(cur, """
+                SELECT
+                    COALESCE(d.bucket, 'Other') AS bucket,
+                    SUM(n)::BIGINT AS errors
+                FROM p_errors LEFT JOIN error_dictionary d USING (message)
+                GROUP BY bucket
+                ORDER BY errors DESC
+            """),
+        }
 
     # ─── NEW: Cohort retention matrix ─────────────────────────────────────────
     # For each monthly cohort (first-seen month), how many users were active
     # at months 0, 1, 2, … after first visit?
     # Uses anon_id (persistent cookie) — not sessionId (ephemeral per-tab ID).
-    write_json(f"{out}/cohort_retention.json", q(f"""
-        WITH user_activity AS (
-            SELECT
-                anon_id,
-                date_trunc('month', date)::DATE AS active_month
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND anon_id IS NOT NULL
-              AND anon_id NOT IN ('', '-', 'TODO', 'null', 'None', 'nan')
-              AND length(anon_id) >= 4
-            GROUP BY 1, 2
-        ),
-        cohorts AS (
-            SELECT anon_id, MIN(active_month) AS cohort_month
-            FROM user_activity
-            GROUP BY anon_id
-        ),
-        cohort_sizes AS (
-            SELECT cohort_month, count(*) AS cohort_size
-            FROM cohorts GROUP BY cohort_month
-        ),
-        joined AS (
-            SELECT
-                c.cohort_month,
-                ua.active_month,
-                datediff('month', c.cohort_month, ua.active_month) AS months_since_first,
-                count(DISTINCT ua.anon_id) AS retained_users
-            FROM cohorts c
-            JOIN user_activity ua USING (anon_id)
-            GROUP BY 1, 2, 3
-        )
+    # Counted from the first-seen state (fa_users), kept incrementally
+    reg.sql("cohort_retention", """
         SELECT
-            strftime(j.cohort_month, '%Y-%m') AS cohort_month,
-            j.months_since_first,
-            j.retained_users AS retained_sessions,
-            cs.cohort_size,
-            round(100.0 * j.retained_users / cs.cohort_size, 1) AS retention_pct
-        FROM joined j
-        JOIN cohort_sizes cs ON j.cohort_month = cs.cohort_month
-        WHERE j.months_since_first >= 0
-        ORDER BY j.cohort_month, j.months_since_first
-    """))
+            strftime(a.first_seen, '%Y-%m') AS cohort_month,
+            datediff('month', a.first_seen, a.active) AS months_since_first,
+            a.n AS retained_sessions,
+            c.n AS cohort_size,
+            round(100.0 * a.n / c.n, 1) AS retention_pct
+        FROM fa_users a
+        JOIN fa_users c ON c.first_seen = a.first_seen AND c.active = c.first_seen
+        ORDER BY cohort_month, months_since_first
+    """)
 
     # ─── NEW: Top UI paths broken down by event type ──────────────────────────
-    # click/hover/keyboard use query['path'] (UI element path)
-    # pageView uses query['e.path'] (URL path)
-    # error uses query['e.reason.message'] (error message)
-    paths_raw = q(f"""
-        SELECT
-            query['event'] AS event,
-            CASE query['event']
-                WHEN 'pageView' THEN query['e.path']
-                WHEN 'error'    THEN query['e.reason.message']
-                ELSE                 query['path']
-            END AS path,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['event'] IN ('click','hover','error','keyboard','pageView')
-        GROUP BY event, path
-        HAVING path IS NOT NULL
-        ORDER BY event, count DESC
-    """)
-    from collections import defaultdict
-    by_event: dict = defaultdict(list)
-    for row in paths_raw:
-        by_event[row["event"]].append({"path": row["path"], "count": row["count"]})
-    write_json(f"{out}/top_paths_by_event.json", {
-        evt: rows[:20] for evt, rows in by_event.items()
-    })
+    @reg.python("top_paths_by_event", inputs=("p_paths_by_event",))
+    def top_paths_by_event(cur):
+        paths_raw = records(cur, """
+            SELECT event, path, SUM(n)::BIGINT AS count
+            FROM p_paths_by_event
+            GROUP BY event, path
+            ORDER BY event, count DESC
+        """)
+        from collections import defaultdict
+        by_event: dict = defaultdict(list)
+        for row in paths_raw:
+            by_event[row["event"]].append({"path": row["path"], "count": row["count"]})
+        return {
+            evt: rows[:20] for evt, rows in by_event.items()
+        }
 
     # ─── NEW: Tool preference per country ────────────────────────────────────
-    write_json(f"{out}/geo_tool_preference.json", q(f"""
+    reg.sql("geo_tool_preference", """
         WITH counts AS (
-            SELECT c_country, {TOOL_CASE} AS tool, count(*)::BIGINT AS visits
-            FROM {P}
+            SELECT c_country, tool, SUM(n)::BIGINT AS visits
+            FROM tool_visits
             WHERE traffic_type='Likely Human'
-              AND site='Apps'
-              AND cs_uri_stem IN {TOOL_STEMS}
               AND c_country IS NOT NULL AND c_country NOT IN ('-','')
             GROUP BY c_country, tool
         ),
@@ -477,22 +724,20 @@ def run(parquet: str, out: str) -> None:
         ),
         ranked AS (
             SELECT c.*, t.total_visits,
-                   ROW_NUMBER() OVER (PARTITION BY c.c_country ORDER BY c.visits DESC) AS rn
+                   ROW_NUMBER() OVER (PARTITION BY c.c_country ORDER BY c.visits DESC, c.tool) AS rn
             FROM counts c JOIN totals t USING (c_country)
         )
         SELECT c_country, tool AS top_tool, visits AS top_tool_visits, total_visits
         FROM ranked WHERE rn = 1
         ORDER BY total_visits DESC LIMIT 30
-    """))
+    """)
 
     # ─── NEW: Per-country per-tool visit breakdown (wide, for stacked bar) ───
-    write_json(f"{out}/geo_tool_breakdown.json", q(f"""
+    reg.sql("geo_tool_breakdown", """
         WITH counts AS (
-            SELECT c_country, {TOOL_CASE} AS tool, count(*)::BIGINT AS visits
-            FROM {P}
+            SELECT c_country, tool, SUM(n)::BIGINT AS visits
+            FROM tool_visits
             WHERE traffic_type='Likely Human'
-              AND site='Apps'
-              AND cs_uri_stem IN {TOOL_STEMS}
               AND c_country IS NOT NULL AND c_country NOT IN ('-','')
             GROUP BY c_country, tool
         ),
@@ -510,333 +755,485 @@ def run(parquet: str, out: str) -> None:
         FROM counts c JOIN totals t USING (c_country)
         GROUP BY c.c_country, t.total
         ORDER BY t.total DESC LIMIT 30
-    """))
+    """)
 
     # ─── NEW: Bot traffic by country ─────────────────────────────────────────
-    write_json(f"{out}/geo_bot_traffic.json", q(f"""
+    reg.sql("geo_bot_traffic", """
         SELECT
             c_country,
-            SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN 1 ELSE 0 END)::BIGINT AS bot_visits,
-            count(*)::BIGINT AS total_requests,
-            round(100.0 * SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN 1 ELSE 0 END)
-                  / count(*), 1) AS bot_pct
-        FROM {P}
+            SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN n ELSE 0 END)::BIGINT AS bot_visits,
+            SUM(n)::BIGINT AS total_requests,
+            round(100.0 * SUM(CASE WHEN traffic_type IN ('Bot','AI-Assistant / Bot') THEN n ELSE 0 END)
+                  / SUM(n), 1) AS bot_pct
+        FROM p_traffic_cube
         WHERE c_country IS NOT NULL AND c_country NOT IN ('-','')
         GROUP BY c_country
         HAVING bot_visits > 100
         ORDER BY bot_visits DESC
         LIMIT 25
-    """))
+    """)
 
     # ─── NEW: Per-tool hourly event heatmap ───────────────────────────────────
     # Shows which tools get used at which hours of the day.
     # Much richer than the total hourly_traffic.json.
-    write_json(f"{out}/tool_hourly_heatmap.json", q(f"""
-        SELECT
-            {APP_TOOL_CASE} AS tool,
-            try_cast(split_part(time, ':', 1) AS INTEGER) AS hour_utc,
-            count(*)::BIGINT AS events
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['app'] IS NOT NULL
-          AND time IS NOT NULL
+    reg.sql("tool_hourly_heatmap", """
+        SELECT tool, hour_utc, SUM(n)::BIGINT AS events
+        FROM p_tool_hours
         GROUP BY tool, hour_utc
-        HAVING tool IS NOT NULL AND hour_utc IS NOT NULL
         ORDER BY tool, hour_utc
-    """))
+    """)
 
     # ─── NEW: Visits by day of week per tool ─────────────────────────────────
-    write_json(f"{out}/traffic_by_dow.json", q(f"""
+    reg.sql("traffic_by_dow", """
         SELECT
-            dayofweek(date) AS dow_num,
-            strftime(date, '%A') AS day_name,
-            {TOOL_CASE} AS tool,
-            count(*)::BIGINT AS visits
-        FROM {P}
+            dow AS dow_num,
+            ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'][dow + 1] AS day_name,
+            tool,
+            SUM(n)::BIGINT AS visits
+        FROM tool_visits
         WHERE traffic_type='Likely Human'
-          AND site='Apps'
-          AND cs_uri_stem IN {TOOL_STEMS}
         GROUP BY dow_num, day_name, tool
         ORDER BY dow_num, tool
-    """))
+    """)
 
     # ─── NEW: Monthly error trend by tool ────────────────────────────────────
-    error_by_tool = q(f"""
-        SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            COALESCE({APP_TOOL_CASE}, 'Unknown') AS tool,
-            count(*)::BIGINT AS errors
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['event'] = 'error'
-        GROUP BY month_year, tool
-        ORDER BY month_year, tool
-    """)
-    error_by_month = q(f"""
-        SELECT
-            strftime(date_trunc('month', date)::DATE, '%Y-%m') AS month_year,
-            count(*)::BIGINT AS total_errors
-        FROM {P}
-        WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['event'] = 'error'
-        GROUP BY month_year ORDER BY month_year
-    """)
-    write_json(f"{out}/monthly_error_trend.json", {
-        "by_tool": error_by_tool,
-        "by_month": error_by_month,
-    })
+    @reg.python("monthly_error_trend", inputs=("p_errors",))
+    def monthly_error_trend(cur):
+        error_by_tool = records(cur, """
+            SELECT
+                strftime(part, '%Y-%m') AS month_year,
+                COALESCE(app_tool, 'Unknown') AS tool,
+                SUM(n)::BIGINT AS errors
+            FROM p_errors
+            GROUP BY month_year, tool
+            ORDER BY month_year, tool
+        """)
+        error_by_month = records(cur, """
+            SELECT
+                strftime(part, '%Y-%m') AS month_year,
+                SUM(n)::BIGINT AS total_errors
+            FROM p_errors
+            GROUP BY month_year ORDER BY month_year
+        """)
+        return {
+            "by_tool": error_by_tool,
+            "by_month": error_by_month,
+        }
 
     # ─── NEW: Human request type breakdown (for Sankey infra bifurcation) ──────
     # Categorises every human CloudFront row that is NOT an event ping (/tr)
     # by the type of asset being fetched, so the Sankey can split "Infra Requests"
     # into meaningful sub-nodes (JS bundles, API calls, fonts, etc.)
-    write_json(f"{out}/request_type_breakdown.json", q(f"""
-        SELECT
-            CASE
-                WHEN cs_uri_stem LIKE '%.js'
-                  OR cs_uri_stem LIKE '%.js.map'       THEN 'JS Bundles'
-                WHEN cs_uri_stem LIKE '%.css'
-                  OR cs_uri_stem LIKE '%.css.map'      THEN 'Stylesheets'
-                WHEN cs_uri_stem LIKE '%.woff'
-                  OR cs_uri_stem LIKE '%.woff2'
-                  OR cs_uri_stem LIKE '%.ttf'
-                  OR cs_uri_stem LIKE '%.otf'
-                  OR cs_uri_stem LIKE '%.eot'          THEN 'Fonts'
-                WHEN cs_uri_stem LIKE '/api/%'
-                  OR cs_uri_stem LIKE '%.graphql'      THEN 'API Calls'
-                WHEN cs_uri_stem LIKE '%.json'
-                  OR cs_uri_stem LIKE '%.geojson'      THEN 'Data Files'
-                WHEN cs_uri_stem LIKE '%.png'
-                  OR cs_uri_stem LIKE '%.jpg'
-                  OR cs_uri_stem LIKE '%.jpeg'
-                  OR cs_uri_stem LIKE '%.svg'
-                  OR cs_uri_stem LIKE '%.ico'
-                  OR cs_uri_stem LIKE '%.webp'         THEN 'Images'
-                WHEN cs_uri_stem LIKE '%.html'
-                  OR cs_uri_stem = '/'
-                  OR cs_uri_stem LIKE '%/'             THEN 'HTML Pages'
-                ELSE                                        'Other'
-            END AS request_type,
-            count(*)::BIGINT AS count
-        FROM {P}
-        WHERE traffic_type = 'Likely Human'
-          AND cs_uri_stem != '/tr'
+    reg.sql("request_type_breakdown", """
+        SELECT request_type, SUM(n)::BIGINT AS count
+        FROM p_request_types
         GROUP BY request_type
         ORDER BY count DESC
-    """))
+    """)
 
     # ─── NEW: KG Explorer error rate per month ───────────────────────────────
-    kg_visits = {r[0]: r[1] for r in con.execute(f"""
-        SELECT strftime(date_trunc('month', date)::DATE, '%Y-%m'), count(*)::BIGINT
-        FROM {P} WHERE traffic_type='Likely Human' AND site='Apps'
-          AND cs_uri_stem='/kg-explorer/'
-        GROUP BY 1 ORDER BY 1""").fetchall()}
-    kg_errors = {r[0]: r[1] for r in con.execute(f"""
-        SELECT strftime(date_trunc('month', date)::DATE, '%Y-%m'), count(*)::BIGINT
-        FROM {P} WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-          AND query['event']='error' AND query['app']='kg-explorer'
-        GROUP BY 1 ORDER BY 1""").fetchall()}
-    write_json(f"{out}/kg_error_rate.json", [
-        {"month_year": m, "visits": kg_visits.get(m, 0), "errors": kg_errors.get(m, 0),
-         "rate": round(kg_errors.get(m, 0) * 100 / kg_visits[m], 1) if kg_visits.get(m) else 0.0}
-        for m in sorted(set(kg_visits) | set(kg_errors))
-    ])
+    @reg.python("kg_error_rate", inputs=("p_errors", "tool_visits"))
+    def kg_error_rate(cur):
+        kg_visits = {r[0]: r[1] for r in cur.execute("""
+            SELECT strftime(part, '%Y-%m'), SUM(n)::BIGINT
+            FROM tool_visits WHERE traffic_type='Likely Human'
+              AND tool='KG Explorer'
+            GROUP BY 1 ORDER BY 1""").fetchall()}
+        kg_errors = {r[0]: r[1] for r in cur.execute("""
+            SELECT strftime(part, '%Y-%m'), SUM(n)::BIGINT
+            FROM p_errors WHERE app_tool='KG Explorer'
+            GROUP BY 1 ORDER BY 1""").fetchall()}
+        return [
+            {"month_year": m, "visits": kg_visits.get(m, 0), "errors": kg_errors.get(m, 0),
+             "rate": round(kg_errors.get(m, 0) * 100 / kg_visits[m], 1) if kg_visits.get(m) else 0.0}
+            for m in sorted(set(kg_visits) | set(kg_errors))
+        ]
 
     # ─── NEW: Per-tool error rate long format (visits + errors + rate) ────────
-    TOOL_APP_KEYS = {
-        "EUI":          ("/eui/",          ("ccf-eui",)),
-        "RUI":          ("/rui/",          ("ccf-rui",)),
-        "CDE":          ("/cde/",          ("cde-ui",)),
-        "FTU Explorer": ("/ftu-explorer/", ("ftu-ui", "ftu-ui-small-wc")),
-        "KG Explorer":  ("/kg-explorer/",  ("kg-explorer",)),
-    }
-    tool_err_rows = []
-    for tool, (stem, app_keys) in TOOL_APP_KEYS.items():
-        app_list = ", ".join(f"'{k}'" for k in app_keys)
-        rows = con.execute(f"""
-            WITH months AS (
-                SELECT DATE_TRUNC('month', CAST(date AS DATE)) AS mo
-                FROM {P} WHERE site='Apps' AND cs_uri_stem='{stem}'
-                GROUP BY 1
-            ),
-            vis AS (
-                SELECT DATE_TRUNC('month', CAST(date AS DATE)) AS mo, COUNT(*)::BIGINT AS visits
-                FROM {P} WHERE site='Apps' AND cs_uri_stem='{stem}'
-                GROUP BY 1
-            ),
-            err AS (
-                SELECT DATE_TRUNC('month', CAST(date AS DATE)) AS mo, COUNT(*)::BIGINT AS errors
-                FROM {P} WHERE site='Events' AND query['app'] IN ({app_list})
-                  AND query['event']='error'
-                GROUP BY 1
-            )
-            SELECT STRFTIME(m.mo, '%Y-%m'),
-                   COALESCE(v.visits, 0), COALESCE(e.errors, 0),
-                   ROUND(COALESCE(e.errors,0)*100.0/NULLIF(COALESCE(v.visits,0),0),1)
-            FROM months m
-            LEFT JOIN vis v ON m.mo=v.mo
-            LEFT JOIN err e ON m.mo=e.mo
-            ORDER BY m.mo
-        """).fetchall()
-        for r in rows:
-            tool_err_rows.append({
-                "tool": tool, "month_year": r[0],
-                "visits": r[1], "errors": r[2],
-                "rate": r[3] if r[3] is not None else 0.0,
-            })
-    write_json(f"{out}/tool_error_rates_long.json", tool_err_rows)
+    @reg.python("tool_error_rates_long", inputs=("p_site_errors", "tool_visits"))
+    def tool_error_rates_long(cur):
+        TOOL_APP_KEYS = {
+            "EUI":          ("ccf-eui",),
+            "RUI":          ("ccf-rui",),
+            "CDE":          ("cde-ui",),
+            "FTU Explorer": ("ftu-ui", "ftu-ui-small-wc"),
+            "KG Explorer":  ("kg-explorer",),
+        }
+        tool_err_rows = []
+        for tool, app_keys in TOOL_APP_KEYS.items():
+            app_list = ", ".join(f"'{k}'" for k in app_keys)
+            rows = cur.execute(f"""
+                WITH months AS (
+                    SELECT part AS mo
+                    FROM tool_visits WHERE tool='{tool}'
+                    GROUP BY 1
+                ),
+                vis AS (
+                    SELECT part AS mo, SUM(n)::BIGINT AS visits
+                    FROM tool_visits WHERE tool='{tool}'
+                    GROUP BY 1
+                ),
+                err AS (
+                    SELECT part AS mo, SUM(n)::BIGINT AS errors
+                    FROM p_site_errors WHERE app IN ({app_list})
+                    GROUP BY 1
+                )
+                SELECT STRFTIME(m.mo, '%Y-%m'),
+                       COALESCE(v.visits, 0), COALESCE(e.errors, 0),
+                       ROUND(COALESCE(e.errors,0)*100.0/NULLIF(COALESCE(v.visits,0),0),1)
+                FROM months m
+                LEFT JOIN vis v ON m.mo=v.mo
+                LEFT JOIN err e ON m.mo=e.mo
+                ORDER BY m.mo
+            """).fetchall()
+            for r in rows:
+                tool_err_rows.append({
+                    "tool": tool, "month_year": r[0],
+                    "visits": r[1], "errors": r[2],
+                    "rate": r[3] if r[3] is not None else 0.0,
+                })
+        return tool_err_rows
 
     # ─── NEW: Tool return rate (% of monthly visitors who returned) ───────────
-    rr_rows = con.execute(f"""
-        WITH um AS (
-            SELECT anon_id, {TOOL_CASE} AS tool, date_trunc('month', date)::DATE AS mo
-            FROM {P} WHERE site='Apps' AND traffic_type='Likely Human'
-              AND cs_uri_stem IN {TOOL_STEMS}
-              AND anon_id IS NOT NULL AND length(anon_id) >= 4
-            GROUP BY 1, 2, 3
-        ),
-        fs AS (SELECT anon_id, tool, MIN(mo) AS first FROM um GROUP BY 1, 2),
-        j  AS (SELECT m.anon_id, m.tool, m.mo, (m.mo > f.first) AS ret
-               FROM um m JOIN fs f USING (anon_id, tool))
-        SELECT strftime(mo, '%Y-%m'), tool,
-               count(DISTINCT anon_id)::BIGINT,
-               sum(CASE WHEN ret THEN 1 ELSE 0 END)::BIGINT,
-               round(100.0*sum(CASE WHEN ret THEN 1 ELSE 0 END)/count(DISTINCT anon_id), 1)
-        FROM j GROUP BY 1, 2 ORDER BY 1, 2
-    """).fetchall()
-    write_json(f"{out}/tool_return_rate.json", [
-        {"month_year": r[0], "tool": r[1], "users": r[2], "returning": r[3], "return_pct": float(r[4])}
-        for r in rr_rows
-    ])
+    # A user returns to a tool in any month after their first month on it
+    reg.sql("tool_return_rate", """
+        SELECT
+            strftime(active, '%Y-%m') AS month_year,
+            tool,
+            sum(n)::BIGINT AS users,
+            coalesce(sum(n) FILTER (WHERE first_seen < active), 0)::BIGINT AS "returning",
+            round(100.0 * coalesce(sum(n) FILTER (WHERE first_seen < active), 0) / sum(n), 1) AS return_pct
+        FROM fa_tool_users
+        GROUP BY ALL
+        ORDER BY month_year, tool
+    """)
 
     # ─── NEW: Cross-tool sessions (users visiting ≥2 tools) ──────────────────
-    from collections import Counter
-    ct_rows = con.execute(f"""
-        SELECT anon_id, LIST(DISTINCT {TOOL_CASE} ORDER BY {TOOL_CASE}) AS tools
-        FROM {P} WHERE site='Apps' AND traffic_type='Likely Human'
-          AND cs_uri_stem IN {TOOL_STEMS}
-          AND anon_id IS NOT NULL AND length(anon_id) >= 4
-        GROUP BY anon_id HAVING count(DISTINCT cs_uri_stem) >= 2
-    """).fetchall()
-    cc: Counter = Counter()
-    for _, tools in ct_rows:
-        key = tuple(sorted(set(t for t in tools if t)))
-        if len(key) >= 2:
-            cc[key] += 1
-    write_json(f"{out}/cross_tool_sessions.json", [
-        {"combo_label": " + ".join(c), "count": n, "tools": list(c)}
-        for c, n in cc.most_common(12)
-    ])
+    @reg.python("cross_tool_sessions", inputs=("p_app_anon_months",))
+    def cross_tool_sessions(cur):
+        from collections import Counter
+        ct_rows = cur.execute(f"""
+            SELECT anon_id, LIST(DISTINCT {TOOL_CASE} ORDER BY {TOOL_CASE}) AS tools
+            FROM p_app_anon_months
+            GROUP BY anon_id HAVING count(DISTINCT cs_uri_stem) >= 2
+        """).fetchall()
+        cc: Counter = Counter()
+        for _, tools in ct_rows:
+            key = tuple(sorted(set(t for t in tools if t)))
+            if len(key) >= 2:
+                cc[key] += 1
+        return [
+            {"combo_label": " + ".join(c), "count": n, "tools": list(c)}
+            for c, n in cc.most_common(12)
+        ]
 
     # ─── NEW: Top errors per tool (drill-down) ────────────────────────────────
-    import re as _re
-    BUCKET_CASE_ERR = """CASE
-        WHEN msg ILIKE '%/api/v1/technology-names%'        THEN 'CORS: technology list API'
-        WHEN msg ILIKE '%Http failure%' AND msg ILIKE '%/api/%' THEN 'API failure'
-        WHEN msg ILIKE '%Http failure%' AND (msg ILIKE '%127.0.0.1%' OR msg ILIKE '%localhost%') THEN 'Dev noise'
-        WHEN msg ILIKE '%Http failure%' AND (msg ILIKE '%.yml%' OR msg ILIKE '%.yaml%') THEN 'Content fetch failure'
-        WHEN msg ILIKE '%Http failure%'                    THEN 'CDN / HTTP failure'
-        WHEN msg ILIKE 'Error retrieving icon%'            THEN 'CDN icon failure'
-        WHEN msg ILIKE 'Cannot read properties of null%'
-          OR msg ILIKE 'Cannot read properties of undefined%'
-          OR msg ILIKE '%is undefined%'
-          OR msg ILIKE 'can''t access property%'           THEN 'Null-ref error'
-        WHEN msg ILIKE 'NG0%'                              THEN 'Angular DI error'
-        WHEN msg ILIKE '%is not a function%'               THEN 'Runtime type error'
-        ELSE 'Other'
-    END"""
-
-    def _clean_msg(msg: str) -> str:
-        msg = _re.sub(r'Http failure (response|during parsing) for (https?://[^\s:]+)[^:]*',
-                      lambda m: f"Http failure: {m.group(2).replace('https://','').replace('http://','')}", msg)
-        msg = _re.sub(r'Error retrieving icon ([^!]+)!.*', r'Icon failure: \1', msg)
-        msg = _re.sub(r'(NG\d+:[^.]+)\..*', r'\1', msg)
-        return msg[:90]
-
-    TOOL_APP_KEYS_ERR = {
-        "EUI":          ["ccf-eui"],
-        "RUI":          ["ccf-rui"],
-        "CDE":          ["cde-ui"],
-        "FTU Explorer": ["ftu-ui", "ftu-ui-small-wc"],
-        "KG Explorer":  ["kg-explorer"],
-    }
-    top_err_results = []
-    for tool, app_keys in TOOL_APP_KEYS_ERR.items():
-        app_list = ", ".join(f"'{k}'" for k in app_keys)
-        # All-time top errors
-        all_time = con.execute(f"""
-            SELECT query['e.reason.message'] AS msg, COUNT(*)::BIGINT AS cnt,
-                   {BUCKET_CASE_ERR} AS bucket
-            FROM {P}
-            WHERE site='Events' AND query['event']='error'
-              AND query['app'] IN ({app_list})
-              AND query['e.reason.message'] IS NOT NULL
-            GROUP BY 1 ORDER BY cnt DESC LIMIT 10
-        """).fetchall()
-        # Per-month top errors
-        months_with_errors = con.execute(f"""
-            SELECT DISTINCT strftime(date_trunc('month', date)::DATE, '%Y-%m') AS mo
-            FROM {P}
-            WHERE site='Events' AND query['event']='error'
-              AND query['app'] IN ({app_list})
-            ORDER BY mo
+    @reg.python("top_errors_by_tool", inputs=("p_site_errors", "error_dictionary"))
+    def top_errors_by_tool(cur):
+        TOOL_APP_KEYS_ERR = {
+            "EUI":          ["ccf-eui"],
+            "RUI":          ["ccf-rui"],
+            "CDE":          ["cde-ui"],
+            "FTU Explorer": ["ftu-ui", "ftu-ui-small-wc"],
+            "KG Explorer":  ["kg-explorer"],
+        }
+        # One grouped pass for every tool: the all-time set (mo IS NULL) and the
+        # per-month sets come from GROUPING SETS, ranked to the top 10 with QUALIFY.
+        app_tool = "CASE app " + " ".join(
+            f"WHEN '{k}' THEN '{tool}'" for tool, keys in TOOL_APP_KEYS_ERR.items() for k in keys
+        ) + " END"
+        # Messages are grouped by dictionary id (ids follow message order, so
+        # ties still break alphabetically); only the ranked rows are decoded.
+        ranked = cur.execute(f"""
+            WITH tool_errors AS (
+                SELECT {app_tool} AS tool, strftime(part, '%Y-%m') AS mo, d.message_id, n
+                FROM p_site_errors JOIN error_dictionary d USING (message)
+                WHERE app IN ({", ".join(f"'{k}'" for keys in TOOL_APP_KEYS_ERR.values() for k in keys)})
+            ),
+            grouped AS (
+                SELECT tool, mo, message_id, SUM(n)::BIGINT AS cnt, GROUPING(mo) AS all_time
+                FROM tool_errors
+                GROUP BY GROUPING SETS ((tool, message_id), (tool, mo, message_id))
+            ),
+            top AS (
+                SELECT * FROM grouped
+                WHERE all_time = 1 OR mo IS NOT NULL
+                QUALIFY row_number() OVER (PARTITION BY tool, all_time, mo ORDER BY cnt DESC, message_id) <= 10
+            )
+            SELECT tool, all_time, mo, d.cleaned, cnt, d.tool_bucket
+            FROM top JOIN error_dictionary d USING (message_id)
+            ORDER BY tool, all_time DESC, mo, cnt DESC, message_id
         """).fetchall()
-        by_month = {}
-        for (mo,) in months_with_errors:
-            mrows = con.execute(f"""
-                SELECT query['e.reason.message'] AS msg, COUNT(*)::BIGINT AS cnt,
-                       {BUCKET_CASE_ERR} AS bucket
-                FROM {P}
-                WHERE site='Events' AND query['event']='error'
-                  AND query['app'] IN ({app_list})
-                  AND query['e.reason.message'] IS NOT NULL
-                  AND strftime(date_trunc('month', date)::DATE, '%Y-%m') = '{mo}'
-                GROUP BY 1 ORDER BY cnt DESC LIMIT 10
-            """).fetchall()
-            if mrows:
-                by_month[mo] = [{"message": _clean_msg(r[0]), "count": r[1], "bucket": r[2]} for r in mrows]
-        top_err_results.append({
-            "tool": tool,
-            "all_time": [{"message": _clean_msg(r[0]), "count": r[1], "bucket": r[2]} for r in all_time],
-            "by_month": by_month,
-        })
-    write_json(f"{out}/top_errors_by_tool.json", top_err_results)
+        per_tool = {tool: {"all_time": [], "by_month": {}} for tool in TOOL_APP_KEYS_ERR}
+        for tool, all_time, mo, message, cnt, bucket in ranked:
+            entry = {"message": message, "count": cnt, "bucket": bucket}
+            if all_time:
+                per_tool[tool]["all_time"].append(entry)
+            else:
+                per_tool[tool]["by_month"].setdefault(mo, []).append(entry)
+        return [{"tool": tool, **per_tool[tool]} for tool in TOOL_APP_KEYS_ERR]
 
     # ─── NEW: All-tool error rate summary ───────────────────────────────────
-    write_json(f"{out}/all_tool_error_rates.json", q(f"""
+    reg.sql("all_tool_error_rates", """
         WITH visits AS (
-            SELECT {TOOL_CASE} AS tool, count(*)::BIGINT AS visits
-            FROM {P}
-            WHERE traffic_type='Likely Human' AND site='Apps'
-              AND cs_uri_stem IN {TOOL_STEMS}
+            SELECT tool, SUM(n)::BIGINT AS visits
+            FROM tool_visits
+            WHERE traffic_type='Likely Human'
             GROUP BY tool
         ),
         errors AS (
-            SELECT COALESCE({APP_TOOL_CASE}, 'Portal/Other') AS tool, count(*)::BIGINT AS errors
-            FROM {P}
-            WHERE site='Events' AND cs_uri_stem='/tr' AND traffic_type='Likely Human'
-              AND query['event'] = 'error'
-            GROUP BY tool
+            SELECT COALESCE(app_tool, 'Portal/Other') AS tool, SUM(n)::BIGINT AS errors
+            FROM p_errors
+            GROUP BY 1
         )
         SELECT v.tool, v.visits, COALESCE(e.errors, 0)::BIGINT AS errors,
                CASE WHEN v.visits > 0 THEN round(100.0 * COALESCE(e.errors, 0) / v.visits, 1) ELSE 0 END AS error_rate
         FROM visits v LEFT JOIN errors e ON v.tool = e.tool
         ORDER BY error_rate DESC
-    """))
+    """)
+
+
+def run(
+    parquet: str,
+    out: str,
+    dedup_mode: str = "table",
+    dedup_key: str = DEFAULT_DEDUP_KEY,
+    verify: bool = False,
+    spill_db: str | None = None,
+    events_mode: str = "fused",
+    incremental: bool = False,
+    state_db: str = STATE_DEFAULT,
+    lookback_days: int = DEFAULT_LOOKBACK_DAYS,
+    workers: int = DEFAULT_WORKERS,
+    runtime: Mapping[str, Any] | None = None,
+    only: Sequence[str] | None = None,
+    cache_dir: str | None = None,
+    profile: str | None = None,
+    explain: str | None = None,
+    approx: bool = False,
+    sample: float | None = None,
+    cube_out: str | None = None,
+    from_cube: str | None = None,
+    log_store: str | None = None,
+    since: date | None = None,
+    until: date | None = None,
+) -> None:
+    windowed = since is not None or until is not None
+    check_window(since, until)
+    if sample and incremental:
+        raise ValueError("--sample cannot be combined with --incremental (the state would hold sampled partials)")
+    if from_cube and (sample or incremental):
+        raise ValueError("--from-cube reads a stored cube; it cannot be combined with --sample or --incremental")
+    if log_store and (sample or incremental or spill_db or dedup_mode != "table"):
+        raise ValueError("--log-store holds the whole deduplicated table; it cannot be combined with "
+                         "--sample, --incremental, --spill-db or --dedup-mode view")
+    if windowed and (incremental or from_cube or cube_out or log_store):
+        raise ValueError("--since/--until filter the log load; they cannot be combined with --incremental, "
+                         "--from-cube, --cube-out or --log-store, which hold every date")
+    started = time.perf_counter()
+    os.makedirs(out, exist_ok=True)
+
+    P = "logs"
+    # Events/`/tr` aggregations: "fused" filters the log once into a small
+    # events table that every event query reads; "scan" re-applies the
+    # predicate against the full log in each query.
+    E = "events" if events_mode == "fused" else f"(SELECT * FROM {P} WHERE {EVENTS_FILTER})"
+    partials = partial_queries(P, E, approx)
+    # What the loaded logs depend on besides the parquet (keys the state and the cache)
+    log_definition = load_definition(dedup_key, EVENT_COLUMNS | TOOL_COLUMNS, ENUM_COLUMNS, [EVENTS_FILTER])
+    reg = Registry()
+    for name, sql in partials.items():
+        # A sampled run scales the request counts back up (see sampling.py)
+        reg.table(f"p_{name}", scale_counts(sql, sample) if sample and name not in SAMPLED_ENTITIES else sql)
+    register_outputs(reg, approx)
+    # Sampled outputs are previews: never cached, never served from the cache
+    if sample:
+        cache_dir = None
+    # A stored cube regenerates the outputs that read only the cube, without
+    # the logs (and without the cache, which is keyed on the parquet)
+    if from_cube:
+        servable = cube_outputs(reg)
+        unservable = [name for name in only or () if name not in servable]
+        if unservable:
+            raise ValueError(f"Not built from the cube alone: {', '.join(unservable)} (expected any of: {', '.join(servable)})")
+        only, cache_dir = only or servable, None
+    # `explain` runs only that node (and what it reads) with its plans kept, uncached
+    if explain:
+        only, cache_dir = reg.readers(explain)[:1], None
+    # `only` restricts the run to those outputs and the partials they read
+    targets = [name for name in reg.select(only) if name in reg.outputs]
+
+    # Outputs whose parquet fingerprint and definitions are unchanged are copied from the cache
+    cache = OutputCache(cache_dir, reg, parquet, dedup_key, window_metadata(since, until),
+                        log_definition, write_json) if cache_dir else None
+    if cache:
+        targets = cache.restore(targets, out)
+
+    con = duckdb.connect()
+    settings = apply_runtime(con, runtime or {})
+    print(describe_runtime(settings))
+    if targets or cube_out:
+        pool = QueryPool(con, workers=workers, threads=int(settings["threads"]), writer=write_json, report=report,
+                         profile=profile is not None, explain=[explain] if explain else ())
+        selected = reg.select(targets) if targets else []
+        if cube_out:
+            selected = [name for name in reg.nodes if name in set(selected) | {CUBE_TABLE}]
+
+        # Incremental runs only load the months whose partials must be recomputed
+        plan = None
+        if incremental:
+            open_state(con, state_db)
+            plan = plan_refresh(con, parquet, partials, lookback_days, load=log_definition)
+            print(describe_plan(plan))
+
+        # Incremental refreshes keep every partial in step with the fingerprints
+        needs_events = incremental or "events" in reg.external_inputs(selected)
+        # Only the log columns the nodes being built read are loaded (all the
+        # partials' in an incremental refresh); fused events filter the log too
+        readers = [*selected, *(f"p_{name}" for name in partials)] if plan else selected
+        read = reg.columns_read(readers, (P, "events"), [*LOG_COLUMNS, *EVENT_COLUMNS, *TOOL_COLUMNS])
+        if events_mode == "fused" and needs_events:
+            read |= referenced_columns(EVENTS_FILTER, LOG_COLUMNS)
+        # A window is pushed into the scan (and the hive partitions) of the load
+        window = window_predicate(since, until, hive_keys(parquet)) if windowed else None
+        if window:
+            print(f"Window: {describe_window(since, until)}")
+
+        if from_cube:
+            cube = pool.stage(CUBE_TABLE, lambda con: attach_cube(con, from_cube, reg))
+            print(describe_cube(cube, from_cube))
+        else:
+            if log_store:
+                # The deduplicated logs shared with the ML and dictionary scripts
+                load = pool.stage(P, lambda con: open_shared_logs(
+                    con, log_store, parquet, LOG_COLUMNS, derived=EVENT_COLUMNS | TOOL_COLUMNS,
+                    enums=ENUM_COLUMNS, hive_types=PARTITION_TYPES, key=dedup_key,
+                ))
+                print(describe_store(load))
+            else:
+                # Deduplicate parquet once on load — CloudFront log delivery can produce exact dupes
+                load = pool.stage(P, lambda con: materialize_logs(
+                    con, parquet, [col for col in LOG_COLUMNS if col in read], mode=dedup_mode, spill_db=spill_db,
+                    where=plan["where"] if plan else combine(sample_predicate(sample) if sample else None, window),
+                    derived={col: expr for col, expr in (EVENT_COLUMNS | TOOL_COLUMNS).items() if col in read},
+                    enums={col: values for col, values in ENUM_COLUMNS.items() if col in read},
+                    hive_types=PARTITION_TYPES, key=dedup_key,
+                ))
+            raw_count, deduped_count, dupes = load["raw_rows"], load["deduped_rows"], load["duplicates"]
+            if dupes > 0:
+                print(f"⚠ Removed {dupes:,} duplicate rows ({dupes/raw_count*100:.2f}%) — {deduped_count:,} rows remain")
+            print(f"Loaded logs ({dedup_mode}, key={dedup_key}) in {load['seconds']:.2f}s")
+            if "scan" in load:
+                print(f"  {describe_scan(load['scan'])}")
+            if verify:
+                print(describe_verification(verify_dedup(con, parquet, plan["where"] if plan else window, PARTITION_TYPES)))
+
+        if events_mode == "fused" and needs_events:
+            n_events = pool.stage("events", lambda con: materialize_events(con, P))
+            print(f"Events relation: {n_events:,} rows (1 scan of {P})")
+
+        done = [CUBE_TABLE] if from_cube else []
+        if plan:
+            t0 = time.perf_counter()
+            # The first-seen state is updated from the rebuilt months in the same transaction
+            refreshed = pool.stage("partials", lambda con: build_partials(
+                con, partials, plan, refresh=partial(refresh_state, specs=USER_STATE),
+                derived=stored_tables(USER_STATE),
+            ))
+            done = [f"p_{name}" for name in partials] + stored_tables(USER_STATE)
+            print(f"Refreshed {len(partials)} partial aggregates in {time.perf_counter() - t0:.2f}s")
+            print(describe_refresh(refreshed))
 
+        reg.run(pool, out, selected, done)
+        stats = pool.close()
+        print(f"  {describe_stats(stats)}")
+        if cube_out:
+            print(describe_cube(write_cube(con, cube_out, reg, parquet), cube_out))
+        if profile:
+            ranked = write_profile(profile, pool.profiles, stats)
+            print(f"{describe_profile(ranked)}")
+        for name, plans in pool.plans.items():
+            print(f"\nEXPLAIN ANALYZE {name} ({len(plans)} queries)")
+            print("\n".join(plans))
+        if cache:
+            cache.store(targets, out)
+    if cache:
+        cache.prune()
+        print(cache.describe())
+    # Run settings differ between runs of the same outputs, so they stay out of the cache
+    if "data_metadata" in reg.select(only):
+        record_runtime(os.path.join(out, "data_metadata.json"), settings, approx_distinct=approx,
+                       sample=sample_metadata(sample, unscaled_outputs(reg, SAMPLED_ENTITIES)),
+                       window=window_metadata(since, until))
     total = len(os.listdir(out))
-    print(f"\nAll done — {total} files in {out}/")
+    mode = "incremental" if incremental else f"{sample:.0%} sample" if sample else "from cube" if from_cube else "full"
+    if windowed:
+        mode += f" of {describe_window(since, until)}"
+    print(f"\nAll done — {total} files in {out}/ ({time.perf_counter() - started:.1f}s, {mode}, dedup={dedup_mode}, events={events_mode})")
 
 
 def parse_args():
     p = argparse.ArgumentParser(description="Generate dashboard JSON files from HRA parquet logs (DuckDB)")
-    p.add_argument("--parquet", default=PARQUET_DEFAULT, help="Path to source parquet")
+    p.add_argument("--parquet", default=PARQUET_DEFAULT, help="Source parquet file, glob, or directory of (hive-partitioned) files")
     p.add_argument("--out",     default=OUT_DEFAULT,     help="Output directory for JSON files")
+    p.add_argument("--dedup-mode", choices=DEDUP_MODES, default="table",
+                   help="'table' materializes the deduplicated logs once; 'view' re-runs DISTINCT per query (for timing comparisons)")
+    p.add_argument("--dedup-key", choices=DEDUP_KEYS, default=DEFAULT_DEDUP_KEY,
+                   help="What identifies a duplicate: x_edge_request_id (default; check it with --verify-dedup), the whole row, or a 64-bit row hash")
+    p.add_argument("--verify-dedup", action="store_true",
+                   help="Report where the dedup keys disagree (request ids shared by differing rows, hash collisions)")
+    p.add_argument("--spill-db", default=None,
+                   help="Materialize the deduplicated logs in this DuckDB file instead of memory")
+    p.add_argument("--log-store", metavar="PATH", default=None,
+                   help="Read the deduplicated logs from this DuckDB file, shared with the ML and dictionary scripts; "
+                        "rebuilt only when the parquet changes")
+    p.add_argument("--events-mode", choices=EVENTS_MODES, default="fused",
+                   help="'fused' filters Events/`/tr` rows once for all event aggregations; 'scan' filters the full log per query")
+    p.add_argument("--incremental", action="store_true",
+                   help="Reuse per-month partial aggregates from --state-db; only changed and recent months are rescanned")
+    p.add_argument("--state-db", default=STATE_DEFAULT,
+                   help="DuckDB file holding the incremental state")
+    p.add_argument("--lookback-days", type=int, default=DEFAULT_LOOKBACK_DAYS,
+                   help="Months overlapping the last N days of data are always recomputed in incremental mode")
+    add_runtime_args(p)
+    p.add_argument("--profile", action="store_true",
+                   help="Profile every output and partial; writes the nodes to --profile-out, most expensive first")
+    p.add_argument("--profile-out", metavar="PATH", default=PROFILE_DEFAULT,
+                   help="Profile report of --profile (kept out of the published outputs)")
+    p.add_argument("--explain-analyze", metavar="NAME", default=None,
+                   help="Run only this output or partial table (and its inputs), uncached, and print its full query plans")
+    p.add_argument("--cube-out", metavar="PATH", default=None,
+                   help="Also write the traffic rollup cube (p_traffic_cube) to this parquet file")
+    p.add_argument("--from-cube", metavar="PATH", default=None,
+                   help="Regenerate only the outputs built from the traffic cube, from this --cube-out file, without reading the logs")
+    p.add_argument("--sample", type=parse_fraction, metavar="FRACTION", default=None,
+                   help="Preview on this fraction of the users (e.g. 0.05), with request counts scaled back up; uncached")
+    p.add_argument("--since", type=parse_day, metavar="DAY", default=None,
+                   help="Only read the logs dated on or after this day (YYYY-MM-DD); pushed into the parquet scan")
+    p.add_argument("--until", type=parse_day, metavar="DAY", default=None,
+                   help="Only read the logs dated on or before this day (YYYY-MM-DD); pushed into the parquet scan")
+    p.add_argument("--approx", action="store_true",
+                   help="Estimate the unique session counts from HyperLogLog sketches (±1.6%% at 95%%)")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help="Aggregations run concurrently on this many cursors; 1 runs them serially")
+    p.add_argument("--only", type=lambda v: [name.strip() for name in v.split(",") if name.strip()],
+                   help="Comma-separated outputs to regenerate (JSON names without .json), plus the partials they need")
+    p.add_argument("--cache-dir", default=CACHE_DEFAULT,
+                   help="Reuse outputs whose parquet fingerprint and query definitions match a cached entry")
+    p.add_argument("--no-cache", action="store_true", help="Recompute every output")
     return p.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    if not os.path.exists(args.parquet):
+    if not args.from_cube and not dataset_files(args.parquet):
         raise FileNotFoundError(f"Parquet not found: {args.parquet}")
-    run(args.parquet, args.out)
+    run(args.parquet, args.out, dedup_mode=args.dedup_mode, dedup_key=args.dedup_key,
+        verify=args.verify_dedup, spill_db=args.spill_db,
+        events_mode=args.events_mode, incremental=args.incremental, state_db=args.state_db,
+        lookback_days=args.lookback_days, workers=args.workers, runtime=runtime_config(args),
+        only=args.only,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        profile=args.profile_out if args.profile else None, explain=args.explain_analyze, approx=args.approx,
+        sample=args.sample, cube_out=args.cube_out, from_cube=args.from_cube, log_store=args.log_store,
+        since=args.since, until=args.until)
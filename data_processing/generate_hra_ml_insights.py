@@ -23,8 +23,9 @@ import json
 import logging
 import math
 import re
+import time
 from collections import Counter
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from itertools import combinations
 from pathlib import Path
 from typing import Any
@@ -34,6 +35,17 @@ import duckdb
 import numpy as np
 import pandas as pd
 
+from event_store import event_fields, materialize_events
+from hll_sketch import estimate, sketch_query
+from log_store import (
+    DEDUP_KEYS, DEDUP_MODES, DEFAULT_DEDUP_KEY, dataset_files, default_source, describe_scan, describe_verification,
+    hive_keys, materialize_logs, verify_dedup,
+)
+from runtime_config import add_runtime_args, apply_runtime, describe_runtime, runtime_config
+from sampling import parse_fraction, sample_metadata, sample_predicate
+from shared_logs import describe_store, open_shared_logs
+from time_window import check_window, combine, describe_window, parse_day, window_metadata, window_predicate
+
 # Prophet imports `prophet.plot`, which logs an optional Plotly warning.
 # We do not use interactive plotting in this pipeline.
 logging.getLogger("prophet.plot").disabled = True
@@ -103,6 +115,17 @@ APP_TOOL_MAP: dict[str, str] = {
     "kg-explorer": "KG Explorer",
 }
 
+# Columns read by the queries in this module; the deduplicated log table is
+# materialized with just these.
+LOG_COLUMNS: tuple[str, ...] = (
+    "anon_id", "date", "time", "timestamp_ms", "site", "cs_uri_stem",
+    "traffic_type", "c_country", "sc_status", "sc_bytes", "cs_bytes",
+    "time_taken", "time_to_first_byte", "cs_user_agent", "cs_referer",
+    "cs_uri_query", "x_edge_request_id",
+)
+# Every `query` MAP key the event features use, flattened into columns on load
+EVENT_COLUMNS = event_fields()
+
 INVALID_SESSION_IDS = {"", "-", "TODO", "null", "None", "nan"}
 INVALID_ANON_IDS = {"", "-", "TODO", "null", "None", "nan"}
 
@@ -162,7 +185,7 @@ def safe_ratio(a: float, b: float) -> float:
     return float(a) / float(b) if b else 0.0
 
 
-def load_monthly_tool_visits(con: duckdb.DuckDBPyConnection, parquet_path: Path) -> pd.DataFrame:
+def load_monthly_tool_visits(con: duckdb.DuckDBPyConnection) -> pd.DataFrame:
     sql = f"""
     SELECT
       date_trunc('month', date)::DATE AS month_start,
@@ -350,7 +373,7 @@ def detect_spikes(piv: pd.DataFrame) -> list[dict[str, Any]]:
     return out
 
 
-def load_event_rows(con: duckdb.DuckDBPyConnection, parquet_path: Path) -> pd.DataFrame:
+def load_event_rows(con: duckdb.DuckDBPyConnection) -> pd.DataFrame:
     sql = f"""
     SELECT
       anon_id,
@@ -366,22 +389,8 @@ def load_event_rows(con: duckdb.DuckDBPyConnection, parquet_path: Path) -> pd.Da
       cs_user_agent,
       cs_referer,
       cs_uri_query,
-      query['sessionId'] AS session_id,
-      query['app'] AS app,
-      query['event'] AS event_type,
-      query['path'] AS path,
-      query['e.label'] AS e_label,
-      query['e.action'] AS e_action,
-      query['e.tab'] AS e_tab,
-      query['e.value'] AS e_value,
-      query['e.message'] AS e_message,
-      query['e.reason.message'] AS e_reason_message,
-      query['e.reason.stack'] AS e_reason_stack,
-      query['e.path'] AS e_path
-    FROM logs
-    WHERE site='Events'
-      AND cs_uri_stem='/tr'
-      AND traffic_type='Likely Human'
+      {", ".join(EVENT_COLUMNS)}
+    FROM events
     """
     df = con.execute(sql).df()
 
@@ -890,7 +899,7 @@ def association_mining(transactions: list[list[str]]) -> dict[str, Any]:
     return {"rules": rules[:60], "transaction_count": total, "method": "pairwise_fallback"}
 
 
-def train_bot_model(con: duckdb.DuckDBPyConnection, parquet_path: Path, session_features: pd.DataFrame) -> dict[str, Any]:
+def train_bot_model(con: duckdb.DuckDBPyConnection, session_features: pd.DataFrame) -> dict[str, Any]:
     if RandomForestClassifier is None or train_test_split is None:
         return {"metrics": {}, "notes": "sklearn unavailable; bot model skipped"}
 
@@ -988,7 +997,7 @@ def train_bot_model(con: duckdb.DuckDBPyConnection, parquet_path: Path, session_
         # event sessions are already human-labeled; we detect suspicious outliers.
         event_sql = f"""
         SELECT
-          query['sessionId'] AS session_id,
+          session_id,
           site,
           sc_status,
           coalesce(sc_bytes, 0) AS sc_bytes,
@@ -1001,11 +1010,8 @@ def train_bot_model(con: duckdb.DuckDBPyConnection, parquet_path: Path, session_
           length(coalesce(cs_referer, '')) AS referer_len,
           try_cast(substr(time, 1, 2) AS INTEGER) AS hour_utc,
           lower(coalesce(cs_user_agent, '')) AS ua_lower
-        FROM logs
-        WHERE site='Events'
-          AND cs_uri_stem='/tr'
-          AND traffic_type='Likely Human'
-          AND query['sessionId'] IS NOT NULL
+        FROM events
+        WHERE session_id IS NOT NULL
         """
         ev = con.execute(event_sql).df()
         ev["session_id"] = ev["session_id"].apply(normalize_session_id)
@@ -1067,17 +1073,20 @@ def cluster_errors(events: pd.DataFrame) -> dict[str, Any]:
     for col in text_cols:
         if col not in err.columns:
             err[col] = ""
-    err["text"] = (
-        err[text_cols]
-        .fillna("")
-        .astype(str)
-        .agg(" ".join, axis=1)
+    raw = err[text_cols[0]].fillna("").astype(str)
+    for col in text_cols[1:]:
+        raw = raw + " " + err[col].fillna("").astype(str)
+    # Error rows repeat a small set of messages: normalize each distinct text once
+    distinct = pd.Series(raw.unique())
+    normalized = (
+        distinct
         .str.lower()
         .str.replace(r"https?://\S+", " ", regex=True)
         .str.replace(r"[^a-z0-9_ ]", " ", regex=True)
         .str.replace(r"\s+", " ", regex=True)
         .str.strip()
     )
+    err["text"] = raw.map(dict(zip(distinct, normalized)))
     err = err[err["text"].str.len() > 0].copy()
     if len(err) < 200:
         return {"clusters": [], "notes": "not enough error text rows"}
@@ -1145,7 +1154,15 @@ def cluster_errors(events: pd.DataFrame) -> dict[str, Any]:
     return {"clusters": result, "total_error_rows": int(len(err))}
 
 
-def detect_geo_anomalies(con: duckdb.DuckDBPyConnection, parquet_path: Path, session_features: pd.DataFrame) -> dict[str, Any]:
+def load_geo_features(con: duckdb.DuckDBPyConnection, approx: bool = False) -> pd.DataFrame:
+    """Request mix per country; `approx` estimates the user-agent cardinality from HLL sketches."""
+    countries = "c_country IS NOT NULL AND c_country <> '-'"
+    if approx:
+        ua_sketches = sketch_query("logs", ["c_country"], "cs_user_agent", f"{countries} AND cs_user_agent IS NOT NULL")
+        ua = f"(SELECT c_country, {estimate()} AS ua_cardinality FROM ({ua_sketches}) GROUP BY c_country)"
+        ua_column, ua_join = "coalesce(any_value(ua.ua_cardinality), 0)::BIGINT", f"LEFT JOIN {ua} ua USING (c_country)"
+    else:
+        ua_column, ua_join = "count(DISTINCT cs_user_agent)::BIGINT", ""
     sql = f"""
     SELECT
       c_country,
@@ -1153,15 +1170,20 @@ def detect_geo_anomalies(con: duckdb.DuckDBPyConnection, parquet_path: Path, ses
       count(*) FILTER (WHERE traffic_type='Likely Human')::BIGINT AS human_requests,
       count(*) FILTER (WHERE traffic_type='Bot')::BIGINT AS bot_requests,
       count(*) FILTER (WHERE traffic_type='AI-Assistant / Bot')::BIGINT AS ai_bot_requests,
-      count(DISTINCT cs_user_agent)::BIGINT AS ua_cardinality,
+      {ua_column} AS ua_cardinality,
       avg(time_taken) AS avg_time_taken,
       avg(sc_bytes) AS avg_sc_bytes
-    FROM logs
-    WHERE c_country IS NOT NULL
-      AND c_country <> '-'
+    FROM logs {ua_join}
+    WHERE {countries}
     GROUP BY 1
     """
-    geo = con.execute(sql).df()
+    return con.execute(sql).df()
+
+
+def detect_geo_anomalies(
+    con: duckdb.DuckDBPyConnection, session_features: pd.DataFrame, approx: bool = False,
+) -> dict[str, Any]:
+    geo = load_geo_features(con, approx)
     if geo.empty:
         return {"suspicious_countries": []}
 
@@ -1247,37 +1269,87 @@ def detect_geo_anomalies(con: duckdb.DuckDBPyConnection, parquet_path: Path, ses
     }
 
 
-def run_pipeline(parquet_path: Path, output_dir: Path, forecast_horizon: int) -> dict[str, Any]:
+def run_pipeline(
+    parquet_path: Path,
+    output_dir: Path,
+    forecast_horizon: int,
+    dedup_mode: str = "table",
+    spill_db: str | None = None,
+    dedup_key: str = DEFAULT_DEDUP_KEY,
+    verify: bool = False,
+    runtime: dict[str, Any] | None = None,
+    approx: bool = False,
+    sample: float | None = None,
+    log_store: str | None = None,
+    since: date | None = None,
+    until: date | None = None,
+) -> dict[str, Any]:
+    windowed = since is not None or until is not None
+    check_window(since, until)
+    if log_store and (sample or windowed or spill_db or dedup_mode != "table"):
+        raise ValueError("--log-store holds the whole deduplicated table; it cannot be combined with "
+                         "--sample, --since/--until, --spill-db or --dedup-mode view")
     con = duckdb.connect()
-    con.execute("PRAGMA threads=4")
-
-    # Deduplicate on load — CloudFront log delivery can produce exact dupes
-    raw = con.execute(f"SELECT count(*) FROM read_parquet('{parquet_path}')").fetchone()[0]
-    con.execute(f"CREATE TEMP VIEW logs AS SELECT DISTINCT * FROM read_parquet('{parquet_path}')")
-    deduped = con.execute("SELECT count(*) FROM logs").fetchone()[0]
+    settings = apply_runtime(con, runtime or {})
+    print(describe_runtime(settings))
+
+    # Wall time of each stage, recorded in the metadata for benchmark_pipeline.py
+    stage_seconds: dict[str, float] = {}
+
+    def timed(name: str, fn: Any, *args: Any) -> Any:
+        t0 = time.perf_counter()
+        result = fn(*args)
+        stage_seconds[name] = round(time.perf_counter() - t0, 4)
+        return result
+
+    if log_store:
+        # The deduplicated logs shared with generate_hra_data.py
+        load = timed("logs", lambda: open_shared_logs(con, log_store, str(parquet_path), LOG_COLUMNS,
+                                                      derived=EVENT_COLUMNS, key=dedup_key))
+        print(describe_store(load))
+    else:
+        # A window is pushed into the scan (and the hive partitions) of the load
+        window = window_predicate(since, until, hive_keys(str(parquet_path))) if windowed else None
+        if window:
+            print(f"Window: {describe_window(since, until)}")
+        # Deduplicate once on load — CloudFront log delivery can produce exact dupes
+        where = combine(sample_predicate(sample) if sample else None, window)
+        load = timed("logs", lambda: materialize_logs(con, str(parquet_path), LOG_COLUMNS, mode=dedup_mode,
+                                                      spill_db=spill_db, derived=EVENT_COLUMNS, key=dedup_key,
+                                                      where=where))
+    raw, deduped = load["raw_rows"], load["deduped_rows"]
     if raw - deduped > 0:
         print(f"⚠ Removed {raw - deduped:,} duplicate rows ({(raw-deduped)/raw*100:.2f}%)")
-
-    monthly_visits = load_monthly_tool_visits(con, parquet_path)
+    if "scan" in load:
+        print(describe_scan(load["scan"]))
+    if verify:
+        print(describe_verification(verify_dedup(con, str(parquet_path))))
+
+    monthly_visits = timed("monthly_visits", load_monthly_tool_visits, con)
+    # A sampled run forecasts the visit counts scaled back up; the other models
+    # work on per-session and per-country rates and take the sample as it is
+    if sample:
+        monthly_visits["visits"] = (monthly_visits["visits"] / sample).round().astype("int64")
     piv = monthly_pivot(monthly_visits)
-    forecast = generate_forecasts(piv, horizon=forecast_horizon)
-    spikes = detect_spikes(piv)
-
-    events = load_event_rows(con, parquet_path)
-    session_features = build_session_features(events)
-    segments = segment_sessions(session_features)
-    churn_ds = build_churn_dataset(events, session_features)
-    churn = train_churn_model(churn_ds)
-
-    seqs = build_tool_sequences(events)
-    transitions = build_transition_matrix(seqs)
-    cross_tool = build_cross_tool_recommendations(seqs)
-    transactions = build_session_transactions(events, seqs)
-    associations = association_mining(transactions)
-
-    bot_scores = train_bot_model(con, parquet_path, session_features)
-    error_clusters = cluster_errors(events)
-    geo_anoms = detect_geo_anomalies(con, parquet_path, session_features)
+    forecast = timed("forecast", generate_forecasts, piv, forecast_horizon)
+    spikes = timed("spikes", detect_spikes, piv)
+
+    timed("events", materialize_events, con)
+    events = timed("event_rows", load_event_rows, con)
+    session_features = timed("session_features", build_session_features, events)
+    segments = timed("segments", segment_sessions, session_features)
+    churn_ds = timed("churn_dataset", build_churn_dataset, events, session_features)
+    churn = timed("churn_model", train_churn_model, churn_ds)
+
+    seqs = timed("tool_sequences", build_tool_sequences, events)
+    transitions = timed("transitions", build_transition_matrix, seqs)
+    cross_tool = timed("cross_tool", build_cross_tool_recommendations, seqs)
+    transactions = timed("transactions", build_session_transactions, events, seqs)
+    associations = timed("associations", association_mining, transactions)
+
+    bot_scores = timed("bot_model", train_bot_model, con, session_features)
+    error_clusters = timed("error_clusters", cluster_errors, events)
+    geo_anoms = timed("geo_anomalies", detect_geo_anomalies, con, session_features, approx)
 
     output_dir.mkdir(parents=True, exist_ok=True)
     write_json(output_dir / "forecast_tool_visits.json", forecast)
@@ -1296,6 +1368,12 @@ def run_pipeline(parquet_path: Path, output_dir: Path, forecast_horizon: int) ->
         "input_parquet": str(parquet_path),
         "output_dir": str(output_dir),
         "forecast_horizon_months": forecast_horizon,
+        "log_load": load,
+        "runtime": settings,
+        "approx_distinct": approx,
+        "sample": sample_metadata(sample),
+        "window": window_metadata(since, until),
+        "stage_seconds": stage_seconds,
         "rows": {
             "monthly_points": int(len(monthly_visits)),
             "event_rows": int(len(events)),
@@ -1319,17 +1397,12 @@ def run_pipeline(parquet_path: Path, output_dir: Path, forecast_horizon: int) ->
     return meta
 
 
-def _latest_parquet(directory: str) -> str:
-    import glob, os
-    files = sorted(glob.glob(os.path.join(directory, "*.parquet")), key=os.path.getmtime, reverse=True)
-    return files[0] if files else ""
-
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate ML insight JSON files from HRA parquet logs")
     parser.add_argument(
         "--input-parquet",
-        default=_latest_parquet("data/hra") or "data/hra/2026-04-06_hra-logs.parquet",
-        help="Path to source parquet log file",
+        default=default_source("data/hra") or "data/hra/2026-04-06_hra-logs.parquet",
+        help="Source parquet file, glob, or directory of (hive-partitioned) files",
     )
     parser.add_argument(
         "--output-dir",
@@ -1342,6 +1415,62 @@ def parse_args() -> argparse.Namespace:
         default=6,
         help="Number of future months to forecast per tool",
     )
+    parser.add_argument(
+        "--dedup-mode",
+        choices=DEDUP_MODES,
+        default="table",
+        help="'table' materializes the deduplicated logs once; 'view' re-runs DISTINCT per query",
+    )
+    parser.add_argument(
+        "--dedup-key",
+        choices=DEDUP_KEYS,
+        default=DEFAULT_DEDUP_KEY,
+        help="What identifies a duplicate: x_edge_request_id (default; check it with --verify-dedup), the whole row, or a 64-bit row hash",
+    )
+    parser.add_argument(
+        "--verify-dedup",
+        action="store_true",
+        help="Report where the dedup keys disagree (request ids shared by differing rows, hash collisions)",
+    )
+    parser.add_argument(
+        "--approx",
+        action="store_true",
+        help="Estimate the user-agent cardinality per country from HyperLogLog sketches",
+    )
+    parser.add_argument(
+        "--sample",
+        type=parse_fraction,
+        metavar="FRACTION",
+        default=None,
+        help="Preview on this fraction of the users (e.g. 0.05); monthly visits are scaled back up",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_day,
+        metavar="DAY",
+        default=None,
+        help="Only read the logs dated on or after this day (YYYY-MM-DD); pushed into the parquet scan",
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_day,
+        metavar="DAY",
+        default=None,
+        help="Only read the logs dated on or before this day (YYYY-MM-DD); pushed into the parquet scan",
+    )
+    parser.add_argument(
+        "--log-store",
+        metavar="PATH",
+        default=None,
+        help="Read the deduplicated logs from this DuckDB file, shared with generate_hra_data.py; "
+             "rebuilt only when the parquet changes",
+    )
+    add_runtime_args(parser)
+    parser.add_argument(
+        "--spill-db",
+        default=None,
+        help="Materialize the deduplicated logs in this DuckDB file instead of memory",
+    )
     return parser.parse_args()
 
 
@@ -1350,10 +1479,24 @@ def main() -> None:
     parquet = Path(args.input_parquet)
     out_dir = Path(args.output_dir)
 
-    if not parquet.exists():
+    if not dataset_files(parquet):
         raise FileNotFoundError(f"Input parquet not found: {parquet}")
 
-    meta = run_pipeline(parquet_path=parquet, output_dir=out_dir, forecast_horizon=args.forecast_horizon)
+    meta = run_pipeline(
+        parquet_path=parquet,
+        output_dir=out_dir,
+        forecast_horizon=args.forecast_horizon,
+        dedup_mode=args.dedup_mode,
+        spill_db=args.spill_db,
+        dedup_key=args.dedup_key,
+        verify=args.verify_dedup,
+        runtime=runtime_config(args),
+        approx=args.approx,
+        sample=args.sample,
+        log_store=args.log_store,
+        since=args.since,
+        until=args.until,
+    )
     print("ML pipeline complete.")
     print(json.dumps(meta, indent=2))
 
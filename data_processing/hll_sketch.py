@@ -0,0 +1,134 @@
+"""
+HyperLogLog sketches in plain DuckDB SQL, behind `--approx`.
+
+An exact `count(DISTINCT x)` keeps every distinct value in memory. A sketch
+keeps at most 2^HLL_PRECISION registers per group, whatever the
+cardinality: each value is hashed, the top `precision` bits pick a
+register and the register keeps the longest run of leading zeros (+1, the
+`rho`) seen in the remaining bits. Sketches are stored as rows
+`(<keys>, register, rho)`, so they live in ordinary partial tables (per
+month, in the `--incremental` state too) and merge with
+`max(rho) GROUP BY register`. The union of any set of months (a quarter, a
+year, everything before a cohort) is a GROUP BY away, without rescanning
+the logs.
+
+Error bounds, at the default precision 14 (16,384 registers):
+  - a count has a relative standard error of 1.04 / sqrt(16384) ≈ 0.81%,
+    so ~95% of the estimates fall within ±1.6%;
+  - small counts are tighter (exact up to a few dozen values), as
+    the empty registers carry most of the information;
+  - differences of counts carry the error of the larger counts they are
+    derived from. Cohort retention and returning users would need
+    |A ∩ B| = |A| + |B| - |A ∪ B| over cumulative sets: measured on 300k
+    synthetic rows that was 16–31% off at p95 (and slower than the exact
+    DISTINCT partials), so those outputs stay exact under `--approx`.
+
+`compare` and `describe_accuracy` measure the actual error of approximate
+outputs against exact ones (see `benchmark_approx.py`).
+"""
+
+from __future__ import annotations
+
+import math
+import statistics
+from typing import Any, Iterable, Mapping, Sequence
+
+HLL_PRECISION = 14
+
+
+def relative_error(precision: int = HLL_PRECISION) -> float:
+    """Relative standard error of an estimate with 2^precision registers."""
+    return 1.04 / math.sqrt(2 ** precision)
+
+
+def sketch(value: str, precision: int = HLL_PRECISION) -> str:
+    """SELECT-list fragment `register, rho` of one `value` (NULLs hash too: filter them first)."""
+    bits = 64 - precision
+    h = f"hash({value})"
+    # Position of the first 1 in the low `bits` bits, shifted to the top of the 64-bit word
+    first_one = f"bit_position('1'::BIT, (({h} & {(1 << bits) - 1}::UBIGINT) << {precision})::BIT)"
+    return (
+        f"({h} >> {bits})::USMALLINT AS register, "
+        f"coalesce(nullif({first_one}, 0), {bits + 1})::UTINYINT AS rho"
+    )
+
+
+def sketch_query(source: str, keys: Sequence[str], value: str, where: str = "TRUE",
+                 precision: int = HLL_PRECISION) -> str:
+    """One sketch of `value` per group of `keys` (SELECT expressions with aliases) over `source`."""
+    return f"""
+        SELECT * EXCLUDE (rho), max(rho) AS rho
+        FROM (
+            SELECT {", ".join(keys)}, {sketch(value, precision)}
+            FROM {source}
+            WHERE {where}
+        )
+        GROUP BY ALL
+    """
+
+
+def merge(source: str, keys: Sequence[str]) -> str:
+    """The union of the sketches of `source` per group of `keys` (column names or aliased expressions)."""
+    return f"SELECT {', '.join(keys)}, register, max(rho) AS rho FROM {source} GROUP BY ALL"
+
+
+def estimate(rho: str = "rho", precision: int = HLL_PRECISION) -> str:
+    """
+    Aggregate expression: the distinct-count estimate of a group of merged
+    registers (one row per register). Empty registers are the rows missing.
+
+    Ertl's improved raw estimator ("New cardinality estimation algorithms
+    for HyperLogLog sketches", 2017): the empty registers enter through
+    σ(zeros / m) instead of a switch to linear counting, which removes the
+    bias of the classic estimator between 2.5m and 5m without correction
+    tables.
+    """
+    m = 2 ** precision
+    x = f"(({m} - count(*)) / {m})"
+    # σ(x) = x + Σ_k x^(2^k) · 2^(k-1); the terms vanish well before k = 2·precision
+    sigma = " + ".join([x] + [f"pow({x}, {2 ** k}) * {2 ** (k - 1)}" for k in range(1, 2 * precision)])
+    alpha = 1 / (2 * math.log(2))
+    return f"round({alpha * m * m!r} / ({m} * ({sigma}) + sum(pow(2.0, -{rho}::INTEGER))))::BIGINT"
+
+
+def compare(
+    exact: Iterable[Mapping[str, Any]],
+    approx: Iterable[Mapping[str, Any]],
+    keys: Sequence[str],
+    fields: Sequence[str],
+) -> dict[str, Any]:
+    """Error of each of `fields` between the rows of two outputs, matched on `keys`."""
+    exact_rows = {tuple(row[k] for k in keys): row for row in exact}
+    approx_rows = {tuple(row[k] for k in keys): row for row in approx}
+    both = sorted(set(exact_rows) & set(approx_rows), key=str)
+    report: dict[str, Any] = {
+        "rows": len(exact_rows),
+        "missing": len(set(exact_rows) - set(approx_rows)),
+        "extra": len(set(approx_rows) - set(exact_rows)),
+        "fields": {},
+    }
+    for field in fields:
+        pairs = [(exact_rows[k][field], approx_rows[k][field]) for k in both]
+        errors = sorted(abs(a - e) / e for e, a in pairs if e)
+        absolute = [abs(a - e) for e, a in pairs]
+        report["fields"][field] = {
+            "median_relative_error": round(statistics.median(errors), 5) if errors else 0.0,
+            "p95_relative_error": round(errors[int(0.95 * (len(errors) - 1))], 5) if errors else 0.0,
+            "max_relative_error": round(errors[-1], 5) if errors else 0.0,
+            "max_absolute_error": max(absolute, default=0),
+            "within_2_sigma": round(sum(e <= 2 * relative_error() for e in errors) / len(errors), 4) if errors else 1.0,
+        }
+    return report
+
+
+def describe_accuracy(reports: Mapping[str, Mapping[str, Any]]) -> str:
+    lines = [f"Approximate vs exact (HLL precision {HLL_PRECISION}, σ ≈ {relative_error():.2%})"]
+    for name, report in reports.items():
+        lines.append(f"  {name}: {report['rows']:,} rows, {report['missing']} missing, {report['extra']} extra")
+        for field, err in report["fields"].items():
+            lines.append(
+                f"    {field:<20} median {err['median_relative_error']:7.2%}  p95 {err['p95_relative_error']:7.2%}  "
+                f"max {err['max_relative_error']:7.2%} ({err['max_absolute_error']:,} abs)  "
+                f"within 2σ {err['within_2_sigma']:.0%}"
+            )
+    return "\n".join(lines)
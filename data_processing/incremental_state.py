@@ -0,0 +1,301 @@
+"""
+Per-month partial aggregates and the state store behind `--incremental`.
+
+Every output of the aggregation scripts is derived from a small set of
+partial aggregate tables, each grouped by `part` (the first day of the month
+the rows fall in, NULL for undated rows). A full run builds them as in-memory
+tables. An incremental run keeps them in a DuckDB state file together with
+a fingerprint per month of the source parquet (or dataset, see
+`log_store.parquet_source`), and only rescans the months whose fingerprint
+changed, plus the months overlapping the trailing `lookback_days` of data
+(late-arriving logs). Fingerprints come from the parquet footers, not the
+data: a month's is the path, size and mtime of each file holding it plus the
+footer of each of its row groups (row count, column sizes and statistics),
+the row groups being placed in months by the min/max of their `date`. So
+finding the changed months costs no scan, and a rewritten file changes the
+fingerprint of every month its row groups hold.
+Whenever the partial definitions change the state is rebuilt from scratch,
+and so it is when the load they read changes (the dedup key, the columns
+derived on load, ENUM members or the events filter; see
+`log_store.load_definition`), since every persisted month was built from it.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import os
+from typing import Any, Callable, Mapping, Sequence
+
+import duckdb
+
+from log_store import dataset_files, decode_enums, hive_keys, sql_escape
+
+PART = "date_trunc('month', date)::DATE"
+UNDATED = "undated"
+DEFAULT_LOOKBACK_DAYS = 7
+
+
+def definition_hash(partials: dict[str, str], load: Mapping[str, Any] | None = None) -> str:
+    """Hash of the partial SQL and of the `load` definition, so edited definitions invalidate the state."""
+    normalized = {name: " ".join(sql.split()) for name, sql in partials.items()}
+    if load:
+        normalized = {"partials": normalized, "load": load}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _day(value: str | None) -> dt.date | None:
+    try:
+        return dt.date.fromisoformat(value[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def _months(first: dt.date, last: dt.date) -> list[dt.date]:
+    months = [_month_start(first.strftime("%Y-%m"))]
+    while _next_month(months[-1]) <= last:
+        months.append(_next_month(months[-1]))
+    return months
+
+
+def _row_groups(con: duckdb.DuckDBPyConnection, path: str) -> list[tuple]:
+    """Per row group of `path`: id, rows, digest of its footer, and the min, max and null count of `date`."""
+    return con.execute(f"""
+        SELECT row_group_id, any_value(row_group_num_rows),
+               md5(string_agg(concat_ws('|', path_in_schema, total_compressed_size, stats_min_value,
+                                        stats_max_value, stats_null_count), ',' ORDER BY column_id)),
+               any_value(stats_min_value) FILTER (WHERE lower(path_in_schema) = 'date'),
+               any_value(stats_max_value) FILTER (WHERE lower(path_in_schema) = 'date'),
+               any_value(stats_null_count) FILTER (WHERE lower(path_in_schema) = 'date')
+        FROM parquet_metadata('{sql_escape(path)}')
+        GROUP BY 1
+        ORDER BY 1
+    """).fetchall()
+
+
+def _file_months(con: duckdb.DuckDBPyConnection, path: str) -> list[tuple[str, dt.date | None]]:
+    """Months (and max date) of `path`, scanned: for row groups without `date` statistics."""
+    return con.execute(f"""
+        SELECT coalesce(strftime({PART}, '%Y-%m'), '{UNDATED}'), max(date)
+        FROM read_parquet('{sql_escape(path)}', hive_partitioning = false)
+        GROUP BY 1
+    """).fetchall()
+
+
+def source_fingerprints(con: duckdb.DuckDBPyConnection, parquet: str) -> dict[str, dict[str, Any]]:
+    """
+    Fingerprint, rows and max date of every month in `parquet`, from file
+    and footer metadata only (see the module docstring).
+
+    A row group is placed in every month between the min and max of its
+    `date`, and in the undated partition when it may hold null dates, so
+    `rows` counts the rows of the row groups holding the month. Only files
+    whose row groups lack `date` statistics are scanned, for their months.
+    """
+    files = dataset_files(parquet)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files]) if files else ""
+    entries: dict[str, list] = {}
+    rows: dict[str, int] = {}
+    max_dates: dict[str, dt.date] = {}
+    for path in files:
+        stat = os.stat(path)
+        name = os.path.relpath(os.path.abspath(path), root) if len(files) > 1 else ""
+        file_id = [name, stat.st_size, stat.st_mtime_ns]
+        scanned = None
+        for group, n, digest, low, high, nulls in _row_groups(con, path):
+            first, last = _day(low), _day(high)
+            if first and last:
+                # Each month's max date is the row group's, capped at the month's last day
+                keys = [(m.strftime("%Y-%m"), min(last, _next_month(m) - dt.timedelta(days=1)))
+                        for m in _months(first, last)]
+                if nulls is None or nulls > 0:
+                    keys.append((UNDATED, None))
+            elif nulls is not None and nulls == n:
+                keys = [(UNDATED, None)]
+            else:
+                scanned = scanned if scanned is not None else _file_months(con, path)
+                keys = scanned
+            for key, max_date in keys:
+                entries.setdefault(key, []).append([*file_id, group, digest])
+                rows[key] = rows.get(key, 0) + int(n)
+                if max_date is not None:
+                    max_dates[key] = max(max_date, max_dates.get(key, max_date))
+    return {
+        key: {
+            "fingerprint": hashlib.sha256(json.dumps(sorted(parts)).encode()).hexdigest()[:32],
+            "rows": rows[key],
+            "max_date": max_dates.get(key),
+        }
+        for key, parts in entries.items()
+    }
+
+
+def _month_start(key: str) -> dt.date:
+    year, month = key.split("-")
+    return dt.date(int(year), int(month), 1)
+
+
+def _next_month(day: dt.date) -> dt.date:
+    return dt.date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def date_predicate(keys, partitions: Sequence[str] = ()) -> str:
+    """
+    WHERE clause selecting the raw rows of the given partition keys. When the
+    source is hive-partitioned by `year` (and `month`) of the row's date, the
+    matching partition filter is added so DuckDB only opens those files.
+    """
+    clauses = []
+    for key in sorted(keys):
+        if key == UNDATED:
+            clauses.append("date IS NULL")
+        else:
+            start = _month_start(key)
+            clause = f"date >= DATE '{start}' AND date < DATE '{_next_month(start)}'"
+            if "year" in partitions:
+                clause += f" AND TRY_CAST(year AS INTEGER) = {start.year}"
+                if "month" in partitions:
+                    clause += f" AND TRY_CAST(month AS INTEGER) = {start.month}"
+            clauses.append(f"({clause})")
+    return " OR ".join(clauses) or "FALSE"
+
+
+def part_predicate(keys, column: str = "part") -> str:
+    """WHERE clause selecting the partial-table rows (or `column` months) of the given partition keys."""
+    dated = [f"DATE '{_month_start(k)}'" for k in sorted(keys) if k != UNDATED]
+    clauses = [f"{column} IN ({', '.join(dated)})"] if dated else []
+    if UNDATED in keys:
+        clauses.append(f"{column} IS NULL")
+    return " OR ".join(clauses) or "FALSE"
+
+
+def open_state(con: duckdb.DuckDBPyConnection, state_db: str) -> None:
+    """Attach the state store as `state` and create the bookkeeping tables."""
+    directory = os.path.dirname(os.path.abspath(state_db))
+    os.makedirs(directory, exist_ok=True)
+    con.execute(f"ATTACH '{sql_escape(str(state_db))}' AS state")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS state.partitions (
+            part_key VARCHAR PRIMARY KEY, fingerprint VARCHAR, rows BIGINT, refreshed_at TIMESTAMP
+        )
+    """)
+    con.execute("CREATE TABLE IF NOT EXISTS state.meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+
+
+def plan_refresh(
+    con: duckdb.DuckDBPyConnection,
+    parquet: str,
+    partials: dict[str, str],
+    lookback_days: int = DEFAULT_LOOKBACK_DAYS,
+    load: Mapping[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Decide which months of `parquet` must be rescanned against the attached state.
+
+    Returns the plan consumed by `materialize_logs(where=plan["where"])` and
+    `build_partials`: partitions to rebuild, partitions that vanished from the
+    source, and whether the whole state has to be rebuilt. `load` is the
+    `log_store.load_definition` of the logs the partials read.
+    """
+    source = source_fingerprints(con, parquet)
+    stored = dict(con.execute("SELECT part_key, fingerprint FROM state.partitions").fetchall())
+    meta = dict(con.execute("SELECT key, value FROM state.meta").fetchall())
+    def_hash = definition_hash(partials, load)
+    missing = [
+        name for name in partials
+        if not con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE database_name = 'state' AND table_name = ?",
+            [f"p_{name}"],
+        ).fetchone()[0]
+    ]
+
+    full = not stored or meta.get("definition_hash") != def_hash or bool(missing)
+    changed = {k for k, v in source.items() if stored.get(k) != v["fingerprint"]}
+    lookback = set()
+    dated = [v["max_date"] for v in source.values() if v["max_date"] is not None]
+    if dated:
+        cutoff = max(dated) - dt.timedelta(days=lookback_days)
+        lookback = {
+            k for k in source
+            if k != UNDATED and _next_month(_month_start(k)) > cutoff
+        }
+    rebuild = set(source) if full else changed | lookback
+    removed = set() if full else set(stored) - set(source)
+
+    return {
+        "full": full,
+        "rebuild": sorted(rebuild),
+        "changed": sorted(changed),
+        "lookback": sorted(lookback - changed),
+        "removed": sorted(removed),
+        "partitions": len(source),
+        "where": date_predicate(rebuild, hive_keys(parquet)),
+        "definition_hash": def_hash,
+        "source": source,
+    }
+
+
+def build_partials(
+    con: duckdb.DuckDBPyConnection,
+    partials: dict[str, str],
+    plan: dict[str, Any] | None = None,
+    refresh: Callable[[duckdb.DuckDBPyConnection, dict[str, Any]], Any] | None = None,
+    derived: Sequence[str] = (),
+) -> Any:
+    """
+    Make every partial available as `p_<name>` on `con`.
+
+    Without a plan the partials are built as in-memory tables from whatever
+    `logs` holds (full runs schedule them through the aggregation registry
+    instead). With a plan
+    (incremental mode) the stale partitions are replaced in the state store in
+    one transaction, the fingerprints are recorded, and `p_<name>` becomes a
+    view over the persisted table. ENUM columns of the log are stored as
+    VARCHAR, so persisted partials do not depend on one run's ENUM members.
+
+    `refresh(con, plan)` runs in the same transaction once the partials are
+    replaced, to update the `derived` state tables kept from them (see
+    `user_state.py`); they become views too, and its result is returned.
+    """
+    if plan is None:
+        for name, sql in partials.items():
+            con.execute(f"CREATE TABLE p_{name} AS {decode_enums(con, sql)}")
+        return
+
+    stale = part_predicate(set(plan["rebuild"]) | set(plan["removed"]))
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for name, sql in partials.items():
+            if plan["full"]:
+                con.execute(f"CREATE OR REPLACE TABLE state.p_{name} AS {decode_enums(con, sql)}")
+            else:
+                con.execute(f"DELETE FROM state.p_{name} WHERE {stale}")
+                con.execute(f"INSERT INTO state.p_{name} {sql}")
+        result = refresh(con, plan) if refresh else None
+        con.execute("DELETE FROM state.partitions")
+        con.executemany(
+            "INSERT INTO state.partitions VALUES (?, ?, ?, current_timestamp)",
+            [(k, v["fingerprint"], v["rows"]) for k, v in plan["source"].items()],
+        )
+        con.execute(
+            "INSERT OR REPLACE INTO state.meta VALUES ('definition_hash', ?)",
+            [plan["definition_hash"]],
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    for table in [f"p_{name}" for name in partials] + list(derived):
+        con.execute(f"CREATE VIEW {table} AS SELECT * FROM state.{table}")
+    return result
+
+
+def describe_plan(plan: dict[str, Any]) -> str:
+    if plan["full"]:
+        return f"Incremental: full rebuild of {plan['partitions']} partitions (new state or changed definitions)"
+    return (
+        f"Incremental: rescanning {len(plan['rebuild'])} of {plan['partitions']} partitions "
+        f"({len(plan['changed'])} changed, {len(plan['lookback'])} in lookback, "
+        f"{len(plan['removed'])} removed)"
+    )
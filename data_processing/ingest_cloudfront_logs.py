@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Ingest raw CloudFront access logs into the parquet the pipelines read.
+
+CloudFront standard logs are delivered as gzipped W3C files (one per
+distribution, hour and edge, `<distribution>.<YYYY-MM-DD-HH>.<id>.gz`),
+tab-separated with a `#Fields:` header. This script streams them from a
+local directory and writes the columns and types of
+`public/data/hra/parquet_field_dictionary.json` as a hive-partitioned
+`year=/month=` dataset, the delivery layout `--parquet` already reads.
+
+The files are split into tasks of about `--task-mb` compressed bytes, which
+a process pool parses in parallel:
+  - each worker streams its files line by line and parses the fields and
+    the `cs_uri_query` string into the `query` MAP (`urllib.parse`)
+  - every `--batch-rows` rows, it casts the batch and derives the other
+    columns in its own one-thread DuckDB, then writes one parquet file per
+    month of the batch and drops it
+
+A worker therefore holds at most one batch, so memory does not grow with
+the number or size of the log files. Derived columns:
+  - `anon_id`: hash of the client IP and user agent (plus `--anon-salt`);
+    the IP itself is not written
+  - `traffic_type`: `AI-Assistant / Bot` for AI crawlers and assistants,
+    `Bot` for other crawlers, scripts and empty user agents, else `Likely Human`
+  - `site`: HRA `/tr` pings are `Events`, then `--site-map HOST=SITE`, then
+    the site's default hosts (`cdn.humanatlas.io` is `CDN`, the rest `Apps`);
+    every CNS row is `CNS`
+  - `c_country` from a `c-country` field when the distribution logs it, else `-`
+  - `referrer` and `cs_user_agent` URL-decoded, `airport` the edge location's
+    code, `distribution` from the file name, `timestamp(_ms)` from date + time
+
+`_ingested.json` in the output lists the files written so far, so a rerun
+(or a run after an interruption) only parses new or changed files. Rows of
+a changed file are written again, and removed as duplicates on load.
+
+Usage:
+    python data_processing/ingest_cloudfront_logs.py --source raw/hra --site hra
+    python data_processing/ingest_cloudfront_logs.py --source raw/cns --site cns --out data/cns/logs --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import gzip
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Iterator, Mapping, Sequence
+from operator import itemgetter
+from urllib.parse import unquote
+
+import duckdb
+import pandas as pd
+
+from generate_cns_data import PARTITION_TYPES as CNS_PARTITION_TYPES
+from generate_hra_data import PARTITION_TYPES as HRA_PARTITION_TYPES
+from generate_synthetic_logs import field_types
+from log_store import sql_escape
+from query_profile import peak_rss_mb
+from runtime_config import add_runtime_args, apply_runtime, runtime_config
+
+MANIFEST = "_ingested.json"
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+DEFAULT_BATCH_ROWS = 50_000
+DEFAULT_TASK_MB = 64
+
+# W3C header fields whose column name is not the field with `-` → `_`
+FIELD_NAMES = {"cs(Referer)": "cs_referer", "cs(User-Agent)": "cs_user_agent", "cs(Cookie)": "cs_cookie",
+               "cs(Host)": "cs_host"}
+# Raw fields read besides the dictionary's columns (c_ip is only hashed into anon_id)
+EXTRA_FIELDS = ("c_ip",)
+# Dictionary columns derived from the others instead of read from a field
+DERIVED = ("anon_id", "timestamp", "timestamp_ms", "query", "traffic_type", "referrer", "airport",
+           "month", "day", "distribution", "site", "year")
+
+AI_AGENTS = (
+    "gptbot", "chatgpt-user", "oai-searchbot", "claudebot", "claude-user", "claude-web", "anthropic-ai",
+    "perplexitybot", "perplexity-user", "ccbot", "google-extended", "bytespider", "amazonbot",
+    "meta-externalagent", "applebot-extended", "cohere-ai", "diffbot", "youbot", "mistralai-user",
+)
+BOT_AGENTS = (
+    "bot", "crawl", "spider", "slurp", "scrapy", "curl", "wget", "python-", "go-http-client", "java/",
+    "okhttp", "axios", "node-fetch", "headless", "httpclient", "libwww", "feedfetcher", "monitor",
+)
+
+# Site → partition types, the `site` of unlisted hosts, the hosts of other sites, and whether /tr is Events
+SITES: dict[str, dict[str, Any]] = {
+    "hra": {"partition_types": HRA_PARTITION_TYPES, "default": "Apps", "hosts": {"cdn.humanatlas.io": "CDN"},
+            "events": True},
+    "cns": {"partition_types": CNS_PARTITION_TYPES, "default": "CNS", "hosts": {}, "events": False},
+}
+
+
+def _column(field: str) -> str:
+    return FIELD_NAMES.get(field, field.replace("-", "_"))
+
+
+def raw_columns(types: Mapping[str, str]) -> list[str]:
+    """Columns parsed from the log fields: the dictionary's non-derived columns, plus `EXTRA_FIELDS`."""
+    return [c for c in types if c not in DERIVED] + list(EXTRA_FIELDS)
+
+
+def _unquote(text: str) -> str:
+    return unquote(text.replace("+", " ")) if "%" in text or "+" in text else text
+
+
+def parse_query(value: str) -> str:
+    """
+    `cs_uri_query` as the JSON object of its decoded parameters, as
+    `parse_qsl(value, keep_blank_values=True)` reads them; the last of
+    repeated keys wins. Pieces without escapes are not decoded.
+    """
+    if not value or value == "-":
+        return "{}"
+    params = {}
+    for pair in value.split("&"):
+        if pair:
+            key, _, val = pair.partition("=")
+            params[_unquote(key)] = _unquote(val)
+    return json.dumps(params, ensure_ascii=False)
+
+
+def distribution_of(path: str) -> str:
+    """Distribution id of a CloudFront log file, the part of its name before the first dot."""
+    return os.path.basename(path).split(".", 1)[0]
+
+
+def _agent_pattern(agents: Sequence[str]) -> str:
+    return "|".join(a.replace(".", r"\.").replace("/", r"\/") for a in agents)
+
+
+def site_case(site: str, site_map: Mapping[str, str] | None = None) -> str:
+    """SQL of the `site` column: Events pings, then `site_map` and the site's hosts, then its default."""
+    profile = SITES[site]
+    hosts = {**profile["hosts"], **(site_map or {})}
+    whens = ["WHEN cs_uri_stem = '/tr' OR cs_uri_stem LIKE '/tr/%' THEN 'Events'"] if profile["events"] else []
+    whens += [f"WHEN x_host_header = '{sql_escape(h)}' THEN '{sql_escape(s)}'" for h, s in hosts.items()]
+    return f"CASE {' '.join(whens)} ELSE '{sql_escape(profile['default'])}' END" if whens else f"'{profile['default']}'"
+
+
+def select_sql(types: Mapping[str, str], site: str, site_map: Mapping[str, str] | None = None,
+               salt: str = "", source: str = "raw") -> str:
+    """SELECT of the dictionary's columns, in its order, from a batch of parsed (VARCHAR) fields."""
+    partition = SITES[site]["partition_types"]
+    derived = {
+        "anon_id": f"substr(md5('{sql_escape(salt)}' || coalesce(c_ip, '') || '|' || coalesce(cs_user_agent, '')), 1, 16)",
+        "date": "TRY_CAST(date AS DATE)",
+        "cs_user_agent": "url_decode(cs_user_agent)",
+        "timestamp": "epoch(TRY_CAST(date AS DATE) + TRY_CAST(time AS TIME))::BIGINT",
+        "timestamp_ms": "epoch(TRY_CAST(date AS DATE) + TRY_CAST(time AS TIME))::BIGINT * 1000",
+        "c_country": "coalesce(nullif(c_country, ''), '-')",
+        "query": "CAST(query::JSON AS MAP(VARCHAR, VARCHAR))",
+        "traffic_type": f"""CASE
+            WHEN regexp_matches(cs_user_agent, '{_agent_pattern(AI_AGENTS)}', 'i') THEN 'AI-Assistant / Bot'
+            WHEN cs_user_agent IS NULL OR cs_user_agent = '-'
+              OR regexp_matches(cs_user_agent, '{_agent_pattern(BOT_AGENTS)}', 'i') THEN 'Bot'
+            ELSE 'Likely Human' END""",
+        "referrer": "url_decode(cs_referer)",
+        "airport": "left(x_edge_location, 3)",
+        "year": f"year(TRY_CAST(date AS DATE))::{partition['year']}",
+        "month": f"month(TRY_CAST(date AS DATE))::{partition['month']}",
+        "day": f"day(TRY_CAST(date AS DATE))::{partition['day']}",
+        "distribution": "distribution",
+        "site": site_case(site, site_map),
+    }
+    projection = []
+    for column, sql_type in types.items():
+        if column in derived:
+            projection.append(f"{derived[column]} AS \"{column}\"")
+        elif sql_type == "VARCHAR":
+            projection.append(f"\"{column}\"")
+        else:
+            projection.append(f"TRY_CAST(nullif(\"{column}\", '-') AS {sql_type}) AS \"{column}\"")
+    return f"SELECT {', '.join(projection)} FROM {source}"
+
+
+def read_log(path: str, columns: Sequence[str]) -> Iterator[tuple[str | None, ...]]:
+    """
+    Rows of one gzipped W3C log: the values of `columns` (None for fields the
+    file does not log), the JSON of its query string, and its distribution.
+    Lines whose field count does not match the header are yielded as None.
+    """
+    distribution = distribution_of(path)
+    pick, query_at, width = None, None, 0
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="\n") as f:
+        for line in f:
+            if line.startswith("#"):
+                if line.startswith("#Fields:"):
+                    fields = [_column(name) for name in line[len("#Fields:"):].split()]
+                    index = {name: i for i, name in enumerate(fields)}
+                    width = len(fields)
+                    # Fields the file does not log read the None appended after its values
+                    pick = itemgetter(*(index.get(column, width) for column in columns))
+                    query_at = index.get("cs_uri_query")
+                continue
+            values = line.rstrip("\r\n").split("\t")
+            if pick is None or len(values) != width:
+                yield None
+                continue
+            query = parse_query(values[query_at]) if query_at is not None else "{}"
+            values.append(None)
+            yield (*pick(values), query, distribution)
+
+
+def _write_batch(con: duckdb.DuckDBPyConnection, rows: list, columns: Sequence[str], out: str,
+                 name: str, select: str) -> None:
+    raw = pd.DataFrame(rows, columns=[*columns, "query", "distribution"], dtype=object)
+    con.register("raw", raw)
+    try:
+        con.execute(f"""
+            COPY ({select} ORDER BY date, time) TO '{sql_escape(out)}'
+            (FORMAT PARQUET, PARTITION_BY (year, month), FILENAME_PATTERN '{sql_escape(name)}_{{i}}',
+             OVERWRITE_OR_IGNORE, WRITE_PARTITION_COLUMNS true)
+        """)
+    finally:
+        con.unregister("raw")
+
+
+def ingest_files(files: Sequence[str], out: str, site: str = "hra", batch_rows: int = DEFAULT_BATCH_ROWS,
+                 site_map: Mapping[str, str] | None = None, salt: str = "",
+                 runtime: Mapping[str, Any] | None = None) -> dict[str, Any]:
+    """Parse `files` into `out`, `batch_rows` rows at a time (one pool task); returns its counts."""
+    started = time.perf_counter()
+    types = field_types()
+    columns = raw_columns(types)
+    select = select_sql(types, site, site_map, salt)
+    con = duckdb.connect()
+    # One thread each: the pool runs the workers in parallel
+    apply_runtime(con, {**(runtime or {}), "threads": 1})
+    stem = os.path.basename(files[0]).removesuffix(".gz")
+    rows, batches, total, bad = [], 0, 0, 0
+    try:
+        for path in files:
+            for row in read_log(path, columns):
+                if row is None:
+                    bad += 1
+                    continue
+                rows.append(row)
+                if len(rows) >= batch_rows:
+                    _write_batch(con, rows, columns, out, f"{stem}-{batches:04d}", select)
+                    total, batches, rows = total + len(rows), batches + 1, []
+        if rows:
+            _write_batch(con, rows, columns, out, f"{stem}-{batches:04d}", select)
+            total, batches = total + len(rows), batches + 1
+    finally:
+        con.close()
+    return {"files": list(files), "rows": total, "bad_lines": bad, "batches": batches,
+            "seconds": round(time.perf_counter() - started, 3), "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def source_files(source: str) -> list[str]:
+    """The `.gz` logs under `source` (a directory, searched recursively, or a glob)."""
+    pattern = os.path.join(source, "**", "*.gz") if os.path.isdir(source) else source
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def _signature(path: str) -> list[int]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _load_manifest(out: str) -> dict[str, list[int]]:
+    try:
+        with open(os.path.join(out, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _save_manifest(out: str, files: Mapping[str, list[int]]) -> None:
+    path = os.path.join(out, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"files": dict(sorted(files.items()))}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def plan_tasks(files: Sequence[str], task_bytes: int) -> list[list[str]]:
+    """Consecutive runs of `files` of about `task_bytes` compressed bytes each."""
+    tasks, current, size = [], [], 0
+    for path in files:
+        if current and size + os.path.getsize(path) > task_bytes:
+            tasks.append(current)
+            current, size = [], 0
+        current.append(path)
+        size += os.path.getsize(path)
+    return tasks + [current] if current else tasks
+
+
+def ingest(
+    source: str,
+    out: str,
+    site: str = "hra",
+    workers: int = DEFAULT_WORKERS,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    task_mb: float = DEFAULT_TASK_MB,
+    site_map: Mapping[str, str] | None = None,
+    salt: str = "",
+    runtime: Mapping[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Parse the logs under `source` that `out` does not hold yet; returns the run's counts and throughput."""
+    if site not in SITES:
+        raise ValueError(f"Unknown site {site!r}; expected one of {', '.join(SITES)}")
+    started = time.perf_counter()
+    os.makedirs(out, exist_ok=True)
+    ingested = _load_manifest(out)
+    files = source_files(source)
+    pending = [p for p in files if ingested.get(os.path.relpath(p, source)) != _signature(p)]
+    tasks = plan_tasks(pending, int(task_mb * 2**20))
+    summary = {"source": source, "out": out, "site": site, "files": len(files), "skipped": len(files) - len(pending),
+               "parsed": len(pending), "tasks": len(tasks), "workers": workers, "batch_rows": batch_rows,
+               "rows": 0, "bad_lines": 0, "peak_worker_rss_mb": 0.0}
+    if tasks:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks))), mp_context=context) as pool:
+            futures = [pool.submit(ingest_files, task, out, site, batch_rows, site_map, salt, dict(runtime or {}))
+                       for task in tasks]
+            for future in as_completed(futures):
+                done = future.result()
+                summary["rows"] += done["rows"]
+                summary["bad_lines"] += done["bad_lines"]
+                summary["peak_worker_rss_mb"] = max(summary["peak_worker_rss_mb"], done["peak_rss_mb"])
+                # Recorded as each task finishes, so an interrupted run resumes where it stopped
+                ingested.update({os.path.relpath(p, source): _signature(p) for p in done["files"]})
+                _save_manifest(out, ingested)
+    seconds = time.perf_counter() - started
+    summary["seconds"] = round(seconds, 3)
+    summary["rows_per_second"] = round(summary["rows"] / seconds) if summary["rows"] else 0
+    return summary
+
+
+def describe_ingest(summary: Mapping[str, Any]) -> str:
+    skipped = f", {summary['skipped']:,} already ingested" if summary["skipped"] else ""
+    bad = f", {summary['bad_lines']:,} malformed lines skipped" if summary["bad_lines"] else ""
+    return (f"Ingested {summary['rows']:,} rows from {summary['parsed']:,} files{skipped}{bad} into "
+            f"{summary['out']}/ in {summary['seconds']:.1f}s ({summary['rows_per_second']:,} rows/s, "
+            f"{summary['workers']} workers, peak worker RSS {summary['peak_worker_rss_mb']:.0f} MB)")
+
+
+def _site_entry(value: str) -> tuple[str, str]:
+    host, sep, site = value.partition("=")
+    if not sep or not host or not site:
+        raise argparse.ArgumentTypeError(f"Expected HOST=SITE, got {value!r}")
+    return host, site
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Parse raw CloudFront .gz access logs into year/month-partitioned parquet")
+    p.add_argument("--source", required=True, help="Directory (searched recursively) or glob of CloudFront .gz logs")
+    p.add_argument("--site", choices=sorted(SITES), default="hra", help="Whose partition types and site labels to use")
+    p.add_argument("--out", default=None, help="Output dataset directory (default data/<site>/logs)")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help=f"Parser processes (default {DEFAULT_WORKERS}: all cores but one)")
+    p.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS,
+                   help="Rows a worker parses before writing them out; bounds each worker's memory (default 50000)")
+    p.add_argument("--task-mb", type=float, default=DEFAULT_TASK_MB,
+                   help="Compressed megabytes of logs per pool task (default 64)")
+    p.add_argument("--site-map", type=_site_entry, action="append", default=[], metavar="HOST=SITE",
+                   help="Label the requests to this host header with this site (repeatable)")
+    p.add_argument("--anon-salt", default=os.environ.get("CLOUDFRONT_ANON_SALT", ""),
+                   help="Secret mixed into the anon_id hash (env CLOUDFRONT_ANON_SALT); keep it fixed across runs")
+    add_runtime_args(p)
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = ingest(args.source, args.out or os.path.join("data", args.site, "logs"), args.site, args.workers,
+                    args.batch_rows, args.task_mb, dict(args.site_map), args.anon_salt, runtime_config(args))
+    print(describe_ingest(result))
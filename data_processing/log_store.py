@@ -0,0 +1,423 @@
+"""
+Shared log-loading stage for the DuckDB pipelines.
+
+CloudFront log delivery can produce exact duplicate rows, so every pipeline
+deduplicates the parquet before aggregating. Defining `logs` as a view over
+`SELECT DISTINCT *` re-runs that full-width DISTINCT inside every query; this
+module runs it once per pipeline and materializes only the columns the
+pipeline reads, either in memory or in a spill-to-disk DuckDB file.
+
+Low-cardinality VARCHAR columns can be stored as ENUMs, so filters and
+GROUP BYs on them work on small integer codes. Tables built from the log
+cast them back with `decode_enums`, so JSON outputs and persisted partials
+only ever see strings.
+
+The source can be a single parquet file, a glob, or a directory of
+deliveries (daily files, or hive-partitioned `year=/month=` directories),
+read as one dataset by `parquet_source`. Dedup runs over the whole dataset,
+so rows delivered twice in different files are still removed once.
+
+Comparing whole rows (`key="row"`) hashes every column of every row,
+including the long cookie/user-agent/query strings, which makes it the most
+expensive step of the pipelines. The pipelines therefore key dedup on
+CloudFront's unique `x_edge_request_id` by default (DEFAULT_DEDUP_KEY; rows
+without one still compare whole, and a source without the column falls back
+to `row`). `key="hash"` keys it on a 64-bit hash of the row. `verify_dedup`
+reports where the keys disagree with each other and with whole-row
+DISTINCT; `row` is the exact fallback when they do.
+
+Whatever the key, the loaded table holds only the `columns` the pipeline
+asks for. The `row` and `hash` keys compare (or hash) every source column,
+so they decode the wide ones no aggregation reads (cookies, TLS ciphers,
+range headers) too. The `request_id` key does not need them: rows with an
+id are read on `columns` plus the id alone, and rows without one compare
+whole, a branch the row-group null counts of the id column let the scan
+skip when every row has an id. `scan_bytes` measures how much of the
+dataset a load reads, after the row groups its filter prunes.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import re
+import time
+from typing import Any, Iterable, Mapping, Sequence
+
+import duckdb
+
+DEDUP_MODES = ("table", "view")
+DEDUP_KEYS = ("row", "request_id", "hash")
+# What the pipelines dedup on unless told otherwise (see the module docstring)
+DEFAULT_DEDUP_KEY = "request_id"
+REQUEST_ID = "x_edge_request_id"
+
+
+def sql_escape(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def _pattern(parquet: str) -> str:
+    return os.path.join(parquet, "**", "*.parquet") if os.path.isdir(parquet) else parquet
+
+
+def dataset_files(parquet: str) -> list[str]:
+    """Parquet files of `parquet`: a file, a glob, or a directory (searched recursively)."""
+    return sorted(glob.glob(_pattern(str(parquet)), recursive=True))
+
+
+def hive_keys(parquet: str) -> list[str]:
+    """Keys of the `key=value` directories in the paths of `parquet`'s files (as DuckDB reads them)."""
+    files = dataset_files(parquet)
+    if not files:
+        return []
+    return [part.split("=", 1)[0] for part in files[0].split(os.sep)[:-1] if "=" in part]
+
+
+def default_source(directory: str) -> str:
+    """
+    Default input of a site: the `logs/` delivery dataset under `directory`
+    when files have landed there, else the newest parquet in `directory`.
+    """
+    deliveries = os.path.join(directory, "logs")
+    if dataset_files(deliveries):
+        return deliveries
+    files = sorted(glob.glob(os.path.join(directory, "*.parquet")), key=os.path.getmtime, reverse=True)
+    return files[0] if files else ""
+
+
+def parquet_source(parquet: str, hive_types: Mapping[str, str] | None = None, row_numbers: bool = False) -> str:
+    """
+    `read_parquet(...)` reading `parquet` as one dataset (with `row_numbers`,
+    plus the `filename` and `file_row_number` of every row).
+
+    A single file is read as is. Several files are unioned by column name (so
+    deliveries may add columns); `key=value` directories become hive partition
+    columns, which DuckDB prunes on filters. A key that is also stored inside
+    the files keeps the type it has there, other keys take their type from
+    `hive_types` (DuckDB infers it when absent).
+    """
+    path = str(parquet)
+    files = dataset_files(path)
+    numbered = ", filename = true, file_row_number = true" if row_numbers else ""
+    if len(files) == 1 and files[0] == path:
+        return f"read_parquet('{sql_escape(path)}'{numbered})"
+    options = ["union_by_name = true"]
+    keys = hive_keys(path)
+    if keys:
+        con = duckdb.connect()
+        try:
+            stored = dict(con.execute(f"""
+                SELECT column_name, column_type
+                FROM (DESCRIBE SELECT * FROM read_parquet('{sql_escape(files[0])}', hive_partitioning = false))
+            """).fetchall())
+        finally:
+            con.close()
+        options.append("hive_partitioning = true")
+        declared = {**(hive_types or {}), **stored}
+        types = ", ".join(f"'{key}': {declared[key]}" for key in keys if key in declared)
+        if types:
+            options.append(f"hive_types = {{{types}}}")
+    else:
+        options.append("hive_partitioning = false")
+    return f"read_parquet('{sql_escape(_pattern(path))}', {', '.join(options)}{numbered})"
+
+
+def _enum_type(values) -> str:
+    return "ENUM(" + ", ".join(f"'{sql_escape(str(v))}'" for v in sorted(values)) + ")"
+
+
+def enum_types(
+    con: duckdb.DuckDBPyConnection,
+    src: str,
+    enums: Mapping[str, Sequence[str] | None],
+) -> dict[str, str]:
+    """
+    `{column: ENUM type}` for `enums`. Columns mapped to None take their
+    members from one DISTINCT pass over `src`; others use the given values.
+    """
+    scan = [col for col, values in enums.items() if values is None]
+    found = {}
+    if scan:
+        lists = ", ".join(f"list(DISTINCT {col}) FILTER (WHERE {col} IS NOT NULL)" for col in scan)
+        found = dict(zip(scan, con.execute(f"SELECT {lists} FROM {src}").fetchone()))
+    return {col: _enum_type(found[col] if values is None else values) for col, values in enums.items()}
+
+
+def decode_enums(con: duckdb.DuckDBPyConnection, sql: str) -> str:
+    """`sql` with the ENUM columns of its result cast back to VARCHAR."""
+    described = con.execute(f"DESCRIBE {sql}").fetchall()
+    enums = [row[0] for row in described if row[1].startswith("ENUM")]
+    if not enums:
+        return sql
+    casts = ", ".join(f'"{col}"::VARCHAR AS "{col}"' for col in enums)
+    return f"SELECT * REPLACE ({casts}) FROM ({sql})"
+
+
+def referenced_columns(sql: str, columns: Iterable[str]) -> set[str]:
+    """
+    The `columns` named in `sql`, case-insensitively like DuckDB resolves
+    them. Names inside string literals count too, which only over-reads.
+    """
+    names = {token.lower() for token in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", sql)}
+    return {col for col in columns if col.lower() in names}
+
+
+def dedup_query(src: str, projection: str, key: str = "row") -> str:
+    """
+    `SELECT {projection}` over the rows of `src` deduplicated on `key` (see
+    DEDUP_KEYS). The row and hash keys compare every column of `src`
+    whatever the projection; the request id key reads the projected columns
+    and the id for the rows that have one.
+    """
+    if key == "row":
+        return f"SELECT {projection} FROM (SELECT DISTINCT * FROM {src})"
+    if key == "hash":
+        return f"SELECT DISTINCT ON (hash(*COLUMNS(*))) {projection} FROM {src}"
+    if key == "request_id":
+        return f"""
+            SELECT DISTINCT ON ({REQUEST_ID}) {projection} FROM {src} WHERE {REQUEST_ID} IS NOT NULL
+            UNION ALL
+            SELECT {projection} FROM (SELECT DISTINCT * FROM {src} WHERE {REQUEST_ID} IS NULL)
+        """
+    raise ValueError(f"Unknown dedup key: {key!r} (expected one of {DEDUP_KEYS})")
+
+
+def load_definition(
+    key: str = "row",
+    derived: Mapping[str, str] | None = None,
+    enums: Mapping[str, Sequence[str] | None] | None = None,
+    filters: Sequence[str] = (),
+) -> dict[str, Any]:
+    """
+    What the loaded rows depend on besides the parquet: the dedup SQL of
+    `key`, the `derived` column expressions, the `enums` members (None when
+    read from the data) and `filters` applied to the loaded rows (e.g. the
+    events filter). Hashed into the incremental state and the output cache,
+    so editing any of them invalidates what was built with the old ones.
+    """
+    return {
+        "dedup": " ".join(dedup_query("src", "*", key).split()),
+        "derived": {col: " ".join(expr.split()) for col, expr in (derived or {}).items()},
+        "enums": {col: None if values is None else sorted(values) for col, values in (enums or {}).items()},
+        "filters": [" ".join(f.split()) for f in filters],
+    }
+
+
+def verify_dedup(
+    con: duckdb.DuckDBPyConnection,
+    parquet: str,
+    where: str | None = None,
+    hive_types: Mapping[str, str] | None = None,
+    examples: int = 5,
+) -> dict[str, Any]:
+    """
+    Rows `parquet` deduplicates to under each of DEDUP_KEYS, and where they
+    disagree: request ids shared by rows that differ (request_id keeps only
+    one of them, with `examples` of the ids) and distinct rows whose hashes
+    collide (hash keeps only one of them). Scans the source twice.
+    """
+    src = parquet_source(parquet, hive_types)
+    if where:
+        src = f"(SELECT * FROM {src} WHERE {where})"
+    start = time.perf_counter()
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE dedup_keys AS
+        SELECT {REQUEST_ID} AS request_id, hash(*COLUMNS(*)) AS row_hash, count(*) AS n
+        FROM {src}
+        GROUP BY ALL
+    """)
+    raw_rows, hashes, ids, null_id_rows = con.execute("""
+        SELECT sum(n), count(DISTINCT row_hash), count(DISTINCT request_id),
+               count(*) FILTER (WHERE request_id IS NULL)
+        FROM dedup_keys
+    """).fetchone()
+    rows = con.execute(f"SELECT count(*) FROM (SELECT DISTINCT * FROM {src})").fetchone()[0]
+    conflicts = con.execute("""
+        SELECT request_id, count(*) AS variants
+        FROM dedup_keys
+        WHERE request_id IS NOT NULL
+        GROUP BY 1
+        HAVING count(*) > 1
+        ORDER BY variants DESC, request_id
+    """).fetchall()
+    con.execute("DROP TABLE dedup_keys")
+    return {
+        "raw_rows": int(raw_rows or 0),
+        "deduped_rows": {"row": int(rows), "request_id": int(ids + null_id_rows), "hash": int(hashes)},
+        "conflicting_ids": len(conflicts),
+        "dropped_by_request_id": int(sum(n - 1 for _, n in conflicts)),
+        "hash_collisions": int(rows - hashes),
+        "examples": [request_id for request_id, _ in conflicts[:examples]],
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def describe_verification(report: Mapping[str, Any]) -> str:
+    counts = ", ".join(f"{key}={n:,}" for key, n in report["deduped_rows"].items())
+    lines = [f"Dedup verification ({report['seconds']:.2f}s): {report['raw_rows']:,} rows -> {counts}"]
+    if report["conflicting_ids"]:
+        lines.append(
+            f"  ⚠ {report['conflicting_ids']:,} request ids are shared by differing rows "
+            f"(request_id drops {report['dropped_by_request_id']:,}), e.g. {', '.join(report['examples'])}"
+        )
+    if report["hash_collisions"]:
+        lines.append(f"  ⚠ {report['hash_collisions']:,} distinct rows share a row hash")
+    if not report["conflicting_ids"] and not report["hash_collisions"]:
+        lines.append("  All dedup keys agree")
+    return "\n".join(lines)
+
+
+def scan_bytes(
+    parquet: str,
+    columns: Sequence[str] | None = None,
+    where: str | None = None,
+    hive_types: Mapping[str, str] | None = None,
+) -> dict[str, int]:
+    """
+    Compressed size of the column chunks a load reading `columns` (every
+    column when None) takes from `parquet`, against the whole dataset's.
+    Row groups that may hold rows without a request id are counted whole, as
+    the dedup reads those rows in full (see `dedup_query`). With `where`,
+    only the row groups holding a row it keeps count as read: the files and
+    row groups its partition and min/max bounds prune are skipped. Finding
+    them reads the columns of `where` from the row groups DuckDB does not
+    prune itself.
+    """
+    files = dataset_files(parquet)
+    if not files:
+        return {"columns_read": 0, "columns_total": 0, "bytes_read": 0, "bytes_total": 0}
+    paths = ", ".join(f"'{sql_escape(path)}'" for path in files)
+    read = ", ".join(f"'{sql_escape(col.lower())}'" for col in columns or ())
+    chosen = f"col IN ({read})" if columns else "true"
+    kept = "true"
+    if where:
+        # Row groups are contiguous row ranges of their file, so each kept row
+        # falls in the last group starting at or before it
+        kept = f"""(file_name, row_group_id) IN (
+            SELECT (g.file_name, g.row_group_id)
+            FROM (SELECT filename, file_row_number FROM {parquet_source(parquet, hive_types, row_numbers=True)}
+                  WHERE {where}) r
+            ASOF JOIN starts g ON r.filename = g.file_name AND r.file_row_number >= g.first_row
+        )"""
+    con = duckdb.connect()
+    try:
+        columns_read, columns_total, bytes_read, bytes_total = con.execute(f"""
+            WITH chunks AS (
+                SELECT file_name, row_group_id, lower(split_part(path_in_schema, ', ', 1)) AS col,
+                       total_compressed_size AS size, stats_null_count AS nulls, row_group_num_rows AS num_rows
+                FROM parquet_metadata([{paths}])
+            ),
+            starts AS (
+                SELECT file_name, row_group_id,
+                       sum(num_rows) OVER (PARTITION BY file_name ORDER BY row_group_id) - num_rows AS first_row
+                FROM (SELECT DISTINCT file_name, row_group_id, num_rows FROM chunks)
+            ),
+            groups AS (
+                SELECT file_name, row_group_id,
+                       NOT bool_or(col = '{REQUEST_ID}') OR bool_or(col = '{REQUEST_ID}' AND coalesce(nulls, 1) > 0) AS whole,
+                       {kept} AS kept
+                FROM chunks GROUP BY ALL
+            )
+            SELECT count(DISTINCT col) FILTER (WHERE {chosen}), count(DISTINCT col),
+                   sum(size) FILTER (WHERE kept AND ({chosen} OR whole)), sum(size)
+            FROM chunks JOIN groups USING (file_name, row_group_id)
+        """).fetchone()
+    finally:
+        con.close()
+    return {"columns_read": int(columns_read), "columns_total": int(columns_total),
+            "bytes_read": int(bytes_read or 0), "bytes_total": int(bytes_total or 0)}
+
+
+def describe_scan(scan: Mapping[str, int]) -> str:
+    share = scan["bytes_read"] / scan["bytes_total"] if scan["bytes_total"] else 0
+    return (f"Scan: {scan['columns_read']} of {scan['columns_total']} columns, "
+            f"{scan['bytes_read'] / 2**20:.1f} of {scan['bytes_total'] / 2**20:.1f} MiB compressed ({share:.0%})")
+
+
+def materialize_logs(
+    con: duckdb.DuckDBPyConnection,
+    parquet: str,
+    columns: Sequence[str] | None = None,
+    mode: str = "table",
+    spill_db: str | None = None,
+    name: str = "logs",
+    where: str | None = None,
+    derived: Mapping[str, str] | None = None,
+    enums: Mapping[str, Sequence[str] | None] | None = None,
+    hive_types: Mapping[str, str] | None = None,
+    key: str = "row",
+) -> dict[str, Any]:
+    """
+    Deduplicate `parquet` (read with `parquet_source(parquet, hive_types)`)
+    once and expose it as `name` on `con`.
+
+    mode="table" materializes the deduplicated rows projected to `columns`
+    (all columns when None); with `spill_db` the table lives in that DuckDB
+    file instead of memory. mode="view" keeps the legacy per-query DISTINCT
+    view so the two approaches can be timed against each other. `where`
+    restricts the rows read from the parquet (e.g. to the partitions an
+    incremental run has to recompute). `derived` adds `{name: expression}`
+    columns computed from the raw row, e.g. keys of the `query` MAP flattened
+    by `event_store.event_fields`; the raw columns they read need not be in
+    `columns`. `enums` stores the listed VARCHAR columns (raw or derived) as
+    ENUMs: None discovers the members from the parquet, which only suits raw
+    columns; derived columns should list their possible values. `key` is
+    what identifies a duplicate (see DEDUP_KEYS and `dedup_query`); with
+    `columns` and key="request_id", only they, the raw columns of `derived`
+    and the id are read from the parquet for the rows that have an id. The
+    load summary's `scan` is `scan_bytes` of it.
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode: {mode!r} (expected one of {DEDUP_MODES})")
+    if key not in DEDUP_KEYS:
+        raise ValueError(f"Unknown dedup key: {key!r} (expected one of {DEDUP_KEYS})")
+
+    src = parquet_source(parquet, hive_types)
+    if where:
+        src = f"(SELECT * FROM {src} WHERE {where})"
+    raw_rows = con.execute(f"SELECT count(*) FROM {src}").fetchone()[0]
+
+    start = time.perf_counter()
+    types = enum_types(con, src, enums) if enums else {}
+    derived = dict(derived or {})
+    encode = {col: f"{col}::{types[col]} AS {col}" for col in types if col not in derived}
+    if columns:
+        projection = ", ".join(encode.get(col, col) for col in columns)
+    else:
+        projection = f"* REPLACE ({', '.join(encode.values())})" if encode else "*"
+    for col, expr in derived.items():
+        projection += f", ({expr})::{types[col]} AS {col}" if col in types else f", {expr} AS {col}"
+    # Keyed on the request id, the rows that have one are read on the requested
+    # columns, the raw columns `derived` and `where` use, and the id; the
+    # whole-row keys read every column (see dedup_query)
+    # A source without request ids falls back to whole-row dedup
+    available = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {src}").fetchall()]
+    if key == "request_id" and REQUEST_ID not in available:
+        key = "row"
+    read = None
+    if columns and key == "request_id":
+        wanted = referenced_columns(" ".join([*columns, *derived.values(), where or "", REQUEST_ID]), available)
+        read = [col for col in available if col in wanted]
+    dedup_sql = dedup_query(src, projection, key)
+    if mode == "view":
+        con.execute(f"CREATE VIEW {name} AS {dedup_sql}")
+    elif spill_db:
+        con.execute(f"ATTACH '{sql_escape(str(spill_db))}' AS spill")
+        con.execute(f"CREATE OR REPLACE TABLE spill.{name} AS {dedup_sql}")
+        con.execute(f"CREATE VIEW {name} AS SELECT * FROM spill.{name}")
+    else:
+        con.execute(f"CREATE TABLE {name} AS {dedup_sql}")
+    deduped_rows = con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+
+    return {
+        "mode": mode,
+        "key": key,
+        "raw_rows": int(raw_rows),
+        "deduped_rows": int(deduped_rows),
+        "duplicates": int(raw_rows - deduped_rows),
+        "columns": len(columns) + len(derived) if columns else None,
+        "enums": sorted(types),
+        "seconds": round(time.perf_counter() - start, 2),
+        "scan": scan_bytes(parquet, read, where, hive_types),
+    }
@@ -0,0 +1,203 @@
+"""
+Content-addressed cache of the JSON outputs of the aggregation scripts.
+
+An output's key hashes the source parquet's fingerprint (size of each file
+plus its footer: row-group row counts, sizes and per-column min/max stats,
+read via `parquet_metadata()` without scanning any data) together with the definition
+of the output and of every partial table upstream of it: the SQL text for SQL
+nodes; for Python builders the source of the builder and of the module-level
+functions and constants it references and the values it closes over, plus
+any declared side files. When
+the key matches a stored entry the cached JSON is copied into place and the
+output is not recomputed, so editing one query only recomputes that output
+(or the outputs of an edited partial). The source key also covers how the
+logs were loaded, since that changes the rows every output reads: the dedup
+key, the date window of a `--since`/`--until` run, the load definition
+(`log_store.load_definition`: the dedup SQL, the columns derived on load,
+ENUM members and the events filter) and the code of `materialize_logs`, and
+how outputs are serialized (`OutputCache`). Entries a run made stale are
+pruned after it (`OutputCache.prune`), so the directory does not grow with
+every edit.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import types
+from typing import Any, Callable, Iterable
+
+import duckdb
+
+from aggregation_registry import Registry
+from log_store import dataset_files, materialize_logs, sql_escape
+from query_pool import stream_json
+
+_PLAIN = (str, int, float, bool, tuple, list, dict, frozenset, set, type(None))
+
+
+def _sha(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def parquet_fingerprint(parquet: str) -> str:
+    """
+    File size + footer metadata of every file of `parquet` (no data pages
+    are read). Files of a dataset are also keyed by their path below the
+    dataset, which carries the hive partition values.
+    """
+    files = dataset_files(parquet)
+    if not files:
+        raise FileNotFoundError(f"No parquet files found: {parquet}")
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+    con = duckdb.connect()
+    try:
+        entries = [
+            [
+                os.path.relpath(os.path.abspath(f), root) if len(files) > 1 else "",
+                os.path.getsize(f),
+                con.execute(f"SELECT * EXCLUDE (file_name) FROM parquet_metadata('{sql_escape(f)}')").fetchall(),
+            ]
+            for f in files
+        ]
+    finally:
+        con.close()
+    return _sha(entries)[:32]
+
+
+def _code_names(code: types.CodeType) -> set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _value_digest(name: str, value: Any, seen: set[int]) -> list[Any] | None:
+    if isinstance(value, types.FunctionType):
+        return None if id(value) in seen else [name, builder_digest(value, seen)]
+    if isinstance(value, _PLAIN):
+        return [name, sorted(value) if isinstance(value, (set, frozenset)) else value]
+    return None
+
+
+def builder_digest(fn: Any, seen: set[int] | None = None, locations: Iterable[str] = ()) -> str:
+    """
+    Source of `fn` plus the module-level constants and functions it uses and
+    the values of the variables it closes over (e.g. the flags a builder
+    defined inside `register_outputs` captures). Closed-over `locations`, the
+    directories of a builder's declared files, are left out: the contents of
+    those files are keyed instead, so the output directory of a run does not
+    change the key.
+    """
+    locations = set(locations)
+    seen = set() if seen is None else seen
+    seen.add(id(fn))
+    parts: list[Any] = [inspect.getsource(fn)]
+    for name in sorted(_code_names(fn.__code__)):
+        parts.append(_value_digest(name, fn.__globals__.get(name), seen))
+    for name, cell in zip(fn.__code__.co_freevars, fn.__closure__ or ()):
+        try:
+            value = cell.cell_contents
+        except ValueError:  # not assigned yet
+            continue
+        if isinstance(value, str) and value in locations:
+            continue
+        parts.append(_value_digest(f"<closure> {name}", value, seen))
+    return _sha([part for part in parts if part is not None])
+
+
+def _file_digest(path: str) -> str:
+    if not os.path.exists(path):
+        return "missing"
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class OutputCache:
+    """
+    Reuse outputs of `reg` whose key is already stored under `directory`.
+
+    `restore(names, out)` copies the cached outputs into `out` and returns
+    the names that still have to be computed; `store(names, out)` files the
+    freshly written outputs under their keys. `prune()` then deletes the
+    entries the run made stale: other keys of the outputs it restored or
+    stored, and entries of outputs no longer registered. Entries of outputs
+    outside the run (e.g. of an `--only` run) are kept.
+
+    The serialization is part of the source key: the code writing SQL
+    outputs (`query_pool.stream_json`) and `writer`, the script's writer of
+    Python outputs, so a change to the bytes written misses everywhere.
+    """
+
+    def __init__(self, directory: str, reg: Registry, parquet: str, dedup_key: str = "row",
+                 window: dict[str, Any] | None = None, load: dict[str, Any] | None = None,
+                 writer: Callable[[str, Any], None] | None = None) -> None:
+        self.directory = directory
+        self.reg = reg
+        self.source = [
+            parquet_fingerprint(parquet), dedup_key, window, load, builder_digest(materialize_logs),
+            builder_digest(stream_json), builder_digest(writer) if writer else None,
+        ]
+        self.hits: list[str] = []
+        self.misses: list[str] = []
+        self.stored: list[str] = []
+        self.evicted = 0
+        self._digests: dict[str, str] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _digest(self, name: str) -> str:
+        if name not in self._digests:
+            node = self.reg.nodes[name]
+            if node["kind"] == "python":
+                locations = {os.path.dirname(p) for p in node["files"]}
+                definition = [builder_digest(node["build"], locations=locations), [_file_digest(p) for p in node["files"]]]
+            else:
+                definition = " ".join(node["build"].split())
+            upstream = sorted(self._digest(i) for i in node["inputs"] if i in self.reg.nodes)
+            self._digests[name] = _sha([node["kind"], definition, upstream])
+        return self._digests[name]
+
+    def key(self, name: str) -> str:
+        return _sha([self.source, name, self._digest(name)])[:32]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}-{self.key(name)}.json")
+
+    def restore(self, names: Iterable[str], out: str) -> list[str]:
+        missing = []
+        for name in names:
+            cached = self._path(name)
+            if os.path.exists(cached):
+                shutil.copyfile(cached, os.path.join(out, f"{name}.json"))
+                self.hits.append(name)
+            else:
+                missing.append(name)
+        self.misses.extend(missing)
+        return missing
+
+    def store(self, names: Iterable[str], out: str) -> None:
+        for name in names:
+            cached = self._path(name)
+            shutil.copyfile(os.path.join(out, f"{name}.json"), f"{cached}.tmp")
+            os.replace(f"{cached}.tmp", cached)
+            self.stored.append(name)
+
+    def prune(self) -> int:
+        """Delete the entries this run made stale (see the class docstring); returns how many."""
+        used = set(self.hits) | set(self.stored)
+        current = {os.path.basename(self._path(name)) for name in used}
+        for entry in os.listdir(self.directory):
+            name = entry.rsplit("-", 1)[0]
+            stale = name not in self.reg.outputs or (name in used and entry not in current)
+            if entry.endswith(".json.tmp") or (entry.endswith(".json") and stale):
+                os.remove(os.path.join(self.directory, entry))
+                self.evicted += 1
+        return self.evicted
+
+    def describe(self) -> str:
+        evicted = f", {self.evicted} stale entries removed" if self.evicted else ""
+        return f"Cache: {len(self.hits)} hits, {len(self.misses)} misses{evicted} ({self.directory})"
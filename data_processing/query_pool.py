@@ -0,0 +1,229 @@
+"""
+Concurrent execution of independent aggregations on DuckDB cursors.
+
+Every output of the aggregation scripts is an independent query (or a short
+chain of queries) over tables that already exist when the outputs start, so
+they can run side by side on `con.cursor()` workers. A single writer thread
+serializes finished results to JSON while the workers keep querying.
+
+Results never go through pandas: SQL outputs are streamed to disk in
+batches of rows, each encoded by one C `json.dumps` call (`stream_json`),
+and the Python builders read plain tuples with `records`. Both end up in
+the same serialization, `json.dumps(..., ensure_ascii=True)`.
+
+The thread budget is split between the two levels of parallelism: serial
+stages on the main connection (load, dedup) get all T threads, and once the
+first task is dispatched to W workers each query may use T // W DuckDB
+threads, so inter-query and intra-query parallelism never oversubscribe the
+cores.
+
+With `profile` every task runs on a `ProfiledCursor` and its DuckDB profile
+is kept under the task's name (`profiles`); `stage()` profiles the serial
+stages on the main connection the same way.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from decimal import Decimal
+from typing import Any, Callable, Iterable
+
+import duckdb
+
+from query_profile import ProfiledCursor, node_profile
+
+DEFAULT_WORKERS = 4
+STREAM_BATCH_ROWS = 10_000
+
+
+def records(cur: duckdb.DuckDBPyConnection, sql: str) -> list[dict]:
+    rows = cur.execute(sql).fetchall()
+    names = [column[0] for column in cur.description]
+    return [dict(zip(names, row)) for row in rows]
+
+
+def json_default(value: Any) -> Any:
+    """`json.dumps` fallback: DECIMAL as a number, dates and times as DuckDB prints them."""
+    return float(value) if isinstance(value, Decimal) else str(value)
+
+
+def stream_json(cur: duckdb.DuckDBPyConnection, path: str, sql: str) -> None:
+    """
+    Stream the rows of `sql` to `path` as a JSON array of records.
+
+    Rows are fetched STREAM_BATCH_ROWS at a time and each batch is encoded by
+    one C `json.dumps` call and appended to the file, so the full result is
+    never held in Python. The bytes are those of `json.dumps(rows,
+    ensure_ascii=True)` over all the rows, like every other output.
+    """
+    cur.execute(sql)
+    names = [column[0] for column in cur.description]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        separator = ""
+        while rows := cur.fetchmany(STREAM_BATCH_ROWS):
+            batch = json.dumps([dict(zip(names, row)) for row in rows], ensure_ascii=True, default=json_default)
+            f.write(separator + batch[1:-1])
+            separator = ", "
+        f.write("]")
+
+
+def _task_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class QueryPool:
+    """
+    Dispatch aggregations to a pool of cursors and overlap JSON writes.
+
+    `write(path, fn)` runs `fn(cursor)` on a worker and hands the result to
+    `writer(path, result)` on the writer thread; `json(path, sql)` streams
+    the rows on the worker and then calls `report(path)` on the writer
+    thread. `close()` waits for
+    everything, re-raises the first failure and returns timing stats: the
+    wall-clock of the concurrent stage, the summed time of its tasks and
+    their ratio, the concurrency achieved. That ratio is not a speedup over
+    a serial run: each task ran on `threads // workers` threads, and under
+    contention takes longer than it would alone. The serial baseline is a
+    `workers=1` run on all threads (`benchmark_pipeline.py --serial-baseline`).
+    Tasks are named after their output file unless given a `name`; tasks
+    named in `explain` also keep their full query plans (`plans`).
+    """
+
+    def __init__(
+        self,
+        con: duckdb.DuckDBPyConnection,
+        workers: int = DEFAULT_WORKERS,
+        threads: int | None = None,
+        writer: Callable[[str, Any], None] | None = None,
+        report: Callable[[str], None] | None = None,
+        profile: bool = False,
+        explain: Iterable[str] = (),
+    ) -> None:
+        self.con = con
+        self.writer = writer
+        self.report = report
+        self.explain = set(explain)
+        self.profile = profile or bool(self.explain)
+        self.profiles: list[dict[str, Any]] = []
+        self.plans: dict[str, list[str]] = {}
+        self.threads = max(1, threads or os.cpu_count() or 1)
+        self.workers = max(1, min(workers, self.threads))
+        self.threads_per_query = max(1, self.threads // self.workers)
+        con.execute(f"SET threads = {self.threads}")
+
+        self._local = threading.local()
+        self._cursors: list[duckdb.DuckDBPyConnection] = []
+        self._lock = threading.Lock()
+        self._queries = ThreadPoolExecutor(self.workers, thread_name_prefix="query")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="writer")
+        self._futures: list[Future] = []
+        self._writes: list[Future] = []
+        self._busy = 0.0
+        self._started: float | None = None
+
+    def _dispatch(self, task: Callable[[], Any]) -> Future:
+        if self._started is None:
+            self.con.execute(f"SET threads = {self.threads_per_query}")
+            self._started = time.perf_counter()
+        future = self._queries.submit(task)
+        self._futures.append(future)
+        return future
+
+    def _cursor(self) -> duckdb.DuckDBPyConnection:
+        cur = getattr(self._local, "cursor", None)
+        if cur is None:
+            cur = self._local.cursor = self.con.cursor()
+            with self._lock:
+                self._cursors.append(cur)
+        return cur
+
+    def _timed(self, fn: Callable, *args) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._busy += elapsed
+
+    def _profiled(self, name: str, fn: Callable, cur: duckdb.DuckDBPyConnection, *args) -> Any:
+        if not self.profile:
+            return fn(cur, *args)
+        profiled = ProfiledCursor(cur, plans=name in self.explain)
+        start = time.perf_counter()
+        try:
+            return fn(profiled, *args)
+        finally:
+            queries = profiled.finish()
+            with self._lock:
+                self.profiles.append(node_profile(name, time.perf_counter() - start, queries))
+                if profiled.plans:
+                    self.plans[name] = profiled.plans
+
+    def _run(self, name: str, fn: Callable, *args) -> Any:
+        """`fn(cursor, *args)` on this worker's cursor, timed (and profiled)."""
+        return self._timed(self._profiled, name, fn, self._cursor(), *args)
+
+    def stage(self, name: str, fn: Callable[[duckdb.DuckDBPyConnection], Any]) -> Any:
+        """Run `fn(con)` on the main connection now (e.g. loading the logs), profiled like a task."""
+        try:
+            return self._profiled(name, fn, self.con)
+        finally:
+            if self.profile:
+                self.con.execute("PRAGMA disable_profiling")
+
+    def submit(self, fn: Callable[[duckdb.DuckDBPyConnection], Any], name: str = "task") -> Future:
+        """Run `fn(cursor)` on a worker."""
+        return self._dispatch(lambda: self._run(name, fn))
+
+    def write(self, path: str, fn: Callable[[duckdb.DuckDBPyConnection], Any]) -> Future:
+        """Run `fn(cursor)` on a worker, then `writer(path, result)` on the writer thread."""
+        def query_then_write():
+            result = self._run(_task_name(path), fn)
+            with self._lock:
+                self._writes.append(self._writer.submit(self._timed, self.writer, path, result))
+        return self._dispatch(query_then_write)
+
+    def json(self, path: str, sql: str) -> Future:
+        """Write the records of `sql` to `path`."""
+        def stream_then_report():
+            self._run(_task_name(path), stream_json, path, sql)
+            if self.report:
+                with self._lock:
+                    self._writes.append(self._writer.submit(self.report, path))
+        return self._dispatch(stream_then_report)
+
+    def close(self) -> dict[str, Any]:
+        # Writes are queued by the query futures, so they are complete once those are
+        wait(self._futures)
+        self._queries.shutdown()
+        self._writer.shutdown()
+        for future in self._futures + self._writes:
+            future.result()
+        for cur in self._cursors:
+            cur.close()
+        self.con.execute(f"SET threads = {self.threads}")
+        wall = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            "tasks": len(self._futures),
+            "workers": self.workers,
+            "threads": self.threads,
+            "threads_per_query": self.threads_per_query,
+            "wall_seconds": round(wall, 2),
+            "task_seconds": round(self._busy, 2),
+            "concurrency": round(self._busy / wall, 2) if wall else 0.0,
+        }
+
+
+def describe_stats(stats: dict[str, Any]) -> str:
+    # Concurrency, not speedup: summed task time is not the serial runtime
+    return (
+        f"Scheduler: {stats['tasks']} tasks on {stats['workers']} workers × "
+        f"{stats['threads_per_query']} threads — wall {stats['wall_seconds']:.2f}s, "
+        f"{stats['task_seconds']:.2f}s summed task time ({stats.get('concurrency', 0.0):.1f}× concurrency)"
+    )
@@ -0,0 +1,150 @@
+"""
+Per-node query profiles for the aggregation scripts (`--profile`,
+`--explain-analyze`).
+
+`ProfiledCursor` wraps a cursor with DuckDB profiling enabled and keeps the
+profile of every query run through it: latency, CPU time, rows scanned,
+cardinalities, memory and the operator tree with per-operator timings. A
+query's profile is only final once its result is consumed, so the cursor
+drains the previous result before starting the next query. The
+QueryPool profiles each node on its own cursor; `write_profile` files the
+nodes, most expensive first, in `pipeline_profile.json` (under `data/`, apart
+from the published outputs).
+
+Memory is reported twice: `memory_allocated` is what the node's queries
+allocated themselves (hash tables, sort runs), `peak_buffer_memory` is the
+peak of DuckDB's whole buffer pool while they ran, including the loaded
+tables and any queries running on other workers.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import resource
+import sys
+from typing import Any, Iterable, Mapping
+
+import duckdb
+
+PROFILE_FILE = "pipeline_profile.json"
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far."""
+    # On Linux, ru_maxrss of a spawned process also counts its parent's memory
+    # at the fork; VmHWM is the peak of the process's own memory
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _operators(node: Mapping[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {
+            "operator": child["operator_name"].strip(),
+            "seconds": round(child["operator_timing"], 6),
+            "cardinality": child["operator_cardinality"],
+            "rows_scanned": child["operator_rows_scanned"],
+            "children": _operators(child),
+        }
+        for child in node.get("children", [])
+    ]
+
+
+def summarize(profile: Mapping[str, Any]) -> dict[str, Any]:
+    """The parts of DuckDB's JSON profile of one query kept in the report."""
+    return {
+        "sql": " ".join(profile["query_name"].split()),
+        "seconds": round(profile["latency"], 6),
+        "cpu_seconds": round(profile["cpu_time"], 6),
+        "rows_scanned": profile["cumulative_rows_scanned"],
+        "cardinality": profile["cumulative_cardinality"],
+        "rows_returned": profile["rows_returned"],
+        "memory_allocated": profile["total_memory_allocated"],
+        "peak_buffer_memory": profile["system_peak_buffer_memory"],
+        "peak_temp_dir_size": profile["system_peak_temp_dir_size"],
+        "operators": _operators(profile),
+    }
+
+
+class ProfiledCursor:
+    """
+    `cur` with every query profiled. `finish()` returns the summaries of the
+    queries run so far; with `plans` it also keeps each query's full
+    EXPLAIN ANALYZE tree (`self.plans`).
+    """
+
+    def __init__(self, cur: duckdb.DuckDBPyConnection, plans: bool = False) -> None:
+        cur.execute("SET enable_profiling = 'no_output'")
+        self._cur = cur
+        self._plans = plans
+        self._pending = False
+        self.queries: list[dict[str, Any]] = []
+        self.plans: list[str] = []
+
+    def _collect(self) -> None:
+        if not self._pending:
+            return
+        self._pending = False
+        try:
+            self._cur.fetchall()
+        except duckdb.InvalidInputError:
+            pass  # no open result left to consume
+        profile = json.loads(self._cur.get_profiling_information(format="json"))
+        if profile.get("query_name"):
+            self.queries.append(summarize(profile))
+            if self._plans:
+                self.plans.append(self._cur.get_profiling_information(format="query_tree"))
+
+    def execute(self, sql: str, *args: Any) -> "ProfiledCursor":
+        self._collect()
+        self._cur.execute(sql, *args)
+        self._pending = True
+        return self
+
+    def finish(self) -> list[dict[str, Any]]:
+        self._collect()
+        return self.queries
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cur, name)
+
+
+def node_profile(name: str, seconds: float, queries: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "name": name,
+        "seconds": round(seconds, 4),
+        "query_seconds": round(sum(q["seconds"] for q in queries), 4),
+        "rows_scanned": sum(q["rows_scanned"] for q in queries),
+        "memory_allocated": max((q["memory_allocated"] for q in queries), default=0),
+        "peak_buffer_memory": max((q["peak_buffer_memory"] for q in queries), default=0),
+        "queries": queries,
+    }
+
+
+def write_profile(path: str, nodes: Iterable[Mapping[str, Any]], stats: Mapping[str, Any]) -> list[dict[str, Any]]:
+    """Write the node profiles to `path`, most expensive first; returns them in that order."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    ranked = sorted(nodes, key=lambda node: node["seconds"], reverse=True)
+    report = {**stats, "peak_rss_mb": round(peak_rss_mb(), 1), "nodes": ranked}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return ranked
+
+
+def describe_profile(ranked: list[Mapping[str, Any]], top: int = 5) -> str:
+    lines = [f"Profile: {len(ranked)} nodes, most expensive first"]
+    for node in ranked[:top]:
+        lines.append(
+            f"  {node['name']:<32} {node['seconds']:8.3f}s  {node['rows_scanned']:>12,} rows scanned  "
+            f"{node['memory_allocated'] / 2**20:7.1f} MiB allocated"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+"""
+Traffic rollup cube: one additive partial that most HRA outputs slice.
+
+Tool visits by year, month and weekday, visits per country and tool, bot
+traffic per country, traffic types, hourly traffic and event types are all
+sums of request counts over the same few dimensions. The cube is a single
+partial (`p_traffic_cube`) that counts requests per part (month), weekday,
+hour, site, tool, country, traffic type and event. Each of those outputs is
+a GROUP BY over the cube instead of its own scan of the logs.
+
+A cube only pays off when its cells are much fewer than the log rows, so it
+keeps no finer time than the outputs slice by: the date is kept as its
+weekday, and with the month and the hour of the day that is every time
+dimension they use. `write_cube` records the cube's rows against the log
+rows it counts (the sum of `n`) in the file's metadata.
+
+`--cube-out PATH` writes the cube to a parquet file, stamped with a hash of
+its query (`write_cube`). `--from-cube PATH` then regenerates the outputs
+that read only the cube from that file, without loading the logs
+(`attach_cube`, `cube_outputs`). That includes the outputs reading
+`tool_visits`, the Apps tool pages rolled up from the cube.
+
+The measure is the request count `n`, which adds up over any slice.
+Distinct counts (users, sessions) are not additive, so they keep their own
+partials. An HLL sketch per cell would be far larger than the cube.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any
+
+import duckdb
+
+from aggregation_registry import Registry
+from log_store import sql_escape
+
+CUBE_TABLE = "p_traffic_cube"
+
+
+def cube_hash(reg: Registry) -> str:
+    """Hash of the registered cube query, so a stored cube built by another definition is refused."""
+    return hashlib.sha256(reg.nodes[CUBE_TABLE]["build"].encode()).hexdigest()[:16]
+
+
+def cube_outputs(reg: Registry) -> list[str]:
+    """Outputs whose only partial is the cube (directly or through tables derived from it)."""
+    return [
+        name for name in reg.outputs
+        if {node for node in reg.select([name]) if reg.external_inputs([node])} == {CUBE_TABLE}
+    ]
+
+
+def write_cube(con: duckdb.DuckDBPyConnection, path: str, reg: Registry, source: str) -> dict[str, Any]:
+    """
+    Write the built cube to `path` (ordered by month, zstd); returns its rows,
+    the log rows it counts, their ratio and the file's bytes.
+    """
+    rows, raw_rows = con.execute(f"SELECT count(*), coalesce(SUM(n), 0)::BIGINT FROM {CUBE_TABLE}").fetchone()
+    ratio = round(rows / raw_rows, 4) if raw_rows else None
+    con.execute(f"""
+        COPY (SELECT * FROM {CUBE_TABLE} ORDER BY part, site, tool) TO '{sql_escape(path)}'
+        (FORMAT PARQUET, COMPRESSION zstd,
+         KV_METADATA {{cube_definition: '{cube_hash(reg)}', source: '{sql_escape(source)}',
+                       raw_rows: '{raw_rows}', ratio: '{ratio}'}})
+    """)
+    return {"rows": rows, "raw_rows": raw_rows, "ratio": ratio, "bytes": os.path.getsize(path)}
+
+
+def attach_cube(con: duckdb.DuckDBPyConnection, path: str, reg: Registry) -> dict[str, Any]:
+    """Expose the stored cube at `path` as `p_traffic_cube`; returns its rows, source and ratio."""
+    meta = dict(con.execute(
+        f"SELECT decode(key), decode(value) FROM parquet_kv_metadata('{sql_escape(path)}')"
+    ).fetchall())
+    if meta.get("cube_definition") != cube_hash(reg):
+        raise ValueError(f"{path} was written by another cube definition (or a --sample run); rebuild it with --cube-out")
+    con.execute(f"CREATE VIEW {CUBE_TABLE} AS SELECT * FROM read_parquet('{sql_escape(path)}')")
+    (rows,) = con.execute(f"SELECT count(*) FROM {CUBE_TABLE}").fetchone()
+    raw_rows = int(meta["raw_rows"])
+    ratio = round(rows / raw_rows, 4) if raw_rows else None
+    return {"rows": rows, "raw_rows": raw_rows, "ratio": ratio, "source": meta.get("source")}
+
+
+def describe_cube(stats: dict[str, Any], path: str) -> str:
+    size = f", {stats['bytes'] / 2**20:.1f} MiB" if "bytes" in stats else ""
+    source = f" (built from {stats['source']})" if stats.get("source") else ""
+    ratio = f" ({stats['ratio']:.1%} of {stats['raw_rows']:,} log rows)" if stats.get("ratio") is not None else ""
+    return f"Traffic cube {path}: {stats['rows']:,} rows{ratio}{size}{source}"
@@ -44,9 +44,26 @@ echo ""
 
 START_TIME=$(date +%s)
 
-# ── Auto-detect latest parquet files ──────────────────────────────────────────
-HRA_PARQUET=$(ls -t data/hra/*hra-logs*.parquet 2>/dev/null | head -1)
-CNS_PARQUET=$(ls -t data/cns/*cns-logs*.parquet 2>/dev/null | head -1)
+# ── Raw CloudFront .gz logs synced to data/<site>/raw/ are parsed into data/<site>/logs/ ──
+for site in hra cns; do
+  if [ -d "data/$site/raw" ]; then
+    echo -e "${GREEN}Ingesting raw ${site} CloudFront logs...${NC}"
+    python data_processing/ingest_cloudfront_logs.py --source "data/$site/raw" --site "$site"
+  fi
+done
+
+# ── Auto-detect sources: the logs/ delivery dataset, else the latest parquet ──
+latest_source() {
+  if [ -n "$(find "data/$1/logs" -name '*.parquet' 2>/dev/null | head -1)" ]; then
+    echo "data/$1/logs"
+  else
+    ls -t data/$1/*$1-logs*.parquet 2>/dev/null | head -1
+  fi
+}
+HRA_PARQUET=$(latest_source hra)
+# Deduplicated HRA logs shared by the aggregation and ML steps, rebuilt when the parquet changes
+HRA_LOG_STORE=data/hra/hra_logs.duckdb
+CNS_PARQUET=$(latest_source cns)
 
 if [ "$RUN_HRA" = true ] && [ -z "$HRA_PARQUET" ]; then
   echo -e "${YELLOW}Warning: No HRA parquet found in data/hra/ — skipping HRA${NC}"
@@ -64,11 +81,11 @@ echo ""
 # ── HRA Pipeline ──────────────────────────────────────────────────────────────
 if [ "$RUN_HRA" = true ]; then
   echo -e "${GREEN}[1/6] HRA: Generating aggregation data...${NC}"
-  python data_processing/generate_hra_data.py --parquet "$HRA_PARQUET"
+  python data_processing/generate_hra_data.py --parquet "$HRA_PARQUET" --log-store "$HRA_LOG_STORE"
   echo ""
 
   echo -e "${GREEN}[2/6] HRA: Running ML pipeline...${NC}"
-  python data_processing/generate_hra_ml_insights.py --input-parquet "$HRA_PARQUET"
+  python data_processing/generate_hra_ml_insights.py --input-parquet "$HRA_PARQUET" --log-store "$HRA_LOG_STORE"
   echo ""
 
   if [ "$SKIP_FETCH" = false ]; then
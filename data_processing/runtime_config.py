@@ -0,0 +1,110 @@
+"""
+DuckDB runtime settings shared by the pipeline scripts.
+
+Every script takes the same flags (`add_runtime_args`), each with an
+environment-variable fallback so CI runners and large boxes can be tuned
+without editing commands:
+
+  --threads                      DUCKDB_THREADS
+  --memory-limit                 DUCKDB_MEMORY_LIMIT
+  --temp-directory               DUCKDB_TEMP_DIRECTORY
+  --[no-]preserve-insertion-order  DUCKDB_PRESERVE_INSERTION_ORDER
+  --[no-]object-cache            DUCKDB_OBJECT_CACHE
+
+Unset options keep DuckDB's defaults (all cores, 80% of RAM, `.tmp`).
+`apply_runtime` sets them on a connection and returns the values DuckDB
+actually uses, which the scripts log and record in their metadata JSON.
+With a memory limit, operators that outgrow it spill to the temp directory
+instead of failing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from typing import Any, Mapping
+
+import duckdb
+
+from log_store import sql_escape
+
+# option: (DuckDB setting, environment variable)
+RUNTIME_OPTIONS = {
+    "threads": ("threads", "DUCKDB_THREADS"),
+    "memory_limit": ("memory_limit", "DUCKDB_MEMORY_LIMIT"),
+    "temp_directory": ("temp_directory", "DUCKDB_TEMP_DIRECTORY"),
+    "preserve_insertion_order": ("preserve_insertion_order", "DUCKDB_PRESERVE_INSERTION_ORDER"),
+    "object_cache": ("enable_object_cache", "DUCKDB_OBJECT_CACHE"),
+}
+_FLAGS = {"1": True, "true": True, "yes": True, "on": True, "0": False, "false": False, "no": False, "off": False}
+
+
+def _parse(option: str, value: str) -> Any:
+    if option == "threads":
+        return int(value)
+    if option in ("preserve_insertion_order", "object_cache"):
+        if value.strip().lower() not in _FLAGS:
+            raise ValueError(f"{RUNTIME_OPTIONS[option][1]}={value!r} is not a boolean")
+        return _FLAGS[value.strip().lower()]
+    return value
+
+
+def add_runtime_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Total DuckDB threads (default: all cores; env DUCKDB_THREADS)")
+    parser.add_argument("--memory-limit", default=None,
+                        help="DuckDB memory limit, e.g. 4GB (default: 80%% of RAM; env DUCKDB_MEMORY_LIMIT)")
+    parser.add_argument("--temp-directory", default=None,
+                        help="Where DuckDB spills when over the memory limit (default: .tmp; env DUCKDB_TEMP_DIRECTORY)")
+    parser.add_argument("--preserve-insertion-order", action=argparse.BooleanOptionalAction, default=None,
+                        help="Keep row order in unordered results; off lets more operators stream and spill "
+                             "(default: on; env DUCKDB_PRESERVE_INSERTION_ORDER)")
+    parser.add_argument("--object-cache", action=argparse.BooleanOptionalAction, default=None,
+                        help="Cache parquet metadata across queries (default: off; env DUCKDB_OBJECT_CACHE)")
+
+
+def runtime_config(args: argparse.Namespace | None = None, environ: Mapping[str, str] | None = None) -> dict[str, Any]:
+    """`{option: value}` for the options set on the command line, else in the environment."""
+    environ = os.environ if environ is None else environ
+    config = {}
+    for option, (_, env) in RUNTIME_OPTIONS.items():
+        value = getattr(args, option, None)
+        if value is None and environ.get(env):
+            value = _parse(option, environ[env])
+        if value is not None:
+            config[option] = value
+    return config
+
+
+def apply_runtime(con: duckdb.DuckDBPyConnection, config: Mapping[str, Any]) -> dict[str, str]:
+    """Set `config` on `con`; returns every option's effective value as DuckDB reports it."""
+    for option, value in config.items():
+        setting = RUNTIME_OPTIONS[option][0]
+        if isinstance(value, bool):
+            con.execute(f"SET {setting} = {str(value).lower()}")
+        elif isinstance(value, int):
+            con.execute(f"SET {setting} = {value}")
+        else:
+            con.execute(f"SET {setting} = '{sql_escape(str(value))}'")
+    settings = dict(con.execute("SELECT name, value FROM duckdb_settings()").fetchall())
+    return {option: settings[setting] for option, (setting, _) in RUNTIME_OPTIONS.items()}
+
+
+def describe_runtime(settings: Mapping[str, str]) -> str:
+    return (
+        f"DuckDB: {settings['threads']} threads, memory limit {settings['memory_limit']}, "
+        f"spill to {settings['temp_directory'] or '(disabled)'}, "
+        f"insertion order {'kept' if settings['preserve_insertion_order'] == 'true' else 'not kept'}, "
+        f"object cache {'on' if settings['object_cache'] == 'true' else 'off'}"
+    )
+
+
+def record_runtime(path: str, settings: Mapping[str, str], **fields: Any) -> None:
+    """Add the run's settings (and other run `fields`) to the metadata JSON at `path` (kept out of the output cache)."""
+    with open(path, encoding="utf-8") as f:
+        metadata = json.load(f)
+    metadata["runtime"] = dict(settings)
+    metadata.update(fields)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(metadata, ensure_ascii=True, default=float))
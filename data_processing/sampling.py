@@ -0,0 +1,129 @@
+"""
+Sampled preview runs (`--sample FRACTION`) and their accuracy against a full run.
+
+A sampled run keeps a deterministic hash sample of the log rows while
+loading it, before deduplication, so the whole pipeline runs on a fraction
+of the data. The key is the user: `anon_id`, or `x_edge_request_id` for rows
+without one. A user's requests are kept or dropped together, so sessions,
+cohorts and per-user features stay whole. Duplicated deliveries share both
+ids, so they stay together and dedup as usual. The same fraction always
+keeps the same rows.
+
+Request counts (the `n` column of the partials) are scaled back up by
+1 / fraction. Partials that count users or sessions are left as sampled,
+and the outputs that read them are listed in the metadata. Each metadata
+JSON records the sample (`sample_metadata`). `compare_outputs` measures the
+error of a sampled run's JSON against a full run's (see
+`benchmark_sample.py`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import statistics
+from typing import Any, Iterable, Iterator, Mapping
+
+SAMPLE_KEY = "coalesce(anon_id, x_edge_request_id)"
+BUCKETS = 1_000_000
+
+
+def parse_fraction(value: str) -> float:
+    """argparse type of `--sample`: a fraction in (0, 1]."""
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise argparse.ArgumentTypeError(f"--sample must be in (0, 1], got {value}")
+    return fraction
+
+
+def sample_predicate(fraction: float) -> str:
+    """WHERE clause keeping `fraction` of the users (raw parquet columns)."""
+    return f"hash({SAMPLE_KEY}) % {BUCKETS} < {round(fraction * BUCKETS)}"
+
+
+def scale_counts(sql: str, fraction: float) -> str:
+    """`sql` with its request count `n` scaled by 1 / fraction (unchanged without an `n` column)."""
+    if not re.search(r"\bAS n\b", sql):
+        return sql
+    return f"SELECT * REPLACE (round(n / {fraction!r})::BIGINT AS n) FROM ({sql})"
+
+
+def unscaled_outputs(reg: Any, partials: Iterable[str]) -> list[str]:
+    """Outputs of the registry `reg` that read any of the (unscaled) `partials`, directly or not."""
+    tables = {f"p_{name}" for name in partials}
+    return [name for name in reg.outputs if tables & set(reg.select([name]))]
+
+
+def sample_metadata(fraction: float | None, unscaled: Iterable[str] = ()) -> dict[str, Any] | None:
+    """The `sample` entry of a metadata JSON (None for a full run)."""
+    if fraction is None:
+        return None
+    return {
+        "fraction": fraction,
+        "key": SAMPLE_KEY,
+        "estimated": True,
+        "scale": round(1 / fraction, 6),
+        "unscaled_outputs": sorted(unscaled),
+    }
+
+
+def _leaves(value: Any, path: tuple = ()) -> Iterator[tuple[tuple, float]]:
+    """Numeric leaves of a JSON value. List items are labelled by their string fields (e.g. a month and a tool)."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _leaves(item, path + (key,))
+    elif isinstance(value, list):
+        seen: dict[tuple, int] = {}
+        for i, item in enumerate(value):
+            label = tuple(v for v in item.values() if isinstance(v, str)) if isinstance(item, dict) else ()
+            label = label or (i,)
+            seen[label] = seen.get(label, 0) + 1
+            yield from _leaves(item, path + (label if seen[label] == 1 else label + (seen[label],),))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, float(value)
+
+
+def compare_outputs(full_dir: str, sample_dir: str, names: Iterable[str] | None = None) -> dict[str, dict[str, Any]]:
+    """
+    Error of every JSON output of `sample_dir` against the same file in
+    `full_dir`: the share of the full run's values the sample reproduces,
+    their median and p95 relative error, and the total absolute error
+    relative to the total (dominated by the large values).
+    """
+    names = sorted(names or (f[:-5] for f in os.listdir(sample_dir) if f.endswith(".json")))
+    reports = {}
+    for name in names:
+        paths = [os.path.join(d, f"{name}.json") for d in (full_dir, sample_dir)]
+        if not all(os.path.exists(p) for p in paths):
+            continue
+        with open(paths[0], encoding="utf-8") as f:
+            full = dict(_leaves(json.load(f)))
+        with open(paths[1], encoding="utf-8") as f:
+            sampled = dict(_leaves(json.load(f)))
+        both = [k for k in full if k in sampled]
+        errors = sorted(abs(sampled[k] - full[k]) / abs(full[k]) for k in both if full[k])
+        total = sum(abs(full[k]) for k in both)
+        reports[name] = {
+            "values": len(full),
+            "covered": round(len(both) / len(full), 4) if full else 1.0,
+            "median_relative_error": round(statistics.median(errors), 4) if errors else 0.0,
+            "p95_relative_error": round(errors[math.ceil(0.95 * len(errors)) - 1], 4) if errors else 0.0,
+            "total_relative_error": round(sum(abs(sampled[k] - full[k]) for k in both) / total, 4) if total else 0.0,
+        }
+    return reports
+
+
+def describe_comparison(reports: Mapping[str, Mapping[str, Any]], top: int = 10) -> str:
+    """The outputs with the largest total error first."""
+    ranked = sorted(reports.items(), key=lambda item: item[1]["total_relative_error"], reverse=True)
+    errors = [r["total_relative_error"] for r in reports.values()]
+    lines = [f"Sample vs full: {len(reports)} outputs, median total error {statistics.median(errors) if errors else 0:.1%}"]
+    for name, r in ranked[:top]:
+        lines.append(
+            f"  {name:<34} total {r['total_relative_error']:6.1%}  median {r['median_relative_error']:6.1%}  "
+            f"p95 {r['p95_relative_error']:6.1%}  covered {r['covered']:6.1%} of {r['values']:,} values"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+"""
+Deduplicated logs shared by the HRA aggregation, ML and dictionary scripts.
+
+`generate_hra_data.py` and `generate_hra_ml_insights.py` each dedup the same
+parquet on load, the most expensive step of both. With `--log-store PATH`
+the deduplicated, enriched logs (flattened event fields, tool columns,
+ENUMs) are kept in a DuckDB file instead. Any script pointed at the same
+file reads them from there, and the logs are only rebuilt when:
+
+  - the source parquet changed (its fingerprint, see
+    `output_cache.parquet_fingerprint`) or another dedup key is asked for
+  - a script needs columns the store lacks. The store is then rebuilt with
+    the union of the stored and the requested columns, so once every script
+    has run, all of them are served from the same build.
+
+The store holds the whole deduplicated dataset. Incremental and sampled
+runs load only part of the source, so they do not use it. Each script sees
+the store through a `logs` view of just its columns; ENUMs it did not ask
+for are cast back to VARCHAR. When up to date, the store is attached
+read-only, so several scripts can read it at once; a rebuild needs the
+file to itself.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Mapping, Sequence
+
+import duckdb
+
+from log_store import materialize_logs, sql_escape
+from output_cache import parquet_fingerprint
+
+STORE_TABLE = "logs"
+
+
+def _meta(con: duckdb.DuckDBPyConnection, path: str) -> dict[str, Any] | None:
+    """The definition the store at `path` was built with (None without a built store)."""
+    if not os.path.exists(path):
+        return None
+    con.execute(f"ATTACH '{sql_escape(path)}' AS shared_meta (READ_ONLY)")
+    try:
+        found = con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE database_name = 'shared_meta' AND table_name = 'store_meta'"
+        ).fetchone()[0]
+        if not found:
+            return None
+        row = con.execute("SELECT value FROM shared_meta.store_meta WHERE key = 'store'").fetchone()
+        return json.loads(row[0]) if row else None
+    finally:
+        con.execute("DETACH shared_meta")
+
+
+def _covers(meta: Mapping[str, Any], columns: Sequence[str], derived: Mapping[str, str],
+            enums: Mapping[str, Sequence[str] | None], hive_types: Mapping[str, str]) -> bool:
+    return (
+        set(columns) <= set(meta["columns"])
+        and all(meta["derived"].get(col) == expr for col, expr in derived.items())
+        and all(col in meta["enums"] and meta["enums"][col] == (list(v) if v is not None else None)
+                for col, v in enums.items())
+        and all(meta["hive_types"].get(col) == t for col, t in hive_types.items())
+    )
+
+
+def store_status(path: str, parquet: str, key: str | None = None) -> dict[str, Any] | None:
+    """
+    The stored definition and row counts when the store at `path` holds
+    `parquet`'s current logs (deduplicated by `key`, if given), else None.
+    """
+    con = duckdb.connect()
+    try:
+        meta = _meta(con, path)
+    finally:
+        con.close()
+    if not meta or meta["fingerprint"] != parquet_fingerprint(parquet) or key not in (None, meta["key"]):
+        return None
+    return meta
+
+
+def open_shared_logs(
+    con: duckdb.DuckDBPyConnection,
+    path: str,
+    parquet: str,
+    columns: Sequence[str],
+    derived: Mapping[str, str] | None = None,
+    enums: Mapping[str, Sequence[str] | None] | None = None,
+    hive_types: Mapping[str, str] | None = None,
+    key: str = "row",
+    name: str = "logs",
+) -> dict[str, Any]:
+    """
+    Expose the deduplicated logs of `parquet` as `name` on `con`, read from
+    the store at `path`, which is (re)built first when it is missing, stale
+    or lacks any of `columns`, `derived` or `enums`. Arguments are those of
+    `materialize_logs`. Returns its load summary, plus `reused`.
+    """
+    derived, enums, hive_types = dict(derived or {}), dict(enums or {}), dict(hive_types or {})
+    start = time.perf_counter()
+    fingerprint = parquet_fingerprint(parquet)
+    meta = _meta(con, path)
+    current = meta is not None and meta["fingerprint"] == fingerprint and meta["key"] == key
+    reused = current and _covers(meta, columns, derived, enums, hive_types)
+    if not reused:
+        # Keep what the other scripts asked for, so they are not rebuilt in turn
+        kept = meta or {"columns": [], "derived": {}, "enums": {}, "hive_types": {}}
+        meta = {
+            "fingerprint": fingerprint,
+            "key": key,
+            "source": parquet,
+            "columns": sorted(set(kept["columns"]) | set(columns)),
+            "derived": {**kept["derived"], **derived},
+            "enums": {**kept["enums"], **{col: list(v) if v is not None else None for col, v in enums.items()}},
+            "hive_types": {**kept["hive_types"], **hive_types},
+        }
+        # Built on `con`, with its runtime settings; the definition is stored last
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        con.execute(f"ATTACH '{sql_escape(path)}' AS shared")
+        try:
+            con.execute("DROP TABLE IF EXISTS shared.store_meta")
+            con.execute(f"DROP TABLE IF EXISTS shared.{STORE_TABLE}")
+            load = materialize_logs(
+                con, parquet, meta["columns"], name=f"shared.{STORE_TABLE}", derived=meta["derived"],
+                enums=meta["enums"], hive_types=meta["hive_types"], key=key,
+            )
+            meta.update({k: load[k] for k in ("raw_rows", "deduped_rows", "duplicates")})
+            con.execute("CREATE TABLE shared.store_meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+            con.execute("INSERT INTO shared.store_meta VALUES ('store', ?)", [json.dumps(meta)])
+        finally:
+            con.execute("DETACH shared")
+
+    con.execute(f"ATTACH '{sql_escape(path)}' AS shared (READ_ONLY)")
+    stored = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE shared.{STORE_TABLE})").fetchall())
+    projection = ", ".join(
+        f"{col}::VARCHAR AS {col}" if stored[col].startswith("ENUM") and col not in enums else col
+        for col in [*columns, *derived]
+    )
+    con.execute(f"CREATE VIEW {name} AS SELECT {projection} FROM shared.{STORE_TABLE}")
+    return {
+        "mode": "store",
+        "key": key,
+        "raw_rows": meta["raw_rows"],
+        "deduped_rows": meta["deduped_rows"],
+        "duplicates": meta["duplicates"],
+        "columns": len(columns) + len(derived),
+        "enums": sorted(enums),
+        "seconds": round(time.perf_counter() - start, 2),
+        "reused": reused,
+        "store": path,
+    }
+
+
+def describe_store(load: Mapping[str, Any]) -> str:
+    action = "reused" if load["reused"] else "rebuilt"
+    return f"Log store {load['store']}: {action} ({load['deduped_rows']:,} rows, {load['seconds']:.2f}s)"
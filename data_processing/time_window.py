@@ -0,0 +1,75 @@
+"""
+Time-windowed runs (`--since DAY` / `--until DAY`).
+
+A windowed run keeps the log rows whose `date` falls within the window
+(both days inclusive) while loading them, before deduplication, so every
+output describes only the window. The filter is part of the load's scan of
+the parquet: DuckDB pushes the date bounds into the scan and skips the row
+groups whose min/max `date` lie outside the window (most of them on a copy
+sorted by `compact_logs.py`). When the source is hive-partitioned by `year`
+(and `month`) of the row's date, the matching partition bounds are added so
+DuckDB does not open the files of other months at all, and the cost of the
+run follows the size of the window rather than that of the dataset.
+
+Rows without a date are outside every window. Each metadata JSON records
+the window (`window_metadata`).
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import date
+from typing import Any, Sequence
+
+
+def parse_day(value: str) -> date:
+    """argparse type of `--since` / `--until`: an ISO day (YYYY-MM-DD)."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a day as YYYY-MM-DD, got {value}") from None
+
+
+def check_window(since: date | None, until: date | None) -> None:
+    if since and until and since > until:
+        raise ValueError(f"--since {since} is after --until {until}")
+
+
+def window_predicate(since: date | None, until: date | None, partitions: Sequence[str] = ()) -> str | None:
+    """
+    WHERE clause keeping the raw rows dated within [since, until] (None
+    without a window), with the `year`/`month` bounds of hive partitions.
+    """
+    clauses = []
+    month = "TRY_CAST(year AS INTEGER) * 100 + TRY_CAST(month AS INTEGER)"
+    for day, op in ((since, ">="), (until, "<=")):
+        if day is None:
+            continue
+        clauses.append(f"date {op} DATE '{day.isoformat()}'")
+        if "year" in partitions:
+            clauses.append(f"TRY_CAST(year AS INTEGER) {op} {day.year}")
+            if "month" in partitions:
+                clauses.append(f"{month} {op} {day.year * 100 + day.month}")
+    return " AND ".join(clauses) or None
+
+
+def combine(*predicates: str | None) -> str | None:
+    """The conjunction of the given WHERE clauses (None when there are none)."""
+    present = [f"({p})" for p in predicates if p]
+    return " AND ".join(present) or None
+
+
+def window_metadata(since: date | None, until: date | None) -> dict[str, Any] | None:
+    """The `window` entry of a metadata JSON (None for a run over all dates)."""
+    if since is None and until is None:
+        return None
+    return {
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "inclusive": True,
+        "column": "date",
+    }
+
+
+def describe_window(since: date | None, until: date | None) -> str:
+    return f"{since or '…'} to {until or '…'}"
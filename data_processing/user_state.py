@@ -0,0 +1,209 @@
+"""
+First-seen state of every user, for cohort and return-rate outputs.
+
+A cohort matrix needs each user's first month, and finding it from the
+per-month partials means re-reading the whole history on every run. A
+first-seen spec names a per-month DISTINCT partial (`part` + user columns)
+and derives two tables from it:
+
+  fs_<name>  one row per key (e.g. anon_id, or anon_id + tool):
+             first_seen, last_active
+  fa_<name>  the activity matrix: keys counted per (groups, first_seen,
+             active month)
+
+A full run builds both from the partials (`state_queries`, registered like
+any other table). With `--incremental` they live in the state store next to
+the partials, and `refresh_state` updates them from the rebuilt months only:
+the keys seen in those months are merged into `fs_`, and the matrix rows of
+those months are recounted. History is read only for the keys whose first
+(or last) month was rebuilt and no longer holds them, or whose first month
+moved. Those keys are rare: late data, rewritten months and backfills.
+Undated rows (`part IS NULL`) have no cohort and are left out.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Mapping
+
+import duckdb
+
+from incremental_state import part_predicate
+
+# name → {"source": partial name, "keys": {alias: expression}, "groups": [key aliases]}
+Spec = Mapping[str, Any]
+
+
+def state_hash(specs: Mapping[str, Spec]) -> str:
+    """Hash of the specs, so an edited spec rebuilds the stored state."""
+    return hashlib.sha256(json.dumps(specs, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _activity(spec: Spec, prefix: str = "", where: str = "TRUE") -> str:
+    """Distinct (active month, keys) rows of the spec's partial."""
+    keys = ", ".join(f"{expr} AS {alias}" for alias, expr in spec["keys"].items())
+    return f"""
+        SELECT DISTINCT part AS active, {keys}
+        FROM {prefix}p_{spec["source"]}
+        WHERE part IS NOT NULL AND ({where})
+    """
+
+
+def _first_seen(spec: Spec, activity: str) -> str:
+    keys = ", ".join(spec["keys"])
+    return f"SELECT {keys}, min(active) AS first_seen, max(active) AS last_active FROM ({activity}) GROUP BY {keys}"
+
+
+def _matrix(spec: Spec, activity: str, first_seen: str) -> str:
+    groups = "".join(f"a.{g}, " for g in spec["groups"])
+    matched = " AND ".join(f"a.{k} = f.{k}" for k in spec["keys"])
+    return f"""
+        SELECT {groups}f.first_seen, a.active, count(*)::BIGINT AS n
+        FROM ({activity}) a JOIN {first_seen} f ON {matched}
+        GROUP BY ALL
+    """
+
+
+def state_queries(specs: Mapping[str, Spec]) -> dict[str, str]:
+    """`fs_<name>` and `fa_<name>` of every spec, built from the in-memory partials."""
+    queries = {}
+    for name, spec in specs.items():
+        queries[f"fs_{name}"] = _first_seen(spec, _activity(spec))
+        queries[f"fa_{name}"] = _matrix(spec, _activity(spec), f"fs_{name}")
+    return queries
+
+
+def _stored(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    return bool(con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE database_name = 'state' AND table_name = ?", [table],
+    ).fetchone()[0])
+
+
+def _rebuild(con: duckdb.DuckDBPyConnection, name: str, spec: Spec) -> None:
+    activity = _activity(spec, "state.")
+    con.execute(f"CREATE OR REPLACE TABLE state.fs_{name} AS {_first_seen(spec, activity)}")
+    con.execute(f"CREATE OR REPLACE TABLE state.fa_{name} AS {_matrix(spec, activity, f'state.fs_{name}')}")
+
+
+def _update(con: duckdb.DuckDBPyConnection, name: str, spec: Spec, months: set[str]) -> dict[str, int]:
+    """Fold the rebuilt `months` (partition keys) into the stored state of one spec."""
+    keys = ", ".join(spec["keys"])
+    groups = "".join(f"{g}, " for g in spec["groups"])
+    fs, fa = f"state.fs_{name}", f"state.fa_{name}"
+
+    def rebuilt(column: str) -> str:
+        return f"coalesce({part_predicate(months, column)}, FALSE)"
+
+    # Keys active in the rebuilt months, plus the keys whose first or last
+    # month was one of them (they may have vanished from it)
+    con.execute(f"CREATE TEMP TABLE _recent AS {_first_seen(spec, _activity(spec, 'state.', part_predicate(months)))}")
+    con.execute(f"""
+        CREATE TEMP TABLE _touched AS
+        SELECT {keys}, o.first_seen AS old_first, o.last_active AS old_last,
+               r.first_seen AS recent_first, r.last_active AS recent_last
+        FROM _recent r
+        FULL JOIN (
+            SELECT * FROM {fs} WHERE {rebuilt("first_seen")} OR {rebuilt("last_active")}
+            UNION ALL
+            SELECT * FROM {fs} SEMI JOIN _recent USING ({keys})
+            WHERE NOT ({rebuilt("first_seen")} OR {rebuilt("last_active")})
+        ) o USING ({keys})
+    """)
+    # Nothing changed outside the rebuilt months: a stored first month that was
+    # not rebuilt still bounds the key, and so does an earlier rebuilt one.
+    # Otherwise the key's whole history is looked up.
+    con.execute(f"""
+        CREATE TEMP TABLE _lookup AS
+        SELECT {keys} FROM _touched
+        WHERE old_first IS NOT NULL AND NOT (
+            (NOT {rebuilt("old_first")} OR coalesce(recent_first <= old_first, FALSE))
+            AND (NOT {rebuilt("old_last")} OR coalesce(recent_last >= old_last, FALSE))
+        )
+    """)
+    looked_up = con.execute("SELECT count(*) FROM _lookup").fetchone()[0]
+    history = "SELECT * FROM _recent WHERE FALSE"
+    if looked_up:
+        history = _first_seen(spec, f"SELECT * FROM ({_activity(spec, 'state.')}) SEMI JOIN _lookup USING ({keys})")
+    con.execute(f"""
+        CREATE TEMP TABLE _merged AS
+        SELECT t.*, least(t.old_first, t.recent_first) AS first_seen, greatest(t.old_last, t.recent_last) AS last_active
+        FROM _touched t ANTI JOIN _lookup USING ({keys})
+        UNION ALL
+        SELECT t.*, h.first_seen, h.last_active
+        FROM _touched t SEMI JOIN _lookup USING ({keys}) LEFT JOIN ({history}) h USING ({keys})
+    """)
+
+    # Keys whose first month moved take their other months to the new cohort
+    moved = "SELECT * FROM _merged WHERE old_first IS DISTINCT FROM first_seen AND old_first IS NOT NULL"
+    n_moved = con.execute(f"SELECT count(*) FROM ({moved})").fetchone()[0]
+    shifted = ""
+    if n_moved:
+        outside = _activity(spec, "state.", f"NOT ({part_predicate(months)})")
+        shifted = f"""
+            UNION ALL
+            SELECT {groups}m.old_first, a.active, -count(*) FROM ({outside}) a JOIN ({moved}) m USING ({keys}) GROUP BY ALL
+            UNION ALL
+            SELECT {groups}m.first_seen, a.active, count(*) FROM ({outside}) a JOIN ({moved}) m USING ({keys})
+            WHERE m.first_seen IS NOT NULL GROUP BY ALL
+        """
+
+    matched = " AND ".join(f"f.{k} = m.{k}" for k in spec["keys"])
+    con.execute(f"DELETE FROM {fs} f USING _merged m WHERE {matched}")
+    con.execute(f"INSERT INTO {fs} SELECT {keys}, first_seen, last_active FROM _merged WHERE first_seen IS NOT NULL")
+    recounted = _matrix(spec, _activity(spec, "state.", part_predicate(months)), fs)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {fa} AS
+        SELECT {groups}first_seen, active, sum(n)::BIGINT AS n
+        FROM (
+            SELECT * FROM {fa} WHERE NOT {rebuilt("active")}
+            UNION ALL
+            {recounted}
+            {shifted}
+        )
+        GROUP BY ALL
+        HAVING sum(n) <> 0
+    """)
+    touched = con.execute("SELECT count(*) FROM _merged").fetchone()[0]
+    for temp in ("_recent", "_touched", "_lookup", "_merged"):
+        con.execute(f"DROP TABLE {temp}")
+    return {"touched": touched, "looked_up": looked_up, "moved": n_moved}
+
+
+def refresh_state(
+    con: duckdb.DuckDBPyConnection, plan: Mapping[str, Any], specs: Mapping[str, Spec],
+) -> dict[str, dict[str, Any]]:
+    """
+    Bring the stored `fs_`/`fa_` tables in step with the partials just
+    refreshed by `plan` (inside `build_partials`' transaction). A full plan,
+    an edited spec or a state without these tables rebuilds them from the
+    stored partials. Returns the keys touched / looked up / moved per spec.
+    """
+    digest = state_hash(specs)
+    stored = dict(con.execute("SELECT key, value FROM state.meta").fetchall()).get("user_state_hash")
+    rebuild = plan["full"] or stored != digest or not all(_stored(con, table) for table in stored_tables(specs))
+    months = set(plan["rebuild"]) | set(plan["removed"])
+    stats = {}
+    for name, spec in specs.items():
+        if rebuild:
+            _rebuild(con, name, spec)
+            stats[name] = {"rebuilt": True}
+        else:
+            stats[name] = _update(con, name, spec, months)
+    con.execute("INSERT OR REPLACE INTO state.meta VALUES ('user_state_hash', ?)", [digest])
+    return stats
+
+
+def describe_refresh(stats: Mapping[str, Mapping[str, Any]]) -> str:
+    parts = []
+    for name, s in stats.items():
+        if s.get("rebuilt"):
+            parts.append(f"{name} rebuilt")
+        else:
+            parts.append(f"{name} {s['touched']:,} keys updated ({s['looked_up']:,} from history, {s['moved']:,} moved cohort)")
+    return "First-seen state: " + ", ".join(parts)
+
+
+def stored_tables(specs: Mapping[str, Spec]) -> list[str]:
+    """The state tables `refresh_state` maintains."""
+    return [f"{kind}_{name}" for name in specs for kind in ("fs", "fa")]
@@ -0,0 +1,60 @@
+"""
+Shared fixtures for the pipeline tests: a small synthetic CloudFront parquet
+with the columns the HRA + CNS scripts read.
+"""
+
+import json
+from pathlib import Path
+
+import duckdb
+import pytest
+
+SYNTHETIC_LOGS = """
+    SELECT
+        d AS date,
+        strftime(d, '%Y') AS year,
+        strftime(d, '%m') AS month,
+        lpad((i % 24)::VARCHAR, 2, '0') || ':00:00' AS time,
+        ['Apps', 'Events', 'Portal'][i % 3 + 1] AS site,
+        CASE WHEN i % 3 = 1 THEN '/tr'
+             ELSE ['/eui/', '/rui/', '/cde/', '/docs/a.pdf', '/workshops.html'][i % 5 + 1] END AS cs_uri_stem,
+        ['-', 'x=1', 'jndi'][i % 3 + 1] AS cs_uri_query,
+        ['Likely Human', 'Likely Human', 'Bot'][i % 3 + 1] AS traffic_type,
+        ['US', 'DE', 'IN'][i % 3 + 1] AS c_country,
+        ['-', 'https://www.google.com/', 'https://gtexportal.org/'][i % 3 + 1] AS cs_referer,
+        ['-', 'https://www.google.com/', 'https://gtexportal.org/'][i % 3 + 1] AS referrer,
+        'anon' || (i % 40) AS anon_id,
+        MAP {
+            'event': ['click', 'error', 'pageView'][i % 3 + 1],
+            'app': ['ccf-eui', 'cde-ui', 'kg-explorer'][i % 3 + 1],
+            'path': 'ui.btn.' || (i % 4),
+            'sessionId': 'sess' || (i % 60),
+            'e.reason.message': 'boom ' || (i % 2)
+        } AS query,
+        [200, 404, 500][i % 3 + 1] AS sc_status,
+        'req' || i AS x_edge_request_id
+    FROM (SELECT i, DATE '2025-01-01' + (i % 180)::INTEGER AS d FROM range(3000) t(i))
+"""
+
+
+def canonical(value):
+    """Drop list order so ties broken differently by the engine compare equal."""
+    if isinstance(value, dict):
+        return {k: canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return sorted((canonical(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))
+    return value
+
+
+def outputs(directory: Path) -> dict:
+    return {p.name: canonical(json.loads(p.read_text())) for p in sorted(directory.glob("*.json"))}
+
+
+@pytest.fixture
+def parquets(tmp_path):
+    con = duckdb.connect()
+    full = tmp_path / "logs.parquet"
+    older = tmp_path / "logs_older.parquet"
+    con.execute(f"COPY ({SYNTHETIC_LOGS}) TO '{full}' (FORMAT PARQUET)")
+    con.execute(f"COPY (SELECT * FROM '{full}' WHERE date < DATE '2025-04-01') TO '{older}' (FORMAT PARQUET)")
+    return older, full
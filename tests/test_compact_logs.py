@@ -0,0 +1,91 @@
+"""
+Compaction tests: a hive-partitioned dataset rewritten sorted keeps its
+layout and every row (the HRA outputs do not change), the sidecar index
+describes its row groups, and the pipeline's event filters can skip row
+groups of the sorted copy but none of the delivery-ordered source.
+
+Usage:
+    pytest tests/test_compact_logs.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from benchmark_compaction import compare  # noqa: E402
+from compact_logs import compact, conjuncts, load_index, may_match, zone_conditions  # noqa: E402
+from generate_synthetic_logs import generate  # noqa: E402
+
+
+def test_compaction_keeps_rows_and_layout(parquets, tmp_path):
+    _, full = parquets
+    con = duckdb.connect()
+    source = tmp_path / "logs"
+    con.execute(f"COPY (SELECT * FROM '{full}') TO '{source}' (FORMAT PARQUET, PARTITION_BY (year, month))")
+    summary = compact(str(source), str(tmp_path / "compacted"), row_group_rows=100)
+    compacted = tmp_path / "compacted"
+    assert summary["rows"] == 3000 and summary["partitions"] == len(list(source.glob("year=*/month=*")))
+    assert sorted(p.relative_to(compacted).parent for p in compacted.rglob("*.parquet")) == \
+        sorted(p.relative_to(source).parent for p in source.rglob("*.parquet"))
+
+    read = "read_parquet('{}/**/*.parquet', hive_partitioning = true)"
+    (different,) = con.execute(f"""
+        SELECT count(*) FROM (
+            (SELECT * FROM {read.format(source)} EXCEPT ALL SELECT * FROM {read.format(compacted)})
+            UNION ALL
+            (SELECT * FROM {read.format(compacted)} EXCEPT ALL SELECT * FROM {read.format(source)})
+        )
+    """).fetchone()
+    assert different == 0
+    # Each file is in (site, date, cs_uri_stem) order
+    for path in compacted.rglob("*.parquet"):
+        keys = con.execute(f"SELECT site, date, cs_uri_stem FROM read_parquet('{path}', hive_partitioning = false)").fetchall()
+        assert keys == sorted(keys, key=lambda k: tuple((v is None, v) for v in k))
+
+    index = load_index(str(compacted))
+    assert index["sort"] == ["site", "date", "cs_uri_stem"] and sum(g["rows"] for g in index["row_groups"]) == 3000
+    assert all(g["ranges"]["year"][0] == g["ranges"]["year"][1] for g in index["row_groups"])
+
+    generate_hra_data.run(str(source), str(tmp_path / "before"), cache_dir=None)
+    generate_hra_data.run(str(compacted), str(tmp_path / "after"), cache_dir=None)
+    before, after = outputs(tmp_path / "before"), outputs(tmp_path / "after")
+    for run in (before, after):
+        run.pop("data_metadata.json")
+    assert after == before
+
+
+def test_sorted_row_groups_are_skipped(tmp_path):
+    # Row groups hold at least 2,048 rows, so this needs more rows than the fixture
+    source = str(tmp_path / "synthetic")
+    generate(source, 20_000, "hra")
+    compacted = compact(source, str(tmp_path / "compacted"), row_group_rows=2048)["out"]
+    results = {r["query"]: r for r in compare(source, compacted, "hra")}
+    events = results["p_event_paths"]
+    assert sorted(events["filters"]) == ["cs_uri_stem='/tr'", "site='Events'", "traffic_type='Likely Human'"]
+    assert events["before"]["row_groups"] == 0 < events["after"]["row_groups"]
+    assert results["incremental load"]["after"]["row_groups"] > results["incremental load"]["before"]["row_groups"]
+
+
+def test_zone_conditions():
+    assert conjuncts("date>='2025-01-01'::DATE AND date<'2025-02-01'::DATE") == \
+        ["date>='2025-01-01'::DATE", "date<'2025-02-01'::DATE"]
+    assert zone_conditions(["(anon_id IS NOT NULL) AND (length(anon_id) >= 4)", "site='O''Hare'", "year=2025"]) == \
+        [("site", "=", "O'Hare"), ("year", "=", 2025)]
+    ranges = {"site": ["Apps", "Apps"], "date": ["2025-01-01", "2025-01-31"]}
+    assert not may_match(ranges, zone_conditions(["site='Events'"]))
+    assert not may_match(ranges, zone_conditions(["date>='2025-02-01'::DATE"]))
+    assert may_match(ranges, zone_conditions(["site!='Events'", "date<='2025-01-01'::DATE", "year=2024"]))
+
+
+def test_out_must_not_hold_source(parquets):
+    _, full = parquets
+    with pytest.raises(ValueError, match="--out"):
+        compact(str(full), str(full.parent))
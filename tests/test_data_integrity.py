@@ -44,17 +44,49 @@ def cns(request):
 
 class TestPipeline:
     def test_hra_parquet_exists(self):
-        parquets = list((ROOT / "data" / "hra").glob("*.parquet"))
+        parquets = list((ROOT / "data" / "hra").glob("*.parquet")) + list((ROOT / "data" / "hra" / "logs").rglob("*.parquet"))
         assert len(parquets) >= 1, "No HRA parquet files found in data/hra/"
 
     def test_cns_parquet_exists(self):
-        parquets = list((ROOT / "data" / "cns").glob("*.parquet"))
+        parquets = list((ROOT / "data" / "cns").glob("*.parquet")) + list((ROOT / "data" / "cns" / "logs").rglob("*.parquet"))
         assert len(parquets) >= 1, "No CNS parquet files found in data/cns/"
 
-    def test_scripts_importable(self):
+    @pytest.mark.parametrize(
+        "script",
+        [
+            "generate_hra_data",
+            "generate_cns_data",
+            "fetch_hra_publications",
+            "fetch_cns_github",
+            "log_store",
+            "incremental_state",
+            "query_pool",
+            "aggregation_registry",
+            "output_cache",
+            "event_store",
+            "benchmark_event_columns",
+            "benchmark_dedup",
+            "runtime_config",
+            "query_profile",
+            "generate_synthetic_logs",
+            "benchmark_pipeline",
+            "hll_sketch",
+            "benchmark_approx",
+            "user_state",
+            "sampling",
+            "benchmark_sample",
+            "rollup_cube",
+            "shared_logs",
+            "ingest_cloudfront_logs",
+            "benchmark_ingest",
+            "compact_logs",
+            "benchmark_compaction",
+            "time_window",
+        ],
+    )
+    def test_scripts_importable(self, script):
         sys.path.insert(0, str(ROOT / "data_processing"))
-        for script in ["generate_hra_data", "generate_cns_data", "fetch_hra_publications", "fetch_cns_github"]:
-            __import__(script)
+        __import__(script)
 
     def test_all_json_valid(self):
         for data_dir in [HRA_DATA, CNS_DATA]:
@@ -0,0 +1,59 @@
+"""
+Error dictionary tests: every distinct error message is classified once and
+the outputs read their buckets and display text from it.
+
+Usage:
+    pytest tests/test_error_dictionary.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import duckdb
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from aggregation_registry import Registry  # noqa: E402
+
+MESSAGES = {
+    "Http failure response for https://apps.humanatlas.io/api/v1/technology-names: 0 Unknown Error":
+        ("Http failure: apps.humanatlas.io/api/v1/technology-names: 0 Unknown Error",
+         "Net/CORS: technology list API",
+         "CORS: technology list API"),
+    "Error retrieving icon organ:heart! <svg> tag not found":
+        ("Icon failure: organ:heart", "Icon retrieval failures", "CDN icon failure"),
+    "NG0201: No provider for HttpClient! Find more at https://angular.io/errors/NG0201":
+        ("NG0201: No provider for HttpClient! Find more at https://angular", "Other", "Angular DI error"),
+    "Cannot read properties of null (reading '0')":
+        ("Cannot read properties of null (reading '0')", "Null selection read", "Null-ref error"),
+}
+
+
+def _dictionary():
+    reg = Registry()
+    generate_hra_data.register_outputs(reg)
+    con = duckdb.connect()
+    con.execute("CREATE TABLE p_site_errors (message VARCHAR, n BIGINT)")
+    con.executemany("INSERT INTO p_site_errors VALUES (?, 1)", [(m,) for m in [*MESSAGES, *MESSAGES, None]])
+    con.execute(f"CREATE TABLE error_dictionary AS {reg.nodes['error_dictionary']['build']}")
+    return con
+
+
+class TestErrorDictionary:
+    def test_one_row_per_distinct_message(self):
+        con = _dictionary()
+        ids = [r[0] for r in con.execute("SELECT message_id FROM error_dictionary ORDER BY message").fetchall()]
+        assert ids == list(range(1, len(MESSAGES) + 1))
+
+    def test_classification(self):
+        con = _dictionary()
+        rows = con.execute("SELECT message, cleaned, bucket, tool_bucket FROM error_dictionary").fetchall()
+        assert {row[0]: row[1:] for row in rows} == MESSAGES
+
+    def test_error_outputs_read_the_dictionary(self):
+        reg = Registry()
+        generate_hra_data.register_outputs(reg)
+        for name in ("error_root_cause_breakdown", "top_errors_by_tool"):
+            assert "error_dictionary" in reg.select([name])
@@ -0,0 +1,48 @@
+"""
+Event store tests: `query` MAP keys are flattened into columns on load and
+the compact events table keeps only human `/tr` pings.
+
+Usage:
+    pytest tests/test_event_store.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+from event_store import EVENTS_FILTER, event_fields, materialize_events  # noqa: E402
+from log_store import materialize_logs  # noqa: E402
+
+
+class TestEventStore:
+    def test_flattened_columns_match_map_lookups(self, parquets):
+        _, full = parquets
+        con = duckdb.connect()
+        materialize_logs(con, str(full), ("site", "cs_uri_stem", "traffic_type", "query"),
+                         derived=event_fields(("event_type", "app", "session_id", "e_reason_message")))
+        mismatched = con.execute("""
+            SELECT count(*) FROM logs
+            WHERE event_type IS DISTINCT FROM query['event']
+               OR app IS DISTINCT FROM query['app']
+               OR session_id IS DISTINCT FROM query['sessionId']
+               OR e_reason_message IS DISTINCT FROM query['e.reason.message']
+        """).fetchone()[0]
+        assert mismatched == 0
+
+    def test_events_table_holds_human_tr_pings(self, parquets):
+        _, full = parquets
+        con = duckdb.connect()
+        materialize_logs(con, str(full), ("site", "cs_uri_stem", "traffic_type"), derived=event_fields())
+        n = materialize_events(con)
+        assert n == con.execute(f"SELECT count(*) FROM logs WHERE {EVENTS_FILTER}").fetchone()[0] > 0
+        columns = [row[0] for row in con.execute("DESCRIBE events").fetchall()]
+        assert "query" not in columns and "event_type" in columns
+
+    def test_unknown_field_rejected(self):
+        with pytest.raises(ValueError, match="nope"):
+            event_fields(["nope"])
@@ -0,0 +1,76 @@
+"""
+HyperLogLog sketch tests: estimates stay within the documented error,
+merged sketches count the union, and `--approx` outputs (full and
+incremental runs) match the exact ones on small data, where linear counting
+is exact.
+
+Usage:
+    pytest tests/test_hll_sketch.py -v
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from hll_sketch import compare, estimate, merge, relative_error, sketch_query  # noqa: E402
+
+APPROX_OUTPUTS = ["monthly_unique_users", "unique_sessions_rollup"]
+
+
+@pytest.mark.parametrize("n", [500, 50_000, 1_000_000])
+def test_estimate_within_error_bound(n):
+    con = duckdb.connect()
+    sketch = sketch_query(f"range({n}) t(i)", ["1 AS g"], "'user' || i")
+    (got,) = con.execute(f"SELECT {estimate()} FROM ({sketch}) GROUP BY g").fetchone()
+    assert abs(got - n) / n <= 3 * relative_error()
+
+
+def test_merged_sketches_count_the_union():
+    con = duckdb.connect()
+    # Three overlapping months of 40k ids each, 100k distinct overall
+    con.execute(f"""
+        CREATE TABLE s AS {sketch_query("range(120000) t(i)", ["i // 40000 AS month"], "(i % 100000)::VARCHAR")}
+    """)
+    months = dict(con.execute(f"SELECT month, {estimate()} FROM s GROUP BY month").fetchall())
+    (union,) = con.execute(f"SELECT {estimate()} FROM ({merge('s', ['1 AS g'])}) GROUP BY g").fetchone()
+    assert all(abs(v - 40000) / 40000 <= 3 * relative_error() for v in months.values())
+    assert abs(union - 100000) / 100000 <= 3 * relative_error()
+
+
+def test_compare_reports_errors():
+    exact = [{"m": "2025-01", "n": 100}, {"m": "2025-02", "n": 200}, {"m": "2025-03", "n": 50}]
+    approx = [{"m": "2025-01", "n": 101}, {"m": "2025-02", "n": 190}]
+    report = compare(exact, approx, ["m"], ["n"])
+    assert (report["rows"], report["missing"], report["extra"]) == (3, 1, 0)
+    assert report["fields"]["n"]["max_relative_error"] == 0.05 and report["fields"]["n"]["max_absolute_error"] == 10
+
+
+def test_approx_outputs_match_exact(parquets, tmp_path):
+    older, full = parquets
+    generate_hra_data.run(str(full), str(tmp_path / "exact"))
+    generate_hra_data.run(str(full), str(tmp_path / "approx"), approx=True)
+    exact, approx = outputs(tmp_path / "exact"), outputs(tmp_path / "approx")
+    assert json.loads((tmp_path / "approx" / "data_metadata.json").read_text())["approx_distinct"] is True
+    for meta in (exact, approx):
+        meta.pop("data_metadata.json")
+    assert approx == exact
+    assert [r["period_type"] for r in exact["unique_sessions_rollup.json"]].count("year") == 1
+
+    # The monthly sketches live in the incremental state and merge across refreshes
+    state = str(tmp_path / "state.duckdb")
+    generate_hra_data.run(str(older), str(tmp_path / "inc"), incremental=True, state_db=state, approx=True,
+                          only=APPROX_OUTPUTS)
+    generate_hra_data.run(str(full), str(tmp_path / "inc"), incremental=True, state_db=state, approx=True,
+                          only=APPROX_OUTPUTS)
+    assert {n: exact[n + ".json"] for n in APPROX_OUTPUTS} == {n: approx[n + ".json"] for n in APPROX_OUTPUTS}
+    incremental = outputs(tmp_path / "inc")
+    assert {n: incremental[n + ".json"] for n in APPROX_OUTPUTS} == {n: exact[n + ".json"] for n in APPROX_OUTPUTS}
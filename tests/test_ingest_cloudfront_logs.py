@@ -0,0 +1,89 @@
+"""
+CloudFront ingestion tests: query strings parse like `parse_qsl`, synthetic
+logs written out as gzipped W3C files come back with the field dictionary's
+schema and values (in year/month partitions the pipelines read), and a
+rerun only parses new files and skips malformed lines.
+
+Usage:
+    pytest tests/test_ingest_cloudfront_logs.py -v
+"""
+
+import gzip
+import json
+import sys
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+import duckdb
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from benchmark_ingest import W3C_FIELDS, write_w3c  # noqa: E402
+from generate_synthetic_logs import field_types, generate  # noqa: E402
+from ingest_cloudfront_logs import MANIFEST, ingest, parse_query  # noqa: E402
+
+COMPARED = ("date", "time", "x_edge_location", "sc_bytes", "cs_uri_stem", "sc_status", "cs_user_agent",
+            "time_taken", "sc_content_len", "c_country", "query", "site", "airport", "year", "month", "day",
+            "distribution")
+
+
+def test_parse_query_matches_parse_qsl():
+    for query in ("a=1&b=&c", "x=a+b%20c&&y=%E2%9C%93&x=2", "e.reason.message=Http%20failure%3A%200", "k=%zz+1"):
+        assert json.loads(parse_query(query)) == dict(parse_qsl(query, keep_blank_values=True))
+    assert parse_query("-") == "{}"
+
+
+def test_round_trip(tmp_path):
+    source, raw, out = tmp_path / "synthetic", tmp_path / "raw", tmp_path / "logs"
+    generate(str(source), 3000, "hra", duplicates=0)
+    assert write_w3c(str(source), str(raw), rows_per_file=700)["files"] == 5
+    summary = ingest(str(raw), str(out), "hra", workers=2, batch_rows=500, task_mb=0.01)
+    assert summary["rows"] == 3000 and summary["tasks"] > 1
+
+    con = duckdb.connect()
+    ingested = f"read_parquet('{out}/**/*.parquet', hive_partitioning = false)"
+    schema = {name: dtype for name, dtype, *_ in con.execute(f"DESCRIBE SELECT * FROM {ingested}").fetchall()}
+    assert schema == field_types()
+    assert all(p.parent.name.startswith("month=") for p in out.rglob("*.parquet"))
+    columns = ", ".join(COMPARED)
+    (missing,) = con.execute(f"""
+        SELECT count(*) FROM (
+            SELECT x_edge_request_id, {columns} FROM '{source}/*.parquet'
+            EXCEPT SELECT x_edge_request_id, {columns} FROM {ingested}
+        )
+    """).fetchone()
+    assert missing == 0
+    # Browsers are human; crawlers and scripts are bots, AI crawlers their own class
+    agents = dict(con.execute(f"SELECT cs_user_agent, any_value(traffic_type) FROM {ingested} GROUP BY 1").fetchall())
+    assert {agents[a] for a in agents if "Chrome/" in a} == {"Likely Human"}
+    assert {agents[a] for a in agents if "GPTBot" in a} == {"AI-Assistant / Bot"}
+    assert {agents[a] for a in agents if a.startswith("curl/")} == {"Bot"}
+
+    generate_hra_data.run(str(out), str(tmp_path / "hra"))
+    assert (tmp_path / "hra" / "total_tool_visits.json").exists()
+
+
+def test_rerun_parses_only_new_files(tmp_path):
+    raw, out = tmp_path / "raw", tmp_path / "logs"
+    raw.mkdir()
+    fields = " ".join(W3C_FIELDS)
+    row = ["2025-03-04", "10:00:00", "FRA56-C1", "512", "10.0.0.1", "GET", "d1.cloudfront.net", "/tr", "200", "-",
+           "Mozilla/5.0%20Firefox/125.0", "event=click&app=ccf-eui", "-", "Hit", "req1", "apps.humanatlas.io",
+           "https", "300", "0.01", "-", "TLSv1.3", "TLS_AES_128_GCM_SHA256", "Hit", "HTTP/2.0", "-", "-", "443",
+           "0.01", "Hit", "application/json", "162", "-", "-", "DE"]
+    lines = ["\t".join(row), "truncated\tline", "\t".join([*row[:14], "req2", *row[15:]])]
+    (raw / "E1TEST.2025-03-04-10.a.gz").write_bytes(gzip.compress(f"#Version: 1.0\n#Fields: {fields}\n{chr(10).join(lines)}\n".encode()))
+    first = ingest(str(raw), str(out), "hra", workers=1)
+    assert (first["rows"], first["bad_lines"]) == (2, 1)
+
+    (raw / "E1TEST.2025-03-04-11.b.gz").write_bytes(gzip.compress(f"#Fields: {fields}\n{lines[0]}\n".encode()))
+    second = ingest(str(raw), str(out), "hra", workers=1)
+    assert (second["parsed"], second["skipped"], second["rows"]) == (1, 1, 1)
+    assert len(json.loads((out / MANIFEST).read_text())["files"]) == 2
+    rows = duckdb.connect().execute(f"""
+        SELECT site, query['event'], traffic_type, c_country, distribution, timestamp
+        FROM read_parquet('{out}/**/*.parquet', hive_partitioning = false)
+    """).fetchall()
+    assert len(rows) == 3 and set(rows) == {("Events", "click", "Likely Human", "DE", "E1TEST", 1741082400)}
@@ -0,0 +1,240 @@
+"""
+Log store tests: multi-file and hive-partitioned sources read as one
+deduplicated dataset, the cheaper dedup keys agree with whole-row DISTINCT
+(and disagreements are reported), and low-cardinality columns are stored as
+ENUMs that decode back to the same strings wherever the pipeline reads them.
+The materialized table holds the rows of the per-query DISTINCT view it
+replaced. Loads keep only the columns they are asked for; keyed on the
+request id (the pipelines' default) they read only those, while the
+whole-row keys compare every column, and row groups a filter prunes are not
+counted as read.
+
+Usage:
+    pytest tests/test_log_store.py -v
+"""
+
+import re
+import sys
+from datetime import date
+from pathlib import Path
+
+import duckdb
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from incremental_state import date_predicate  # noqa: E402
+from log_store import (  # noqa: E402
+    DEDUP_KEYS, DEFAULT_DEDUP_KEY, REQUEST_ID, decode_enums, hive_keys, materialize_logs, parquet_source, scan_bytes,
+    verify_dedup,
+)
+from query_pool import records  # noqa: E402
+from time_window import window_predicate  # noqa: E402
+
+COLUMNS = ("site", "cs_uri_stem", "traffic_type", "c_country")
+DERIVED = {"tool_stem": "CASE WHEN cs_uri_stem IN ('/eui/', '/rui/') THEN cs_uri_stem END"}
+ENUMS = {"site": None, "c_country": None, "tool_stem": ("/eui/", "/rui/", "/cde/")}
+
+
+def _load(parquet, enums):
+    con = duckdb.connect()
+    load = materialize_logs(con, str(parquet), COLUMNS, derived=DERIVED, enums=enums)
+    return con, load
+
+
+class TestEnums:
+    def test_columns_stored_as_enums(self, parquets):
+        _, full = parquets
+        con, load = _load(full, ENUMS)
+        types = {row[0]: row[1] for row in con.execute("DESCRIBE logs").fetchall()}
+        assert load["enums"] == sorted(ENUMS)
+        assert types["site"] == "ENUM('Apps', 'Events', 'Portal')"
+        assert types["tool_stem"].startswith("ENUM") and types["traffic_type"] == "VARCHAR"
+
+    def test_decoded_results_match_plain_columns(self, parquets):
+        _, full = parquets
+        sql = "SELECT site, tool_stem, c_country, count(*) AS n FROM logs GROUP BY ALL ORDER BY ALL"
+        plain, _ = _load(full, None)
+        encoded, _ = _load(full, ENUMS)
+        assert records(encoded, sql) == records(plain, sql)
+        stems = {row["tool_stem"] for row in records(encoded, sql) if isinstance(row["tool_stem"], str)}
+        assert stems == {"/eui/", "/rui/"}
+
+    def test_decode_enums_casts_to_varchar(self, parquets):
+        _, full = parquets
+        con, _ = _load(full, ENUMS)
+        con.execute(f"CREATE TABLE t AS {decode_enums(con, 'SELECT DISTINCT site, tool_stem FROM logs')}")
+        assert {row[1] for row in con.execute("DESCRIBE t").fetchall()} == {"VARCHAR"}
+        assert decode_enums(con, "SELECT traffic_type FROM logs") == "SELECT traffic_type FROM logs"
+
+
+def _count(con, sql):
+    return con.execute(f"SELECT count(*) FROM {sql}").fetchone()[0]
+
+
+def _redelivered(parquets, tmp_path):
+    """Directory holding the full log plus the older file delivered again."""
+    older, full = parquets
+    con = duckdb.connect()
+    deliveries = tmp_path / "logs"
+    deliveries.mkdir()
+    con.execute(f"COPY (SELECT * FROM '{full}') TO '{deliveries / 'a.parquet'}' (FORMAT PARQUET)")
+    con.execute(f"COPY (SELECT * FROM '{older}') TO '{deliveries / 'b.parquet'}' (FORMAT PARQUET)")
+    return str(deliveries)
+
+
+class TestMaterialize:
+    def test_table_matches_per_query_distinct(self, parquets, tmp_path):
+        # The HRA load against the `SELECT DISTINCT *` view every query used to re-run
+        deliveries = _redelivered(parquets, tmp_path)
+        con = duckdb.connect()
+        derived = generate_hra_data.EVENT_COLUMNS | generate_hra_data.TOOL_COLUMNS
+        load = materialize_logs(con, deliveries, generate_hra_data.LOG_COLUMNS, derived=derived,
+                                enums=generate_hra_data.ENUM_COLUMNS, hive_types=generate_hra_data.PARTITION_TYPES)
+        columns = [*generate_hra_data.LOG_COLUMNS, *derived]
+        checksum = f"count(*), sum(hash({', '.join(f'{col}::VARCHAR' for col in columns)}))"
+        expressions = ", ".join(f"{expr} AS {col}" for col, expr in derived.items())
+        per_query = f"""
+            WITH logs AS (SELECT DISTINCT * FROM {parquet_source(deliveries, generate_hra_data.PARTITION_TYPES)})
+            SELECT {checksum} FROM (SELECT *, {expressions} FROM logs)
+        """
+        assert load["duplicates"] > 0
+        assert con.execute(f"SELECT {checksum} FROM logs").fetchone() == con.execute(per_query).fetchone()
+
+
+class TestDatasets:
+    def test_dedup_spans_files(self, parquets, tmp_path):
+        older, full = parquets
+        con = duckdb.connect()
+        load = materialize_logs(con, _redelivered(parquets, tmp_path), COLUMNS)
+        single = materialize_logs(duckdb.connect(), str(full), COLUMNS)
+        assert load["deduped_rows"] == single["deduped_rows"]
+        assert load["duplicates"] == _count(con, f"'{older}'") + single["duplicates"]
+
+    @pytest.mark.parametrize("stored", [True, False], ids=["stored", "directory-only"])
+    def test_hive_partitions_keep_column_types(self, parquets, tmp_path, stored):
+        _, full = parquets
+        con = duckdb.connect()
+        dataset = tmp_path / "hive"
+        con.execute(f"""
+            COPY (SELECT * FROM '{full}') TO '{dataset}'
+            (FORMAT PARQUET, PARTITION_BY (year, month), WRITE_PARTITION_COLUMNS {str(stored).lower()})
+        """)
+        assert hive_keys(str(dataset)) == ["year", "month"]
+        src = parquet_source(str(dataset), {"year": "VARCHAR", "month": "VARCHAR"})
+        types = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM {src})").fetchall())
+        assert types["year"] == types["month"] == "VARCHAR"
+        months = "SELECT year, month, count(*) FROM {} GROUP BY ALL ORDER BY ALL"
+        assert con.execute(months.format(src)).fetchall() == con.execute(months.format(f"'{full}'")).fetchall()
+
+        # An incremental month window adds the partition filter without changing the rows
+        window = date_predicate(["2025-03"], hive_keys(str(dataset)))
+        assert "TRY_CAST(month AS INTEGER) = 3" in window
+        assert _count(con, f"{src} WHERE {window}") == _count(con, f"'{full}' WHERE {date_predicate(['2025-03'])}") > 0
+
+
+class TestDedupKeys:
+    @pytest.mark.parametrize("key", DEDUP_KEYS)
+    def test_keys_remove_the_same_duplicates(self, parquets, tmp_path, key):
+        deliveries = _redelivered(parquets, tmp_path)
+        sql = "SELECT site, tool_stem, c_country, count(*) AS n FROM logs GROUP BY ALL ORDER BY ALL"
+        row = duckdb.connect()
+        expected = materialize_logs(row, deliveries, COLUMNS, derived=DERIVED)
+        con = duckdb.connect()
+        load = materialize_logs(con, deliveries, COLUMNS, derived=DERIVED, enums=ENUMS, key=key)
+        assert load["key"] == key
+        assert load["duplicates"] == expected["duplicates"] > 0
+        assert records(con, sql) == records(row, sql)
+
+    def test_rows_without_request_id_compare_whole(self, parquets, tmp_path):
+        _, full = parquets
+        con = duckdb.connect()
+        path = tmp_path / "no_ids.parquet"
+        # Every 10th row loses its id and is delivered twice; ids 1 and 2 are reused by a differing row
+        con.execute(f"""
+            COPY (
+                SELECT * REPLACE (CASE WHEN i % 10 = 0 THEN NULL ELSE x_edge_request_id END AS x_edge_request_id)
+                FROM (SELECT *, row_number() OVER () AS i FROM '{full}')
+                UNION ALL
+                SELECT * REPLACE (NULL AS x_edge_request_id) FROM (SELECT *, row_number() OVER () AS i FROM '{full}') WHERE i % 10 = 0
+                UNION ALL
+                SELECT * REPLACE ('c_country' AS c_country) FROM (SELECT *, 0 AS i FROM '{full}') WHERE x_edge_request_id IN ('req1', 'req2')
+            ) TO '{path}' (FORMAT PARQUET)
+        """)
+        loads = {key: materialize_logs(duckdb.connect(), str(path), COLUMNS, key=key) for key in DEDUP_KEYS}
+        counts = {key: load["deduped_rows"] for key, load in loads.items()}
+        assert counts == {"row": 3002, "request_id": 3000, "hash": 3002}
+        # Rows without an id are read whole
+        assert loads["request_id"]["scan"]["bytes_read"] == loads["request_id"]["scan"]["bytes_total"]
+
+        report = verify_dedup(con, str(path))
+        assert report["deduped_rows"] == counts
+        assert report["conflicting_ids"] == report["dropped_by_request_id"] == 2
+        assert report["examples"] == ["req1", "req2"] and report["hash_collisions"] == 0
+
+
+class TestProjection:
+    def test_load_reads_only_its_columns(self, parquets):
+        _, full = parquets
+        load = materialize_logs(duckdb.connect(), str(full), COLUMNS, derived=DERIVED, key="request_id")
+        scan = load["scan"]
+        # The four columns plus the request id; the derived column reads cs_uri_stem
+        assert scan["columns_read"] == len(COLUMNS) + 1 < scan["columns_total"]
+        assert scan["bytes_read"] < scan["bytes_total"]
+        # None of the unread `query` MAP is
+        unread = scan_bytes(str(full), ["query"])["bytes_read"]
+        assert unread > 0 and scan["bytes_read"] + unread <= scan["bytes_total"]
+        whole = materialize_logs(duckdb.connect(), str(full))
+        assert whole["scan"]["bytes_read"] == whole["scan"]["bytes_total"] == scan["bytes_total"]
+        assert load["deduped_rows"] == whole["deduped_rows"]
+
+    def test_pipelines_project_by_default(self, parquets, tmp_path, capsys):
+        _, full = parquets
+        generate_hra_data.run(str(full), str(tmp_path / "out"), cache_dir=None)
+        printed = capsys.readouterr().out
+        assert f"key={DEFAULT_DEDUP_KEY}" in printed and DEFAULT_DEDUP_KEY == "request_id"
+        read, total = map(int, re.search(r"Scan: (\d+) of (\d+) columns", printed).groups())
+        assert read < total
+        # Without request ids the load falls back to whole rows
+        con = duckdb.connect()
+        path = tmp_path / "no_ids.parquet"
+        con.execute(f"COPY (SELECT * EXCLUDE (x_edge_request_id) FROM '{full}') TO '{path}' (FORMAT PARQUET)")
+        load = materialize_logs(con, str(path), COLUMNS, key="request_id")
+        assert load["key"] == "row"
+        assert load["deduped_rows"] == materialize_logs(duckdb.connect(), str(path), COLUMNS)["deduped_rows"]
+
+    def test_pruned_files_are_not_read(self, parquets, tmp_path):
+        _, full = parquets
+        logs = tmp_path / "logs"
+        duckdb.connect().execute(f"COPY (SELECT * FROM '{full}') TO '{logs}' (FORMAT PARQUET, PARTITION_BY (year, month))")
+        where = window_predicate(date(2025, 2, 1), date(2025, 2, 28), hive_keys(str(logs)))
+        columns = ["date", "site", REQUEST_ID]
+        windowed = scan_bytes(str(logs), columns, where, generate_hra_data.PARTITION_TYPES)
+        # Only the February partition holds rows of the window
+        february = scan_bytes(str(logs / "year=2025" / "month=02"), columns)
+        assert windowed["bytes_read"] == february["bytes_read"] > 0
+        assert windowed["bytes_total"] == scan_bytes(str(logs), columns)["bytes_total"]
+        load = materialize_logs(duckdb.connect(), str(logs), COLUMNS, key="request_id", where=where,
+                                hive_types=generate_hra_data.PARTITION_TYPES)
+        assert 0 < load["scan"]["bytes_read"] < load["scan"]["bytes_total"] / 4
+
+    @pytest.mark.parametrize("key", ["row", "hash"])
+    def test_whole_row_keys_compare_unread_columns(self, parquets, tmp_path, key):
+        _, full = parquets
+        con = duckdb.connect()
+        path = tmp_path / "reused_ids.parquet"
+        # Ids 1 and 2 are reused by rows differing only in a column the load does not keep
+        con.execute(f"""
+            COPY (
+                SELECT * FROM '{full}'
+                UNION ALL
+                SELECT * REPLACE ('23:59:59' AS time) FROM '{full}' WHERE x_edge_request_id IN ('req1', 'req2')
+            ) TO '{path}' (FORMAT PARQUET)
+        """)
+        load = materialize_logs(con, str(path), COLUMNS, derived=DERIVED, key=key)
+        assert load["deduped_rows"] == 3002
+        assert load["scan"]["bytes_read"] == load["scan"]["bytes_total"]
+        # The table still holds only the requested columns
+        assert [row[0] for row in con.execute("DESCRIBE logs").fetchall()] == [*COLUMNS, *DERIVED]
@@ -0,0 +1,127 @@
+"""
+Output cache tests: unchanged reruns are served from the cache, edits to
+one definition or to the parquet only recompute what they affect, and edits
+to how the logs are loaded (a column derived on load) recompute everything.
+
+Usage:
+    pytest tests/test_output_cache.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_cns_data  # noqa: E402
+import generate_hra_data  # noqa: E402
+from aggregation_registry import Registry  # noqa: E402
+from output_cache import OutputCache  # noqa: E402
+
+
+def _registry(output_sql: str = "SELECT * FROM p_a", partial_sql: str = "SELECT 1 AS n FROM logs") -> Registry:
+    reg = Registry()
+    reg.table("p_a", partial_sql)
+    reg.table("p_b", "SELECT 2 AS n FROM logs")
+    reg.sql("from_a", output_sql)
+    reg.sql("from_b", "SELECT * FROM p_b")
+    return reg
+
+
+def _stored(tmp_path, parquet) -> Path:
+    """Cache directory holding both outputs of the default registry."""
+    cache_dir, out = tmp_path / "cache", tmp_path / "out"
+    out.mkdir()
+    for name in ("from_a", "from_b"):
+        (out / f"{name}.json").write_text("[]")
+    OutputCache(str(cache_dir), _registry(), str(parquet)).store(["from_a", "from_b"], str(out))
+    return cache_dir
+
+
+class TestOutputCache:
+    def test_unchanged_definitions_hit(self, parquets, tmp_path):
+        _, full = parquets
+        cache = OutputCache(str(_stored(tmp_path, full)), _registry(), str(full))
+        assert cache.restore(["from_a", "from_b"], str(tmp_path / "out")) == []
+
+    def test_edited_output_only_recomputes_itself(self, parquets, tmp_path):
+        _, full = parquets
+        reg = _registry(output_sql="SELECT n FROM p_a")
+        cache = OutputCache(str(_stored(tmp_path, full)), reg, str(full))
+        assert cache.restore(["from_a", "from_b"], str(tmp_path / "out")) == ["from_a"]
+
+    def test_edited_partial_recomputes_its_outputs(self, parquets, tmp_path):
+        _, full = parquets
+        reg = _registry(partial_sql="SELECT 3 AS n FROM logs")
+        cache = OutputCache(str(_stored(tmp_path, full)), reg, str(full))
+        assert cache.restore(["from_a", "from_b"], str(tmp_path / "out")) == ["from_a"]
+
+    def test_new_parquet_misses(self, parquets, tmp_path):
+        older, full = parquets
+        cache = OutputCache(str(_stored(tmp_path, full)), _registry(), str(older))
+        assert cache.restore(["from_a", "from_b"], str(tmp_path / "out")) == ["from_a", "from_b"]
+
+    def test_edited_writer_misses(self, parquets, tmp_path):
+        _, full = parquets
+
+        def writer(path, data):
+            pass
+
+        cache = OutputCache(str(_stored(tmp_path, full)), _registry(), str(full), writer=writer)
+        assert cache.restore(["from_a", "from_b"], str(tmp_path / "out")) == ["from_a", "from_b"]
+
+    def test_closed_over_value_is_keyed(self, parquets, tmp_path):
+        _, full = parquets
+
+        def registry(limit):
+            reg = _registry()
+
+            @reg.python("top", inputs=("p_a",))
+            def top(cur):
+                return cur.execute(f"SELECT * FROM p_a LIMIT {limit}").fetchall()
+
+            return reg
+
+        cache = OutputCache(str(tmp_path / "cache"), registry(10), str(full))
+        assert cache.key("top") == OutputCache(str(tmp_path / "cache"), registry(10), str(full)).key("top")
+        assert cache.key("top") != OutputCache(str(tmp_path / "cache"), registry(20), str(full)).key("top")
+
+    def test_prune_removes_stale_entries(self, parquets, tmp_path):
+        _, full = parquets
+        cache_dir, out = _stored(tmp_path, full), tmp_path / "out"
+        (cache_dir / "dropped-0123.json").write_text("[]")
+        cache = OutputCache(str(cache_dir), _registry(output_sql="SELECT n FROM p_a"), str(full))
+        cache.store(cache.restore(["from_a"], str(out)), str(out))
+        assert cache.prune() == 2
+        assert sorted(p.name for p in cache_dir.iterdir()) == sorted(
+            f"{name}-{cache.key(name)}.json" for name in ("from_a", "from_b"))
+
+
+@pytest.mark.parametrize("script", [generate_hra_data, generate_cns_data], ids=["hra", "cns"])
+def test_cached_rerun_matches(script, parquets, tmp_path, capsys):
+    _, full = parquets
+    cache_dir = str(tmp_path / "cache")
+    script.run(str(full), str(tmp_path / "first"), cache_dir=cache_dir)
+    script.run(str(full), str(tmp_path / "second"), cache_dir=cache_dir)
+    assert "0 misses" in capsys.readouterr().out
+    assert outputs(tmp_path / "second") == outputs(tmp_path / "first")
+
+
+def test_changed_derived_column_misses(parquets, tmp_path, monkeypatch, capsys):
+    _, full = parquets
+    cache_dir = str(tmp_path / "cache")
+    generate_hra_data.run(str(full), str(tmp_path / "first"), cache_dir=cache_dir)
+    # Re-map an app to another tool, as an edit of APP_TOOL_CASE would
+    tools = {**generate_hra_data.TOOL_COLUMNS,
+             "app_tool": generate_hra_data.APP_TOOL_CASE.replace("THEN 'CDE'", "THEN 'EUI'")}
+    monkeypatch.setattr(generate_hra_data, "TOOL_COLUMNS", tools)
+    capsys.readouterr()
+    generate_hra_data.run(str(full), str(tmp_path / "edited"), cache_dir=cache_dir)
+    assert "Cache: 0 hits" in capsys.readouterr().out
+    generate_hra_data.run(str(full), str(tmp_path / "uncached"), cache_dir=None)
+    first, edited, uncached = (outputs(tmp_path / run) for run in ("first", "edited", "uncached"))
+    assert edited["error_breakdown.json"] == uncached["error_breakdown.json"] != first["error_breakdown.json"]
@@ -0,0 +1,67 @@
+"""
+Query profiling tests: every query of a node is profiled (including the
+Python builders' multi-query chains), `--profile` writes the per-node report
+sorted by cost without changing any output, and `--explain-analyze` prints
+the plans of one node.
+
+Usage:
+    pytest tests/test_query_profile.py -v
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_cns_data  # noqa: E402
+import generate_hra_data  # noqa: E402
+from query_profile import PROFILE_FILE, ProfiledCursor  # noqa: E402
+
+
+def test_profiled_cursor_keeps_every_query():
+    cur = ProfiledCursor(duckdb.connect().cursor(), plans=True)
+    cur.execute("CREATE TABLE t AS SELECT range AS i FROM range(1000)")
+    # Partly consumed results are drained before the next query starts
+    assert cur.execute("SELECT i FROM t ORDER BY i").fetchone() == (0,)
+    assert cur.execute("SELECT count(*) FROM t").fetchall() == [(1000,)]
+    queries = cur.finish()
+    assert [q["sql"] for q in queries] == [
+        "CREATE TABLE t AS SELECT range AS i FROM range(1000)", "SELECT i FROM t ORDER BY i", "SELECT count(*) FROM t",
+    ]
+    assert [q["rows_scanned"] for q in queries] == [1000, 1000, 1000]
+    assert queries[1]["operators"][0]["children"][0]["operator"] == "ORDER_BY"
+    assert len(cur.plans) == 3 and "Total Time" in cur.plans[2]
+
+
+@pytest.mark.parametrize("script", [generate_hra_data, generate_cns_data], ids=["hra", "cns"])
+def test_profile_report(script, parquets, tmp_path):
+    _, full = parquets
+    script.run(str(full), str(tmp_path / "plain"))
+    script.run(str(full), str(tmp_path / "profiled"), profile=str(tmp_path / "profile" / PROFILE_FILE))
+
+    report = json.loads((tmp_path / "profile" / PROFILE_FILE).read_text())
+    nodes = {node["name"]: node for node in report["nodes"]}
+    seconds = [node["seconds"] for node in report["nodes"]]
+    assert seconds == sorted(seconds, reverse=True)
+    assert nodes["logs"]["rows_scanned"] > 0 and all(node["queries"] for node in nodes.values())
+
+    # The report stays out of the published outputs
+    profiled = outputs(tmp_path / "profiled")
+    assert {Path(name).stem for name in profiled} < set(nodes)
+    assert profiled == outputs(tmp_path / "plain")
+
+
+def test_explain_analyze(parquets, tmp_path, capsys):
+    _, full = parquets
+    generate_cns_data.run(str(full), str(tmp_path / "out"), explain="p_traffic")
+    printed = capsys.readouterr().out
+    assert "EXPLAIN ANALYZE p_traffic (1 queries)" in printed and "Total Time" in printed
+    # Only one output reading the partial is built
+    assert len(list((tmp_path / "out").glob("*.json"))) == 1
@@ -0,0 +1,110 @@
+"""
+Aggregation registry tests: dependency selection, scheduling, and `--only`
+runs of the HRA + CNS scripts on the synthetic parquet.
+
+Usage:
+    pytest tests/test_registry.py -v
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_cns_data  # noqa: E402
+import generate_hra_data  # noqa: E402
+import query_pool  # noqa: E402
+from aggregation_registry import Registry  # noqa: E402
+from query_pool import QueryPool, records  # noqa: E402
+
+
+def _chain() -> Registry:
+    reg = Registry()
+    reg.table("t1", "SELECT range AS x FROM range(10)")
+    reg.table("t2", "SELECT x * 2 AS y FROM t1")
+    reg.table("unused", "SELECT * FROM logs")
+    reg.sql("doubled", "SELECT sum(y)::BIGINT AS total FROM t2")
+
+    @reg.python("counted", inputs=("t1",))
+    def counted(cur):
+        return {"rows": cur.execute("SELECT count(*) FROM t1").fetchone()[0]}
+
+    return reg
+
+
+class TestRegistry:
+    def test_select_pulls_only_upstream_tables(self):
+        reg = _chain()
+        assert reg.select(["doubled"]) == ["t1", "t2", "doubled"]
+        assert reg.select(["counted"]) == ["t1", "counted"]
+        # Tables no output reads are never built
+        assert reg.select() == ["t1", "t2", "doubled", "counted"]
+        assert reg.external_inputs(["unused"]) == {"logs"}
+
+    def test_columns_read(self):
+        reg = Registry()
+        reg.table("p_sites", "SELECT site, count(*) AS n FROM logs WHERE traffic_type = 'Bot' GROUP BY site")
+        reg.table("p_stems", "SELECT cs_Uri_Stem FROM (SELECT * FROM events WHERE site = 'Apps')")
+        reg.sql("everything", "SELECT * FROM logs")
+        reg.sql("sites", "SELECT * FROM p_sites")
+        columns = ("site", "traffic_type", "cs_uri_stem", "cs_cookie")
+        assert reg.columns_read(reg.select(["sites"]), ("logs",), columns) == {"site", "traffic_type"}
+        assert reg.columns_read(["p_stems"], ("logs", "events"), columns) == {"site", "cs_uri_stem"}
+        assert reg.columns_read(["p_stems"], ("logs",), columns) == set()
+        assert reg.columns_read(["everything"], ("logs",), columns) == set(columns)
+
+    def test_unknown_output_rejected(self):
+        with pytest.raises(ValueError, match="nope"):
+            _chain().select(["nope"])
+
+    def test_run_builds_dependencies_first(self, tmp_path):
+        reg = _chain()
+        pool = QueryPool(duckdb.connect(), workers=2, threads=2, writer=lambda p, d: Path(p).write_text(json.dumps(d)))
+        reg.run(pool, str(tmp_path), reg.select(["doubled", "counted"]))
+        pool.close()
+        assert json.loads((tmp_path / "doubled.json").read_text()) == [{"total": 90}]
+        assert json.loads((tmp_path / "counted.json").read_text()) == {"rows": 10}
+
+    def test_streamed_json_matches_records(self, tmp_path, monkeypatch):
+        sql = """
+            SELECT x, CASE WHEN x % 2 = 0 THEN 'zürich "' || x || '"' END AS label, x / 4 AS share,
+                   (x / 3)::DECIMAL(6, 2) AS ratio, DATE '2025-01-01' + x::INTEGER AS day
+            FROM range(5) t(x) ORDER BY x DESC
+        """
+        # Batches of two rows: the array is written in three appends
+        monkeypatch.setattr(query_pool, "STREAM_BATCH_ROWS", 2)
+        con = duckdb.connect()
+        reported = []
+        pool = QueryPool(con, workers=1, threads=1, report=reported.append)
+        pool.json(str(tmp_path / "rows.json"), sql)
+        pool.close()
+        expected = json.dumps(records(con, sql), ensure_ascii=True, default=query_pool.json_default)
+        # Same bytes as one json.dumps of every row: compact and ASCII-escaped
+        assert (tmp_path / "rows.json").read_text() == expected
+        assert json.loads(expected)[0] == {"x": 4, "label": 'z\u00fcrich "4"', "share": 1.0, "ratio": 1.33, "day": "2025-01-05"}
+        assert reported == [str(tmp_path / "rows.json")]
+
+
+@pytest.mark.parametrize(
+    "script, only",
+    [
+        (generate_hra_data, ["kg_error_rate", "tool_error_rates_long"]),
+        (generate_cns_data, ["cns_top_404s", "cns_team_pages"]),
+    ],
+    ids=["hra", "cns"],
+)
+def test_only_matches_full_run(script, only, parquets, tmp_path):
+    _, full = parquets
+    script.run(str(full), str(tmp_path / "full"))
+    script.run(str(full), str(tmp_path / "only"), only=only)
+    selected = outputs(tmp_path / "only")
+    assert sorted(selected) == sorted(f"{name}.json" for name in only)
+    everything = outputs(tmp_path / "full")
+    assert selected == {name: everything[name] for name in selected}
@@ -0,0 +1,73 @@
+"""
+Traffic rollup cube tests: a stored cube (`--cube-out`) regenerates the
+cube-only outputs exactly as a full run writes them, without the logs, and
+records how many log rows its cells stand for; a cube written by another
+definition, or an output needing other partials, is refused.
+
+Usage:
+    pytest tests/test_rollup_cube.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from rollup_cube import cube_outputs  # noqa: E402
+
+REQUESTED = {
+    "tool_visits_by_year", "tool_visits_by_month", "total_tool_visits", "geo_distribution",
+    "geo_tool_preference", "geo_tool_breakdown", "traffic_by_dow", "hourly_traffic", "geo_bot_traffic",
+}
+
+
+def _registry():
+    reg = generate_hra_data.Registry()
+    for name, sql in generate_hra_data.partial_queries("logs", "events").items():
+        reg.table(f"p_{name}", sql)
+    generate_hra_data.register_outputs(reg)
+    return reg
+
+
+def test_cube_outputs():
+    served = set(cube_outputs(_registry()))
+    assert REQUESTED <= served
+    assert not served & {"cohort_retention", "kg_error_rate", "data_metadata"}
+
+
+def test_stored_cube_matches_full_run(parquets, tmp_path):
+    _, full = parquets
+    cube = tmp_path / "cube.parquet"
+    generate_hra_data.run(str(full), str(tmp_path / "full"), cube_out=str(cube))
+    # The source is not read again
+    generate_hra_data.run(str(tmp_path / "missing.parquet"), str(tmp_path / "cube"), from_cube=str(cube))
+    exact, rebuilt = outputs(tmp_path / "full"), outputs(tmp_path / "cube")
+    assert set(rebuilt) == {f"{name}.json" for name in cube_outputs(_registry())}
+    assert rebuilt == {name: exact[name] for name in rebuilt}
+    con = duckdb.connect()
+    meta = dict(con.execute(f"SELECT decode(key), decode(value) FROM parquet_kv_metadata('{cube}')").fetchall())
+    (rows,) = con.execute(f"SELECT count(*) FROM '{cube}'").fetchone()
+    (logs,) = con.execute(f"SELECT count(*) FROM (SELECT DISTINCT * FROM '{full}')").fetchone()
+    assert int(meta["raw_rows"]) == logs
+    assert float(meta["ratio"]) == round(rows / logs, 4) < 1
+
+
+def test_mismatched_cube_is_refused(parquets, tmp_path):
+    _, full = parquets
+    cube = tmp_path / "cube.parquet"
+    # A sampled cube scales its counts, so its definition differs
+    generate_hra_data.run(str(full), str(tmp_path / "sample"), sample=0.5, only=["traffic_types"], cube_out=str(cube))
+    with pytest.raises(ValueError, match="another cube definition"):
+        generate_hra_data.run(str(full), str(tmp_path / "out"), from_cube=str(cube))
+    duckdb.connect().execute(f"COPY (SELECT 1 AS n) TO '{cube}' (FORMAT PARQUET)")
+    with pytest.raises(ValueError, match="another cube definition"):
+        generate_hra_data.run(str(full), str(tmp_path / "out"), from_cube=str(cube))
+    with pytest.raises(ValueError, match="cohort_retention"):
+        generate_hra_data.run(str(full), str(tmp_path / "out"), from_cube=str(cube), only=["cohort_retention"])
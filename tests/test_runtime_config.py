@@ -0,0 +1,85 @@
+"""
+Runtime config tests: flags override environment variables, the settings
+reach DuckDB and the metadata JSON, and a load over a deliberately tiny
+memory limit spills to the temp directory instead of failing.
+
+Usage:
+    pytest tests/test_runtime_config.py -v
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_cns_data  # noqa: E402
+import generate_hra_data  # noqa: E402
+from log_store import materialize_logs  # noqa: E402
+from runtime_config import add_runtime_args, apply_runtime, runtime_config  # noqa: E402
+
+
+def _args(*argv):
+    p = argparse.ArgumentParser()
+    add_runtime_args(p)
+    return p.parse_args(argv)
+
+
+class TestRuntimeConfig:
+    def test_flags_override_environment(self):
+        environ = {"DUCKDB_THREADS": "3", "DUCKDB_MEMORY_LIMIT": "1GB", "DUCKDB_PRESERVE_INSERTION_ORDER": "off"}
+        config = runtime_config(_args("--memory-limit", "512MB", "--object-cache"), environ)
+        assert config == {
+            "threads": 3, "memory_limit": "512MB", "preserve_insertion_order": False, "object_cache": True,
+        }
+        assert runtime_config(_args(), {}) == {}
+        with pytest.raises(ValueError):
+            runtime_config(_args(), {"DUCKDB_OBJECT_CACHE": "maybe"})
+
+    def test_settings_applied(self, tmp_path):
+        con = duckdb.connect()
+        settings = apply_runtime(con, {
+            "threads": 2, "memory_limit": "256MB", "temp_directory": str(tmp_path),
+            "preserve_insertion_order": False, "object_cache": True,
+        })
+        assert settings["threads"] == "2" and settings["temp_directory"] == str(tmp_path)
+        assert settings["preserve_insertion_order"] == "false" and settings["object_cache"] == "true"
+        assert con.execute("SELECT current_setting('memory_limit')").fetchone()[0] == settings["memory_limit"]
+
+    def test_load_spills_under_tiny_memory_limit(self, tmp_path):
+        parquet = tmp_path / "wide.parquet"
+        duckdb.connect().execute(f"""
+            COPY (SELECT i AS x_edge_request_id, 'padding-' || i AS cs_user_agent FROM range(1500000) t(i))
+            TO '{parquet}' (FORMAT PARQUET)
+        """)
+        tiny = {"threads": 1, "memory_limit": "96MB", "preserve_insertion_order": False}
+
+        con = duckdb.connect()
+        apply_runtime(con, {**tiny, "temp_directory": str(tmp_path / "spill")})
+        assert materialize_logs(con, str(parquet))["deduped_rows"] == 1_500_000
+
+        # The same load without anywhere to spill runs out of memory
+        con = duckdb.connect()
+        apply_runtime(con, {**tiny, "temp_directory": ""})
+        with pytest.raises(duckdb.OutOfMemoryException):
+            materialize_logs(con, str(parquet))
+
+
+@pytest.mark.parametrize("script,metadata", [
+    (generate_hra_data, "data_metadata.json"),
+    (generate_cns_data, "cns_data_metadata.json"),
+], ids=["hra", "cns"])
+def test_runtime_recorded_in_metadata(script, metadata, parquets, tmp_path):
+    _, full = parquets
+    out = tmp_path / "out"
+    runtime = {"threads": 1, "memory_limit": "64MB", "temp_directory": str(tmp_path / "spill")}
+    script.run(str(full), str(out), runtime=runtime, workers=1)
+    recorded = json.loads((out / metadata).read_text())["runtime"]
+    assert recorded["threads"] == "1" and recorded["temp_directory"] == str(tmp_path / "spill")
+    assert recorded["memory_limit"] == duckdb.connect().execute(
+        "SET memory_limit = '64MB'; SELECT current_setting('memory_limit')").fetchone()[0]
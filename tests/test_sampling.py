@@ -0,0 +1,92 @@
+"""
+Sampled preview tests: the sample keeps whole users deterministically, a
+full-size sample reproduces the full run, a half sample scales request counts
+back up and marks its metadata as estimated, and `compare_outputs` reports
+the error of one run against the other.
+
+Usage:
+    pytest tests/test_sampling.py -v
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_cns_data  # noqa: E402
+import generate_hra_data  # noqa: E402
+from sampling import compare_outputs, sample_predicate  # noqa: E402
+
+
+def test_sample_keeps_whole_users():
+    con = duckdb.connect()
+    rows = "SELECT 'u' || (i % 5000) AS anon_id, 'r' || i AS x_edge_request_id FROM range(50000) t(i)"
+    kept = f"SELECT * FROM ({rows}) WHERE {sample_predicate(0.2)}"
+    users, partial = con.execute(f"""
+        SELECT count(*), count(*) FILTER (WHERE n <> 10) FROM (SELECT anon_id, count(*) AS n FROM ({kept}) GROUP BY 1)
+    """).fetchone()
+    assert partial == 0 and abs(users - 1000) <= 100
+    assert con.execute(f"SELECT count(*) FROM ({kept})").fetchone()[0] == users * 10
+
+
+def test_full_sample_matches_full_run(parquets, tmp_path):
+    _, full = parquets
+    generate_hra_data.run(str(full), str(tmp_path / "full"))
+    generate_hra_data.run(str(full), str(tmp_path / "sample"), sample=1.0)
+    exact, sampled = outputs(tmp_path / "full"), outputs(tmp_path / "sample")
+    meta = sampled.pop("data_metadata.json")
+    exact.pop("data_metadata.json")
+    assert sampled == exact
+    assert meta["sample"]["estimated"] is True and meta["sample"]["scale"] == 1.0
+
+
+def test_half_sample_scales_counts(parquets, tmp_path):
+    _, full = parquets
+    for site, name in ((generate_hra_data, "hra"), (generate_cns_data, "cns")):
+        site.run(str(full), str(tmp_path / name / "full"))
+        site.run(str(full), str(tmp_path / name / "sample"), sample=0.5)
+
+    meta = json.loads((tmp_path / "hra" / "sample" / "data_metadata.json").read_text())
+    assert meta["sample"]["fraction"] == 0.5 and meta["sample"]["scale"] == 2.0
+    assert {"cohort_retention", "monthly_unique_users"} <= set(meta["sample"]["unscaled_outputs"])
+    assert "total_tool_visits" not in meta["sample"]["unscaled_outputs"]
+    cns_meta = json.loads((tmp_path / "cns" / "sample" / "cns_data_metadata.json").read_text())
+    assert cns_meta["sample"]["unscaled_outputs"] == []
+
+    hra = compare_outputs(str(tmp_path / "hra" / "full"), str(tmp_path / "hra" / "sample"))
+    # The fixture has 40 users (8 per tool), so a half sample is coarse
+    assert hra["total_tool_visits"]["covered"] == 1.0
+    assert hra["total_tool_visits"]["total_relative_error"] < 0.5
+    # Unscaled: the sessions of the sample, never more than the full run's
+    sessions = {
+        run: sum(r["unique_sessions"] for r in json.loads((tmp_path / "hra" / run / "monthly_unique_users.json").read_text()))
+        for run in ("full", "sample")
+    }
+    assert 0 < sessions["sample"] <= sessions["full"]
+    cns = compare_outputs(str(tmp_path / "cns" / "full"), str(tmp_path / "cns" / "sample"))
+    assert cns["cns_traffic_types"]["total_relative_error"] < 0.5
+
+
+def test_sample_rejects_incremental(parquets, tmp_path):
+    _, full = parquets
+    with pytest.raises(ValueError, match="--sample"):
+        generate_cns_data.run(str(full), str(tmp_path / "out"), incremental=True,
+                              state_db=str(tmp_path / "state.duckdb"), sample=0.5)
+
+
+def test_compare_outputs_reports_errors(tmp_path):
+    for name, rows in (("full", [100, 200, 50]), ("sample", [110, 190])):
+        (tmp_path / name).mkdir()
+        data = [{"month": f"2025-0{i + 1}", "n": n} for i, n in enumerate(rows)]
+        (tmp_path / name / "visits.json").write_text(json.dumps(data))
+    report = compare_outputs(str(tmp_path / "full"), str(tmp_path / "sample"))["visits"]
+    assert report["values"] == 3 and report["covered"] == round(2 / 3, 4)
+    assert report["median_relative_error"] == 0.075 and report["p95_relative_error"] == 0.1
+    assert report["total_relative_error"] == round(20 / 300, 4)
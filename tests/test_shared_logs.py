@@ -0,0 +1,76 @@
+"""
+Shared log store tests: an HRA run reading the store matches a normal run,
+later consumers reuse the store instead of deduplicating again, a consumer
+needing other columns rebuilds it once with the union, and a changed source
+rebuilds it.
+
+Usage:
+    pytest tests/test_shared_logs.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_hra_data  # noqa: E402
+from shared_logs import open_shared_logs, store_status  # noqa: E402
+
+
+def _load(store, parquet, columns, **kwargs):
+    con = duckdb.connect()
+    try:
+        return open_shared_logs(con, str(store), str(parquet), columns, **kwargs)
+    finally:
+        con.close()
+
+
+def test_store_matches_normal_run(parquets, tmp_path):
+    _, full = parquets
+    store = tmp_path / "logs.duckdb"
+    generate_hra_data.run(str(full), str(tmp_path / "plain"), cache_dir=None)
+    generate_hra_data.run(str(full), str(tmp_path / "store"), cache_dir=None, log_store=str(store))
+    generate_hra_data.run(str(full), str(tmp_path / "again"), cache_dir=None, log_store=str(store))
+    plain, stored, again = (outputs(tmp_path / name) for name in ("plain", "store", "again"))
+    for run in (plain, stored, again):
+        run.pop("data_metadata.json")
+    assert stored == plain and again == plain
+    assert store_status(str(store), str(full))["deduped_rows"] == 3000
+
+
+def test_union_rebuild_then_reuse(parquets, tmp_path):
+    _, full = parquets
+    store = tmp_path / "logs.duckdb"
+    first = _load(store, full, ["date", "site"], enums={"site": None})
+    wider = _load(store, full, ["date", "anon_id"], derived={"day": "strftime(date, '%d')"})
+    assert not first["reused"] and not wider["reused"]
+    # Both requests are now served by the same build
+    again = _load(store, full, ["anon_id"], derived={"day": "strftime(date, '%d')"})
+    con = duckdb.connect()
+    assert again["reused"] and open_shared_logs(con, str(store), str(full), ["date", "site"])["reused"]
+    # An ENUM this request did not ask for reads back as text
+    types = dict(con.execute("SELECT column_name, column_type FROM (DESCRIBE logs)").fetchall())
+    assert types == {"date": "DATE", "site": "VARCHAR"}
+
+
+def test_changed_source_rebuilds(parquets, tmp_path):
+    older, full = parquets
+    store = tmp_path / "logs.duckdb"
+    _load(store, older, ["date"])
+    assert store_status(str(store), str(older)) and store_status(str(store), str(older), key="request_id") is None
+    duckdb.connect().execute(f"COPY (SELECT * FROM '{full}') TO '{older}' (FORMAT PARQUET)")
+    assert store_status(str(store), str(older)) is None
+    load = _load(store, older, ["date"])
+    assert not load["reused"] and load["deduped_rows"] == 3000
+
+
+def test_store_rejects_partial_loads(parquets, tmp_path):
+    _, full = parquets
+    with pytest.raises(ValueError, match="--log-store"):
+        generate_hra_data.run(str(full), str(tmp_path / "out"), sample=0.5, log_store=str(tmp_path / "logs.duckdb"))
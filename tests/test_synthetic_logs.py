@@ -0,0 +1,96 @@
+"""
+Synthetic log tests: the generated parquet has the field dictionary's schema,
+is reproducible from its seed, carries the requested duplicates, and the
+scale benchmark runs all three pipelines on it and compares two results.
+
+Usage:
+    pytest tests/test_synthetic_logs.py -v
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import benchmark_pipeline  # noqa: E402
+from generate_synthetic_logs import MANIFEST, field_types, format_rows, generate, matches, parse_rows  # noqa: E402
+from log_store import materialize_logs  # noqa: E402
+
+
+def _schema(path):
+    return {name: dtype for name, dtype, *_ in duckdb.connect().execute(f"DESCRIBE SELECT * FROM '{path}/*.parquet'").fetchall()}
+
+
+def test_parse_and_format_rows():
+    assert [parse_rows(v) for v in ("1000", "250k", "1M", "1.5M", "100M")] == [1000, 250_000, 10**6, 1_500_000, 10**8]
+    assert [format_rows(n) for n in (10**6, 10**8, 250_000, 1234)] == ["1M", "100M", "250k", "1234"]
+    with pytest.raises(ValueError):
+        parse_rows("0")
+
+
+@pytest.mark.parametrize("site", ["hra", "cns"])
+def test_schema_matches_field_dictionary(site, tmp_path):
+    generate(str(tmp_path), 3000, site, chunk_rows=1000)
+    expected = field_types()
+    if site == "cns":
+        expected.update(year="VARCHAR", month="VARCHAR", day="VARCHAR")
+    assert _schema(tmp_path) == expected
+    assert json.loads((tmp_path / MANIFEST).read_text())["files"] == [f"part-0000{n}.parquet" for n in range(3)]
+
+
+def test_reproducible_with_duplicates(tmp_path):
+    a, b, other = tmp_path / "a", tmp_path / "b", tmp_path / "other"
+    manifest = generate(str(a), 20000, "hra", seed=7, duplicates=0.05)
+    generate(str(b), 20000, "hra", seed=7, duplicates=0.05)
+    generate(str(other), 20000, "hra", seed=8, duplicates=0.05)
+    assert matches(str(a), 20000, "hra", 7, 0.05) and not matches(str(a), 20000, "hra", 8, 0.05)
+
+    con = duckdb.connect()
+    checksum = "SELECT sum(hash(COLUMNS(*))) FROM '{}/*.parquet'"
+    assert con.execute(checksum.format(a)).fetchall() == con.execute(checksum.format(b)).fetchall()
+    assert con.execute(checksum.format(a)).fetchall() != con.execute(checksum.format(other)).fetchall()
+
+    # Duplicates are exact redeliveries: every key dedups to the distinct rows
+    assert 20000 * 1.04 < manifest["written_rows"] < 20000 * 1.06
+    for key in ("row", "request_id"):
+        assert materialize_logs(duckdb.connect(), str(a), key=key)["deduped_rows"] == 20000
+
+    events = con.execute(f"""
+        SELECT count(DISTINCT query['sessionId']), count(DISTINCT query['app']), count(DISTINCT query['e.reason.message'])
+        FROM '{a}/*.parquet' WHERE site = 'Events' AND cs_uri_stem = '/tr'
+    """).fetchone()
+    assert events[0] > 100 and events[1] == 7 and events[2] > 5
+
+
+def test_benchmark_runs_and_compares(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    results = benchmark_pipeline.run(
+        [5000], data_dir=str(tmp_path / "data"), results_dir=str(tmp_path / "results"), runtime={"threads": 1}, workers=1,
+    )
+    stored = json.loads(next((tmp_path / "results").glob("*.json")).read_text())
+    assert stored["commit"] == results["commit"] and [r["pipeline"] for r in stored["runs"]] == ["hra", "cns", "ml"]
+    stages = {r["pipeline"]: r["stages"] for r in stored["runs"]}
+    assert {"logs", "events", "p_apps_dates"} <= set(stages["hra"]) and "logs" in stages["cns"]
+    assert {"logs", "transactions", "bot_model"} <= set(stages["ml"])
+
+    rows = benchmark_pipeline.compare(stored, results)
+    assert [(row["pipeline"], row["scale"]) for row in rows] == [("hra", "5k"), ("cns", "5k"), ("ml", "5k")]
+    assert all(stage["base"] == stage["head"] for row in rows for stage in row["stages"])
+
+
+def test_serial_baseline_speedup(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    results = benchmark_pipeline.run(
+        [5000], pipelines=["cns"], data_dir=str(tmp_path / "data"), results_dir=None, runtime={"threads": 2},
+        workers=2, serial_baseline=True,
+    )
+    (cns,) = results["runs"]
+    baseline = cns["serial_baseline"]
+    assert cns["scheduler"]["workers"] == 2 and baseline["concurrent_wall_seconds"] == cns["scheduler"]["wall_seconds"]
+    assert baseline["serial_wall_seconds"] > 0 and baseline["speedup"] == round(
+        baseline["serial_wall_seconds"] / baseline["concurrent_wall_seconds"], 2)
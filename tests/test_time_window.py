@@ -0,0 +1,99 @@
+"""
+Time-window tests: a `--since`/`--until` run reproduces a full run over the
+logs of those days and records the window in its metadata, the window opens
+only the hive partitions it overlaps, windowed outputs are cached apart from
+full ones, and invalid windows are rejected.
+
+Usage:
+    pytest tests/test_time_window.py -v
+"""
+
+import argparse
+import json
+import re
+import sys
+from datetime import date
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from conftest import outputs
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_processing"))
+
+import generate_cns_data  # noqa: E402
+import generate_hra_data  # noqa: E402
+from log_store import hive_keys, parquet_source  # noqa: E402
+from time_window import parse_day, window_metadata, window_predicate  # noqa: E402
+
+SINCE, UNTIL = date(2025, 2, 10), date(2025, 4, 2)
+
+
+def partitioned(con, query, path):
+    con.execute(f"COPY ({query}) TO '{path}' (FORMAT PARQUET, PARTITION_BY (year, month))")
+    return str(path)
+
+
+def test_window_matches_run_over_its_days(parquets, tmp_path):
+    _, full = parquets
+    con = duckdb.connect()
+    source = partitioned(con, f"SELECT * FROM '{full}'", tmp_path / "logs")
+    days = partitioned(con, f"SELECT * FROM '{full}' WHERE date BETWEEN DATE '{SINCE}' AND DATE '{UNTIL}'",
+                       tmp_path / "days")
+    for site, name, meta_file in ((generate_hra_data, "hra", "data_metadata.json"),
+                                  (generate_cns_data, "cns", "cns_data_metadata.json")):
+        site.run(source, str(tmp_path / name / "window"), cache_dir=None, since=SINCE, until=UNTIL)
+        site.run(days, str(tmp_path / name / "days"), cache_dir=None)
+        windowed, expected = outputs(tmp_path / name / "window"), outputs(tmp_path / name / "days")
+        meta = windowed.pop(meta_file)
+        expected.pop(meta_file)
+        assert windowed == expected
+        assert meta["window"] == window_metadata(SINCE, UNTIL)
+        assert meta["window"]["since"] == "2025-02-10" and meta["window"]["until"] == "2025-04-02"
+
+    meta = json.loads((tmp_path / "hra" / "window" / "data_metadata.json").read_text())
+    assert "2025-02-10" <= meta["first_date"] <= meta["last_date"] <= "2025-04-02"
+    generate_hra_data.run(str(full), str(tmp_path / "all"), cache_dir=None)
+    assert json.loads((tmp_path / "all" / "data_metadata.json").read_text())["window"] is None
+
+
+def test_window_prunes_partitions(parquets, tmp_path):
+    _, full = parquets
+    con = duckdb.connect()
+    source = partitioned(con, f"SELECT * FROM '{full}'", tmp_path / "logs")
+    where = window_predicate(SINCE, UNTIL, hive_keys(source))
+    for types in (generate_hra_data.PARTITION_TYPES, generate_cns_data.PARTITION_TYPES):
+        plan = con.execute(f"EXPLAIN ANALYZE SELECT count(*) FROM {parquet_source(source, types)} WHERE {where}").fetchall()[0][1]
+        # February to April of the six months
+        assert re.search(r"Scanning Files: 3/6\b", plan)
+        assert "date>='2025-02-10'::DATE" in plan
+    # Without partitions the bounds are on the date alone
+    assert window_predicate(SINCE, None) == "date >= DATE '2025-02-10'"
+    assert window_predicate(None, None) is None
+
+
+def test_window_cached_apart_from_full_run(parquets, tmp_path):
+    _, full = parquets
+    cache = str(tmp_path / "cache")
+    generate_hra_data.run(str(full), str(tmp_path / "window"), cache_dir=cache, since=SINCE, until=UNTIL)
+    generate_hra_data.run(str(full), str(tmp_path / "full"), cache_dir=cache)
+    generate_hra_data.run(str(full), str(tmp_path / "uncached"), cache_dir=None)
+    full_run, uncached = outputs(tmp_path / "full"), outputs(tmp_path / "uncached")
+    for run in (full_run, uncached):
+        run.pop("data_metadata.json")
+    assert full_run == uncached
+
+
+def test_invalid_windows_rejected(parquets, tmp_path):
+    _, full = parquets
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_day("2025-13-01")
+    with pytest.raises(ValueError, match="after --until"):
+        generate_hra_data.run(str(full), str(tmp_path / "out"), since=UNTIL, until=SINCE)
+    with pytest.raises(ValueError, match="--incremental"):
+        generate_cns_data.run(str(full), str(tmp_path / "out"), incremental=True,
+                              state_db=str(tmp_path / "state.duckdb"), since=SINCE)
+    with pytest.raises(ValueError, match="--since/--until"):
+        generate_hra_data.run(str(full), str(tmp_path / "out"), log_store=str(tmp_path / "logs.duckdb"), until=UNTIL)